@@ -0,0 +1,192 @@
+"""
+End-to-end latency of the native host with a stand-in mpv.
+
+The host is run as the browser runs it: a new process with a framed message on standard input, or
+one persistent process for all messages with ``--persistent``. ``mpv`` on ``PATH`` is
+``benchmarks/fake_mpv.py``, which serves the JSON IPC protocol and records when it emits
+``playback-restart``. Each URL is opened once with no instance running (cold) and once with the
+previous instance still running (warm).
+
+For each case this reports the time until the host's response and the time until
+``playback-restart``. Sockets, logs and caches (such as the probed capabilities of the stand-in)
+go to a temporary directory (set with the ``XDG_*`` variables, so Linux only).
+
+Run with ``python benchmarks/e2e.py`` in an environment with this package installed.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import IO, Any, cast
+import json
+import os
+import socket
+import statistics
+import struct
+import subprocess as sp
+import sys
+import time
+
+import click
+
+FAKE_MPV = Path(__file__).resolve().parent / 'fake_mpv.py'
+TIMEOUT = 10.0
+
+
+def _percentiles(values: list[float]) -> tuple[float, float, float]:
+    if len(values) == 1:
+        return values[0], values[0], values[0]
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def _frame(data: dict[str, Any]) -> bytes:
+    encoded = json.dumps(data).encode()
+    return struct.pack('@i', len(encoded)) + encoded
+
+
+def _read_frame(stream: IO[bytes]) -> dict[str, Any]:
+    header = stream.read(4)
+    if len(header) < 4:  # ruff:ignore[magic-value-comparison]
+        msg = 'Host closed standard output.'
+        raise EOFError(msg)
+    return cast('dict[str, Any]', json.loads(stream.read(struct.unpack('@i', header)[0])))
+
+
+def _wait_for_event(events: Path, url: str, start: float) -> float:
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        if events.exists():
+            for line in events.read_text(encoding='utf-8').splitlines():
+                record = json.loads(line)
+                if record.get('event') == 'playback-restart' and record.get('path') == url:
+                    return float(record['t']) - start
+        time.sleep(0.002)
+    msg = f'No playback-restart for {url}.'
+    raise TimeoutError(msg)
+
+
+def _send_quit(path: Path) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            sock.connect(str(path))
+            sock.sendall(b'{"command":["quit"]}\n')
+    except OSError:
+        return False
+    return True
+
+
+def _quit(paths: list[Path]) -> None:
+    # A claimed pool instance does not remove its renamed socket, so wait until nothing listens.
+    deadline = time.monotonic() + TIMEOUT
+    for path in paths:
+        while _send_quit(path) and time.monotonic() < deadline:
+            time.sleep(0.005)
+        path.unlink(missing_ok=True)
+
+
+def _pipes(proc: sp.Popen[bytes]) -> tuple[IO[bytes], IO[bytes]]:
+    if proc.stdin is None or proc.stdout is None:
+        msg = 'Host was started without pipes.'
+        raise RuntimeError(msg)
+    return proc.stdin, proc.stdout
+
+
+class _Host:
+    def __init__(self, env: dict[str, str], *, persistent: bool) -> None:
+        self.env = env
+        self.persistent = persistent
+        self.proc: sp.Popen[bytes] | None = None
+
+    def _start(self) -> sp.Popen[bytes]:
+        return sp.Popen((sys.executable, '-m', 'open_in_mpv', 'chrome-extension://benchmark/'),
+                        env=self.env,
+                        stdin=sp.PIPE,
+                        stdout=sp.PIPE)
+
+    def send(self, message: dict[str, Any]) -> dict[str, Any]:
+        if not self.persistent:
+            with self._start() as proc:
+                stdin, stdout = _pipes(proc)
+                stdin.write(_frame(message))
+                stdin.close()
+                return _read_frame(stdout)
+        if self.proc is None:
+            self.proc = self._start()
+            stdin, stdout = _pipes(self.proc)
+            stdin.write(_frame({'init': True, 'persistent': True}))
+            stdin.flush()
+            _read_frame(stdout)
+        stdin, stdout = _pipes(self.proc)
+        stdin.write(_frame(message))
+        stdin.flush()
+        return _read_frame(stdout)
+
+    def close(self) -> None:
+        if self.proc is not None:
+            _pipes(self.proc)[0].close()
+            self.proc.wait()
+
+
+@click.command()
+@click.option('-n', '--iterations', default=20, help='URLs opened per case.')
+@click.option('--startup-delay', default=0.05, help='Seconds fake mpv takes to start.')
+@click.option('--load-delay', default=0.1, help='Seconds fake mpv takes to load a URL.')
+@click.option('--launcher', default='spawn', type=click.Choice(('fork', 'spawn')))
+@click.option('--pool-size', default=0, help='Pre-warmed instances.')
+@click.option('--persistent', is_flag=True, help='Use one persistent host for all messages.')
+def main(iterations: int, startup_delay: float, load_delay: float, launcher: str, pool_size: int,
+         *, persistent: bool) -> None:
+    """
+    Benchmark cold and warm click-to-playback latency with a stand-in mpv.
+
+    Prints the percentiles of the time until the host's response and until playback starts.
+    """  # ruff:ignore[docstring-missing-exception]
+    with TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        bin_dir = tmp / 'bin'
+        bin_dir.mkdir()
+        mpv = bin_dir / 'mpv'
+        mpv.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_MPV}" "$@"\n', encoding='utf-8')
+        mpv.chmod(0o755)
+        run_dir = tmp / 'run'
+        run_dir.mkdir(mode=0o700)
+        events = tmp / 'events.jsonl'
+        env = dict(os.environ,
+                   FAKE_MPV_EVENTS=str(events),
+                   FAKE_MPV_LOAD_DELAY=str(load_delay),
+                   FAKE_MPV_STARTUP_DELAY=str(startup_delay),
+                   PATH=f'{bin_dir}{os.pathsep}{os.environ.get("PATH", "")}',
+                   XDG_CACHE_HOME=str(tmp / 'cache'),
+                   XDG_CONFIG_HOME=str(tmp / 'config'),
+                   XDG_DATA_HOME=str(tmp / 'data'),
+                   XDG_RUNTIME_DIR=str(run_dir),
+                   XDG_STATE_HOME=str(tmp / 'state'))
+        host = _Host(env, persistent=persistent)
+        results: dict[str, tuple[list[float], list[float]]] = {'cold': ([], []), 'warm': ([], [])}
+        message = {'launcher': launcher, 'poolSize': pool_size, 'single': True}
+        try:
+            for i in range(iterations):
+                for case in ('cold', 'warm'):
+                    if case == 'cold':
+                        _quit([run_dir / 'open-in-mpv' / 'open-in-mpv.sock'])
+                    url = f'https://example.com/{case}/{i}'
+                    start = time.monotonic()
+                    resp = host.send({**message, 'url': url})
+                    responded = time.monotonic() - start
+                    if 'error' in resp:
+                        raise click.ClickException(resp['error'])
+                    results[case][0].append(responded * 1000)
+                    results[case][1].append(_wait_for_event(events, url, start) * 1000)
+        finally:
+            host.close()
+            _quit(list(run_dir.rglob('*.sock')))
+        click.echo(f'{"case":<5} {"response p50/p95/p99 ms":>26} {"playback p50/p95/p99 ms":>26}')
+        for case, (responses, playbacks) in results.items():
+            click.echo(f'{case:<5} {"/".join(f"{x:.1f}" for x in _percentiles(responses)):>26} '
+                       f'{"/".join(f"{x:.1f}" for x in _percentiles(playbacks)):>26}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Stand-in for mpv that serves the JSON IPC protocol without a display or network.
+
+It accepts the command line the host builds, listens on ``--input-ipc-server`` and answers the
+commands the host and :py:class:`open_in_mpv.ipc.MpvClient` send. Loading a URL emits
+``start-file``, then ``file-loaded`` and ``playback-restart`` after a delay. Configure it with
+environment variables:
+
+``FAKE_MPV_STARTUP_DELAY``
+    Seconds before the socket is created. Default 0.05.
+``FAKE_MPV_LOAD_DELAY``
+    Seconds between ``start-file`` and ``file-loaded``. Default 0.1.
+``FAKE_MPV_EVENTS``
+    File to append each event to as a JSON line with the :py:func:`time.monotonic` time.
+``FAKE_MPV_LIFETIME``
+    Seconds after which the process exits by itself. Default 120.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, cast
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+
+STARTUP_DELAY = float(os.environ.get('FAKE_MPV_STARTUP_DELAY', '0.05'))
+LOAD_DELAY = float(os.environ.get('FAKE_MPV_LOAD_DELAY', '0.1'))
+EVENTS_PATH = os.environ.get('FAKE_MPV_EVENTS')
+LIFETIME = float(os.environ.get('FAKE_MPV_LIFETIME', '120'))
+
+
+class FakeMpv:
+    """State of the stand-in player shared by all IPC connections."""
+    def __init__(self) -> None:
+        self.clients: set[asyncio.Transport] = set()
+        self.path: str | None = None
+        self.playlist: list[str] = []
+        self.properties: dict[str, Any] = {'pid': os.getpid(), 'idle-active': True}
+        self.quit = asyncio.Event()
+        self.loading: asyncio.Task[None] | None = None
+
+    def emit(self, message: dict[str, Any]) -> None:
+        """Send ``message`` to every client and append it to ``FAKE_MPV_EVENTS``."""
+        data = json.dumps(message).encode() + b'\n'
+        for transport in list(self.clients):
+            if not transport.is_closing():
+                transport.write(data)
+        if EVENTS_PATH:
+            record = {'t': time.monotonic(), 'pid': os.getpid(), 'path': self.path, **message}
+            with Path(EVENTS_PATH).open('a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+
+    async def _load(self, url: str) -> None:
+        self.path = url
+        self.properties.update({'idle-active': False, 'path': url})
+        self.properties.pop('playback-time', None)
+        self.emit({'event': 'start-file'})
+        await asyncio.sleep(LOAD_DELAY)
+        self.properties['playback-time'] = 0.0
+        self.emit({'event': 'file-loaded'})
+        self.emit({'event': 'playback-restart'})
+
+    def load(self, url: str) -> None:
+        """Start loading ``url``, cancelling the URL being loaded."""
+        if self.loading is not None:
+            self.loading.cancel()
+        self.loading = asyncio.create_task(self._load(url))
+
+    def add(self, urls: list[str], flag: str) -> None:
+        """Add ``urls`` to the playlist like ``loadfile`` and ``loadlist`` with ``flag``."""
+        if flag == 'replace' or not urls:
+            self.playlist = list(urls)
+            if urls:
+                self.load(urls[0])
+            return
+        self.playlist.extend(urls)
+        if flag == 'append-play' and self.properties['idle-active']:
+            self.load(urls[0])
+
+    def run_command(self, command: list[Any]) -> tuple[str, Any]:
+        """
+        Run an IPC command.
+
+        Returns
+        -------
+        tuple[str, Any]
+            The ``error`` and ``data`` fields of the reply.
+        """
+        name, *args = command
+        if name == 'loadfile':
+            self.add([args[0]], args[1] if len(args) > 1 else 'replace')
+        elif name == 'loadlist':
+            urls = [x.strip() for x in Path(args[0]).read_text(encoding='utf-8').splitlines()]
+            self.add([x for x in urls if x and not x.startswith('#')],
+                     args[1] if len(args) > 1 else 'replace')
+        elif name == 'get_property':
+            if args[0] == 'playlist-count':
+                return 'success', len(self.playlist)
+            if args[0] not in self.properties:
+                return 'property unavailable', None
+            return 'success', self.properties[args[0]]
+        elif name == 'set_property':
+            self.properties[args[0]] = args[1]
+        elif name == 'quit':
+            self.quit.set()
+        elif name not in {'observe_property', 'unobserve_property', 'script-message'}:
+            return 'invalid parameter', None
+        return 'success', None
+
+    def reply(self, transport: asyncio.Transport, line: bytes) -> None:
+        """Run the command in ``line`` and write the reply to ``transport``."""
+        try:
+            message = json.loads(line)
+            error, data = self.run_command(message['command'])
+        except (ValueError, KeyError, IndexError, TypeError, OSError):
+            message, error, data = {}, 'invalid parameter', None
+        transport.write(
+            json.dumps({
+                'data': data,
+                'error': error,
+                'request_id': message.get('request_id', 0)
+            }).encode() + b'\n')
+        if message.get('command', [None])[0] == 'observe_property':
+            name = message['command'][2]
+            transport.write(
+                json.dumps({
+                    'event': 'property-change',
+                    'id': message['command'][1],
+                    'name': name,
+                    'data': self.properties.get(name)
+                }).encode() + b'\n')
+
+
+class Client(asyncio.Protocol):
+    """
+    One IPC connection.
+
+    Commands are run as soon as they arrive, so like mpv, commands sent by a client that
+    disconnects without reading the replies still run.
+    """
+    def __init__(self, mpv: FakeMpv) -> None:
+        self.mpv = mpv
+        self.buffer = b''
+        self.transport: asyncio.Transport | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """Register the connection to receive events."""
+        self.transport = cast('asyncio.Transport', transport)
+        self.mpv.clients.add(self.transport)
+
+    def connection_lost(self, exc: Exception | None) -> None:  # ruff:ignore[unused-method-argument]
+        """Stop sending events to the connection."""
+        if self.transport is not None:
+            self.mpv.clients.discard(self.transport)
+
+    def data_received(self, data: bytes) -> None:
+        """Run each complete line of ``data`` as a command."""
+        if self.transport is None:
+            return
+        *lines, self.buffer = (self.buffer + data).split(b'\n')
+        for line in lines:
+            if line.strip():
+                self.mpv.reply(self.transport, line)
+
+
+async def serve(socket_path: str | None, urls: list[str]) -> None:
+    """Listen on ``socket_path`` and play ``urls`` until ``quit`` or ``FAKE_MPV_LIFETIME``."""
+    await asyncio.sleep(STARTUP_DELAY)
+    mpv = FakeMpv()
+    server = None
+    if socket_path:
+        address = f'\0{socket_path[1:]}' if socket_path.startswith('@') else socket_path
+        server = await asyncio.get_running_loop().create_unix_server(lambda: Client(mpv),
+                                                                     path=address)
+    if urls:
+        mpv.add(urls, 'replace')
+    with contextlib.suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(mpv.quit.wait(), LIFETIME)
+    if server is not None:
+        server.close()
+
+
+def main(argv: list[str]) -> None:
+    """Run the stand-in with mpv's command line ``argv``."""
+    socket_path = next((x.split('=', 1)[1] for x in argv if x.startswith('--input-ipc-server=')),
+                       None)
+    asyncio.run(serve(socket_path, [x for x in argv if not x.startswith('-')]))
+    if socket_path and not socket_path.startswith('@'):
+        # mpv removes the socket path it was started with, even if it was renamed.
+        Path(socket_path).unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
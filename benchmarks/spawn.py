@@ -0,0 +1,92 @@
+"""
+Compare the ``fork`` and ``spawn`` launchers.
+
+Each launcher starts a small shell command in place of mpv many times. For each run this records
+how long the caller is blocked, how long until the command is running, and the peak RSS of the
+Python process left waiting for the command (``fork`` only; ``spawn`` leaves nothing behind). Use
+``--ballast`` to grow the parent first and mimic a host with many modules loaded.
+
+Run with ``python benchmarks/spawn.py`` in an environment with this package installed.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+import os
+import resource
+import statistics
+import subprocess as sp
+import time
+
+from open_in_mpv import main as host
+import click
+
+
+def _percentiles(values: list[float]) -> tuple[float, float, float]:
+    if len(values) == 1:
+        return values[0], values[0], values[0]
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def _run_once(launcher: str, tmp: Path, index: int) -> tuple[float, float, int]:
+    fifo = tmp / f'started-{index}'
+    rss_file = tmp / f'rss-{index}'
+    os.mkfifo(fifo)
+    cmd = ('/bin/sh', '-c', 'echo started > "$0"', str(fifo))
+    env = dict(os.environ)
+
+    def callback() -> None:
+        rss_file.write_text(str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss),
+                            encoding='utf-8')
+        sp.run(cmd, env=env, check=False)
+
+    start = time.perf_counter()
+    if launcher == 'spawn':
+        host.launch(cmd, env)
+    else:
+        try:
+            host.spawn(callback)
+        except SystemExit as exc:
+            # The intermediate child must not run the parent's cleanup code.
+            os._exit(exc.code if isinstance(exc.code, int) else 0)
+    blocked = time.perf_counter() - start
+    with fifo.open(encoding='utf-8') as f:
+        f.read()
+    started = time.perf_counter() - start
+    host.reap_children()
+    rss = 0
+    if launcher == 'fork':
+        while not rss_file.exists() or not rss_file.read_text(encoding='utf-8'):
+            time.sleep(0.001)
+        rss = int(rss_file.read_text(encoding='utf-8'))
+    return blocked, started, rss
+
+
+@click.command()
+@click.option('-n', '--iterations', default=50, help='Runs per launcher.')
+@click.option('--ballast', default=0, help='Allocate this many MiB in the parent first.')
+def main(iterations: int, ballast: int) -> None:
+    """Benchmark the fork and posix_spawn launchers."""
+    kept = b'x' * (ballast << 20)
+    with TemporaryDirectory() as tmp_dir, mock.patch.object(host, 'MPV_LOG_PATH',
+                                                             Path(tmp_dir) / 'mpv.log'):
+        tmp = Path(tmp_dir)
+        click.echo(f'Parent max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss} KiB '
+                   f'(ballast {len(kept) >> 20} MiB)')
+        click.echo(f'{"launcher":<8} {"blocked p50/p95/p99 ms":>24} {"started p50/p95/p99 ms":>24} '
+                   f'{"resident KiB":>12}')
+        for launcher in ('fork', 'spawn'):
+            results = [_run_once(launcher, tmp, i) for i in range(iterations)]
+            blocked = _percentiles([x[0] * 1000 for x in results])
+            started = _percentiles([x[1] * 1000 for x in results])
+            rss = max(x[2] for x in results)
+            click.echo(f'{launcher:<8} {"/".join(f"{x:.2f}" for x in blocked):>24} '
+                       f'{"/".join(f"{x:.2f}" for x in started):>24} {rss:>12}')
+            for path in tmp.glob('[rs]*-*'):
+                path.unlink()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 """Entry point for ``python -m`` invocation."""
 from __future__ import annotations
 
-from .main import main
+from .main import run
 
-main()
+run()
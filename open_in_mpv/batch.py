@@ -0,0 +1,160 @@
+"""
+Loading several URLs into an instance at once.
+
+A batch is turned into ``loadfile`` commands that are sent in one write. Batches larger than
+``LOADLIST_THRESHOLD`` are written to a playlist file and loaded with one ``loadlist`` command
+instead, so mpv does not have to parse and answer hundreds of commands.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import json
+import logging
+import os
+import socket
+import time
+
+from .constants import MPV_SOCKET
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping, Sequence
+    from pathlib import Path
+
+__all__ = ('LOADLIST_THRESHOLD', 'MODES', 'PLAYLIST_TTL', 'args', 'commands', 'loadfile', 'send',
+           'write_playlist')
+
+LOADLIST_THRESHOLD = 32
+"""Batches with more URLs than this are loaded with ``loadlist``."""
+MODES = ('append', 'replace')
+"""How a batch is added to the playlist of a running instance."""
+PLAYLIST_TTL = 3600.0
+"""Seconds a playlist file written for ``loadlist`` is kept."""
+
+log = logging.getLogger(__name__)
+
+
+def _playlist_dir() -> Path:
+    return MPV_SOCKET.parent / 'playlists'
+
+
+def _remove_older(path: Path, cutoff: float) -> None:
+    try:
+        if path.stat().st_mtime < cutoff:
+            path.unlink()
+    except OSError:  # pragma: no cover
+        log.debug('Failed to remove old playlist %s.', path)
+
+
+def write_playlist(urls: Iterable[str]) -> Path:
+    """
+    Write ``urls`` to a new playlist file.
+
+    mpv reads the file some time after the command is sent, so files are not removed straight away.
+    Files older than ``PLAYLIST_TTL`` are removed instead.
+
+    Returns
+    -------
+    Path
+        The playlist file.
+    """
+    playlist_dir = _playlist_dir()
+    playlist_dir.mkdir(parents=True, exist_ok=True)
+    cutoff = time.time() - PLAYLIST_TTL
+    for old in playlist_dir.glob('*.m3u'):
+        _remove_older(old, cutoff)
+    path = playlist_dir / f'{os.getpid()}-{time.monotonic_ns()}.m3u'
+    path.write_text(''.join(f'{url}\n' for url in urls), encoding='utf-8')
+    return path
+
+
+def loadfile(url: str,
+             flag: str,
+             options: Mapping[str, str] | None = None) -> list[str] | dict[str, Any]:
+    """
+    Get a ``loadfile`` command.
+
+    With ``options``, the command uses named arguments, because mpv 0.38 added an argument before
+    the options.
+
+    Returns
+    -------
+    list[str] | dict[str, Any]
+        The command.
+    """
+    if not options:
+        return ['loadfile', url, flag]
+    return {'name': 'loadfile', 'url': url, 'flags': flag, 'options': dict(options)}
+
+
+def commands(urls: Sequence[str],
+             *,
+             mode: str = 'append',
+             playlist: str | None = None,
+             options: Mapping[str, str] | None = None) -> list[list[str] | dict[str, Any]]:
+    """
+    Get the commands that add a batch to a running instance.
+
+    ``playlist`` is a playlist file or URL that is loaded after ``urls``. With ``mode`` set to
+    ``replace``, the first item replaces the current playlist. Otherwise items are appended and
+    playback starts if the instance is idle. ``options`` are per-file options for the first URL.
+
+    Returns
+    -------
+    list[list[str] | dict[str, Any]]
+        The commands, in order.
+    """
+    flag = 'replace' if mode == 'replace' else 'append-play'
+    ret: list[list[str] | dict[str, Any]] = []
+    if options and urls:
+        ret.append(loadfile(urls[0], flag, options))
+        urls = urls[1:]
+        flag = 'append-play'
+    if len(urls) > LOADLIST_THRESHOLD:
+        ret.append(['loadlist', str(write_playlist(urls)), flag])
+        flag = 'append-play'
+    else:
+        for url in urls:
+            ret.append(loadfile(url, flag))
+            flag = 'append-play'
+    if playlist:
+        ret.append(['loadlist', playlist, flag])
+    return ret
+
+
+def args(urls: Sequence[str], *, playlist: str | None = None) -> list[str]:
+    """
+    Get the command line arguments that make a new instance play a batch.
+
+    Returns
+    -------
+    list[str]
+        Arguments to add after the first URL, if there is one.
+    """
+    ret = ([f'--playlist={write_playlist(urls)}']
+           if len(urls) > LOADLIST_THRESHOLD else list(urls))
+    if playlist:
+        ret.append(f'--playlist={playlist}')
+    return ret
+
+
+def send(commands: Iterable[Sequence[Any] | Mapping[str, Any]],
+         path: Path | str = MPV_SOCKET,
+         *,
+         timeout: float | None = 2) -> None:
+    """
+    Send ``commands`` to the instance at ``path`` in one write without waiting for the replies.
+
+    Raises
+    ------
+    OSError
+        If the instance cannot be reached.
+    """  # ruff:ignore[docstring-extraneous-exception]
+    data = b''.join(
+        json.dumps({
+            'command': command if isinstance(command, dict) else list(command)
+        }).encode(errors='strict') + b'\n' for command in commands)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+        sock.settimeout(None)
+        sock.sendall(data)
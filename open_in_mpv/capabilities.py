@@ -0,0 +1,264 @@
+"""
+What the installed mpv supports.
+
+mpv builds differ in the options, video outputs and hardware decoders they have, and mpv refuses to
+start when given an option it does not know. :py:func:`probe` asks an mpv binary with
+``--version``, ``--list-options`` and the ``help`` values of ``--vo``, ``--hwdec`` and
+``--gpu-api``. That takes several mpv start-ups, so it is done once per binary, in the background
+(``python -m open_in_mpv.capabilities MPV``), and the result is cached in
+``MPV_CAPABILITIES_PATH`` with the path, modification time and size of the binary. Replacing or
+upgrading mpv invalidates the entry.
+
+:py:func:`profile` builds the options the host always passes from the cached result, and
+:py:meth:`Capabilities.supports` is used to drop any other option the binary would reject. Without
+a cached result, every option is assumed to be supported.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from shutil import which
+from typing import TYPE_CHECKING, NamedTuple
+import json
+import logging
+import os
+import re
+import subprocess as sp
+import sys
+
+from .constants import IS_WIN, MPV_CAPABILITIES_PATH
+
+if TYPE_CHECKING:
+    from collections.abc import Collection, Iterable, Sequence
+
+__all__ = ('PROBE_TIMEOUT', 'PROFILE', 'Capabilities', 'command', 'load', 'main', 'probe',
+           'profile', 'resolve', 'store')
+
+PROBE_TIMEOUT = 10.0
+"""Seconds each mpv run of the probe may take."""
+PROFILE = ('--gpu-api=opengl', '--player-operation-mode=pseudo-gui')
+"""Options passed to every instance when the binary supports them."""
+
+_LIST_SUFFIXES = ('-add', '-append', '-clr', '-pre', '-remove', '-set', '-toggle')
+_OPTION_RE = re.compile(r'^ --([\w-]+)', re.MULTILINE)
+
+log = logging.getLogger(__name__)
+
+
+class Capabilities(NamedTuple):
+    """What an mpv binary supports."""
+    path: str
+    """Resolved path of the binary."""
+    mtime: int
+    """Modification time of the binary in nanoseconds."""
+    size: int
+    """Size of the binary in bytes."""
+    version: str
+    """First line of ``mpv --version``."""
+    options: Collection[str]
+    """Option names without the leading ``--``."""
+    vos: Sequence[str] = ()
+    """Video outputs."""
+    hwdecs: Sequence[str] = ()
+    """Hardware decoding modes."""
+    gpu_apis: Sequence[str] = ()
+    """GPU APIs."""
+
+    def supports(self, arg: str) -> bool:
+        """
+        Check whether the binary accepts command line argument ``arg``.
+
+        Arguments that are not ``--`` options are accepted. Values are checked for ``--vo``,
+        ``--hwdec`` and ``--gpu-api``.
+
+        Returns
+        -------
+        bool
+            ``False`` if mpv would reject the argument.
+        """
+        if not arg.startswith('--') or arg in {'--', '--{', '--}'}:
+            return True
+        name, _, value = arg[2:].partition('=')
+        if name not in self.options:
+            base = next((name.removesuffix(x) for x in _LIST_SUFFIXES if name.endswith(x)),
+                        name.removeprefix('no-'))
+            if base not in self.options:
+                return False
+            name = base
+        choices = {'gpu-api': self.gpu_apis, 'hwdec': self.hwdecs, 'vo': self.vos}.get(name)
+        return not choices or not value or all(x in choices for x in value.split(',') if x)
+
+    def filter(self, args: Iterable[str]) -> list[str]:
+        """
+        Remove the arguments the binary would reject.
+
+        Returns
+        -------
+        list[str]
+            The supported arguments, in order.
+        """
+        ret = []
+        for arg in args:
+            if self.supports(arg):
+                ret.append(arg)
+            else:
+                log.warning('%s does not support %s. Leaving it out.', self.path, arg)
+        return ret
+
+
+def resolve(mpv: str, path: str | None = None) -> Path | None:
+    """
+    Find the binary that ``mpv`` runs with ``PATH`` set to ``path``.
+
+    Returns
+    -------
+    Path | None
+        The resolved path, or ``None`` if it is not found.
+    """
+    if (found := which(mpv, path=path)) is None:
+        return None
+    return Path(found).resolve()
+
+
+def _read(cache_path: Path) -> dict[str, dict[str, object]]:
+    try:
+        data = json.loads(cache_path.read_bytes())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        log.warning('Ignoring invalid capability cache %s.', cache_path)
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def load(mpv_path: Path, *, cache_path: Path | None = None) -> Capabilities | None:
+    """
+    Get the cached capabilities of ``mpv_path`` without running it.
+
+    Returns
+    -------
+    Capabilities | None
+        The capabilities, or ``None`` if they were not probed since the binary last changed.
+    """
+    try:
+        stat = mpv_path.stat()
+        data = _read(cache_path or MPV_CAPABILITIES_PATH)[str(mpv_path)]
+        caps = Capabilities(**data)  # type: ignore[arg-type]
+    except (KeyError, OSError, TypeError):
+        return None
+    if (caps.mtime, caps.size) != (stat.st_mtime_ns, stat.st_size):
+        log.debug('%s changed since it was probed.', mpv_path)
+        return None
+    return caps._replace(options=frozenset(caps.options))
+
+
+def _run(mpv_path: Path, *args: str) -> str:
+    try:
+        # mpv prints help to standard output or standard error depending on the version.
+        return sp.run((str(mpv_path), '--no-config', *args),
+                      check=False,
+                      stdin=sp.DEVNULL,
+                      stdout=sp.PIPE,
+                      stderr=sp.STDOUT,
+                      text=True,
+                      errors='replace',
+                      timeout=PROBE_TIMEOUT).stdout
+    except (OSError, sp.TimeoutExpired):
+        log.warning('Running %s %s failed.', mpv_path, ' '.join(args))
+        return ''
+
+
+def _values(output: str) -> list[str]:
+    # Help output is a heading followed by indented lines that start with a value.
+    return [line.split()[0] for line in output.splitlines() if line[:1].isspace() and line.strip()]
+
+
+def probe(mpv_path: Path) -> Capabilities:
+    """
+    Run ``mpv_path`` to find out what it supports.
+
+    Returns
+    -------
+    Capabilities
+        The capabilities.
+    """
+    stat = mpv_path.stat()
+    version = _run(mpv_path, '--version').strip().partition('\n')[0]
+    return Capabilities(str(mpv_path), stat.st_mtime_ns, stat.st_size, version,
+                        frozenset(_OPTION_RE.findall(_run(mpv_path, '--list-options'))),
+                        _values(_run(mpv_path, '--vo=help')),
+                        _values(_run(mpv_path, '--hwdec=help')),
+                        _values(_run(mpv_path, '--gpu-api=help')))
+
+
+def store(caps: Capabilities, *, cache_path: Path | None = None) -> None:
+    """Add or replace the cached capabilities of ``caps.path``."""
+    cache_path = cache_path or MPV_CAPABILITIES_PATH
+    data = _read(cache_path)
+    data[caps.path] = caps._replace(options=sorted(caps.options))._asdict()
+    tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}')
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(json.dumps(data), encoding='utf-8')
+        tmp_path.replace(cache_path)
+    except OSError:
+        log.warning('Failed to write the capability cache %s.', cache_path)
+        tmp_path.unlink(missing_ok=True)
+
+
+def profile(caps: Capabilities | None,
+            *,
+            debug: bool = False,
+            gpu_api: bool = True) -> list[str]:
+    """
+    Get the options passed to every instance.
+
+    Without ``gpu_api``, ``--gpu-api`` is left out. It is not passed on Windows.
+
+    Returns
+    -------
+    list[str]
+        ``PROFILE`` without the options ``caps`` does not support, and the verbosity option.
+    """
+    args = [x for x in PROFILE if gpu_api or not x.startswith('--gpu-api=')]
+    return [*(caps.filter(args) if caps else args), '-v' if debug else '--quiet']
+
+
+def command(mpv_path: Path) -> list[str]:
+    """
+    Get the command line that probes ``mpv_path`` and caches the result.
+
+    Returns
+    -------
+    list[str]
+        The command line.
+    """
+    return [sys.executable, '-m', __name__, str(mpv_path)]
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """
+    Probe the mpv binary given as the only argument and cache the result.
+
+    Does nothing if another probe is running or the result is already cached.
+    """
+    mpv_path = Path((sys.argv[1:] if argv is None else argv)[0])
+    MPV_CAPABILITIES_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with MPV_CAPABILITIES_PATH.with_name(f'{MPV_CAPABILITIES_PATH.name}.lock').open('a') as lock:
+        if not IS_WIN:
+            import fcntl  # ruff:ignore[import-outside-top-level]
+
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                log.debug('Another probe is running.')
+                return
+        if load(mpv_path) is not None:
+            return
+        if not (caps := probe(mpv_path)).options:
+            log.warning('%s did not list any options. Not caching.', mpv_path)
+            return
+        store(caps)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Click command for the native messaging host."""
+from __future__ import annotations
+
+from typing import BinaryIO, cast
+import sys
+
+from open_in_mpv import __version__ as VERSION  # ruff:ignore[lowercase-imported-as-non-lowercase]
+from typing_extensions import override
+import click
+
+from .main import host
+
+__all__ = ('main',)
+
+
+class CustomHelp(click.Command):
+    @override
+    def format_help(self, ctx: click.Context, formatter: click.formatting.HelpFormatter) -> None:
+        click.echo('This script is intended to be used with the '
+                   'Chrome extension. There is no CLI interface for general use.')
+        super().format_help(ctx, formatter)
+
+
+@click.command(cls=CustomHelp,
+               context_settings={
+                   'allow_extra_args': True,
+                   'help_option_names': ('-h', '--help')
+               })
+@click.argument('chrome_url')
+@click.argument('message', type=click.File('rb'), default=sys.stdin.buffer)
+@click.option('-d', '--debug', help='Enable debug logging.', is_flag=True)
+@click.version_option(VERSION, '-V', '--version', message='%(version)s')
+def main(
+        chrome_url: str,  # ruff: ignore[unused-function-argument]
+        message: BinaryIO,
+        *,
+        debug: bool = False) -> None:
+    """
+    Open a URL in mpv; read a 4-byte length prefix and JSON message from standard input.
+
+    If the first message has ``"persistent": true``, keep reading messages until standard input is
+    closed or no message arrives within ``idleTimeout`` seconds.
+    """  # ruff:ignore[docstring-missing-exception]
+    # Read without Python-level buffering so select() sees every pending frame in persistent mode.
+    try:
+        host(cast('BinaryIO', getattr(message, 'raw', message)), debug=debug)
+    except ValueError as exc:
+        raise click.Abort from exc
@@ -0,0 +1,182 @@
+"""
+Framing for native messages.
+
+Each message is a JSON document preceded by its length as a native-endian 32-bit integer. Chrome
+and Firefox do not accept messages from a host larger than ``MAX_RESPONSE_SIZE``, so larger
+responses are refused here instead of making the browser disconnect the port. JSON is handled by
+:py:mod:`json` unless :py:func:`use_fast_backend` is called.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, cast
+import json
+import struct
+
+if TYPE_CHECKING:
+    from typing import IO, BinaryIO
+
+__all__ = ('HEADER', 'MAX_REQUEST_SIZE', 'MAX_RESPONSE_SIZE', 'FrameError', 'FrameTooLargeError',
+           'MalformedFrameError', 'dumps', 'encode', 'loads', 'read', 'use_fast_backend', 'write')
+
+HEADER = struct.Struct('@i')
+"""Length prefix of each message."""
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+"""Largest message the browser sends to a host."""
+MAX_RESPONSE_SIZE = 1024 * 1024
+"""Largest message the browser accepts from a host."""
+
+
+class FrameError(ValueError):
+    """A message could not be read or written."""
+    code = 'invalid-frame'
+    """Identifier sent back to the extension with the error."""
+
+
+class FrameTooLargeError(FrameError):
+    """A message is larger than the browser allows."""
+    code = 'frame-too-large'
+
+
+class MalformedFrameError(FrameError):
+    """A message is not valid JSON or does not match the expected schema."""
+    code = 'malformed-frame'
+
+
+def _json_dumps(data: Any) -> bytes:
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+_backend: dict[str, Any] = {
+    'name': 'json',
+    'dumps': _json_dumps,
+    'loads': json.loads,
+    'error': ValueError
+}
+
+
+def use_fast_backend() -> str:
+    """
+    Use orjson or msgspec for JSON if either is installed.
+
+    Importing either takes longer than decoding a few small messages with :py:mod:`json`, so this
+    is only worth it for a host that stays running.
+
+    Returns
+    -------
+    str
+        The name of the backend now in use.
+    """
+    try:
+        import orjson  # ruff:ignore[import-outside-top-level]
+        _backend.update(name='orjson', dumps=orjson.dumps, loads=orjson.loads)
+    except ImportError:
+        try:
+            import msgspec  # ruff:ignore[import-outside-top-level]
+            _backend.update(name='msgspec',
+                            dumps=msgspec.json.encode,
+                            loads=msgspec.json.decode,
+                            error=msgspec.DecodeError)
+        except ImportError:
+            pass
+    return cast('str', _backend['name'])
+
+
+def dumps(data: Any) -> bytes:
+    """
+    Encode ``data`` as JSON.
+
+    Returns
+    -------
+    bytes
+        The JSON.
+    """
+    return cast('bytes', _backend['dumps'](data))
+
+
+def loads(data: bytes) -> Any:
+    """
+    Decode JSON ``data``.
+
+    Returns
+    -------
+    Any
+        The decoded value.
+    """
+    return _backend['loads'](data)
+
+
+def _read_exactly(buffer: IO[bytes], size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        if not (chunk := buffer.read(size - len(data))):
+            break
+        data += chunk
+    return bytes(data)
+
+
+def read(buffer: IO[bytes]) -> Any:
+    """
+    Read and decode one message.
+
+    Short reads are retried until the whole message has been read.
+
+    Returns
+    -------
+    Any
+        The decoded JSON.
+
+    Raises
+    ------
+    EOFError
+        If the stream is closed before a complete message is read.
+    FrameTooLargeError
+        If the length prefix is negative or larger than ``MAX_REQUEST_SIZE``. The stream cannot be
+        read any further.
+    MalformedFrameError
+        If the message is not valid JSON.
+    """
+    if len(header := _read_exactly(buffer, HEADER.size)) < HEADER.size:
+        raise EOFError
+    size = HEADER.unpack(header)[0]
+    if not 0 <= size <= MAX_REQUEST_SIZE:
+        msg = f'Invalid message length: {size}.'
+        raise FrameTooLargeError(msg)
+    if len(body := _read_exactly(buffer, size)) < size:
+        raise EOFError
+    try:
+        return loads(body)
+    except (ValueError, _backend['error']) as e:
+        msg = f'Invalid JSON: {e}'
+        raise MalformedFrameError(msg) from e
+
+
+def encode(data: Any) -> bytes:
+    """
+    Encode ``data`` as a complete message.
+
+    Returns
+    -------
+    bytes
+        The length prefix followed by the JSON.
+
+    Raises
+    ------
+    FrameTooLargeError
+        If the message would be larger than ``MAX_RESPONSE_SIZE``.
+    """
+    body = dumps(data)
+    if len(body) > MAX_RESPONSE_SIZE:
+        msg = f'Response is {len(body)} bytes, more than the limit of {MAX_RESPONSE_SIZE}.'
+        raise FrameTooLargeError(msg)
+    return HEADER.pack(len(body)) + body
+
+
+def write(buffer: BinaryIO, data: Any) -> None:
+    """
+    Write ``data`` to ``buffer`` as one message with a single write, and flush it.
+
+    If the message would be larger than ``MAX_RESPONSE_SIZE``, the :py:exc:`FrameTooLargeError`
+    from :py:func:`encode` is raised and nothing is written.
+    """
+    buffer.write(encode(data))
+    buffer.flush()
@@ -0,0 +1,103 @@
+"""
+Process that collects playback quality telemetry for an instance.
+
+The host starts this next to an instance when telemetry, cache tuning or the format policy is
+enabled. It observes :py:data:`open_in_mpv.telemetry.PROPERTIES` over IPC, keeps a
+:py:class:`open_in_mpv.telemetry.Session` for the current file and, when the file ends or mpv
+exits, writes it and passes it to :py:func:`open_in_mpv.tuning.observe` and
+:py:func:`open_in_mpv.formats.observe` as enabled. Only one collector runs per instance (see
+:py:mod:`open_in_mpv.companion`). Run as
+``python -m open_in_mpv.collector ADDRESS [--no-telemetry] [--tune] [--formats]``.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import functools
+import sys
+
+from . import companion, formats, telemetry, tuning
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping, Sequence
+
+__all__ = ('Collector', 'main')
+
+
+class Collector(companion.Companion):
+    """
+    Turn the properties of one instance into telemetry records.
+
+    Parameters
+    ----------
+    write : bool
+        Write the records to ``TELEMETRY_PATH``.
+    tune : bool
+        Update the cache tuning profiles with the records.
+    formats : bool
+        Update the format records with the records.
+    """
+    properties = telemetry.PROPERTIES
+    file_properties = ('path', 'script-opts', 'video-format', 'height', 'hwdec-current')
+
+    def __init__(self, *, write: bool = True, tune: bool = False, formats: bool = False) -> None:
+        self.write = write
+        """Write the records to ``TELEMETRY_PATH``."""
+        self.tune = tune
+        """Update the cache tuning profiles with the records."""
+        self.formats = formats
+        """Update the format records with the records."""
+        self.session: telemetry.Session | None = None
+        """Session of the current file."""
+
+    def file_loaded(self, properties: Mapping[str, Any]) -> None:
+        """Start a session."""
+        self.close()
+        video_format = properties.get('video-format') or ''
+        if video_format and isinstance(height := properties.get('height'), int):
+            video_format = f'{video_format} {height}p'
+        hwdec = properties.get('hwdec-current') or ''
+        self.session = telemetry.Session(
+            companion.page_url(properties) or properties['path'], video_format,
+            '' if hwdec == 'no' else hwdec)
+
+    def property_change(self, name: str, value: Any) -> None:
+        """Pass the value to the current session."""
+        if self.session is not None:
+            self.session.update(name, value)
+
+    def event(self, event: Mapping[str, Any]) -> None:
+        """Write the session when the file ends."""
+        if event['event'] == 'end-file':
+            self.close()
+
+    def close(self) -> None:
+        """Write the current session, if there is one."""
+        if self.session is not None:
+            record = self.session.record()
+            self.session = None
+            if self.write:
+                telemetry.write(record)
+            if self.tune:
+                tuning.observe(record)
+            if self.formats:
+                formats.observe(record)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """
+    Collect telemetry for the instance at the address given as the first argument.
+
+    ``--no-telemetry`` keeps the records from being written, ``--tune`` updates the cache tuning
+    profiles with them and ``--formats`` updates the format records.
+    """
+    address, *flags = sys.argv[1:] if argv is None else argv
+    companion.run(
+        'collector', address,
+        functools.partial(Collector,
+                          write='--no-telemetry' not in flags,
+                          tune='--tune' in flags,
+                          formats='--formats' in flags))
+
+
+if __name__ == '__main__':
+    main()
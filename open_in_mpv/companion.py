@@ -0,0 +1,152 @@
+"""
+Processes that follow one instance over IPC until it exits.
+
+The host starts a companion next to an instance when a feature needs to see what mpv does after
+the host has exited, such as the history recorder (:py:mod:`open_in_mpv.recorder`). Each kind is a
+:py:class:`Companion` subclass run with :py:func:`run`, which holds the lock from
+:py:func:`open_in_mpv.instance.companion_lock` so there is at most one of each kind per instance.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, ClassVar
+import asyncio
+import logging
+import os
+import re
+import time
+
+from . import instance
+from .ipc import MpvClient, MpvCommandError
+from .urls import PAGE_OPTION, canonical_url
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping, Sequence
+    from pathlib import Path
+
+__all__ = ('CONNECT_TIMEOUT', 'Companion', 'follow', 'page_url', 'run')
+
+CONNECT_TIMEOUT = 60.0
+"""Seconds to wait for the instance to accept connections."""
+
+log = logging.getLogger(__name__)
+
+
+def page_url(properties: Mapping[str, Any]) -> str | None:
+    """
+    Get the canonical page URL of a file from its ``path`` and ``script-opts`` properties.
+
+    Returns
+    -------
+    str | None
+        The URL, or ``None`` if the file is not a web page or stream.
+    """
+    script_opts = properties.get('script-opts')
+    url = (script_opts if isinstance(script_opts, dict) else {}).get(PAGE_OPTION) or properties.get(
+        'path')
+    return canonical_url(url) if isinstance(url, str) and re.match(r'^https?://', url) else None
+
+
+class Companion:
+    """
+    What a companion does with the events of an instance. The methods do nothing by default.
+
+    Property and event callbacks run on the event loop and must not block.
+    """
+    properties: ClassVar[Sequence[str]] = ()
+    """Properties passed to :py:meth:`property_change` whenever they change."""
+    file_properties: ClassVar[Sequence[str]] = ('path', 'script-opts')
+    """Properties passed to :py:meth:`file_loaded`."""
+
+    def property_change(self, name: str, value: Any) -> None:
+        """Handle a change of one of ``properties``."""
+
+    def file_loaded(self, properties: Mapping[str, Any]) -> None:
+        """
+        Handle a file being loaded, with the values of ``file_properties``.
+
+        Also called after connecting if a file is already loaded. Properties mpv could not get are
+        left out.
+        """
+
+    def event(self, event: Mapping[str, Any]) -> None:
+        """Handle any other event message."""
+
+    def close(self) -> None:
+        """Finish after the instance exited or could not be reached."""
+
+
+async def _file_loaded(client: MpvClient, companion: Companion) -> None:
+    values = await client.commands([('get_property', x) for x in companion.file_properties],
+                                   return_exceptions=True)
+    properties = {
+        k: v
+        for k, v in zip(companion.file_properties, values, strict=True)
+        if not isinstance(v, BaseException)
+    }
+    if isinstance(properties.get('path'), str):
+        companion.file_loaded(properties)
+
+
+async def _pass_events(client: MpvClient, companion: Companion,
+                       events: asyncio.Queue[dict[str, Any]], closed: asyncio.Future[Any]) -> None:
+    for name in companion.properties:
+        await client.observe_property(name, companion.property_change)
+    # A file may have been loaded before the connection was made.
+    await _file_loaded(client, companion)
+    while True:
+        get = asyncio.ensure_future(events.get())
+        await asyncio.wait((get, closed), return_when=asyncio.FIRST_COMPLETED)
+        if not get.done():
+            get.cancel()
+            return
+        if (event := get.result())['event'] == 'file-loaded':
+            await _file_loaded(client, companion)
+        elif event['event'] != 'property-change':
+            companion.event(event)
+
+
+async def follow(address: Path | str,
+                 companion: Companion,
+                 *,
+                 timeout: float = CONNECT_TIMEOUT) -> None:
+    """Pass what the instance at ``address`` does to ``companion`` until it exits."""
+    events: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+    client = MpvClient(instance.connect_address(address))
+    client.add_event_handler(None, events.put_nowait)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.connect()
+            break
+        except (OSError, asyncio.TimeoutError):
+            if time.monotonic() >= deadline:
+                log.debug('Instance at %s never became reachable.', address)
+                return
+            await asyncio.sleep(0.05)
+    closed = asyncio.ensure_future(client.wait_closed())
+    try:
+        await _pass_events(client, companion, events, closed)
+    except (ConnectionError, MpvCommandError, asyncio.TimeoutError):
+        log.debug('Lost the connection to %s.', address)
+    finally:
+        closed.cancel()
+        await client.close()
+
+
+def run(name: str, address: str, factory: Callable[[], Companion]) -> None:
+    """
+    Follow the instance at ``address`` with the companion ``factory`` makes.
+
+    Does nothing if a ``name`` companion is already running for the instance.
+    """
+    if (lock := instance.companion_lock(address, name)) is None:
+        log.debug('A %s is already running for %s.', name, address)
+        return
+    try:
+        companion = factory()
+        try:
+            asyncio.run(follow(address, companion))
+        finally:
+            companion.close()
+    finally:
+        os.close(lock)
@@ -1,17 +1,32 @@
-"""Constants."""
+"""
+Constants.
+
+Only values needed to handle a ``url`` message are computed at import time. The native host
+directory lists are computed on first access.
+"""
 from __future__ import annotations
 
+from typing import TYPE_CHECKING, Any
 import os
-import platform
+import sys
 
-from platformdirs import user_config_dir, user_log_path, user_runtime_path
+from platformdirs import (
+    user_cache_path,
+    user_config_dir,
+    user_data_path,
+    user_log_path,
+    user_runtime_path,
+)
 
-__all__ = ('HOST_DATA', 'HOST_DATA_FIREFOX', 'IS_LINUX', 'IS_MAC', 'IS_WIN', 'JSON_FILENAME',
-           'LOG_PATH', 'MAC_SYSTEM_HOSTS_DIRS', 'MAC_USER_HOSTS_DIRS', 'MPV_LOG_PATH', 'MPV_SOCKET',
-           'SYSTEM_HOSTS_DIRS', 'USER_CHROME_HOSTS_REG_PATH_WIN', 'USER_HOSTS_DIRS')
+__all__ = ('FORMATS_PATH', 'HISTORY_PATH', 'HOST_DATA', 'HOST_DATA_FIREFOX', 'IS_LINUX', 'IS_MAC',
+           'IS_WIN', 'JSON_FILENAME', 'LOG_PATH', 'MAC_SYSTEM_HOSTS_DIRS', 'MAC_USER_HOSTS_DIRS',
+           'METRICS_PATH', 'MPV_CAPABILITIES_PATH', 'MPV_CRASH_LOG_PATH', 'MPV_INSTANCES_DIR',
+           'MPV_LOG_PATH', 'MPV_POOL_DIR', 'MPV_SOCKET', 'RESOLVER_SOCKET', 'STREAM_CACHE_DIR',
+           'SYSTEM_HOSTS_DIRS', 'TELEMETRY_PATH', 'TUNING_PATH', 'USER_CHROME_HOSTS_REG_PATH_WIN',
+           'USER_HOSTS_DIRS')
 
-IS_MAC = bool(platform.mac_ver()[0])
-IS_WIN = bool(platform.win32_ver()[0])
+IS_MAC = sys.platform == 'darwin'
+IS_WIN = sys.platform == 'win32'
 IS_LINUX = not IS_MAC and not IS_WIN
 
 JSON_FILENAME = 'sh.tat.open_in_mpv.json'
@@ -31,12 +46,10 @@ MACPORTS_BIN_PATH = '/opt/local/bin'
 SYSTEM_HOSTS_DIRS = ('/etc/chromium/native-messaging-hosts',
                      '/etc/opt/chrome/native-messaging-hosts',
                      '/etc/opt/edge/native-messaging-hosts')
-USER_HOSTS_DIRS = (f'{user_config_dir()}/BraveSoftware/Brave-Browser/NativeMessagingHosts',
-                   f'{user_config_dir()}/chromium/NativeMessagingHosts',
-                   f'{user_config_dir()}/google-chrome-beta/NativeMessagingHosts',
-                   f'{user_config_dir()}/google-chrome-canary/NativeMessagingHosts',
-                   f'{user_config_dir()}/google-chrome/NativeMessagingHosts',
-                   f'{user_config_dir()}/.mozilla/native-messaging-hosts')
+_USER_HOSTS_SUBDIRS = ('BraveSoftware/Brave-Browser/NativeMessagingHosts',
+                       'chromium/NativeMessagingHosts', 'google-chrome-beta/NativeMessagingHosts',
+                       'google-chrome-canary/NativeMessagingHosts',
+                       'google-chrome/NativeMessagingHosts', '.mozilla/native-messaging-hosts')
 
 COMMON_HOST_DATA = {
     'description': 'Opens a URL in mpv (for use with extension).',
@@ -52,11 +65,31 @@ HOST_DATA_FIREFOX = COMMON_HOST_DATA | {
     'name': 'sh.tat.open-in-mpv'
 }
 
-try:
-    _LOG_DIR_PATH = user_log_path('open-in-mpv', ensure_exists=True)
-    MPV_SOCKET = user_runtime_path('open-in-mpv', ensure_exists=True) / 'open-in-mpv.sock'
-except PermissionError:  # pragma: no cover
-    _LOG_DIR_PATH = user_log_path('open-in-mpv')
-    MPV_SOCKET = user_runtime_path('open-in-mpv') / 'open-in-mpv.sock'
+# These directories are created when they are first written to, not here.
+_LOG_DIR_PATH = user_log_path('open-in-mpv')
+MPV_SOCKET = user_runtime_path('open-in-mpv') / 'open-in-mpv.sock'
+MPV_POOL_DIR = MPV_SOCKET.parent / 'pool'
+MPV_INSTANCES_DIR = MPV_SOCKET.parent / 'instances'
+RESOLVER_SOCKET = MPV_SOCKET.parent / 'resolver.sock'
 LOG_PATH = _LOG_DIR_PATH / 'main.log'
 MPV_LOG_PATH = _LOG_DIR_PATH / 'mpv.log'
+MPV_CRASH_LOG_PATH = _LOG_DIR_PATH / 'mpv-crash.log'
+METRICS_PATH = _LOG_DIR_PATH / 'metrics.jsonl'
+TELEMETRY_PATH = _LOG_DIR_PATH / 'telemetry.jsonl'
+STREAM_CACHE_DIR = user_cache_path('open-in-mpv') / 'streams'
+MPV_CAPABILITIES_PATH = user_cache_path('open-in-mpv') / 'mpv-capabilities.json'
+TUNING_PATH = user_cache_path('open-in-mpv') / 'tuning.json'
+FORMATS_PATH = user_cache_path('open-in-mpv') / 'formats.json'
+HISTORY_PATH = user_data_path('open-in-mpv') / 'history.sqlite3'
+
+if TYPE_CHECKING:
+    USER_HOSTS_DIRS: tuple[str, ...]
+
+
+def __getattr__(name: str) -> Any:
+    if name == 'USER_HOSTS_DIRS':
+        config_dir = user_config_dir()
+        value = globals()[name] = tuple(f'{config_dir}/{x}' for x in _USER_HOSTS_SUBDIRS)
+        return value
+    msg = f'module {__name__!r} has no attribute {name!r}'
+    raise AttributeError(msg)
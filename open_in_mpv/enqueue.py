@@ -0,0 +1,153 @@
+"""Command-line tool to add URLs from standard input to the running instance."""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+import asyncio
+import logging
+import sys
+
+from bascom import setup_logging
+import click
+
+from . import batch, instance
+from .constants import IS_WIN, MPV_SOCKET
+from .ipc import MpvClient
+
+if TYPE_CHECKING:
+    from typing import TextIO
+
+__all__ = ('enqueue', 'main')
+
+START_TIMEOUT = 10.0
+"""Seconds to wait for a new instance to accept connections."""
+
+log = logging.getLogger(__name__)
+
+
+async def _read(stream: TextIO, queue: asyncio.Queue[str | None]) -> None:
+    while line := await asyncio.to_thread(stream.readline):
+        if (url := line.strip()) and not url.startswith('#'):
+            # Blocks while the queue is full, so a fast producer waits for mpv.
+            await queue.put(url)
+    await queue.put(None)
+
+
+async def enqueue(stream: TextIO,
+                  client: MpvClient,
+                  *,
+                  batch_size: int = batch.LOADLIST_THRESHOLD,
+                  mode: str = 'append') -> tuple[int, int]:
+    """
+    Add URLs read from ``stream`` to the playlist of the instance behind ``client``.
+
+    URLs are sent as soon as they are read, in batches of up to ``batch_size``. The next batch is
+    not sent until mpv has answered the previous one, and at most ``batch_size`` URLs are read
+    ahead. With ``mode`` set to ``replace``, the first batch replaces the current playlist.
+
+    Returns
+    -------
+    tuple[int, int]
+        The number of URLs sent and the number of commands mpv rejected.
+    """
+    queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize=batch_size)
+    reader = asyncio.create_task(_read(stream, queue))
+    sent = failed = 0
+    done = False
+    while not done:
+        items = [await queue.get()]
+        while len(items) < batch_size and not queue.empty():
+            items.append(queue.get_nowait())
+        done = items[-1] is None
+        urls = [x for x in items if x is not None]
+        if not urls:
+            continue
+        log.debug('Sending %d URLs.', len(urls))
+        results = await client.commands(batch.commands(urls, mode=mode), return_exceptions=True)
+        failed += sum(1 for x in results if isinstance(x, Exception))
+        sent += len(urls)
+        mode = 'append'
+    await reader
+    return sent, failed
+
+
+async def _connect(client: MpvClient, wait: float = 0) -> None:
+    if wait:
+        await asyncio.to_thread(instance.wait, Path(client.path), wait)
+    await client.connect()
+
+
+def _start_instance(*, debug: bool) -> bool:
+    from .main import environment, launch, mpv_command  # ruff:ignore[import-outside-top-level]
+
+    # Checking and starting under the host's launch lock keeps this and a concurrent request from
+    # both starting an instance.
+    with instance.LaunchLock(MPV_SOCKET) as lock:
+        existed = MPV_SOCKET.exists()
+        if (running := instance.is_running(MPV_SOCKET)) or existed:
+            # The last instance started is up, or its socket is stale.
+            lock.clear()
+        if running:
+            return False
+        if lock.starting():
+            log.debug('Another process is starting mpv. Waiting for it.')
+            return True
+        log.debug('Starting mpv.')
+        pid = launch(
+            mpv_command(None, debug=debug, extra_args=('--idle=once', '--force-window=yes')),
+            environment({}, debugging=False),
+            drain=True)
+        instance.write_owner(MPV_SOCKET, pid)
+        lock.mark(pid)
+    return True
+
+
+@click.command(context_settings={'help_option_names': ('-h', '--help')})
+@click.option('-b',
+              '--batch-size',
+              default=batch.LOADLIST_THRESHOLD,
+              help='Maximum number of URLs sent and read ahead at once.',
+              type=click.IntRange(1))
+@click.option('-d', '--debug', help='Enable debug logging.', is_flag=True)
+@click.option('--no-start', help='Fail instead of starting mpv if it is not running.', is_flag=True)
+@click.option('-r', '--replace', help='Replace the current playlist.', is_flag=True)
+def main(*,
+         batch_size: int = batch.LOADLIST_THRESHOLD,
+         debug: bool = False,
+         no_start: bool = False,
+         replace: bool = False) -> None:
+    """
+    Add URLs from standard input to the playlist of the running mpv instance.
+
+    One URL per line. Blank lines and lines starting with ``#`` are ignored.
+    """  # ruff:ignore[docstring-missing-exception]
+    setup_logging(debug=debug,
+                  loggers={'open_in_mpv': {
+                      'handlers': ('console',),
+                      'propagate': False
+                  }})
+    if IS_WIN:
+        click.echo('Not supported on Windows.', err=True)
+        raise click.Abort
+    wait = START_TIMEOUT if not no_start and _start_instance(debug=debug) else 0.0
+
+    async def run() -> tuple[int, int]:
+        client = MpvClient(MPV_SOCKET)
+        try:
+            await _connect(client, wait)
+            return await enqueue(sys.stdin,
+                                 client,
+                                 batch_size=batch_size,
+                                 mode='replace' if replace else 'append')
+        finally:
+            await client.close()
+
+    try:
+        sent, failed = asyncio.run(run())
+    except (OSError, asyncio.TimeoutError) as e:
+        click.echo(f'Could not connect to mpv: {e}', err=True)
+        raise click.Abort from e
+    log.debug('Sent %d URLs, %d failed.', sent, failed)
+    if failed:
+        click.echo(f'mpv rejected {failed} of {sent} URLs.', err=True)
+        raise click.exceptions.Exit(1)
@@ -0,0 +1,212 @@
+"""
+Format selection learnt per site and machine, and capped to the screen.
+
+mpv's ``ytdl_hook`` asks yt-dlp for the best format, which may be a codec this machine cannot
+decode without dropping frames or a resolution far larger than the screen. With the format policy
+enabled, the telemetry collector (:py:mod:`open_in_mpv.collector`) passes each finished session to
+:py:func:`observe`, which keeps, per machine and site, how often each video format (codec and
+height, such as ``vp9 1080p``) dropped frames. :py:func:`selector` turns that and the height of the
+largest screen into a ``ytdl-format`` value that avoids the codecs and heights that dropped frames
+and does not go above the screen.
+
+``FORMATS_PATH`` is a JSON file changed under an exclusive ``flock`` like the cache tuning table.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+import fcntl
+import json
+import logging
+import os
+import re
+import socket
+
+from .constants import FORMATS_PATH
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+__all__ = ('BAD_RATE', 'DRM_DIR', 'DROP_RATE', 'MAX_ENTRIES', 'MIN_SECONDS', 'MIN_SESSIONS',
+           'SMOOTHING', 'VCODECS', 'Record', 'lookup', 'observe', 'screen_height', 'selector')
+
+BAD_RATE = 0.5
+"""Share of recent sessions of a format that must have dropped frames to avoid it."""
+DRM_DIR = Path('/sys/class/drm')
+"""Where Linux lists the connectors of the graphics cards and their modes."""
+DROP_RATE = 10.0
+"""Dropped frames per minute above which a session counts as dropping frames."""
+MAX_ENTRIES = 256
+"""Number of machine and site pairs kept."""
+MIN_SECONDS = 10.0
+"""Sessions shorter than this are not learnt from."""
+MIN_SESSIONS = 2
+"""Sessions of a format needed before it can be avoided."""
+SMOOTHING = 0.3
+"""Weight of a new session in the share of sessions that dropped frames."""
+VCODECS = {
+    'av1': ('av01',),
+    'h264': ('avc1',),
+    'hevc': ('hvc1', 'hev1'),
+    'vp9': ('vp9', 'vp09')
+}
+"""yt-dlp ``vcodec`` prefixes of the video formats mpv reports."""
+
+log = logging.getLogger(__name__)
+
+
+class Record(NamedTuple):
+    """What was observed for a video format."""
+    sessions: int
+    """Number of sessions learnt from."""
+    bad_rate: float
+    """Moving average of whether sessions dropped frames, between 0 and 1."""
+
+    def bad(self) -> bool:
+        """
+        Check if the format should be avoided.
+
+        Returns
+        -------
+        bool
+            ``True`` if the format was seen often enough and mostly dropped frames.
+        """
+        return self.sessions >= MIN_SESSIONS and self.bad_rate >= BAD_RATE
+
+
+def _key(machine: str, site: str) -> str:
+    return f'{machine} {site}'
+
+
+def _read(path: Path) -> dict[str, dict[str, Record]]:
+    try:
+        data = json.loads(path.read_bytes())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        log.warning('Ignoring invalid format table %s.', path)
+        return {}
+    return {
+        key: {k: Record(*v) for k, v in formats.items()}
+        for key, formats in (data.items() if isinstance(data, dict) else ())
+        if isinstance(formats, dict) and all(
+            isinstance(v, list) and len(v) == len(Record._fields) for v in formats.values())
+    }
+
+
+def lookup(site: str,
+           *,
+           machine: str | None = None,
+           path: Path | None = None) -> dict[str, Record]:
+    """
+    Get the records of the video formats played from ``site``.
+
+    ``machine`` defaults to the host name.
+
+    Returns
+    -------
+    dict[str, Record]
+        The records by video format, such as ``vp9 1080p``.
+    """
+    return _read(path or FORMATS_PATH).get(_key(machine or socket.gethostname(), site), {})
+
+
+def _update(path: Path, key: str, video_format: str, bad: float) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.with_name(f'{path.name}.lock').open('a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        table = _read(path)
+        formats = table.pop(key, {})
+        old = formats.get(video_format)
+        formats[video_format] = Record(1, bad) if old is None else Record(
+            old.sessions + 1, round(old.bad_rate + SMOOTHING * (bad - old.bad_rate), 3))
+        # The most recently seen pair is last, so the oldest are dropped first.
+        table[key] = formats
+        data = {
+            k: {f: list(r) for f, r in v.items()}
+            for k, v in list(table.items())[-MAX_ENTRIES:]
+        }
+        tmp = path.with_name(f'{path.name}.{os.getpid()}')
+        tmp.write_text(json.dumps(data), encoding='utf-8')
+        tmp.replace(path)
+
+
+def observe(record: Mapping[str, object], *, path: Path | None = None) -> None:
+    """
+    Update the record of the video format of telemetry ``record``.
+
+    Sessions of local files, audio and sessions shorter than ``MIN_SECONDS`` are ignored.
+    """
+    machine, site, video_format = (record.get(x) for x in ('machine', 'site', 'format'))
+    seconds = record.get('seconds')
+    if not (isinstance(machine, str) and isinstance(site, str) and isinstance(video_format, str)):
+        return
+    if (site == 'local' or not video_format or not isinstance(seconds, (int, float))
+            or seconds < MIN_SECONDS):
+        return
+    drops = sum(x for x in (record.get('frame_drops'), record.get('decoder_frame_drops'))
+                if isinstance(x, (int, float)))
+    bad = float(drops * 60 / seconds > DROP_RATE)
+    path = path or FORMATS_PATH
+    try:
+        _update(path, _key(machine, site), video_format, bad)
+    except OSError:
+        log.warning('Cannot update the format table %s.', path)
+
+
+def screen_height(drm_dir: Path | None = None) -> int | None:
+    """
+    Get the tallest 16:9 video that fits on a connected screen.
+
+    Reads the preferred mode of each connected connector in ``DRM_DIR``, so it only knows about
+    screens on Linux.
+
+    Returns
+    -------
+    int | None
+        The height in pixels, or ``None`` if no screen was found.
+    """
+    heights = []
+    for status in (drm_dir or DRM_DIR).glob('card*-*/status'):
+        try:
+            if status.read_text(encoding='utf-8').strip() != 'connected':
+                continue
+            mode = (status.parent / 'modes').read_text(encoding='utf-8').partition('\n')[0]
+        except OSError:
+            continue
+        if m := re.match(r'(\d+)x(\d+)', mode):
+            width, height = int(m.group(1)), int(m.group(2))
+            heights.append(min(height, width * 9 // 16))
+    return max(heights, default=None)
+
+
+def selector(records: Mapping[str, Record], max_height: int | None = None) -> str | None:
+    """
+    Get a ``ytdl-format`` value that avoids the formats in ``records`` that dropped frames.
+
+    The first choice leaves out the codecs of those formats. If nothing is left, the next is the
+    best format below the lowest height that dropped frames. All choices are limited to
+    ``max_height``, and formats whose height is not known are allowed.
+
+    Returns
+    -------
+    str | None
+        The value, or ``None`` if nothing needs to be avoided and there is no height limit.
+    """
+    bad = [x.split() for x, record in records.items() if record.bad()]
+    heights = [int(h[:-1]) for x in bad for h in x[1:] if re.match(r'^\d+p$', h)]
+    prefixes = sorted({p for x in bad for p in VCODECS.get(x[0], ())})
+    if not prefixes and not heights and max_height is None:
+        return None
+    limit = f'[height<=?{max_height}]' if max_height is not None else ''
+    choices = []
+    if prefixes:
+        codecs = ''.join(f'[vcodec!^={x}]' for x in prefixes)
+        choices.append(f'bestvideo{limit}{codecs}+bestaudio')
+    if heights:
+        lower = min(heights) - 1 if max_height is None else min(max_height, min(heights) - 1)
+        choices.append(f'bestvideo[height<=?{lower}]+bestaudio')
+    elif not prefixes:
+        choices.append(f'bestvideo{limit}+bestaudio')
+    choices.extend((f'best{limit}', 'best') if limit else ('best',))
+    return '/'.join(choices)
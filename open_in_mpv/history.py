@@ -0,0 +1,273 @@
+"""
+Playback history and resume positions.
+
+``HISTORY_PATH`` is an SQLite database with a row per canonical URL (see
+:py:func:`open_in_mpv.urls.canonical_url`): the last position, the duration, how many milliseconds
+mpv took to start playing it, how many times it was opened and when it was last updated. The URL is
+the primary key of a ``WITHOUT ROWID`` table, so :py:func:`lookup` is a single B-tree search
+however long the history gets. An index on the update time keeps removing the oldest entries from
+walking the whole table; a :py:class:`Writer` does it at most every ``PRUNE_INTERVAL`` seconds, so
+the history can briefly hold more than ``MAX_ENTRIES`` URLs.
+
+The host only reads the database. It is written by a recorder process next to each instance
+(:py:mod:`open_in_mpv.recorder`) through a :py:class:`Writer`, which batches updates on a
+background thread so reading events from mpv never waits for the disk.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from .constants import HISTORY_PATH
+from .urls import canonical_url
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
+
+__all__ = ('END_MARGIN', 'LOOKUP_TIMEOUT', 'MAX_ENTRIES', 'MIN_POSITION', 'PRUNE_INTERVAL',
+           'WRITE_INTERVAL', 'Entry', 'Update', 'Writer', 'connect', 'lookup', 'write')
+
+END_MARGIN = 30.0
+"""Positions less than this many seconds before the end are not resumed."""
+LOOKUP_TIMEOUT = 0.1
+"""Seconds :py:func:`lookup` waits for a writer to release the database."""
+MAX_ENTRIES = 1_000_000
+"""Number of URLs kept. The least recently updated are removed first."""
+MIN_POSITION = 10.0
+"""Positions below this many seconds are not resumed."""
+PRUNE_INTERVAL = 3600.0
+"""Seconds between removals of the entries over ``MAX_ENTRIES`` by a :py:class:`Writer`."""
+WRITE_INTERVAL = 1.0
+"""Seconds a :py:class:`Writer` collects updates before writing them."""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    url TEXT PRIMARY KEY,
+    position REAL,
+    duration REAL,
+    start_ms REAL,
+    plays INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+) WITHOUT ROWID
+"""
+_INDEX = 'CREATE INDEX IF NOT EXISTS history_updated ON history (updated)'
+_UPSERT = """
+INSERT INTO history (url, position, duration, start_ms, plays, updated) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (url) DO UPDATE SET
+    position = coalesce(excluded.position, position),
+    duration = coalesce(excluded.duration, duration),
+    start_ms = coalesce(excluded.start_ms, start_ms),
+    plays = plays + excluded.plays,
+    updated = excluded.updated
+"""
+_PRUNE = """
+DELETE FROM history WHERE updated < (
+    SELECT updated FROM history ORDER BY updated DESC LIMIT 1 OFFSET ?
+)
+"""
+
+log = logging.getLogger(__name__)
+
+
+class Entry(NamedTuple):
+    """A URL in the history."""
+    url: str
+    """Canonical URL."""
+    position: float | None
+    """Last position in seconds."""
+    duration: float | None
+    """Duration in seconds."""
+    start_ms: float | None
+    """Milliseconds from mpv starting to load the URL to playback starting."""
+    plays: int
+    """Number of times the URL was opened."""
+    updated: float
+    """Time of the last update in seconds since the epoch."""
+
+    def resume_position(self) -> float | None:
+        """
+        Get the position to start playing at.
+
+        Returns
+        -------
+        float | None
+            The last position, or ``None`` if it is too close to the start or the end.
+        """
+        if self.position is None or self.position < MIN_POSITION:
+            return None
+        if self.duration is not None and self.duration - self.position < END_MARGIN:
+            return None
+        return self.position
+
+
+class Update(NamedTuple):
+    """A change to the entry of a URL. ``None`` leaves a value as it is."""
+    url: str
+    """Canonical URL."""
+    position: float | None = None
+    """Position in seconds. Zero after the URL was played to the end."""
+    duration: float | None = None
+    """Duration in seconds."""
+    start_ms: float | None = None
+    """Milliseconds from mpv starting to load the URL to playback starting."""
+    plays: int = 0
+    """Number of times the URL was opened since the last update."""
+    updated: float = 0.0
+    """Time of the update in seconds since the epoch."""
+
+    def merge(self, newer: Update) -> Update:
+        """
+        Combine this update with a ``newer`` one for the same URL.
+
+        Returns
+        -------
+        Update
+            An update with the effect of both.
+        """
+        return Update(self.url, self.position if newer.position is None else newer.position,
+                      self.duration if newer.duration is None else newer.duration,
+                      self.start_ms if newer.start_ms is None else newer.start_ms,
+                      self.plays + newer.plays, newer.updated)
+
+
+def connect(path: Path | None = None) -> sqlite3.Connection:
+    """
+    Open the database for writing, creating it if necessary.
+
+    Returns
+    -------
+    sqlite3.Connection
+        The connection.
+    """
+    path = path or HISTORY_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=5)
+    # Readers are not blocked by a write in progress with a write-ahead log.
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = NORMAL')
+    connection.execute(_SCHEMA)
+    connection.execute(_INDEX)
+    return connection
+
+
+def write(connection: sqlite3.Connection,
+          updates: Iterable[Update],
+          *,
+          prune: bool = True) -> None:
+    """
+    Apply ``updates`` in one transaction.
+
+    With ``prune``, the oldest entries over ``MAX_ENTRIES`` are also removed. Entries updated at the
+    same time as the oldest one kept are kept too.
+    """
+    with connection:
+        connection.executemany(_UPSERT, updates)
+        if prune:
+            connection.execute(_PRUNE, (MAX_ENTRIES - 1,))
+
+
+def lookup(url: str, *, path: Path | None = None) -> Entry | None:
+    """
+    Get the entry of ``url``.
+
+    Returns
+    -------
+    Entry | None
+        The entry, or ``None`` if the URL is not in the history or the database cannot be read.
+    """
+    path = path or HISTORY_PATH
+    if not path.exists():
+        return None
+    try:
+        connection = sqlite3.connect(f'{path.as_uri()}?mode=ro', uri=True, timeout=LOOKUP_TIMEOUT)
+    except sqlite3.Error:
+        log.warning('Cannot open the history %s.', path)
+        return None
+    try:
+        row = connection.execute(
+            'SELECT url, position, duration, start_ms, plays, updated FROM history WHERE url = ?',
+            (canonical_url(url),)).fetchone()
+    except sqlite3.Error:
+        log.warning('Cannot read the history %s.', path)
+        return None
+    finally:
+        connection.close()
+    return None if row is None else Entry(*row)
+
+
+class Writer:
+    """
+    Write updates to the database on a background thread.
+
+    :py:meth:`put` only queues an update. The thread waits ``interval`` seconds after the first
+    queued update, merges the updates to each URL and writes them in one transaction, so a URL
+    updated every second costs one write per batch. Old entries are removed with the first batch
+    and then at most every ``PRUNE_INTERVAL`` seconds.
+
+    Parameters
+    ----------
+    path : Path | None
+        The database. Defaults to ``HISTORY_PATH``.
+    interval : float
+        Seconds to collect updates for before writing them.
+    """
+    def __init__(self, path: Path | None = None, *, interval: float = WRITE_INTERVAL) -> None:
+        self.path = path or HISTORY_PATH
+        """The database."""
+        self.interval = interval
+        """Seconds to collect updates for before writing them."""
+        self._queue: queue.SimpleQueue[Update | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def put(self, update: Update) -> None:
+        """Queue ``update``. The thread is started by the first call."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+            self._thread.start()
+        self._queue.put(update)
+
+    def close(self) -> None:
+        """Write the queued updates and stop the thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _batch(self) -> tuple[list[Update], bool]:
+        pending: dict[str, Update] = {}
+        item = self._queue.get()
+        deadline = time.monotonic() + self.interval
+        while item is not None:
+            pending[item.url] = pending[item.url].merge(item) if item.url in pending else item
+            try:
+                item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                return list(pending.values()), False
+        return list(pending.values()), True
+
+    def _run(self) -> None:
+        connection: sqlite3.Connection | None = None
+        pruned: float | None = None
+        try:
+            closing = False
+            while not closing:
+                updates, closing = self._batch()
+                if not updates:
+                    continue
+                now = time.monotonic()
+                prune = pruned is None or now - pruned >= PRUNE_INTERVAL
+                try:
+                    connection = connection or connect(self.path)
+                    write(connection, updates, prune=prune)
+                    if prune:
+                        pruned = now
+                except (OSError, sqlite3.Error):
+                    log.exception('Failed to write %d history updates.', len(updates))
+        finally:
+            if connection is not None:
+                connection.close()
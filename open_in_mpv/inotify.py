@@ -0,0 +1,123 @@
+"""
+Minimal inotify bindings (Linux only).
+
+Used to wake up as soon as a file appears in a directory instead of polling for it.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import ctypes
+import functools
+import os
+import select
+import struct
+import threading
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from types import TracebackType
+
+    from typing_extensions import Self
+
+__all__ = ('IN_CREATE', 'IN_MOVED_TO', 'Watch')
+
+IN_CREATE = 0x100
+"""A file was created in the watched directory."""
+IN_MOVED_TO = 0x80
+"""A file was moved into the watched directory."""
+
+_EVENT = struct.Struct('iIII')
+
+
+@functools.cache
+def _libc() -> ctypes.CDLL:
+    # The C library is already loaded, so look the functions up in the process instead of running
+    # ctypes.util.find_library(), which starts ldconfig.
+    return ctypes.CDLL(None, use_errno=True)
+
+
+class Watch:
+    """
+    Watch a directory for new files.
+
+    Parameters
+    ----------
+    path : Path
+        Directory to watch.
+    mask : int
+        Events to watch for.
+
+    Raises
+    ------
+    OSError
+        On entering, if inotify is not available or the directory cannot be watched.
+    """
+    def __init__(self, path: Path, mask: int = IN_CREATE | IN_MOVED_TO) -> None:
+        self.path = path
+        """Watched directory."""
+        self.mask = mask
+        """Events to watch for."""
+        self._fd = -1
+
+    def __enter__(self) -> Self:
+        """
+        Start watching.
+
+        Returns
+        -------
+        Self
+            This watch.
+
+        Raises
+        ------
+        OSError
+            If inotify is not available or the directory cannot be watched.
+        """
+        try:
+            libc = _libc()
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (AttributeError, OSError) as e:
+            msg = 'inotify is not available.'
+            raise OSError(msg) from e
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1() failed.')
+        if libc.inotify_add_watch(fd, os.fsencode(self.path), self.mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, 'inotify_add_watch() failed.', str(self.path))
+        self._fd = fd
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None,
+                 traceback: TracebackType | None) -> None:
+        """Stop watching."""
+        if self._fd >= 0:
+            # Closing an inotify descriptor waits for the kernel to synchronise, which takes
+            # several milliseconds, so it is done off the caller's path.
+            threading.Thread(target=os.close, args=(self._fd,), daemon=True).start()
+            self._fd = -1
+
+    def read(self, timeout: float | None = None) -> list[str]:
+        """
+        Wait up to ``timeout`` seconds for events.
+
+        Returns
+        -------
+        list[str]
+            Names of the files the events are about. Empty if the timeout expired.
+        """
+        readable, _, _ = select.select((self._fd,), (), (), timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            names.append(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+            offset += length
+        return names
@@ -0,0 +1,515 @@
+"""
+Checks for whether the mpv instance behind a socket is usable.
+
+When the host starts an instance it writes an ownership record next to the socket with the process
+ID and the process start time. Reading it and comparing it against the running process is much
+cheaper than connecting, so a socket left behind by a crashed mpv is detected without a failed
+connect. An instance that passes that check is then asked for its ``pid`` with a short timeout so
+a hung mpv is not reused.
+
+Between starting mpv and mpv creating its socket, another request would see no instance and start
+a second one. :py:class:`LaunchLock` serialises the check and the start across processes and
+records when the last start happened, so requests in that window wait for the socket instead.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+from .constants import IS_LINUX, IS_WIN, MPV_SOCKET
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+    from typing_extensions import Self
+
+__all__ = ('LAUNCH_TIMEOUT', 'PROBE_TIMEOUT', 'LaunchLock', 'abstract_address', 'companion_command',
+           'companion_lock', 'companion_lock_path', 'companion_running', 'connect_address',
+           'connectable', 'is_running', 'owner_alive', 'owner_path', 'probe', 'process_alive',
+           'process_start_time', 'read_owner', 'remove', 'remove_owner', 'wait', 'write_owner')
+
+LAUNCH_TIMEOUT = 10.0
+"""Seconds a started instance has to create its socket before other requests stop waiting."""
+PROBE_TIMEOUT = 0.08
+"""Seconds to wait for an instance to answer the health probe."""
+
+_LOCK_MAX_DELAY = 0.05
+"""Longest wait in seconds between attempts to take a held launch lock."""
+
+log = logging.getLogger(__name__)
+
+
+def abstract_address(path: Path) -> str:
+    """
+    Get the Linux abstract socket name used instead of ``path``.
+
+    Abstract sockets have no file, so nothing is left behind if mpv crashes. mpv takes the name
+    with a leading ``@``; Python needs a leading null byte instead.
+
+    Returns
+    -------
+    str
+        The name with a leading ``@``.
+    """
+    return f'@{path.stem}-{os.getuid()}'
+
+
+def connect_address(address: Path | str) -> str:
+    """
+    Convert a socket path or ``@``-prefixed abstract name to an address for ``connect()``.
+
+    Returns
+    -------
+    str
+        The address.
+    """
+    address = str(address)
+    return f'\0{address[1:]}' if address.startswith('@') else address
+
+
+def owner_path(path: Path) -> Path:
+    """
+    Get the path of the ownership record for socket ``path``.
+
+    Returns
+    -------
+    Path
+        The record path.
+    """
+    return path.with_name(f'{path.name}.owner')
+
+
+def process_start_time(pid: int) -> int | None:
+    """
+    Get the start time of a process in clock ticks since boot.
+
+    Returns
+    -------
+    int | None
+        The start time, or ``None`` if it is not available on this platform or the process does
+        not exist or has exited and not been reaped yet.
+    """
+    if not IS_LINUX:
+        return None
+    try:
+        stat = Path(f'/proc/{pid}/stat').read_bytes()
+    except OSError:
+        return None
+    # The command name can contain spaces and parentheses, so split after the last ')'.
+    fields = stat.rsplit(b')', 1)[1].split()
+    return None if fields[0] == b'Z' else int(fields[19])
+
+
+def write_owner(path: Path, pid: int) -> None:
+    """Record that the instance at socket ``path`` is process ``pid``."""
+    record = owner_path(path)
+    tmp = record.with_name(f'{record.name}.{os.getpid()}')
+    try:
+        tmp.write_text(json.dumps({
+            'pid': pid,
+            'start_time': process_start_time(pid)
+        }),
+                       encoding='utf-8')
+        tmp.replace(record)
+    except OSError:
+        log.warning('Failed to write ownership record %s.', record)
+
+
+def read_owner(path: Path) -> tuple[int, int | None] | None:
+    """
+    Read the ownership record for socket ``path``.
+
+    Returns
+    -------
+    tuple[int, int | None] | None
+        The process ID and start time, or ``None`` if there is no valid record.
+    """
+    try:
+        data = json.loads(owner_path(path).read_bytes())
+        return int(data['pid']), data.get('start_time')
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def owner_alive(path: Path) -> bool | None:
+    """
+    Check the ownership record for socket ``path`` against the running processes.
+
+    Returns
+    -------
+    bool | None
+        ``None`` if there is no record, otherwise whether the recorded process is still running. A
+        process with the same ID but a different start time does not count.
+    """
+    if (owner := read_owner(path)) is None:
+        return None
+    return process_alive(*owner)
+
+
+def process_alive(pid: int, start_time: int | None = None) -> bool:
+    """
+    Check whether process ``pid`` is running.
+
+    If ``start_time`` is given, a process with the same ID but a different start time does not
+    count.
+
+    Returns
+    -------
+    bool
+        ``True`` if the process is running.
+    """
+    if start_time is not None:
+        return process_start_time(pid) == start_time
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _ask_pid(address: Path | str, timeout: float) -> int | None:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(connect_address(address))
+        sock.sendall(b'{"command":["get_property","pid"],"request_id":1}\n')
+        with sock.makefile('rb') as f:
+            for line in f:
+                reply = json.loads(line)
+                if reply.get('request_id') == 1:
+                    return int(reply['data']) if reply.get('error') == 'success' else None
+    return None
+
+
+def probe(address: Path | str, timeout: float = PROBE_TIMEOUT) -> int | None:
+    """
+    Ask the instance at ``address`` for its process ID.
+
+    Returns
+    -------
+    int | None
+        The process ID, or ``None`` if the instance did not answer in time.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    try:
+        return _ask_pid(address, timeout)
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        log.debug('Probe of %s failed: %s', address, exc)
+    return None
+
+
+def _unlink(path: Path) -> None:
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:  # pragma: no cover
+        log.warning('Failed to remove %s.', path)
+
+
+def remove_owner(path: Path) -> None:
+    """Remove the ownership record for socket ``path``."""
+    _unlink(owner_path(path))
+
+
+def remove(path: Path) -> None:
+    """Remove socket ``path`` and its ownership record."""
+    _unlink(path)
+    _unlink(owner_path(path))
+
+
+def is_running(path: Path, *, abstract: bool = False) -> bool:
+    """
+    Check whether a usable mpv instance is listening on ``path``.
+
+    A dead owner removes the stale socket and record. A failed probe while the owner is alive or
+    unknown removes nothing, as the socket may still be in use; mpv replaces it when a new instance
+    is started on ``path``. With ``abstract`` (Linux only), the abstract socket for ``path`` is
+    probed instead and there is nothing to remove.
+
+    Returns
+    -------
+    bool
+        ``True`` if the instance can be sent commands.
+    """
+    if abstract and IS_LINUX:
+        return probe(abstract_address(path)) is not None
+    if not path.exists():
+        return False
+    if (alive := owner_alive(path)) is False:
+        log.debug('Owner of %s is gone. Removing stale socket.', path)
+        remove(path)
+        return False
+    if (pid := probe(path)) is None:
+        log.debug('Instance at %s did not answer.', path)
+        return False
+    if alive is None:
+        write_owner(path, pid)
+    return True
+
+
+def connectable(address: Path | str) -> bool:
+    """
+    Check whether something accepts connections at ``address``.
+
+    Without ``AF_UNIX`` support, only checks that the socket file exists.
+
+    Returns
+    -------
+    bool
+        ``True`` if a connection succeeded.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return not str(address).startswith('@') and Path(address).exists()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(PROBE_TIMEOUT)
+            sock.connect(connect_address(address))
+    except OSError:
+        return False
+    return True
+
+
+def _wait_inotify(path: Path, deadline: float) -> bool:
+    from . import inotify  # ruff:ignore[import-outside-top-level]
+
+    # Watch before checking so a socket created in between is not missed.
+    with inotify.Watch(path.parent) as watch:
+        while not connectable(path):
+            if (remaining := deadline - time.monotonic()) <= 0:
+                return False
+            if path.exists():
+                # mpv creates the file with bind() just before it calls listen().
+                time.sleep(min(0.001, remaining))
+            else:
+                watch.read(remaining)
+    return True
+
+
+def wait(path: Path, timeout: float = LAUNCH_TIMEOUT, *, abstract: bool = False) -> bool:
+    """
+    Wait up to ``timeout`` seconds for the instance at socket ``path`` to accept connections.
+
+    On Linux, the directory of ``path`` is watched with inotify so the wait ends as soon as the
+    socket is created. Otherwise, and for the abstract socket for ``path`` (with ``abstract``, Linux
+    only), the socket is polled with exponential backoff.
+
+    Returns
+    -------
+    bool
+        ``True`` if the instance accepts connections.
+    """
+    abstract = abstract and IS_LINUX
+    deadline = time.monotonic() + timeout
+    if IS_LINUX and not abstract:
+        try:
+            return _wait_inotify(path, deadline)
+        except OSError as e:
+            log.debug('Cannot watch %s: %s. Polling instead.', path.parent, e)
+    address = abstract_address(path) if abstract else path
+    delay = 0.005
+    while not connectable(address):
+        if (remaining := deadline - time.monotonic()) <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.2)
+    return True
+
+
+def _try_flock(fd: int) -> bool:
+    import fcntl  # ruff:ignore[import-outside-top-level]
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+class LaunchLock:
+    """
+    Cross-process lock held while checking for and starting the instance at socket ``path``.
+
+    The lock is an exclusive ``flock`` on ``<socket>.launch``, which also holds the time of the
+    last start. Waiting for the lock gives up after ``timeout`` seconds and continues without it.
+    On Windows the lock does nothing.
+
+    Parameters
+    ----------
+    path : Path
+        Socket path.
+    timeout : float
+        Seconds to wait for the lock and for a started instance to create its socket.
+    """
+    def __init__(self, path: Path, timeout: float = LAUNCH_TIMEOUT) -> None:
+        self.path = path.with_name(f'{path.name}.launch')
+        """Lock file path."""
+        self.timeout = timeout
+        """Seconds to wait for the lock and for a started instance to create its socket."""
+        self._fd: int | None = None
+        self._owner: int | None = None
+
+    def __enter__(self) -> Self:
+        """
+        Take the lock, waiting with increasing delays for at most ``timeout`` seconds.
+
+        Returns
+        -------
+        Self
+            This lock.
+        """
+        if IS_WIN:
+            return self
+        self._owner = os.getpid()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError:
+            log.warning('Cannot open launch lock %s.', self.path)
+            return self
+        deadline = time.monotonic() + self.timeout
+        delay = 0.005
+        while not _try_flock(self._fd):
+            if (remaining := deadline - time.monotonic()) <= 0:
+                log.warning('Timed out waiting for launch lock %s.', self.path)
+                break
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, _LOCK_MAX_DELAY)
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None,
+                 traceback: TracebackType | None) -> None:
+        """Release the lock."""
+        if self._fd is not None:
+            import fcntl  # ruff:ignore[import-outside-top-level]
+
+            # Unlock explicitly: a forked child may still have the descriptor open. A forked child
+            # leaving the context only closes its copy, as unlocking would release the lock of the
+            # process that took it.
+            if os.getpid() == self._owner:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def starting(self) -> bool:
+        """
+        Check whether an instance was started less than ``timeout`` seconds ago and is running.
+
+        Returns
+        -------
+        bool
+            ``True`` if a started instance may still create its socket.
+        """
+        if self._fd is None:
+            return False
+        try:
+            data = json.loads(os.pread(self._fd, 256, 0) or b'{}')
+            started, pid = float(data.get('time', 0)), data.get('pid')
+            if pid is not None and not process_alive(int(pid), data.get('start_time')):
+                return False
+        except (OSError, ValueError, AttributeError, TypeError):
+            return False
+        return 0 <= time.time() - started < self.timeout
+
+    def clear(self) -> None:
+        """Forget the last start, for example because its instance was found to be stale."""
+        if self._fd is None:
+            return
+        try:
+            os.ftruncate(self._fd, 0)
+        except OSError:  # pragma: no cover
+            log.warning('Failed to write launch lock %s.', self.path)
+
+    def mark(self, pid: int | None = None) -> None:
+        """Record that an instance was started now, as process ``pid`` if it is known."""
+        if self._fd is None:
+            return
+        record = {'time': time.time(), 'pid': pid, 'start_time': None}
+        if pid is not None:
+            record['start_time'] = process_start_time(pid)
+        try:
+            os.ftruncate(self._fd, 0)
+            os.pwrite(self._fd, json.dumps(record).encode(), 0)
+        except OSError:  # pragma: no cover
+            log.warning('Failed to write launch lock %s.', self.path)
+
+
+def companion_lock_path(address: Path | str, name: str) -> Path:
+    """
+    Get the lock file of the ``name`` companion of the instance at ``address``.
+
+    Companions are processes that follow one instance over IPC until it exits, such as the history
+    recorder. Each holds an exclusive ``flock`` on this file while it runs, so there is at most one
+    of each kind per instance.
+
+    Returns
+    -------
+    Path
+        ``<socket>.<name>``. For an abstract socket it is in the directory of ``MPV_SOCKET``.
+    """
+    address = str(address)
+    if address.startswith('@'):
+        return MPV_SOCKET.with_name(f'{address[1:]}.{name}')
+    return Path(f'{address}.{name}')
+
+
+def companion_lock(address: Path | str, name: str) -> int | None:
+    """
+    Take the lock of the ``name`` companion of the instance at ``address`` without waiting.
+
+    An :py:exc:`OSError` from creating or opening the lock file is not caught.
+
+    Returns
+    -------
+    int | None
+        The locked file descriptor, which the caller closes to release the lock, or ``None`` if
+        another process holds the lock.
+    """
+    path = companion_lock_path(address, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    if not _try_flock(fd):
+        os.close(fd)
+        return None
+    return fd
+
+
+def companion_running(address: Path | str, name: str) -> bool:
+    """
+    Check whether the ``name`` companion of the instance at ``address`` is running.
+
+    Returns
+    -------
+    bool
+        ``True`` if another process holds its lock.
+    """
+    try:
+        fd = companion_lock(address, name)
+    except OSError:
+        log.warning('Cannot check the %s lock of %s.', name, address)
+        return False
+    if fd is None:
+        return True
+    os.close(fd)
+    return False
+
+
+def companion_command(name: str, address: Path | str, *args: str) -> list[str]:
+    """
+    Get the command line that starts the ``name`` companion for the instance at ``address``.
+
+    ``name`` is the module in this package that runs the companion. ``args`` are added after the
+    address.
+
+    Returns
+    -------
+    list[str]
+        The command line.
+    """
+    return [sys.executable, '-m', f'{__package__}.{name}', str(address), *args]
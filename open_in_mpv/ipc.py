@@ -0,0 +1,313 @@
+"""
+Asynchronous client for mpv's JSON IPC protocol.
+
+One :py:class:`MpvClient` keeps a single connection open. Commands are pipelined: each gets a
+``request_id`` and its reply is matched to it, so many commands can be in flight at once. Events
+and observed property changes are passed to callbacks.
+
+See https://mpv.io/manual/stable/#json-ipc.
+"""
+from __future__ import annotations
+
+from itertools import count
+from typing import TYPE_CHECKING, Any
+import asyncio
+import contextlib
+import json
+import logging
+
+from .constants import MPV_SOCKET
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping, Sequence
+    from pathlib import Path
+    from types import TracebackType
+
+    from typing_extensions import Self
+
+__all__ = ('COMMAND_TIMEOUT', 'READ_LIMIT', 'MpvClient', 'MpvCommandError')
+
+COMMAND_TIMEOUT = 5.0
+"""Default number of seconds to wait for the reply to a command."""
+READ_LIMIT = 16 * 1024 * 1024
+"""Longest line accepted from mpv. Replies such as a long ``playlist`` can be several megabytes."""
+
+log = logging.getLogger(__name__)
+
+
+class MpvCommandError(Exception):
+    """Raised when mpv replies to a command with an error."""
+    def __init__(self, command: Sequence[Any] | Mapping[str, Any], error: str) -> None:
+        super().__init__(f'{command!r} failed: {error}')
+        self.command = command
+        """The command that failed."""
+        self.error = error
+        """Error string from mpv."""
+
+
+class MpvClient:
+    """
+    Connection to an mpv instance.
+
+    Use as an asynchronous context manager or call :py:meth:`connect` and :py:meth:`close`.
+
+    Parameters
+    ----------
+    path : Path | str
+        Socket path. Defaults to ``MPV_SOCKET``.
+    timeout : float
+        Default number of seconds to wait for each reply.
+    """
+    def __init__(self, path: Path | str = MPV_SOCKET, *, timeout: float = COMMAND_TIMEOUT) -> None:
+        self.path = str(path)
+        """Socket path."""
+        self.timeout = timeout
+        """Default number of seconds to wait for each reply."""
+        self._ids = count(1)
+        self._pending: dict[int, tuple[Sequence[Any] | Mapping[str, Any], asyncio.Future[Any]]] = {}
+        self._event_handlers: dict[str | None, list[Callable[[dict[str, Any]], None]]] = {}
+        self._property_handlers: dict[int, Callable[[str, Any], None]] = {}
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._read_task: asyncio.Task[None] | None = None
+
+    @property
+    def connected(self) -> bool:
+        """Whether the connection is open."""
+        return self._read_task is not None and not self._read_task.done()
+
+    async def connect(self, timeout: float | None = None) -> None:
+        """Open the connection."""
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(self.path, limit=READ_LIMIT),
+            self.timeout if timeout is None else timeout)
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    async def close(self) -> None:
+        """Close the connection and fail any commands still waiting for a reply."""
+        if self._writer is not None:
+            self._writer.close()
+            with contextlib.suppress(OSError):
+                await self._writer.wait_closed()
+        if self._read_task is not None:
+            self._read_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._read_task
+        self._fail_pending(ConnectionError('Connection closed.'))
+
+    async def __aenter__(self) -> Self:
+        """
+        Open the connection.
+
+        Returns
+        -------
+        Self
+            This client.
+        """
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type: type[BaseException] | None,
+                        exc_value: BaseException | None, traceback: TracebackType | None) -> None:
+        """Close the connection."""
+        await self.close()
+
+    def _fail_pending(self, exc: BaseException) -> None:
+        for _, future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self._pending.clear()
+
+    async def _read_loop(self) -> None:
+        if self._reader is None:
+            msg = 'Not connected.'
+            raise ConnectionError(msg)
+        try:
+            while True:
+                try:
+                    line = await self._reader.readline()
+                except ValueError:
+                    log.warning('Ignoring a line from mpv longer than %d bytes.', READ_LIMIT)
+                    continue
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    log.warning('Ignoring invalid line from mpv: %r', line)
+                    continue
+                self._dispatch(message)
+        finally:
+            self._fail_pending(ConnectionError('mpv closed the connection.'))
+
+    def _dispatch(self, message: dict[str, Any]) -> None:
+        if 'event' in message:
+            if message['event'] == 'property-change' and (handler := self._property_handlers.get(
+                    message.get('id', 0))):
+                handler(message['name'], message.get('data'))
+            for handler_ in (*self._event_handlers.get(message['event'], ()),
+                             *self._event_handlers.get(None, ())):
+                handler_(message)
+            return
+        if (pending := self._pending.pop(message.get('request_id', 0), None)) is None:
+            log.debug('Reply without a matching request: %s', message)
+            return
+        command, future = pending
+        if future.done():
+            return
+        if message.get('error', 'success') != 'success':
+            future.set_exception(MpvCommandError(command, message['error']))
+        else:
+            future.set_result(message.get('data'))
+
+    def _write(
+            self,
+            commands: Sequence[Sequence[Any] | Mapping[str, Any]]) -> list[asyncio.Future[Any]]:
+        if self._writer is None or not self.connected:
+            msg = 'Not connected.'
+            raise ConnectionError(msg)
+        loop = asyncio.get_running_loop()
+        futures = []
+        lines = []
+        for command in commands:
+            request_id = next(self._ids)
+            future: asyncio.Future[Any] = loop.create_future()
+            self._pending[request_id] = (command, future)
+            futures.append(future)
+            lines.append(
+                json.dumps({
+                    'command': command if isinstance(command, dict) else list(command),
+                    'request_id': request_id
+                }).encode() + b'\n')
+        self._writer.write(b''.join(lines))
+        return futures
+
+    async def _drain(self) -> None:
+        if self._writer is None:
+            msg = 'Not connected.'
+            raise ConnectionError(msg)
+        await self._writer.drain()
+
+    async def _wait(self, future: asyncio.Future[Any], timeout: float | None) -> Any:
+        try:
+            return await asyncio.wait_for(future, self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            for request_id, (_, pending) in tuple(self._pending.items()):
+                if pending is future:
+                    del self._pending[request_id]
+            raise
+
+    async def command(self, *args: Any, timeout: float | None = None) -> Any:
+        """
+        Run a command and wait for its reply.
+
+        Returns
+        -------
+        Any
+            The ``data`` field of the reply.
+
+        Raises
+        ------
+        MpvCommandError
+            If mpv reports an error.
+        """  # ruff:ignore[docstring-extraneous-exception]
+        (future,) = self._write((args,))
+        await self._drain()
+        return await self._wait(future, timeout)
+
+    async def commands(self,
+                       commands: Sequence[Sequence[Any] | Mapping[str, Any]],
+                       *,
+                       timeout: float | None = None,
+                       return_exceptions: bool = False) -> list[Any]:
+        """
+        Send several commands in one write and wait for all replies.
+
+        A command is a sequence of positional arguments or a mapping of named arguments.
+
+        Returns
+        -------
+        list[Any]
+            The ``data`` field of each reply, in order. With ``return_exceptions``, failed commands
+            give their exception instead of raising it.
+        """
+        futures = self._write(commands)
+        await self._drain()
+        return list(await asyncio.gather(*(self._wait(x, timeout) for x in futures),
+                                         return_exceptions=return_exceptions))
+
+    async def get_property(self, name: str, *, timeout: float | None = None) -> Any:
+        """
+        Get a property.
+
+        Returns
+        -------
+        Any
+            The property value.
+        """
+        return await self.command('get_property', name, timeout=timeout)
+
+    async def set_property(self, name: str, value: Any, *, timeout: float | None = None) -> None:
+        """Set a property."""
+        await self.command('set_property', name, value, timeout=timeout)
+
+    async def observe_property(self, name: str, callback: Callable[[str, Any], None]) -> int:
+        """
+        Call ``callback`` with the name and value of ``name`` every time it changes.
+
+        mpv sends the current value straight away.
+
+        Returns
+        -------
+        int
+            ID to pass to :py:meth:`unobserve_property`.
+        """
+        observe_id = len(self._property_handlers) + 1
+        while observe_id in self._property_handlers:
+            observe_id += 1
+        self._property_handlers[observe_id] = callback
+        await self.command('observe_property', observe_id, name)
+        return observe_id
+
+    async def unobserve_property(self, observe_id: int) -> None:
+        """Stop observing a property."""
+        await self.command('unobserve_property', observe_id)
+        self._property_handlers.pop(observe_id, None)
+
+    def add_event_handler(self, event: str | None, callback: Callable[[dict[str, Any]],
+                                                                      None]) -> None:
+        """Call ``callback`` for ``event`` messages, or for all events if ``event`` is ``None``."""
+        self._event_handlers.setdefault(event, []).append(callback)
+
+    def remove_event_handler(self, event: str | None, callback: Callable[[dict[str, Any]],
+                                                                         None]) -> None:
+        """Remove a callback added with :py:meth:`add_event_handler`."""
+        with contextlib.suppress(KeyError, ValueError):
+            self._event_handlers[event].remove(callback)
+
+    async def wait_for_event(self, event: str, timeout: float | None = None) -> dict[str, Any]:
+        """
+        Wait for the next ``event`` message.
+
+        Returns
+        -------
+        dict[str, Any]
+            The event message.
+        """
+        future: asyncio.Future[dict[str, Any]] = asyncio.get_running_loop().create_future()
+
+        def callback(message: dict[str, Any]) -> None:
+            if not future.done():
+                future.set_result(message)
+
+        self.add_event_handler(event, callback)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.remove_event_handler(event, callback)
+
+    async def wait_closed(self) -> None:
+        """Wait until mpv closes the connection."""
+        if self._read_task is not None:
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._read_task
@@ -0,0 +1,168 @@
+"""
+Logging that does not block the request path.
+
+:py:class:`BackgroundHandler` only queues records. The handlers that write them are created on a
+writer thread when the first record arrives, so creating the log directory, opening and rotating
+the file, and slow (network) file systems do not delay the response to the extension or the start
+of mpv.
+
+A fork only waits for other threads to finish handing records to the writer thread, never for a
+record being written. The child does not touch the parent's handlers: it starts its own writer
+thread, creates its own handlers and should exit with :py:func:`close_all` rather than
+:py:func:`logging.shutdown`, which would also flush the handlers of the parent's thread.
+"""
+from __future__ import annotations
+
+from queue import SimpleQueue
+from typing import TYPE_CHECKING
+import logging
+import os
+import sys
+import threading
+import weakref
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+__all__ = ('CLOSE_TIMEOUT', 'BackgroundHandler', 'close_all')
+
+CLOSE_TIMEOUT = 2.0
+"""Seconds :py:meth:`BackgroundHandler.close` waits for queued records to be written."""
+
+_handlers: weakref.WeakSet[BackgroundHandler] = weakref.WeakSet()
+_forking: list[BackgroundHandler] = []
+
+
+class BackgroundHandler(logging.Handler):
+    """
+    Handler that writes records with other handlers on a background thread.
+
+    The message of each record is formatted when it is queued, so arguments that change later are
+    logged as they were. Records are written in order. A forked child starts its own thread;
+    records the parent queued before the fork are written by the parent.
+
+    Parameters
+    ----------
+    factory : Callable[[], Sequence[logging.Handler]]
+        Creates the handlers that write the records. Called on the writer thread.
+    level : int
+        Level of this handler.
+    """
+    def __init__(self,
+                 factory: Callable[[], Sequence[logging.Handler]],
+                 level: int = logging.NOTSET) -> None:
+        super().__init__(level)
+        self.factory = factory
+        """Creates the handlers that write the records."""
+        self._queue: SimpleQueue[logging.LogRecord | None] = SimpleQueue()
+        self._thread: threading.Thread | None = None
+        # Guards the queue and the thread. Held by a thread that forks, but never while writing.
+        self._handoff = threading.Lock()
+        _handlers.add(self)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:  # ruff:ignore[no-self-use]
+        """
+        Get a copy of ``record`` with its message and traceback already formatted.
+
+        Returns
+        -------
+        logging.LogRecord
+            The copy.
+        """
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        ret = logging.makeLogRecord(record.__dict__)
+        ret.msg = message
+        ret.args = None
+        ret.exc_info = None
+        return ret
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Queue ``record`` and start the writer thread if it is not running."""
+        try:
+            prepared = self.prepare(record)
+        except Exception:  # ruff:ignore[blind-except]
+            self.handleError(record)
+            return
+        with self._handoff:
+            self._queue.put(prepared)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write,
+                                                args=(self._queue,),
+                                                name='open-in-mpv-log',
+                                                daemon=True)
+                self._thread.start()
+
+    def _write(self, queue: SimpleQueue[logging.LogRecord | None]) -> None:
+        handlers: Sequence[logging.Handler]
+        try:
+            handlers = self.factory()
+        except Exception:  # ruff:ignore[blind-except]
+            fallback = logging.lastResort
+            if fallback is None:
+                fallback = logging.StreamHandler(sys.stderr)
+                fallback.setLevel(logging.WARNING)
+            fallback.handle(
+                logging.makeLogRecord({
+                    'levelno': logging.ERROR,
+                    'levelname': 'ERROR',
+                    'msg': 'Failed to set up logging. Only warnings and errors are logged.'
+                }))
+            handlers = (fallback,)
+        while (record := queue.get()) is not None:
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+        for handler in handlers:
+            if handler is not logging.lastResort:
+                handler.close()
+
+    def close(self) -> None:
+        """Write the queued records and stop the writer thread, waiting up to ``CLOSE_TIMEOUT``."""
+        with self._handoff:
+            thread, self._thread = self._thread, None
+            queue, self._queue = self._queue, SimpleQueue()
+        if thread is not None:
+            queue.put(None)
+            thread.join(CLOSE_TIMEOUT)
+        super().close()
+
+    def _after_fork(self) -> None:
+        self._queue = SimpleQueue()
+        self._thread = None
+        self._handoff = threading.Lock()
+
+
+def close_all() -> None:
+    """
+    Close every :py:class:`BackgroundHandler`.
+
+    Writes the queued records. A forked child calls this before :py:func:`os._exit`.
+    """
+    for handler in list(_handlers):
+        handler.close()
+
+
+def _before_fork() -> None:
+    _forking[:] = _handlers
+    for handler in _forking:
+        handler._handoff.acquire()  # ruff:ignore[private-member-access]
+
+
+def _after_fork_in_parent() -> None:
+    for handler in _forking:
+        handler._handoff.release()  # ruff:ignore[private-member-access]
+    _forking.clear()
+
+
+def _after_fork_in_child() -> None:
+    _forking.clear()
+    for handler in list(_handlers):
+        handler._after_fork()  # ruff:ignore[private-member-access]
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_before_fork,
+                        after_in_parent=_after_fork_in_parent,
+                        after_in_child=_after_fork_in_child)
@@ -1,69 +1,271 @@
-"""Main command."""
+"""
+Native messaging host.
+
+This module runs once per click, so it only imports what handling a ``url`` message needs. The
+Click command is in :py:mod:`open_in_mpv.cli` and is only imported for other invocations such as
+``--help``.
+"""
 from __future__ import annotations
 
 from pathlib import Path
 from shlex import quote
-from typing import TYPE_CHECKING, Any, BinaryIO, cast
+from shutil import which
+from typing import TYPE_CHECKING, Any, BinaryIO, NamedTuple, cast
+import contextlib
+import functools
 import json
 import logging
 import os
 import re
+import select
 import socket
-import struct
 import subprocess as sp
 import sys
 
-from bascom import setup_logging
 from open_in_mpv import __version__ as VERSION  # ruff:ignore[lowercase-imported-as-non-lowercase]
-from typing_extensions import override
-import click
 
-from .constants import IS_WIN, LOG_PATH, MACPORTS_BIN_PATH, MPV_LOG_PATH, MPV_SOCKET, _LOG_DIR_PATH
+from . import batch, capabilities, codec, instance, logs, metrics, pool
+from .constants import (
+    IS_LINUX,
+    IS_WIN,
+    LOG_PATH,
+    MACPORTS_BIN_PATH,
+    MPV_CRASH_LOG_PATH,
+    MPV_LOG_PATH,
+    MPV_SOCKET,
+    _LOG_DIR_PATH,
+)
 
 if TYPE_CHECKING:
-    from collections.abc import Callable, Mapping
+    from collections.abc import Callable, Mapping, Sequence
+
+    from .cli import main
 
 logger = logging.getLogger(__name__)
 
-__all__ = ('main',)
+__all__ = ('main', 'run')
+
+IDLE_TIMEOUT = 300.0
+"""Seconds a persistent host waits for the next message before exiting."""
+LAUNCHERS = ('fork', 'spawn')
+"""
+Ways to start a new mpv instance.
+
+``fork`` double-forks the host and waits for mpv in the grandchild so it can remove the socket
+afterwards. ``spawn`` starts mpv directly in a new session and leaves nothing resident.
+"""
+DEFAULT_LAUNCHER = 'spawn'
+
+
+class Request(NamedTuple):
+    """A message from the extension."""
+    init: bool = False
+    """Whether the extension only asks for information about the host."""
+    url: str | None = None
+    """URL to open."""
+    urls: Sequence[str] = ()
+    """More URLs to add after ``url``."""
+    playlist: str | None = None
+    """Playlist file or URL to add after the URLs."""
+    mode: str = 'replace'
+    """Whether the URLs replace the playlist of a running instance or are appended to it."""
+    debug: bool = False
+    """Enable debug logging."""
+    dump_env: bool = False
+    """Include the full environment of mpv in the response."""
+    metrics: bool = False
+    """Record the latency of each stage."""
+    click_time: float | None = None
+    """Time of the click in milliseconds since the epoch."""
+    single: bool = True
+    """Use the running instance if there is one."""
+    persistent: bool = False
+    """Keep reading messages after this one."""
+    launcher: str = DEFAULT_LAUNCHER
+    """How to start a new instance. One of ``LAUNCHERS``."""
+    pool_size: int = 0
+    """Number of pre-warmed instances to keep."""
+    pool_ttl: float = pool.POOL_TTL
+    """Seconds an unused pre-warmed instance stays alive."""
+    abstract: bool = False
+    """Use a Linux abstract socket."""
+    idle_timeout: float | None = IDLE_TIMEOUT
+    """Seconds a persistent host waits for the next message."""
+    stream_cache: bool = False
+    """Use and fill the cache of streams resolved by ``ytdl_hook``."""
+    resolver: bool = False
+    """Have ``ytdl_hook`` use the resolver daemon instead of starting yt-dlp."""
+    route: str = 'new'
+    """How an instance is picked when ``single`` is disabled. One of ``registry.POLICIES``."""
+    max_instances: int = 0
+    """Number of instances ``route`` may start when ``single`` is disabled. Zero means no limit."""
+    debounce: float = 0.0
+    """Seconds during which a repeat of this request is dropped. Zero disables the check."""
+    history: bool = False
+    """Resume URLs where they were left and record the playback history."""
+    telemetry: bool = False
+    """Record the playback quality of each file."""
+    tune_cache: bool = False
+    """Tune the cache settings for each site from the playback quality seen before."""
+    format_policy: bool = False
+    """Pick a format that fits the screen and did not drop frames before on this machine."""
+
 
+_REQUEST_FIELDS: tuple[tuple[str, str, tuple[type, ...]], ...] = (
+    ('url', 'url', (str, type(None))),
+    ('urls', 'urls', (list,)),
+    ('playlist', 'playlist', (str, type(None))),
+    ('mode', 'mode', (str,)),
+    ('debug', 'debug', (bool,)),
+    ('dumpEnv', 'dump_env', (bool,)),
+    ('metrics', 'metrics', (bool,)),
+    ('clickTime', 'click_time', (int, float)),
+    ('single', 'single', (bool,)),
+    ('persistent', 'persistent', (bool,)),
+    ('launcher', 'launcher', (str,)),
+    ('poolSize', 'pool_size', (int,)),
+    ('poolTtl', 'pool_ttl', (int, float)),
+    ('abstractSocket', 'abstract', (bool,)),
+    ('idleTimeout', 'idle_timeout', (int, float, type(None))),
+    ('streamCache', 'stream_cache', (bool,)),
+    ('resolver', 'resolver', (bool,)),
+    ('route', 'route', (str,)),
+    ('maxInstances', 'max_instances', (int,)),
+    ('debounce', 'debounce', (int, float)),
+    ('history', 'history', (bool,)),
+    ('telemetry', 'telemetry', (bool,)),
+    ('tuneCache', 'tune_cache', (bool,)),
+    ('formatPolicy', 'format_policy', (bool,)),
+)
+"""Message key, :py:class:`Request` field and accepted types."""
 
-def environment(data_resp: dict[str, Any], *, debugging: bool) -> dict[str, Any]:
-    env: dict[str, Any] = os.environ.copy()
+
+@functools.cache
+def _launch_environment() -> tuple[dict[str, str], dict[str, str]]:
+    env = os.environ.copy()
+    overrides: dict[str, str] = {}
     if Path(MACPORTS_BIN_PATH).is_dir():
         logger.info('Detected MacPorts. Setting PATH.')
+        old_path = env.get('PATH')
+        overrides['PATH'] = (MACPORTS_BIN_PATH
+                             if not old_path else f'{MACPORTS_BIN_PATH}:{old_path}')
+    env.update(overrides)
+    return env, overrides
+
+
+def environment(data_resp: dict[str, Any], *, debugging: bool) -> dict[str, str]:
+    """
+    Get the environment for mpv.
+
+    The environment is computed once per host process. The variables the host changes are added to
+    ``data_resp`` as ``envOverrides``.
+
+    Returns
+    -------
+    dict[str, str]
+        The environment. Do not modify it.
+    """
+    env, overrides = _launch_environment()
+    if 'PATH' in overrides:
         data_resp['macports'] = True
-        old_path = os.environ.get('PATH')
-        env['PATH'] = MACPORTS_BIN_PATH if not old_path else f'{MACPORTS_BIN_PATH}:{old_path}'
-    if debugging:  # pragma: no cover
-        logger.debug('Environment:')
-        for k, value in env.items():
-            logger.debug('  %s=%s', k, value)
+    data_resp['envOverrides'] = overrides
+    if debugging:
+        logger.debug('Environment:%s', ''.join(f'\n  {k}={v}' for k, v in env.items()))
     return env
 
 
 def response(data: dict[str, Any]) -> None:
-    resp = json.dumps(data).encode()
-    size = struct.pack('@i', len(resp))
+    """
+    Send one message to the extension.
+
+    A message that is too large for the browser is replaced with an error message.
+    """
     stdout_buffer: BinaryIO = sys.stdout.buffer
-    stdout_buffer.write(size)
-    stdout_buffer.write(resp)
-
-
-def request(buffer: BinaryIO) -> dict[str, Any]:
-    req_len = struct.unpack('@i', buffer.read(4))[0]
-    message = json.loads(buffer.read(req_len).decode())
-    return {
-        'init': 'init' in message,
-        'url': message.get('url'),
-        'debug': message.get('debug', False),
-        'single': message.get('single', True)
-    }
+    try:
+        # Flushed before any fork so the child does not write the same response again on exit.
+        codec.write(stdout_buffer, data)
+    except codec.FrameTooLargeError as exc:
+        logger.exception('Response not sent.')
+        codec.write(stdout_buffer, {'error': str(exc), 'code': exc.code})
+
+
+def request(buffer: BinaryIO) -> Request:
+    """
+    Read and decode one message.
+
+    Errors from :py:func:`open_in_mpv.codec.read` are not caught: :py:exc:`EOFError` if the stream
+    is closed first, :py:exc:`open_in_mpv.codec.FrameTooLargeError` if the length is invalid and
+    :py:exc:`open_in_mpv.codec.MalformedFrameError` if the message is not valid JSON.
 
+    Returns
+    -------
+    Request
+        The message.
+
+    Raises
+    ------
+    codec.MalformedFrameError
+        If the message is not an object or a field has the wrong type.
+    """
+    if not isinstance(message := codec.read(buffer), dict):
+        msg = 'Message is not an object.'
+        raise codec.MalformedFrameError(msg)
+    fields: dict[str, Any] = {'init': 'init' in message}
+    for key, name, types in _REQUEST_FIELDS:
+        if key not in message:
+            continue
+        if not isinstance(value := message[key], types):
+            msg = f'Invalid value for {key}: {value!r}'
+            raise codec.MalformedFrameError(msg)
+        fields[name] = value
+    return Request(**fields)
+
+
+def wait_for_message(buffer: BinaryIO, timeout: float | None) -> bool:
+    """
+    Wait up to ``timeout`` seconds for ``buffer`` to become readable.
 
-def remove_socket() -> bool:
+    Streams without a file descriptor (and all streams on Windows) are treated as always readable.
+
+    Returns
+    -------
+    bool
+        ``False`` if the timeout expired with nothing to read.
+    """
+    if timeout is None or IS_WIN:
+        return True
     try:
-        Path(MPV_SOCKET).unlink(missing_ok=True)
+        fd = buffer.fileno()
+    except (AttributeError, OSError, ValueError):
+        return True
+    readable, _, _ = select.select((fd,), (), (), timeout)
+    return bool(readable)
+
+
+def reap_children() -> None:
+    """Collect exited children so a long-lived host does not accumulate zombies."""
+    if IS_WIN:
+        return
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0] > 0:
+            pass
+    except ChildProcessError:
+        pass
+
+
+def _ensure_dir(path: Path) -> None:
+    try:
+        path.mkdir(parents=True, exist_ok=True)
+    except PermissionError:  # pragma: no cover
+        logger.warning('Cannot create directory %s.', path)
+
+
+def remove_socket(path: Path | str = MPV_SOCKET) -> bool:
+    if str(path).startswith('@'):
+        # Abstract sockets have no file.
+        return True
+    try:
+        Path(path).unlink(missing_ok=True)
     except OSError:  # pragma: no cover
         return False
     return True
@@ -93,15 +295,17 @@ def spawn(func: Callable[[], Any]) -> None:
     logger.debug('Second fork.')
     try:
         if os.fork() > 0:
-            # Exit from the second parent.
-            sys.exit(0)
+            # Exit from the second parent without running cleanup handlers or unwinding the caller.
+            os._exit(os.EX_OK)
     except OSError as exc:
         logger.exception('Fork #2 failed: %s (%s).', exc.errno, exc.strerror)
         sys.exit(1)
     logger.debug('Calling callback.')
     func()
     logger.debug('Callback returned.')
-    # Exit without calling cleanup handlers.
+    # Exit without calling cleanup handlers, except for writing the queued log records. Unlike
+    # logging.shutdown(), this does not touch the handlers inherited from the parent.
+    logs.close_all()
     os._exit(os.EX_OK)
 
 
@@ -126,146 +330,868 @@ def get_mpv_path() -> str:
     return 'mpv'
 
 
-def mpv_and_cleanup(url: str,
+def mpv_capabilities(new_env: Mapping[str, str]) -> capabilities.Capabilities | None:
+    """
+    Get the cached capabilities of the mpv that runs with ``new_env``.
+
+    If they are not cached, they are probed in the background for the next launch.
+
+    Returns
+    -------
+    capabilities.Capabilities | None
+        The capabilities, or ``None`` if they are not cached.
+    """
+    if (mpv_path := capabilities.resolve(get_mpv_path(), new_env.get('PATH'))) is None:
+        return None
+    if (caps := capabilities.load(mpv_path)) is None and not getattr(sys, 'frozen', False):
+        logger.debug('Capabilities of %s are not cached. Probing in the background.', mpv_path)
+        try:
+            launch(capabilities.command(mpv_path), new_env)
+        except OSError:
+            logger.exception('Failed to start the capability probe.')
+    return caps
+
+
+def mpv_command(url: str | None,
+                *,
+                debug: bool = False,
+                socket_path: Path | str | None = None,
+                extra_args: Sequence[str] = (),
+                queue: Sequence[str] = (),
+                url_options: Mapping[str, str] | None = None,
+                caps: capabilities.Capabilities | None = None,
+                drained: bool | None = None) -> list[str]:
+    """
+    Build the command line for a new mpv instance.
+
+    ``url`` may be ``None`` for an instance that starts idle. ``socket_path`` defaults to
+    ``MPV_SOCKET`` and may be an ``@``-prefixed abstract socket name. ``extra_args`` are added
+    before the URL and ``queue`` after it. ``url_options`` are per-file options for ``url``. With
+    ``caps`` (see :py:func:`mpv_capabilities`), options the binary does not support are left out.
+    ``drained`` tells whether the output of mpv goes through the log drain (by default, whether
+    :py:func:`launch` can drain it). Without the drain, debug mode adds ``--log-file``.
+
+    Returns
+    -------
+    list[str]
+        The command line.
+    """
+    cmd_parts = [get_mpv_path(), *capabilities.profile(caps, debug=debug, gpu_api=not IS_WIN)]
+    cmd_parts.append(f'--input-ipc-server={socket_path or MPV_SOCKET}')
+    cmd_parts.extend(caps.filter(extra_args) if caps else extra_args)
+    file_options = [f'--{k}={v}' for k, v in (url_options or {}).items()]
+    if url is not None and (file_options := caps.filter(file_options) if caps else file_options):
+        cmd_parts.extend(('--{', *file_options, url, '--}'))
+    elif url is not None:
+        cmd_parts.append(url)
+    cmd_parts.extend(queue)
+    if debug and not (_launch_drains() if drained is None else drained):
+        cmd_parts.append(f'--log-file={MPV_LOG_PATH}')
+    # On Windows with a PyInstaller bundle, configure the yt-dlp path.
+    if IS_WIN and getattr(sys, 'frozen', False):
+        ytdlp_path = Path(sys.executable).parent / 'yt-dlp.exe'
+        if ytdlp_path.exists():
+            logger.debug('Using bundled yt-dlp at: %s', ytdlp_path)
+            cmd_parts.append(f'--script-opts=ytdl_hook-ytdl_path={ytdlp_path}')
+    return cmd_parts
+
+
+def mpv_and_cleanup(url: str | None,
                     new_env: Mapping[str, str],
                     *,
-                    debug: bool = False) -> Callable[[], None]:
+                    debug: bool = False,
+                    socket_path: Path | str | None = None,
+                    queue: Sequence[str] = (),
+                    extra_args: Sequence[str] = (),
+                    url_options: Mapping[str, str] | None = None,
+                    registered: bool = False) -> Callable[[], None]:
     def callback() -> None:
-        with Path(MPV_LOG_PATH).open('a', encoding='utf-8') as log:
-            mpv_path = get_mpv_path()
-            cmd_parts = [mpv_path]
-            if not IS_WIN:
-                cmd_parts.append('--gpu-api=opengl')
-            cmd_parts.append('--player-operation-mode=pseudo-gui')
-            if debug:
-                cmd_parts.append('-v')
-            else:
-                cmd_parts.append('--quiet')
-            cmd_parts.extend((f'--input-ipc-server={MPV_SOCKET}', url))
-            if debug:
-                cmd_parts.append(f'--log-file={MPV_LOG_PATH}')
-            # On Windows with a PyInstaller bundle, configure the yt-dlp path.
-            if IS_WIN and getattr(sys, 'frozen', False):
-                ytdlp_path = Path(sys.executable).parent / 'yt-dlp.exe'
-                if ytdlp_path.exists():
-                    logger.debug('Using bundled yt-dlp at: %s', ytdlp_path)
-                    cmd_parts.append(f'--script-opts=ytdl_hook-ytdl_path={ytdlp_path}')
-            logger.debug('Running: %s', ' '.join(quote(x) for x in cmd_parts))
-            sp.run(cmd_parts, env=new_env, stderr=log, stdout=log, check=True)
-        if not remove_socket():  # pragma: no cover
+        if registered:
+            from . import registry  # ruff:ignore[import-outside-top-level]
+
+            # This process waits for mpv, so it stands in for mpv in the registry.
+            registry.register(Path(socket_path or MPV_SOCKET), os.getpid())
+        cmd_parts = mpv_command(url,
+                                debug=debug,
+                                socket_path=socket_path,
+                                extra_args=extra_args,
+                                queue=queue,
+                                url_options=url_options,
+                                caps=mpv_capabilities(new_env),
+                                drained=not IS_WIN)
+        logger.debug('Running: %s', ' '.join(quote(x) for x in cmd_parts))
+        _run_drained(cmd_parts, new_env)
+        if not remove_socket(socket_path or MPV_SOCKET):  # pragma: no cover
             logger.warning('Failed to remove socket file.')
+        if registered:
+            registry.release(Path(socket_path or MPV_SOCKET))
 
     return callback
 
 
-def spawn_init(url: str, new_env: Mapping[str, str], *, debug: bool = False) -> None:
+def _run_drained(cmd: Sequence[str], new_env: Mapping[str, str]) -> None:
+    if IS_WIN:
+        # Rotating the log needs flock().
+        with MPV_LOG_PATH.open('a', encoding='utf-8') as log:
+            sp.run(cmd, env=new_env, stderr=log, stdout=log, check=True)
+        return
+    from . import mpvlog  # ruff:ignore[import-outside-top-level]
+
+    read_fd, write_fd = os.pipe()
+    drain = mpvlog.Drain(read_fd, MPV_LOG_PATH)
+    drain.start()
+    try:
+        with contextlib.ExitStack() as stack:
+            # Closing the write end lets the drain reach the end of the output.
+            stack.callback(drain.close)
+            stack.callback(os.close, write_fd)
+            sp.run(cmd, env=new_env, stderr=sp.STDOUT, stdout=write_fd, check=True)
+    except sp.CalledProcessError as e:
+        logger.warning('mpv exited with status %d. Its last output is in %s.', e.returncode,
+                       MPV_CRASH_LOG_PATH)
+        mpvlog.write_crash_report(drain, path=MPV_CRASH_LOG_PATH)
+        raise
+
+
+def _launch_drains() -> bool:
+    # A frozen host cannot be run as python -m, and rotating the log needs flock().
+    return not IS_WIN and not getattr(sys, 'frozen', False)
+
+
+def _spawn_detached(executable: str, cmd: Sequence[str], new_env: Mapping[str, str], *,
+                    stdin: int, output: int) -> int:
+    if hasattr(os, 'posix_spawn'):
+        try:
+            return os.posix_spawn(executable,
+                                  list(cmd),
+                                  new_env,
+                                  file_actions=((os.POSIX_SPAWN_DUP2, stdin, 0),
+                                                (os.POSIX_SPAWN_DUP2, output, 1),
+                                                (os.POSIX_SPAWN_DUP2, output, 2)),
+                                  setsid=True)
+        except NotImplementedError:
+            logger.debug('posix_spawn() does not support setsid here.')
+    return sp.Popen(
+        (executable, *cmd[1:]),
+        env=new_env,
+        stdin=stdin,
+        stdout=output,
+        stderr=output,
+        start_new_session=True).pid
+
+
+def launch(cmd: Sequence[str], new_env: Mapping[str, str], *, drain: bool = False) -> int:
+    """
+    Start ``cmd`` detached from the host without forking the interpreter.
+
+    The child runs in a new session with ``/dev/null`` as standard input and ``MPV_LOG_PATH`` as
+    standard output and standard error, so the browser does not wait for it. Nothing waits for the
+    child; mpv removes its own IPC socket when it exits. Uses :py:func:`os.posix_spawn` where it
+    supports ``setsid``, otherwise :py:class:`subprocess.Popen`.
+
+    With ``drain`` (except on Windows and in a frozen build), the output goes through a pipe to
+    ``python -m open_in_mpv.mpvlog`` instead, which rotates the file (see
+    :py:mod:`open_in_mpv.mpvlog`). That is a second, resident process: it is also started in a new
+    session and runs until the child and anything that inherited the pipe have exited.
+
+    Returns
+    -------
+    int
+        The process ID of the child.
+    """
+    executable = which(cmd[0], path=new_env.get('PATH')) or cmd[0]
+    logger.debug('Launching: %s', ' '.join(quote(x) for x in cmd))
+    _ensure_dir(MPV_LOG_PATH.parent)
+    log_fd = os.open(MPV_LOG_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    null_fd = os.open(os.devnull, os.O_RDONLY)
+    try:
+        if not drain or not _launch_drains():
+            return _spawn_detached(executable, cmd, new_env, stdin=null_fd, output=log_fd)
+        read_fd, write_fd = os.pipe()
+        try:
+            _spawn_detached(sys.executable, (sys.executable, '-m', f'{__package__}.mpvlog'),
+                            new_env,
+                            stdin=read_fd,
+                            output=log_fd)
+            return _spawn_detached(executable, cmd, new_env, stdin=null_fd, output=write_fd)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+    finally:
+        os.close(null_fd)
+        os.close(log_fd)
+
+
+def fill_pool(size: int,
+              new_env: Mapping[str, str],
+              *,
+              debug: bool = False,
+              ttl: float = pool.POOL_TTL,
+              extra_args: Sequence[str] = (),
+              caps: capabilities.Capabilities | None = None) -> None:
+    """Start idle instances in the background until the pool has ``size`` of them."""
+    for _ in range(pool.missing(size)):
+        logger.debug('Starting a pool instance.')
+        socket_path = pool.new_socket_path()
+        instance.write_owner(
+            socket_path,
+            launch(
+                mpv_command(None,
+                            debug=debug,
+                            socket_path=socket_path,
+                            extra_args=[*extra_args, *pool.instance_args(ttl)],
+                            caps=caps),
+                new_env,
+                drain=True))
+
+
+def spawn_init(url: str | None,
+               new_env: Mapping[str, str],
+               *,
+               debug: bool = False,
+               launcher: str = DEFAULT_LAUNCHER,
+               pool_size: int = 0,
+               pool_ttl: float = pool.POOL_TTL,
+               abstract: bool = False,
+               queue: Sequence[str] = (),
+               playlist: str | None = None,
+               extra_args: Sequence[str] = (),
+               url_options: Mapping[str, str] | None = None,
+               socket_path: Path | None = None) -> int | None:
+    """
+    Open ``url`` in a new instance.
+
+    ``queue`` and ``playlist`` are added to the playlist after ``url``. If ``pool_size`` is not
+    zero, a pre-warmed instance is used if there is one, and the pool is refilled afterwards. With
+    ``abstract``, the instance listens on a Linux abstract socket instead of ``MPV_SOCKET``.
+    ``extra_args`` are added to the command line of new instances and ``url_options`` are per-file
+    options for ``url``. ``socket_path`` is a socket reserved with
+    :py:func:`open_in_mpv.registry.route`; the instance listens on it and is registered.
+
+    Returns
+    -------
+    int | None
+        The process ID of the instance, or ``None`` if it is not known (with the ``fork``
+        launcher).
+    """
     logger.debug('Spawning initial instance.')
-    spawn(mpv_and_cleanup(url, new_env, debug=debug))
+    _ensure_dir(MPV_SOCKET.parent)
+    abstract = abstract and socket_path is None
+    use_pool = pool_size > 0 and not IS_WIN and not abstract
+    target = socket_path or MPV_SOCKET
+    address = instance.abstract_address(MPV_SOCKET) if abstract else socket_path
+    pid: int | None = None
+    launched = False
+    caps: capabilities.Capabilities | None = None
+    if use_pool and url is not None and pool.claim(url, url_options, target=socket_path):
+        logger.debug('Using a pool instance.')
+        if (owner := instance.read_owner(target)) is not None:
+            pid = owner[0]
+        if queue or playlist:
+            try:
+                batch.send(batch.commands(queue, mode='append', playlist=playlist), target)
+            except OSError:
+                logger.exception('Failed to add the rest of the batch.')
+    elif launcher == 'spawn' and not IS_WIN:
+        launched = True
+        caps = mpv_capabilities(new_env)
+        pid = launch(
+            mpv_command(url,
+                        debug=debug,
+                        socket_path=address,
+                        extra_args=extra_args,
+                        queue=batch.args(queue, playlist=playlist),
+                        url_options=url_options,
+                        caps=caps),
+            new_env,
+            drain=True)
+        if not abstract:
+            instance.write_owner(target, pid)
+    else:
+        if not abstract:
+            # The process ID is not known here. A record left by an earlier instance would make the
+            # new one look stale.
+            instance.remove_owner(target)
+        spawn(
+            mpv_and_cleanup(url,
+                            new_env,
+                            debug=debug,
+                            socket_path=address,
+                            queue=batch.args(queue, playlist=playlist),
+                            extra_args=extra_args,
+                            url_options=url_options,
+                            registered=socket_path is not None))
+    if socket_path is not None and pid is not None:
+        from . import registry  # ruff:ignore[import-outside-top-level]
+
+        registry.register(socket_path, pid)
+    if use_pool:
+        fill_pool(pool_size,
+                  new_env,
+                  debug=debug,
+                  ttl=pool_ttl,
+                  extra_args=extra_args,
+                  caps=caps if launched else mpv_capabilities(new_env))
+    return pid
 
 
-def get_callback(url: str,
+def get_callback(url: str | None,
                  new_env: Mapping[str, str],
                  *,
-                 debug: bool = False) -> Callable[[], None]:
+                 debug: bool = False,
+                 launcher: str = DEFAULT_LAUNCHER,
+                 pool_size: int = 0,
+                 pool_ttl: float = pool.POOL_TTL,
+                 abstract: bool = False,
+                 queue: Sequence[str] = (),
+                 playlist: str | None = None,
+                 mode: str = 'replace',
+                 extra_args: Sequence[str] = (),
+                 url_options: Mapping[str, str] | None = None,
+                 socket_path: Path | None = None,
+                 starting: bool = False) -> Callable[[], None]:
+    address = socket_path or (instance.abstract_address(MPV_SOCKET) if abstract else MPV_SOCKET)
+
     def callback() -> None:
         if not hasattr(socket, 'AF_UNIX'):
             # The Python build may lack AF_UNIX socket support on Windows, or the OS version may be
             # too old.
             logger.debug('AF_UNIX not supported, spawning initial instance.')
-            spawn_init(url, new_env, debug=debug)
+            spawn_init(url,
+                       new_env,
+                       debug=debug,
+                       launcher=launcher,
+                       pool_size=pool_size,
+                       pool_ttl=pool_ttl,
+                       abstract=abstract,
+                       queue=queue,
+                       playlist=playlist,
+                       extra_args=extra_args,
+                       url_options=url_options,
+                       socket_path=socket_path)
             return
+        if starting or (socket_path is not None and not socket_path.exists()):
+            logger.debug('Waiting for the instance at %s to start.', address)
+            instance.wait(socket_path or MPV_SOCKET, abstract=abstract and socket_path is None)
         logger.debug('Sending loadfile command.')
+        # All commands go out in one write so mpv handles the batch in one read.
+        data = b''.join(
+            json.dumps({
+                'command': command
+            }).encode(errors='strict') + b'\n'
+            for command in batch.commands([url, *queue] if url is not None else queue,
+                                          mode=mode,
+                                          playlist=playlist,
+                                          options=url_options))
         sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         sock.settimeout(2)
         try:
-            sock.connect(str(MPV_SOCKET))
+            sock.connect(instance.connect_address(address))
             sock.settimeout(None)
             logger.debug('Connected to socket.')
-            sock.send(json.dumps({'command': ['loadfile', url]}).encode(errors='strict') + b'\n')
+            sock.send(data)
         except OSError:
             logger.exception('Connection refused.')
-            if not remove_socket():  # pragma: no cover
+            if not remove_socket(address):  # pragma: no cover
                 logger.exception('Failed to remove socket file.')
-            spawn_init(url, new_env, debug=debug)
+            spawn_init(url,
+                       new_env,
+                       debug=debug,
+                       launcher=launcher,
+                       pool_size=pool_size,
+                       pool_ttl=pool_ttl,
+                       abstract=abstract,
+                       queue=queue,
+                       playlist=playlist,
+                       extra_args=extra_args,
+                       url_options=url_options,
+                       socket_path=socket_path)
 
     return callback
 
 
-class CustomHelp(click.Command):
-    @override
-    def format_help(self, ctx: click.Context, formatter: click.formatting.HelpFormatter) -> None:
-        click.echo('This script is intended to be used with the '
-                   'Chrome extension. There is no CLI interface for general use.')
-        super().format_help(ctx, formatter)
-
-
-@click.command(cls=CustomHelp,
-               context_settings={
-                   'allow_extra_args': True,
-                   'help_option_names': ('-h', '--help')
-               })
-@click.argument('chrome_url')
-@click.argument('message', type=click.File('rb'), default=sys.stdin.buffer)
-@click.option('-d', '--debug', help='Enable debug logging.', is_flag=True)
-@click.version_option(VERSION, '-V', '--version', message='%(version)s')
-def main(
-        chrome_url: str,  # ruff: ignore[unused-function-argument]
-        message: BinaryIO,
-        *,
-        debug: bool = False) -> None:
-    """Open a URL in mpv; read a 4-byte length prefix and JSON message from standard input."""  # ruff:ignore[docstring-missing-exception]
-    input_json = request(message)
-    debug = input_json.get('debug', debug)
-    single: bool = input_json.get('single', True)
-    setup_logging(
-        debug=debug,
-        formatters={
-            'file': {
-                'format': '%(asctime)s | %(levelname)-8s | %(name)s:%(funcName)s:%(lineno)d - '
-                          '%(message)s'
-            }
-        },
-        handlers={
-            'file': {
-                'backupCount': 1,
-                'class': 'logging.handlers.RotatingFileHandler',
-                'filename': str(_LOG_DIR_PATH / 'main.log'),
-                'formatter': 'file',
-                'maxBytes': 1048576
-            }
-        },
-        loggers={
-            'open_in_mpv': {
-                'handlers': ('console', 'file') if debug else ('file',),
-                'propagate': False
-            }
-        },
-        root={'handlers': ('console', 'file')})
-    logger.debug('Arguments: %s', ' '.join(quote(x) for x in sys.argv))
-    logger.debug('Decoded message: %s', input_json)
-    logger.info('Single instance mode %s.', 'enabled' if single else 'disabled')
-    logger.info('Debug mode %s.', 'enabled' if debug else 'disabled')
-    if input_json.get('init'):
-        response({'logPath': str(LOG_PATH), 'socketPath': str(MPV_SOCKET), 'version': VERSION})
+LOG_FORMAT = '%(asctime)s | %(levelname)-8s | %(name)s:%(funcName)s:%(lineno)d - %(message)s'
+"""Format of records in the log file."""
+
+
+def _log_handlers(*, debug: bool) -> list[logging.Handler]:
+    # Runs on the writer thread of logs.BackgroundHandler.
+    from logging.handlers import RotatingFileHandler  # ruff:ignore[import-outside-top-level]
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers: list[logging.Handler] = []
+    if debug:
+        handlers.append(logging.StreamHandler())
+    _ensure_dir(_LOG_DIR_PATH)
+    try:
+        handlers.append(
+            RotatingFileHandler(_LOG_DIR_PATH / 'main.log',
+                                backupCount=1,
+                                encoding='utf-8',
+                                maxBytes=1048576))
+    except OSError:
+        logger.warning('Cannot open the log file.')
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _setup_logging(*, debug: bool) -> None:
+    # The log file is only opened when the first record is written, on another thread.
+    handler = logs.BackgroundHandler(functools.partial(_log_handlers, debug=debug))
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG if debug else logging.INFO)
+
+
+def _record_metrics(message: Request, timer: metrics.Timer, env: Mapping[str, str], *,
+                    address: Path | str, new_instance: bool, url: str | None) -> None:
+    if message.click_time is not None:
+        timer.mark_browser(message.click_time)
+    metrics.write(timer.stages, record_id=timer.id)
+    if IS_WIN or getattr(sys, 'frozen', False):
         return
-    if (url := input_json.get('url')) is None:
+    # The watcher imports asyncio, which is too slow to import for every message.
+    from . import watcher  # ruff:ignore[import-outside-top-level]
+    try:
+        launch(
+            watcher.command(address, timer, new_instance=new_instance, url=url), env)
+    except OSError:
+        logger.exception('Failed to start the watcher.')
+
+
+def _stream_cache(url: str | None,
+                  ytdl_format: str | None = None) -> tuple[str | None, dict[str, Any]]:
+    # Hashing and URL parsing are only imported when the cache is enabled.
+    from . import streams  # ruff:ignore[import-outside-top-level]
+    # A frozen host cannot be run as python -m by the script.
+    options: dict[str, Any] = {
+        'extra_args': () if getattr(sys, 'frozen', False) else streams.script_args()
+    }
+    if url is not None and (entry := streams.lookup(url, ytdl_format=ytdl_format)) is not None:
+        logger.debug('Using the cached stream for %s.', url)
+        options['url_options'] = entry.loadfile_options()
+        return entry.stream, options
+    return url, options
+
+
+def _site(page_url: str) -> str | None:
+    from urllib.parse import urlsplit  # ruff:ignore[import-outside-top-level]
+
+    from .urls import canonical_url  # ruff:ignore[import-outside-top-level]
+    return urlsplit(canonical_url(page_url)).hostname
+
+
+def _pick_format(page_url: str) -> str | None:
+    if not (site := _site(page_url)):
+        return None
+    from . import formats  # ruff:ignore[import-outside-top-level]
+    if (value := formats.selector(formats.lookup(site), formats.screen_height())) is not None:
+        logger.debug('Using format %s for %s.', value, site)
+    return value
+
+
+def _file_options(page_url: str, url: str | None, *, resume: bool, tune: bool,
+                  ytdl_format: str | None) -> dict[str, str]:
+    options = {}
+    if tune and (site := _site(page_url)):
+        from . import tuning  # ruff:ignore[import-outside-top-level]
+        if (profile := tuning.lookup(site)) is not None:
+            logger.debug('Using the cache settings tuned for %s.', site)
+            options.update(tuning.options(profile))
+    # A cached stream is not passed to yt-dlp.
+    if ytdl_format is not None and url == page_url:
+        options['ytdl-format'] = ytdl_format
+    if resume:
+        # SQLite is only imported when history is enabled.
+        from . import history  # ruff:ignore[import-outside-top-level]
+        entry = history.lookup(page_url)
+        if entry is not None and (position := entry.resume_position()) is not None:
+            logger.debug('Resuming %s at %s seconds.', page_url, position)
+            options['start'] = str(position)
+    if url != page_url:
+        from .urls import PAGE_OPTION  # ruff:ignore[import-outside-top-level]
+
+        # mpv is given a cached stream, so tell the companions what the page was.
+        options['script-opts-append'] = f'{PAGE_OPTION}={page_url}'
+    return options
+
+
+def _start_companions(companions: Mapping[str, Sequence[str]], address: Path | str,
+                      env: Mapping[str, str]) -> None:
+    if getattr(sys, 'frozen', False):
+        return
+    for name, args in companions.items():
+        if instance.companion_running(address, name):
+            continue
+        logger.debug('Starting the %s.', name)
+        try:
+            launch(instance.companion_command(name, address, *args), env)
+        except OSError:
+            logger.exception('Failed to start the %s.', name)
+
+
+def _resolver(env: Mapping[str, str]) -> list[str]:
+    if IS_WIN:
+        return []
+    # The resolver imports concurrent.futures, which most messages do not need.
+    from . import resolver  # ruff:ignore[import-outside-top-level]
+    if not (shim := resolver.shim_path()):
+        logger.warning('%s is not installed.', resolver.SHIM_NAME)
+        return []
+    if not resolver.is_running():
+        logger.debug('Starting the resolver.')
+        try:
+            launch(resolver.command(), env)
+        except OSError:
+            logger.exception('Failed to start the resolver.')
+    return [f'--script-opts-append=ytdl_hook-ytdl_path={shim}']
+
+
+def _urls(message: Request) -> list[Any]:
+    urls: list[Any] = [*((message.url,) if message.url is not None else ()), *message.urls]
+    playlist = message.playlist
+    if not urls and not playlist:
         logger.error('No URL was given.')
-        raise click.Abort
-    if not re.match(r'^https?://', url):
-        logger.error('Invalid URL: %s', url)
-        raise click.Abort
+        msg = 'No URL was given.'
+        raise ValueError(msg)
+    for url in urls:
+        if not isinstance(url, str) or not re.match(r'^https?://', url):
+            logger.error('Invalid URL: %s', url)
+            msg = f'Invalid URL: {url}'
+            raise ValueError(msg)
+    if playlist and not (re.match(r'^https?://', playlist) or Path(playlist).is_file()):
+        logger.error('Invalid playlist: %s', playlist)
+        msg = f'Invalid playlist: {playlist}'
+        raise ValueError(msg)
+    if message.mode not in batch.MODES:
+        logger.error('Invalid mode: %s', message.mode)
+        msg = f'Invalid mode: {message.mode}'
+        raise ValueError(msg)
+    # The registry needs flock() and a socket file per instance.
+    if not message.single and not IS_WIN:
+        from . import registry  # ruff:ignore[import-outside-top-level]
+
+        if message.route not in registry.POLICIES:
+            logger.error('Invalid route: %s', message.route)
+            msg = f'Invalid route: {message.route}'
+            raise ValueError(msg)
+    return urls
+
+
+def _repeated(message: Request, urls: Sequence[str]) -> bool:
+    # The table needs flock().
+    if message.debounce <= 0 or IS_WIN:
+        return False
+    from . import recent  # ruff:ignore[import-outside-top-level]
+
+    if not recent.seen(recent.key(urls, playlist=message.playlist, mode=message.mode),
+                       message.debounce):
+        return False
+    logger.info('Dropping a repeated request.')
+    response({
+        'duplicate': True,
+        'logPath': str(LOG_PATH),
+        'message': 'Repeated request dropped.',
+        'version': VERSION
+    })
+    return True
+
+
+def _launch_options(message: Request, page_url: str | None,
+                    env: Mapping[str, str]) -> tuple[str | None, dict[str, Any]]:
+    url = page_url
+    launch_options: dict[str, Any] = {}
+    # Picked first, as the cached stream must have been resolved with the same format.
+    ytdl_format = _pick_format(page_url) if message.format_policy and page_url is not None else None
+    if message.stream_cache:
+        url, launch_options = _stream_cache(url, ytdl_format)
+    if page_url is not None and (options := _file_options(page_url,
+                                                          url,
+                                                          resume=message.history,
+                                                          tune=message.tune_cache,
+                                                          ytdl_format=ytdl_format)):
+        launch_options['url_options'] = {**launch_options.get('url_options', {}), **options}
+    if message.resolver and (resolver_args := _resolver(env)):
+        launch_options['extra_args'] = [*launch_options.get('extra_args', ()), *resolver_args]
+    return url, launch_options
+
+
+def _companions(message: Request) -> dict[str, list[str]]:
+    # Companions need flock() to find out whether an instance already has one.
+    companions: dict[str, list[str]] = {}
+    if IS_WIN:
+        return companions
+    if message.history:
+        companions['recorder'] = []
+    if message.telemetry or message.tune_cache or message.format_policy:
+        companions['collector'] = [
+            *(() if message.telemetry else ('--no-telemetry',)),
+            *(('--tune',) if message.tune_cache else ()),
+            *(('--formats',) if message.format_policy else ())
+        ]
+    return companions
+
+
+def _open(message: Request, url: str | None, queue: Sequence[str], env: Mapping[str, str], *,
+          debug: bool, page_url: str | None, items: int,
+          launch_options: dict[str, Any]) -> tuple[bool, Path | None]:
+    abstract = IS_LINUX and message.abstract
+    pool_options: dict[str, Any] = {
+        'pool_size': message.pool_size,
+        'pool_ttl': message.pool_ttl,
+        'abstract': abstract
+    }
+    socket_path: Path | None = None
+    lock: instance.LaunchLock | None = None
+    starting = False
+    with contextlib.ExitStack() as stack:
+        # The registry needs flock() and a socket file per instance.
+        if not message.single and not IS_WIN:
+            from . import registry  # ruff:ignore[import-outside-top-level]
+
+            socket_path, new = registry.route(page_url,
+                                              policy=message.route,
+                                              max_instances=message.max_instances,
+                                              items=items,
+                                              replace=message.mode == 'replace')
+            launch_options['socket_path'] = socket_path
+            running = not new
+            logger.debug('Routed to %s instance at %s.', 'a new' if new else 'the', socket_path)
+        elif message.single:
+            # Checking and starting under the lock keeps concurrent requests from both starting
+            # an instance.
+            lock = stack.enter_context(instance.LaunchLock(MPV_SOCKET))
+            existed = not abstract and MPV_SOCKET.exists()
+            if (running := instance.is_running(MPV_SOCKET, abstract=abstract)) or existed:
+                # The last instance started is up, or its socket is stale.
+                lock.clear()
+            if running:
+                logger.debug('An instance is running and single instance mode is enabled.')
+            elif running := lock.starting():
+                logger.debug('Another request is starting an instance. Waiting for it.')
+                starting = True
+        else:
+            running = False
+        if running:
+            spawn(
+                get_callback(url,
+                             env,
+                             debug=debug,
+                             launcher=message.launcher,
+                             queue=queue,
+                             playlist=message.playlist,
+                             mode=message.mode,
+                             starting=starting,
+                             **pool_options,
+                             **launch_options))
+        else:
+            try:
+                pid = spawn_init(url,
+                                 env,
+                                 debug=debug,
+                                 launcher=message.launcher,
+                                 queue=queue,
+                                 playlist=message.playlist,
+                                 **pool_options,
+                                 **launch_options)
+            except OSError:
+                if socket_path is not None:
+                    registry.release(socket_path)
+                raise
+            if lock is not None:
+                lock.mark(pid)
+    return running, socket_path
+
+
+def handle_message(message: Request,
+                   *,
+                   debug: bool,
+                   timer: metrics.Timer | None = None) -> None:
+    """
+    Act on one decoded message.
+
+    The duration of each stage is recorded in ``timer``. If the message has ``metrics``, the
+    durations are written to the metrics file and a watcher is started to time mpv. With
+    ``debounce``, a repeat of a request handled less than that many seconds ago is only answered
+    (see :py:mod:`open_in_mpv.recent`). With ``history``, the first URL starts where it was left
+    (see :py:mod:`open_in_mpv.history`). With ``tune_cache``, it gets the cache settings tuned for
+    its site (see :py:mod:`open_in_mpv.tuning`). With ``format_policy``, it gets a ``ytdl-format``
+    that fits the screen and avoids formats that dropped frames (see :py:mod:`open_in_mpv.formats`).
+    The history recorder and, with ``telemetry``, ``tune_cache`` or ``format_policy``, the
+    telemetry collector are started for the instance if it has none (see
+    :py:mod:`open_in_mpv.companion`).
+
+    An :py:exc:`OSError` from starting mpv is not caught.
+
+    Raises
+    ------
+    ValueError
+        If the message does not contain a usable URL or playlist, or has an invalid ``mode`` or
+        ``route``.
+    """  # ruff:ignore[docstring-extraneous-exception]
+    if message.init:
+        response({'logPath': str(LOG_PATH), 'socketPath': str(MPV_SOCKET), 'version': VERSION})
+        return
+    urls = _urls(message)
+    if _repeated(message, urls):
+        return
+    url, queue = (urls[0], urls[1:]) if urls else (None, [])
     data_resp: dict[str, Any] = {
         'logPath': str(LOG_PATH),
         'message': 'About to spawn.',
         'version': VERSION
     }
-    data_resp['env'] = environment(data_resp, debugging=debug)
+    timer = timer or metrics.Timer()
+    env = environment(data_resp, debugging=debug)
+    timer.mark('env')
+    if message.dump_env:
+        data_resp['env'] = env
     logger.debug('About to spawn.')
     response(data_resp)
-    if MPV_SOCKET.exists() and single:
-        logger.debug('Socket exists and single instance mode is enabled.')
-        spawn(get_callback(cast('str', url), data_resp['env'], debug=debug))
-    else:
-        spawn_init(cast('str', url), data_resp['env'], debug=debug)
+    page_url = url
+    url, launch_options = _launch_options(message, page_url, env)
+    running, socket_path = _open(message,
+                                 url,
+                                 queue,
+                                 env,
+                                 debug=debug,
+                                 page_url=page_url,
+                                 items=len(urls) + bool(message.playlist),
+                                 launch_options=launch_options)
+    timer.mark('ipc' if running else 'spawn')
+    address = socket_path or (instance.abstract_address(MPV_SOCKET)
+                              if IS_LINUX and message.abstract else MPV_SOCKET)
+    if companions := _companions(message):
+        _start_companions(companions, address, env)
+    if message.metrics:
+        _record_metrics(message,
+                        timer,
+                        env,
+                        address=address,
+                        new_instance=not running,
+                        url=url)
     logger.debug('mpv should open soon.')
+
+
+def serve(buffer: BinaryIO, *, debug: bool, idle_timeout: float | None = IDLE_TIMEOUT) -> None:
+    """
+    Handle messages from a ``connectNative`` port until it is closed or idle for too long.
+
+    ``buffer`` should be unbuffered (such as the ``raw`` stream of standard input). Errors,
+    including failures to start mpv, are sent back as ``{"error": ...}`` responses instead of
+    ending the host. Framing errors also have a ``code``; after an invalid length prefix the stream
+    cannot be read any further, so the host exits.
+    """
+    logger.info('Persistent mode enabled.')
+    logger.debug('Using %s for JSON.', codec.use_fast_backend())
+    while True:
+        reap_children()
+        if not wait_for_message(buffer, idle_timeout):
+            logger.info('No message for %s seconds. Exiting.', idle_timeout)
+            return
+        timer = metrics.Timer()
+        try:
+            message = request(buffer)
+        except EOFError:
+            logger.info('Port closed. Exiting.')
+            return
+        except codec.FrameTooLargeError as exc:
+            logger.exception('Invalid frame. Exiting.')
+            response({'error': str(exc), 'code': exc.code})
+            return
+        except codec.MalformedFrameError as exc:
+            logger.exception('Invalid message.')
+            response({'error': str(exc), 'code': exc.code})
+            continue
+        timer.mark('decode')
+        logger.debug('Decoded message: %s', message)
+        try:
+            handle_message(message, debug=message.debug or debug, timer=timer)
+        except ValueError as exc:
+            response({'error': str(exc)})
+        except OSError as exc:
+            # For example mpv could not be started. The next message may still succeed.
+            logger.exception('Failed to handle the message.')
+            response({'error': str(exc)})
+
+
+def host(buffer: BinaryIO, *, debug: bool = False) -> None:
+    """
+    Handle the first message on ``buffer`` and, if it asks for it, every following message.
+
+    If the first message has ``"persistent": true``, keep reading messages until ``buffer`` is
+    closed or no message arrives within ``idleTimeout`` seconds.
+
+    Raises
+    ------
+    OSError
+        If the first message cannot be handled, such as when mpv cannot be started, and persistent
+        mode was not requested.
+    ValueError
+        If the first message cannot be decoded, or is invalid and persistent mode was not requested.
+    """
+    timer = metrics.Timer()
+    message = request(buffer)
+    timer.mark('decode')
+    debug = message.debug or debug
+    _setup_logging(debug=debug)
+    timer.mark('logging')
+    logger.debug('Arguments: %s', ' '.join(quote(x) for x in sys.argv))
+    logger.debug('Decoded message: %s', message)
+    logger.info('Single instance mode %s.', 'enabled' if message.single else 'disabled')
+    logger.info('Debug mode %s.', 'enabled' if debug else 'disabled')
+    try:
+        handle_message(message, debug=debug, timer=timer)
+    except ValueError as exc:
+        if not message.persistent:
+            raise
+        response({'error': str(exc)})
+    except OSError as exc:
+        if not message.persistent:
+            raise
+        logger.exception('Failed to handle the message.')
+        response({'error': str(exc)})
+    if message.persistent:
+        serve(buffer, debug=debug, idle_timeout=message.idle_timeout)
     logger.debug('Exiting with status 0.')
+
+
+def run() -> None:
+    """
+    Console script entry point.
+
+    Browsers start the host with the extension origin as the only argument (plus
+    ``--parent-window`` on Windows). That case is handled here without importing Click. Anything
+    else, such as ``--help``, is passed to the Click command.
+    """
+    args = [x for x in sys.argv[1:] if not x.startswith('--parent-window=')]
+    if len(args) != 1 or args[0].startswith('-'):
+        from .cli import main  # ruff:ignore[import-outside-top-level]
+
+        main()
+        return
+    # Read without Python-level buffering so select() sees every pending frame in persistent mode.
+    try:
+        host(cast('BinaryIO', getattr(sys.stdin.buffer, 'raw', sys.stdin.buffer)))
+    except ValueError:
+        sys.exit(1)
+    except EOFError:
+        logger.exception('Standard input was closed before a message was read.')
+        sys.exit(1)
+    except OSError:
+        logger.exception('Failed to handle the message.')
+        sys.exit(1)
+
+
+def __getattr__(name: str) -> Any:
+    if name == 'main':
+        from .cli import main  # ruff:ignore[import-outside-top-level]
+
+        return main
+    msg = f'module {__name__!r} has no attribute {name!r}'
+    raise AttributeError(msg)
@@ -0,0 +1,133 @@
+"""
+Latency of each stage between a click and the first frame.
+
+The host times decoding the message, setting up logging, building the environment and starting
+or messaging mpv. :py:mod:`open_in_mpv.watcher` times mpv starting, ``file-loaded`` and
+``playback-restart``. Each writes one JSON line to ``METRICS_PATH`` with the duration of each
+stage in milliseconds. Records from the same click share an ``id``.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import json
+import logging
+import math
+import os
+import time
+
+from .constants import METRICS_PATH
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator, Mapping
+    from pathlib import Path
+
+__all__ = ('STAGES', 'Timer', 'append', 'percentile', 'read', 'write')
+
+STAGES = ('browser', 'decode', 'logging', 'env', 'spawn', 'ipc', 'mpv_start', 'file_loaded',
+          'playback_restart', 'total')
+"""Stage names in the order they happen."""
+
+log = logging.getLogger(__name__)
+
+
+class Timer:
+    """
+    Durations of the stages of handling one message.
+
+    Parameters
+    ----------
+    start : float | None
+        Value of :py:func:`time.monotonic` when handling started. Defaults to now.
+    """
+    def __init__(self, start: float | None = None) -> None:
+        self.start = time.monotonic() if start is None else start
+        """Value of :py:func:`time.monotonic` when handling started."""
+        self.last = self.start
+        """Value of :py:func:`time.monotonic` at the last mark."""
+        self.stages: dict[str, float] = {}
+        """Milliseconds spent in each stage so far."""
+        self.id = f'{os.getpid()}-{time.time_ns()}'
+        """Identifier shared by all records about this message."""
+
+    def mark(self, stage: str) -> None:
+        """Record that ``stage`` ended now."""
+        now = time.monotonic()
+        self.stages[stage] = round((now - self.last) * 1000, 3)
+        self.last = now
+
+    def mark_browser(self, click_time: float) -> None:
+        """
+        Record the time between the click and the start of handling.
+
+        ``click_time`` is the click time in milliseconds since the epoch.
+        """
+        start_ms = (time.time() - (time.monotonic() - self.start)) * 1000
+        self.stages['browser'] = round(max(0.0, start_ms - click_time), 3)
+
+
+def append(record: Mapping[str, Any], path: Path) -> None:
+    """Append ``record`` to the JSON lines file ``path``."""
+    line = json.dumps(record, separators=(',', ':')) + '\n'
+    try:
+        _append_line(path, line.encode())
+    except OSError:
+        log.warning('Failed to write a record to %s.', path)
+
+
+def _append_line(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # One write to a file opened with O_APPEND, so records from several processes do not mix.
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def write(stages: Mapping[str, float], *, record_id: str, path: Path | None = None) -> None:
+    """Append a record to ``path``, which defaults to ``METRICS_PATH``."""
+    append({
+        'id': record_id,
+        'time': round(time.time(), 3),
+        'stages': stages
+    }, path or METRICS_PATH)
+
+
+def read(path: Path | None = None) -> Iterator[dict[str, Any]]:
+    """
+    Read the records in ``path``, which defaults to ``METRICS_PATH``.
+
+    Lines that cannot be decoded are skipped.
+
+    Yields
+    ------
+    dict[str, Any]
+        Each record.
+    """
+    try:
+        f = (path or METRICS_PATH).open(encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and isinstance(record.get('stages'), dict):
+                yield record
+
+
+def percentile(values: Iterable[float], p: float) -> float:
+    """
+    Get the ``p``-th percentile of ``values`` using the nearest-rank method.
+
+    Returns
+    -------
+    float
+        The percentile, or ``nan`` if there are no values.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return math.nan
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
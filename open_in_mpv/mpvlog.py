@@ -0,0 +1,258 @@
+"""
+Bounded capture of mpv's output.
+
+mpv writes to a pipe instead of ``MPV_LOG_PATH``. A :py:class:`Drain` reads the pipe on one thread
+into memory and appends to the file in batches on another, so mpv never waits for the disk. When the
+file reaches ``MAX_BYTES`` it is rotated (see :py:func:`rotate`), so the logs of all instances take
+at most about ``BACKUP_COUNT + 1`` times that. The last ``RING_BYTES`` of output are kept in memory
+and written to ``MPV_CRASH_LOG_PATH`` when mpv fails.
+
+The host drains instances it waits for itself. For instances it starts detached, it starts this
+module as ``python -m open_in_mpv.mpvlog`` with the pipe as standard input.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import TYPE_CHECKING
+import fcntl
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+from .constants import MPV_CRASH_LOG_PATH, MPV_LOG_PATH
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+__all__ = ('BACKUP_COUNT', 'BATCH_BYTES', 'CLOSE_TIMEOUT', 'FLUSH_INTERVAL', 'MAX_BYTES',
+           'RING_BYTES', 'Drain', 'main', 'rotate', 'write_crash_report')
+
+BACKUP_COUNT = 3
+"""Number of rotated files kept."""
+BATCH_BYTES = 64 * 1024
+"""Output collected before it is written without waiting for ``FLUSH_INTERVAL``."""
+CLOSE_TIMEOUT = 2.0
+"""Seconds :py:meth:`Drain.close` waits for the pipe to be read and written."""
+FLUSH_INTERVAL = 1.0
+"""Most seconds output waits in memory before it is written."""
+MAX_BYTES = 10 * 1024 * 1024
+"""Size at which the log file is rotated."""
+RING_BYTES = 1024 * 1024
+"""Output kept in memory for crash reports, and most output waiting to be written."""
+
+log = logging.getLogger(__name__)
+
+
+def _rotated(path: Path, index: int, *, compress: bool) -> Path:
+    return path.with_name(f'{path.name}.{index}{".gz" if compress else ""}')
+
+
+def rotate(path: Path,
+           *,
+           max_bytes: int = MAX_BYTES,
+           backups: int = BACKUP_COUNT,
+           compress: bool = True) -> None:
+    """
+    Rename ``path`` to ``path.1`` and shift older files up if it is at least ``max_bytes`` long.
+
+    Files past ``backups`` are deleted. With ``compress``, rotated files are compressed with gzip
+    and named ``path.1.gz`` and so on. Holds an exclusive ``flock`` on ``path.lock`` so only one of
+    several drains of the same file rotates it.
+    """
+    with path.with_name(f'{path.name}.lock').open('a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if path.stat().st_size < max_bytes:
+                # Another drain rotated it first.
+                return
+        except FileNotFoundError:
+            return
+        if backups < 1:
+            path.unlink()
+            return
+        _rotated(path, backups, compress=compress).unlink(missing_ok=True)
+        for index in range(backups - 1, 0, -1):
+            if (older := _rotated(path, index, compress=compress)).exists():
+                older.replace(_rotated(path, index + 1, compress=compress))
+        first = _rotated(path, 1, compress=False)
+        path.replace(first)
+        if compress:
+            # Only needed when rotating.
+            import gzip  # ruff:ignore[import-outside-top-level]
+
+            tmp = path.with_name(f'{path.name}.1.gz.{os.getpid()}')
+            with first.open('rb') as f, gzip.open(tmp, 'wb', compresslevel=1) as gz:
+                shutil.copyfileobj(f, gz)
+            tmp.replace(_rotated(path, 1, compress=True))
+            first.unlink()
+
+
+class Drain:
+    """
+    Copy what is written to a pipe to a log file that is rotated when it gets too large.
+
+    Parameters
+    ----------
+    fd : int
+        Read end of the pipe. Closed when the pipe is drained.
+    path : Path | None
+        The log file. Defaults to ``MPV_LOG_PATH``.
+    max_bytes : int
+        Size at which the log file is rotated.
+    backups : int
+        Number of rotated files kept.
+    compress : bool
+        Compress rotated files with gzip.
+    ring_bytes : int
+        Output kept in memory for :py:meth:`tail`.
+    interval : float
+        Most seconds output waits in memory before it is written.
+    """
+    def __init__(self,
+                 fd: int,
+                 path: Path | None = None,
+                 *,
+                 max_bytes: int = MAX_BYTES,
+                 backups: int = BACKUP_COUNT,
+                 compress: bool = True,
+                 ring_bytes: int = RING_BYTES,
+                 interval: float = FLUSH_INTERVAL) -> None:
+        self.fd = fd
+        """Read end of the pipe."""
+        self.path = path or MPV_LOG_PATH
+        """The log file."""
+        self.max_bytes = max_bytes
+        """Size at which the log file is rotated."""
+        self.backups = backups
+        """Number of rotated files kept."""
+        self.compress = compress
+        """Compress rotated files with gzip."""
+        self.ring_bytes = ring_bytes
+        """Output kept in memory for :py:meth:`tail`."""
+        self.interval = interval
+        """Most seconds output waits in memory before it is written."""
+        self.dropped = 0
+        """Bytes that were not written because the disk could not keep up."""
+        self._ring: deque[bytes] = deque()
+        self._ring_size = 0
+        self._pending = bytearray()
+        self._eof = False
+        self._condition = threading.Condition()
+        self._reader = threading.Thread(target=self._read, name='mpv-log-reader', daemon=True)
+        self._writer = threading.Thread(target=self._write, name='mpv-log-writer', daemon=True)
+
+    def start(self) -> None:
+        """Start reading the pipe."""
+        self._reader.start()
+        self._writer.start()
+
+    def close(self, timeout: float | None = CLOSE_TIMEOUT) -> None:
+        """
+        Wait for the pipe to be closed by every writer and its output to be written.
+
+        Gives up after ``timeout`` seconds, for example if a process mpv started still has the pipe
+        open. ``None`` waits for as long as it takes.
+        """
+        if timeout is None:
+            self._reader.join()
+            self._writer.join()
+            return
+        deadline = time.monotonic() + timeout
+        self._reader.join(timeout)
+        self._writer.join(max(0, deadline - time.monotonic()))
+
+    def tail(self) -> bytes:
+        """
+        Get the last output.
+
+        Returns
+        -------
+        bytes
+            Up to ``ring_bytes`` of the most recent output.
+        """
+        with self._condition:
+            return b''.join(self._ring)[-self.ring_bytes:]
+
+    def _read(self) -> None:
+        try:
+            while chunk := os.read(self.fd, BATCH_BYTES):
+                self._add(chunk)
+        except OSError:
+            log.exception('Failed to read the output of mpv.')
+        finally:
+            os.close(self.fd)
+            with self._condition:
+                self._eof = True
+                self._condition.notify()
+
+    def _add(self, chunk: bytes) -> None:
+        with self._condition:
+            self._ring.append(chunk)
+            self._ring_size += len(chunk)
+            while self._ring_size - len(self._ring[0]) >= self.ring_bytes:
+                self._ring_size -= len(self._ring.popleft())
+            self._pending += chunk
+            if (excess := len(self._pending) - self.ring_bytes) > 0:
+                del self._pending[:excess]
+                self.dropped += excess
+            if len(self._pending) >= BATCH_BYTES:
+                self._condition.notify()
+
+    def _write(self) -> None:
+        done = False
+        while not done:
+            with self._condition:
+                self._condition.wait_for(lambda: self._eof or len(self._pending) >= BATCH_BYTES,
+                                         self.interval)
+                data = bytes(self._pending)
+                self._pending.clear()
+                done = self._eof
+            if data:
+                self._append(data)
+
+    def _append(self, data: bytes) -> None:
+        try:
+            size = _append_to(self.path, data)
+            if size >= self.max_bytes:
+                rotate(self.path,
+                       max_bytes=self.max_bytes,
+                       backups=self.backups,
+                       compress=self.compress)
+        except OSError:
+            log.exception('Failed to write the output of mpv to %s.', self.path)
+
+
+def _append_to(path: Path, data: bytes) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Opening the file for each batch follows a rotation by another drain.
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+        return os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+
+def write_crash_report(drain: Drain, *, path: Path | None = None) -> None:
+    """Replace ``path``, which defaults to ``MPV_CRASH_LOG_PATH``, with the tail of ``drain``."""
+    path = path or MPV_CRASH_LOG_PATH
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(drain.tail())
+    except OSError:
+        log.exception('Failed to write the crash report %s.', path)
+
+
+def main() -> None:
+    """Drain standard input to ``MPV_LOG_PATH``."""
+    drain = Drain(sys.stdin.fileno())
+    drain.start()
+    # Nothing waits for this process, so it can take as long as it needs.
+    drain.close(None)
+
+
+if __name__ == '__main__':
+    main()
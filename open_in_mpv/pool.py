@@ -0,0 +1,143 @@
+"""
+Pool of pre-warmed idle mpv instances.
+
+Pool instances run with ``--idle=yes --force-window=no`` and listen on their own socket in
+``MPV_POOL_DIR``. A request claims one by renaming its socket to ``MPV_SOCKET``, which is atomic,
+so two hosts can never claim the same instance. Each socket name is unique because mpv removes the
+socket path it was started with when it exits. The ownership record written by
+:py:mod:`open_in_mpv.instance` moves with the socket.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+import json
+import logging
+import os
+import socket
+import time
+
+from . import batch, instance
+from .constants import MPV_POOL_DIR, MPV_SOCKET
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping, Sequence
+
+__all__ = ('POOL_TTL', 'claim', 'instance_args', 'missing', 'new_socket_path', 'sockets')
+
+POOL_TTL = 600.0
+"""Seconds an unused pool instance stays alive."""
+SCRIPT_PATH = Path(__file__).parent / 'pool_ttl.lua'
+"""Script that makes pool instances quit themselves after the TTL."""
+
+log = logging.getLogger(__name__)
+
+
+def _send(path: Path,
+          commands: Iterable[Sequence[Any] | Mapping[str, Any]],
+          timeout: float = 0.5) -> None:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+        sock.sendall(b''.join(
+            json.dumps({
+                'command': command if isinstance(command, dict) else list(command)
+            }).encode() + b'\n' for command in commands))
+
+
+def sockets() -> list[Path]:
+    """
+    Get the sockets of pool instances, newest first.
+
+    Returns
+    -------
+    list[Path]
+        Socket paths.
+    """
+    try:
+        paths = [(x.stat().st_mtime, x) for x in MPV_POOL_DIR.glob('*.sock')]
+    except OSError:
+        return []
+    return [x for _, x in sorted(paths, reverse=True)]
+
+
+def new_socket_path() -> Path:
+    """
+    Get a socket path for a new pool instance.
+
+    Returns
+    -------
+    Path
+        An unused socket path in ``MPV_POOL_DIR``.
+    """
+    MPV_POOL_DIR.mkdir(parents=True, exist_ok=True)
+    return MPV_POOL_DIR / f'{os.getpid()}-{time.monotonic_ns()}.sock'
+
+
+def instance_args(ttl: float = POOL_TTL) -> list[str]:
+    """
+    Get the mpv arguments that make an instance a pool instance.
+
+    Returns
+    -------
+    list[str]
+        Arguments to add after the normal arguments.
+    """
+    return [
+        '--idle=yes', '--force-window=no', f'--script={SCRIPT_PATH}',
+        f'--script-opts-append=open_in_mpv-pool-ttl={int(ttl)}'
+    ]
+
+
+def missing(size: int) -> int:
+    """
+    Get how many instances need to be started to fill the pool.
+
+    Returns
+    -------
+    int
+        Number of instances to start.
+    """
+    for record in MPV_POOL_DIR.glob('*.sock.owner'):
+        if not record.with_suffix('').exists():
+            record.unlink(missing_ok=True)
+    return max(0, size - len(sockets()))
+
+
+def claim(url: str,
+          options: Mapping[str, str] | None = None,
+          *,
+          target: Path | None = None) -> bool:
+    """
+    Hand ``url`` to a pool instance, which then becomes the instance at ``target``.
+
+    ``options`` are per-file options for ``url``. ``target`` defaults to ``MPV_SOCKET``.
+
+    Returns
+    -------
+    bool
+        ``True`` if an instance accepted the URL.
+    """
+    target = target or MPV_SOCKET
+    for path in sockets():
+        try:
+            path.rename(target)
+        except FileNotFoundError:
+            log.debug('Pool instance at %s was claimed by another host.', path)
+            continue
+        try:
+            instance.owner_path(path).replace(instance.owner_path(target))
+        except FileNotFoundError:
+            instance.owner_path(target).unlink(missing_ok=True)
+        try:
+            _send(target,
+                  (('set_property', 'force-window', 'yes'),
+                   batch.loadfile(url, 'replace', options) if options else ('loadfile', url),
+                   ('set_property', 'idle', 'once')))
+        except OSError:
+            log.debug('Pool instance at %s is not running.', path)
+            instance.remove(target)
+            continue
+        log.debug('Claimed pool instance at %s.', path)
+        return True
+    return False
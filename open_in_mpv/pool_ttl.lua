@@ -0,0 +1,11 @@
+-- Loaded into pre-warmed open-in-mpv instances. Quits the instance if it is still unused after
+-- the number of seconds in script option open_in_mpv-pool-ttl.
+local ttl = tonumber(mp.get_opt('open_in_mpv-pool-ttl') or '0') or 0
+if ttl > 0 then
+  mp.add_timeout(ttl, function()
+    if mp.get_property_native('idle-active') and mp.get_property_native('playlist-count') == 0 then
+      mp.msg.info('Pool instance unused for ' .. ttl .. ' seconds. Quitting.')
+      mp.command('quit')
+    end
+  end)
+end
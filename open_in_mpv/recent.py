@@ -0,0 +1,107 @@
+"""
+Table of recently handled requests, used to drop repeated ones.
+
+A double click in the context menu, or the extension sending a message again, gives the host the
+same request twice within milliseconds, which would load the URL twice or start a second mpv.
+Each request is reduced to a key made from its canonical URLs (see
+:py:func:`open_in_mpv.urls.canonical_url`), playlist and mode. ``RECENT_PATH`` maps keys to the
+time they were first handled. It is small, lives in the runtime directory and is changed while
+holding an exclusive ``flock``, so concurrent hosts agree on which of them handles a request.
+"""
+from __future__ import annotations
+
+from operator import itemgetter
+from typing import TYPE_CHECKING
+import fcntl
+import json
+import logging
+import os
+import time
+import zlib
+
+from .constants import MPV_SOCKET
+from .urls import canonical_url
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from pathlib import Path
+
+__all__ = ('MAX_ENTRIES', 'RECENT_PATH', 'key', 'seen')
+
+MAX_ENTRIES = 64
+"""Number of keys kept."""
+RECENT_PATH = MPV_SOCKET.parent / 'recent.json'
+"""The table. Functions that take a ``path`` default to it."""
+
+log = logging.getLogger(__name__)
+
+
+def key(urls: Sequence[str], *, playlist: str | None = None, mode: str = 'replace') -> str:
+    """
+    Get the key of a request for ``urls`` and ``playlist``.
+
+    The key has the mode, the number of URLs, a checksum of all of them and the first one, so it
+    stays short for large batches.
+
+    Returns
+    -------
+    str
+        The key.
+    """
+    canonical = [canonical_url(x) for x in urls]
+    if playlist is not None:
+        canonical.append(canonical_url(playlist) if '://' in playlist else playlist)
+    checksum = zlib.crc32('\n'.join(canonical).encode())
+    return f'{mode} {len(canonical)} {checksum:08x} {canonical[0] if canonical else ""}'
+
+
+def _read(path: Path) -> dict[str, float]:
+    try:
+        data = json.loads(path.read_bytes())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        log.warning('Ignoring invalid recent requests table %s.', path)
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _record(request_key: str, window: float, path: Path) -> bool:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.with_name(f'{path.name}.lock').open('a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # Taken after waiting for the lock, so a key recorded by the process that held it is not
+        # newer than now.
+        now = time.time()
+        table = {
+            k: v
+            for k, v in _read(path).items() if isinstance(v, (int, float)) and 0 <= now - v < window
+        }
+        if request_key in table:
+            return True
+        table[request_key] = now
+        if len(table) > MAX_ENTRIES:
+            table = dict(sorted(table.items(), key=itemgetter(1))[-MAX_ENTRIES:])
+        tmp = path.with_name(f'{path.name}.{os.getpid()}')
+        tmp.write_text(json.dumps(table), encoding='utf-8')
+        tmp.replace(path)
+    return False
+
+
+def seen(request_key: str, window: float, *, path: Path | None = None) -> bool:
+    """
+    Check whether ``request_key`` was handled less than ``window`` seconds ago.
+
+    If it was not, it is recorded as handled now. Keys older than ``window`` are dropped.
+
+    Returns
+    -------
+    bool
+        ``True`` if the request is a repeat and should be dropped.
+    """
+    path = path or RECENT_PATH
+    try:
+        return _record(request_key, window, path)
+    except OSError:
+        log.warning('Cannot use the recent requests table %s.', path)
+    return False
@@ -0,0 +1,116 @@
+"""
+Process that records the playback history of an instance.
+
+The host starts this next to an instance when history is enabled. It follows the instance over IPC
+until mpv exits and turns what it sees into :py:class:`open_in_mpv.history.Update` objects: an
+open count when a URL is loaded, the start-up time when playback starts, the position every
+``SAVE_INTERVAL`` seconds and when the file ends. Only one recorder runs per instance (see
+:py:mod:`open_in_mpv.companion`). Run as ``python -m open_in_mpv.recorder ADDRESS``.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import logging
+import sys
+import time
+
+from . import companion, history
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping, Sequence
+
+__all__ = ('SAVE_INTERVAL', 'Recorder', 'main')
+
+SAVE_INTERVAL = 15.0
+"""Seconds between saves of the position while playing."""
+
+log = logging.getLogger(__name__)
+
+
+class Recorder(companion.Companion):
+    """
+    Turn the events of one instance into history updates.
+
+    Parameters
+    ----------
+    writer : history.Writer
+        Where updates are queued.
+    interval : float
+        Seconds between saves of the position while playing.
+    """
+    properties = ('duration', 'time-pos')
+
+    def __init__(self, writer: history.Writer, *, interval: float = SAVE_INTERVAL) -> None:
+        self.writer = writer
+        """Where updates are queued."""
+        self.interval = interval
+        """Seconds between saves of the position while playing."""
+        self.url: str | None = None
+        """Canonical URL of the current file, if it is a web page or stream."""
+        self.position: float | None = None
+        """Last position of the current file."""
+        self.duration: float | None = None
+        """Duration of the current file."""
+        self._started: float | None = None
+        self._saved = 0.0
+
+    def file_loaded(self, properties: Mapping[str, Any]) -> None:
+        """Count an opening of the file."""
+        self.url = companion.page_url(properties)
+        self.position = self.duration = None
+        self._saved = time.monotonic()
+        if self.url is not None:
+            self.writer.put(history.Update(self.url, plays=1, updated=time.time()))
+
+    def event(self, event: Mapping[str, Any]) -> None:
+        """Time the start of playback and save the position when a file ends."""
+        if event['event'] == 'start-file':
+            self._started = time.monotonic()
+        elif event['event'] == 'playback-restart' and self._started is not None:
+            start_ms = round((time.monotonic() - self._started) * 1000, 3)
+            self._started = None
+            if self.url is not None:
+                self.writer.put(history.Update(self.url, start_ms=start_ms, updated=time.time()))
+        elif event['event'] == 'end-file':
+            # A file played to the end is not resumed.
+            if event.get('reason') == 'eof' and self.url is not None:
+                self.writer.put(history.Update(self.url, position=0.0, updated=time.time()))
+            else:
+                self.save()
+            self.url = self.position = self.duration = None
+
+    def property_change(self, name: str, value: Any) -> None:
+        """Note a change of ``time-pos`` or ``duration``, saving the position if it is due."""
+        if not isinstance(value, (int, float)):
+            return
+        if name == 'duration':
+            self.duration = value
+            return
+        self.position = value
+        if time.monotonic() - self._saved >= self.interval:
+            self.save()
+
+    def save(self) -> None:
+        """Queue the position of the current file."""
+        self._saved = time.monotonic()
+        if self.url is not None and self.position is not None:
+            self.writer.put(
+                history.Update(self.url,
+                               position=round(self.position, 3),
+                               duration=self.duration,
+                               updated=time.time()))
+
+    def close(self) -> None:
+        """Save the position and write the queued updates."""
+        self.save()
+        self.writer.close()
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Record the history of the instance at the address given as the only argument."""
+    address = (sys.argv[1:] if argv is None else argv)[0]
+    companion.run('recorder', address, lambda: Recorder(history.Writer()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Registry of the instances started with single instance mode disabled.
+
+Each instance listens on its own socket in ``MPV_INSTANCES_DIR``, so starting one never replaces
+the socket of another. ``REGISTRY_PATH`` lists them with the process ID and start time, when each
+was last sent a URL, how many playlist items the host gave it since its playlist was last replaced
+and the domain it last opened. Hosts read the file without connecting to any instance; dead
+instances are recognised from the process ID and start time. Changes are made while holding an
+exclusive ``flock`` on a lock file and written with an atomic rename, so readers never see a
+partial file.
+
+A request is routed to an instance by one of ``POLICIES``:
+
+* ``new``: start a new instance unless ``max_instances`` are running, otherwise use the least
+  recently used one.
+* ``lru``: use the least recently used instance.
+* ``fewest``: use the instance with the fewest playlist items.
+* ``domain``: use the instance that last opened a URL from the same domain, otherwise as ``new``.
+
+A new instance is reserved in the same transaction that chose it, so concurrent hosts cannot start
+more than ``max_instances``. Until the instance is started the entry is ``pending`` and its
+process is the requesting host. Other hosts only route to a pending instance when the limit leaves
+no other choice, and then wait for its socket.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+from urllib.parse import urlsplit
+import fcntl
+import json
+import logging
+import os
+import time
+
+from . import instance
+from .constants import MPV_INSTANCES_DIR
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+__all__ = ('POLICIES', 'REGISTRY_PATH', 'START_TIMEOUT', 'Entry', 'choose', 'domain', 'entries',
+           'register', 'release', 'route', 'wait')
+
+POLICIES = ('domain', 'fewest', 'lru', 'new')
+"""How a request picks an instance."""
+REGISTRY_PATH = MPV_INSTANCES_DIR / 'registry.json'
+"""The registry file. Functions that take a ``path`` default to it."""
+START_TIMEOUT = 10.0
+"""Seconds :py:func:`wait` waits for a new instance to create its socket."""
+
+log = logging.getLogger(__name__)
+
+
+class Entry(NamedTuple):
+    """A registered instance."""
+    socket: str
+    """Socket path."""
+    pid: int
+    """Process ID of the instance, or of the host that is starting it."""
+    start_time: int | None = None
+    """Start time of ``pid`` (see :py:func:`open_in_mpv.instance.process_start_time`)."""
+    last_used: float = 0.0
+    """Time the instance was last sent a URL, in seconds since the epoch."""
+    items: int = 0
+    """Playlist items added by hosts since the playlist was last replaced."""
+    domain: str | None = None
+    """Domain of the last URL."""
+    pending: bool = False
+    """Whether the instance is still being started."""
+
+    def alive(self) -> bool:
+        """
+        Check whether the process of the entry is running.
+
+        Returns
+        -------
+        bool
+            ``True`` if it is running.
+        """
+        return instance.process_alive(self.pid, self.start_time)
+
+
+def domain(url: str | None) -> str | None:
+    """
+    Get the domain of ``url`` without a leading ``www.``.
+
+    Returns
+    -------
+    str | None
+        The domain, or ``None`` if ``url`` has no host.
+    """
+    if url is None:
+        return None
+    return (urlsplit(url).hostname or '').removeprefix('www.') or None
+
+
+def _read(path: Path) -> list[Entry]:
+    try:
+        return [Entry(**x) for x in json.loads(path.read_bytes())['instances']]
+    except FileNotFoundError:
+        return []
+    except (OSError, KeyError, TypeError, ValueError):
+        log.warning('Ignoring invalid instance registry %s.', path)
+        return []
+
+
+def entries(path: Path | None = None) -> list[Entry]:
+    """
+    Get the registered instances that are running, without locking.
+
+    Returns
+    -------
+    list[Entry]
+        The entries.
+    """
+    return [x for x in _read(path or REGISTRY_PATH) if x.alive()]
+
+
+@contextmanager
+def _transaction(path: Path) -> Generator[list[Entry]]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.with_name(f'{path.name}.lock').open('a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        live = []
+        for entry in _read(path):
+            if entry.alive():
+                live.append(entry)
+            else:
+                log.debug('Instance at %s is gone.', entry.socket)
+                instance.remove(Path(entry.socket))
+        # If the body raises, nothing is written and the registry stays as it was.
+        yield live  # ruff:ignore[fallible-context-manager]
+        tmp = path.with_name(f'{path.name}.{os.getpid()}')
+        tmp.write_text(json.dumps({'instances': [x._asdict() for x in live]}), encoding='utf-8')
+        tmp.replace(path)
+
+
+def choose(candidates: list[Entry],
+           url: str | None,
+           *,
+           policy: str = 'new',
+           max_instances: int = 0) -> Entry | None:
+    """
+    Pick the instance that gets ``url``.
+
+    ``max_instances`` of zero means no limit. Pending entries count towards the limit. They are only
+    picked when no other instance can be, so that a quick second click joins the instance the first
+    one is starting. Use :py:func:`wait` before sending commands to a picked instance.
+
+    Returns
+    -------
+    Entry | None
+        The entry, or ``None`` if a new instance should be started.
+    """
+    ready = [x for x in candidates if not x.pending]
+    if policy == 'domain' and (matches := [x for x in ready if x.domain == domain(url)]):
+        return max(matches, key=lambda x: x.last_used)
+    if policy in {'domain', 'new'} and (not max_instances or len(candidates) < max_instances):
+        return None
+    if not ready:
+        return max(candidates, key=lambda x: x.last_used) if candidates else None
+    if policy == 'fewest':
+        return min(ready, key=lambda x: (x.items, x.last_used))
+    return min(ready, key=lambda x: x.last_used)
+
+
+def route(url: str | None,
+          *,
+          policy: str = 'new',
+          max_instances: int = 0,
+          items: int = 1,
+          replace: bool = True,
+          path: Path | None = None) -> tuple[Path, bool]:
+    """
+    Pick the instance for ``url`` and record that it was used, or reserve a new one.
+
+    ``items`` is the number of playlist items being added. With ``replace``, they replace the
+    playlist of an existing instance.
+
+    Returns
+    -------
+    tuple[Path, bool]
+        The socket path, and ``True`` if a new instance must be started on it and passed to
+        :py:func:`register`.
+    """
+    path = path or REGISTRY_PATH
+    now = time.time()
+    with _transaction(path) as live:
+        if (chosen := choose(live, url, policy=policy, max_instances=max_instances)) is None:
+            socket_path = path.parent / f'{os.getpid()}-{time.monotonic_ns()}.sock'
+            live.append(
+                Entry(str(socket_path),
+                      os.getpid(),
+                      instance.process_start_time(os.getpid()),
+                      now,
+                      items,
+                      domain(url),
+                      pending=True))
+            return socket_path, True
+        live[live.index(chosen)] = chosen._replace(last_used=now,
+                                                   items=items if replace else chosen.items + items,
+                                                   domain=domain(url) or chosen.domain)
+        return Path(chosen.socket), False
+
+
+def register(socket_path: Path, pid: int, *, path: Path | None = None) -> None:
+    """Record that the instance at ``socket_path`` is process ``pid`` and is ready."""
+    with _transaction(path or REGISTRY_PATH) as live:
+        for i, entry in enumerate(live):
+            if entry.socket == str(socket_path):
+                live[i] = entry._replace(pid=pid,
+                                         start_time=instance.process_start_time(pid),
+                                         pending=False)
+                return
+        live.append(Entry(str(socket_path), pid, instance.process_start_time(pid), time.time()))
+
+
+def release(socket_path: Path, *, path: Path | None = None) -> None:
+    """Remove the instance at ``socket_path`` from the registry."""
+    with _transaction(path or REGISTRY_PATH) as live:
+        live[:] = [x for x in live if x.socket != str(socket_path)]
+
+
+def wait(socket_path: Path, timeout: float = START_TIMEOUT) -> bool:
+    """
+    Wait for the instance at ``socket_path`` to create its socket.
+
+    Returns
+    -------
+    bool
+        ``True`` if the socket exists.
+    """
+    return instance.wait(socket_path, timeout)
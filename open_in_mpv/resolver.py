@@ -0,0 +1,273 @@
+"""
+Resolver daemon that keeps yt-dlp loaded between videos.
+
+mpv's ``ytdl_hook`` normally starts a new yt-dlp process for every URL, which spends most of its
+time starting Python and importing the extractors. The daemon imports yt-dlp once and listens on
+``RESOLVER_SOCKET``. ``open-in-mpv-ytdl`` (:py:mod:`open_in_mpv.ytdl`) is given to ``ytdl_hook``
+as ``ytdl_path`` and forwards its arguments to the daemon.
+
+Requests are handled by a pool of ``WORKERS`` threads. Each thread keeps its ``YoutubeDL``
+objects, so HTTP connections are reused between requests. When ``MAX_PENDING`` requests are
+waiting, or the arguments are not a ``-J`` extraction of one URL, the reply tells the shim to run
+yt-dlp itself. The daemon exits after ``IDLE_TIMEOUT`` seconds without a request.
+
+Requests and replies are one line of JSON each. A request is ``{"args": [...]}``. A reply is
+``{"code": int, "stdout": str, "stderr": str}`` or ``{"fallback": true}``.
+
+Install with ``pip install open-in-mpv[resolver]``.
+"""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from shutil import which
+from typing import TYPE_CHECKING, Any
+import contextlib
+import importlib.util
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+from .constants import RESOLVER_SOCKET
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+__all__ = ('IDLE_TIMEOUT', 'MAX_PENDING', 'WORKERS', 'Resolver', 'command', 'is_running', 'main',
+           'shim_path')
+
+IDLE_TIMEOUT = 1800.0
+"""Seconds without a request after which the daemon exits."""
+MAX_PENDING = 16
+"""Requests that may be queued or running before new ones are sent back to the shim."""
+MAX_REQUEST_SIZE = 1048576
+"""Maximum size of a request in bytes."""
+WORKERS = 4
+"""Number of requests resolved at the same time."""
+SHIM_NAME = 'open-in-mpv-ytdl'
+"""Name of the executable ``ytdl_hook`` runs."""
+_ACCEPT_TIMEOUT = 1.0
+_MAX_CLIENTS_PER_THREAD = 8
+
+log = logging.getLogger(__name__)
+
+
+class _Output:
+    """Logger for ``YoutubeDL`` that collects what yt-dlp would print to standard error."""
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+
+    def debug(self, message: str) -> None:
+        pass
+
+    def warning(self, message: str) -> None:
+        self.lines.append(message)
+
+    def error(self, message: str) -> None:
+        self.lines.append(message)
+
+    def text(self) -> str:
+        return ''.join(f'{x}\n' for x in self.lines)
+
+
+def _warm() -> None:
+    # Compile the URL patterns of all extractors, which the first request would do.
+    from yt_dlp.extractor import gen_extractor_classes  # ruff:ignore[import-outside-top-level]
+
+    for extractor in gen_extractor_classes():
+        extractor.suitable('https://example.com/')
+
+
+class Resolver:
+    """
+    Resolves URLs with yt-dlp on a bounded pool of threads.
+
+    Parameters
+    ----------
+    workers : int
+        Number of threads.
+    max_pending : int
+        Number of requests that may be queued or running.
+    """
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='resolver')
+        """Threads that handle connections."""
+        self.slots = threading.BoundedSemaphore(max_pending)
+        """One slot per request that may be queued or running."""
+        self.last_request = time.monotonic()
+        """Value of :py:func:`time.monotonic` when the last request arrived."""
+        self._local = threading.local()
+
+    def _client(self, ydl_opts: dict[str, Any]) -> tuple[Any, _Output]:
+        import yt_dlp  # ruff:ignore[import-outside-top-level]
+
+        clients: dict[str, tuple[Any, _Output]] = self._local.__dict__.setdefault('clients', {})
+        key = json.dumps(ydl_opts, sort_keys=True, default=repr)
+        if key not in clients:
+            if len(clients) >= _MAX_CLIENTS_PER_THREAD:
+                for client, _ in clients.values():
+                    client.close()
+                clients.clear()
+            output = _Output()
+            clients[key] = (yt_dlp.YoutubeDL({**ydl_opts, 'logger': output}), output)
+        return clients[key]
+
+    def resolve(self, args: Sequence[str]) -> dict[str, Any]:
+        """
+        Run yt-dlp with command line ``args`` and collect what it would print.
+
+        Returns
+        -------
+        dict[str, Any]
+            The reply.
+        """
+        import yt_dlp  # ruff:ignore[import-outside-top-level]
+
+        try:
+            parsed = yt_dlp.parse_options(list(args))
+        except SystemExit:
+            return {'fallback': True}
+        if not parsed.ydl_opts.get('dump_single_json') or len(parsed.urls) != 1:
+            return {'fallback': True}
+        client, output = self._client(parsed.ydl_opts)
+        output.lines.clear()
+        try:
+            info = client.extract_info(parsed.urls[0], download=False)
+        except yt_dlp.utils.DownloadError:
+            info = None
+        if info is None:
+            # The error was reported to output, as yt-dlp would print it.
+            return {'code': 1, 'stdout': '', 'stderr': output.text()}
+        client.post_extract(info)
+        return {
+            'code': 0,
+            'stdout': json.dumps(client.sanitize_info(info)) + '\n',
+            'stderr': output.text()
+        }
+
+    def _answer(self, conn: socket.socket) -> None:
+        with conn, conn.makefile('rb') as f:
+            if not (line := f.readline(MAX_REQUEST_SIZE)):
+                # A connection closed without a request is a probe from is_running().
+                return
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = None
+            if not isinstance(request, dict) or not isinstance(args := request.get('args'), list):
+                log.warning('Invalid request.')
+                reply: dict[str, Any] = {'fallback': True}
+            else:
+                conn.settimeout(None)
+                reply = self.resolve([str(x) for x in args])
+            conn.sendall(json.dumps(reply).encode() + b'\n')
+
+    def handle(self, conn: socket.socket) -> None:
+        """Answer the request on ``conn`` and close it."""
+        try:
+            self._answer(conn)
+        except OSError:
+            log.exception('Failed to answer a request.')
+        except Exception:
+            # An extractor bug must not take down the worker thread.
+            log.exception('Resolving failed.')
+        finally:
+            self.slots.release()
+
+    def serve(self, path: Path = RESOLVER_SOCKET, *, idle_timeout: float = IDLE_TIMEOUT) -> None:
+        """Accept requests on ``path`` until no request arrived for ``idle_timeout`` seconds."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.unlink(missing_ok=True)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(str(path))
+            path.chmod(0o600)
+            server.listen()
+            server.settimeout(_ACCEPT_TIMEOUT)
+            log.info('Listening on %s.', path)
+            # Requests that arrive meanwhile wait in the backlog.
+            _warm()
+            self.last_request = time.monotonic()
+            try:
+                while time.monotonic() - self.last_request < idle_timeout:
+                    try:
+                        conn, _ = server.accept()
+                    except TimeoutError:
+                        continue
+                    self.last_request = time.monotonic()
+                    conn.settimeout(5)
+                    if not self.slots.acquire(blocking=False):
+                        log.warning('Too many requests. Sending one back.')
+                        with conn, contextlib.suppress(OSError):
+                            conn.sendall(b'{"fallback": true}\n')
+                        continue
+                    self.executor.submit(self.handle, conn)
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    path.unlink()
+                self.executor.shutdown(wait=False, cancel_futures=True)
+        log.info('Idle for %d seconds. Exiting.', idle_timeout)
+
+
+def is_running(path: Path = RESOLVER_SOCKET) -> bool:
+    """
+    Check if a daemon is listening on ``path``.
+
+    Returns
+    -------
+    bool
+        ``True`` if a connection could be made.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.1)
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+def command() -> list[str]:
+    """
+    Get the command line that starts the daemon.
+
+    Returns
+    -------
+    list[str]
+        The command line.
+    """
+    return [sys.executable, '-m', __name__]
+
+
+def shim_path() -> str | None:
+    """
+    Find ``open-in-mpv-ytdl``, preferring the one next to the Python interpreter.
+
+    Returns
+    -------
+    str | None
+        The path, or ``None`` if it is not installed.
+    """
+    return which(SHIM_NAME,
+                 path=os.pathsep.join((str(Path(sys.executable).parent),
+                                       os.environ.get('PATH', os.defpath))))
+
+
+def main() -> None:
+    """Run the daemon unless one is already running."""
+    logging.basicConfig(format='%(asctime)s | %(levelname)-8s | %(name)s - %(message)s',
+                        level=logging.INFO)
+    if importlib.util.find_spec('yt_dlp') is None:
+        log.error('yt-dlp is not installed. Install open-in-mpv[resolver].')
+        sys.exit(1)
+    if is_running():
+        log.info('A resolver is already running.')
+        return
+    Resolver().serve()
+
+
+if __name__ == '__main__':
+    main()
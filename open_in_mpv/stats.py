@@ -0,0 +1,101 @@
+"""Command-line tool to summarise the latency metrics and the playback quality telemetry."""
+from __future__ import annotations
+
+from pathlib import Path
+import os
+
+import click
+
+from . import metrics, telemetry
+from .constants import METRICS_PATH, TELEMETRY_PATH
+
+__all__ = ('main',)
+
+PERCENTILES = (50, 95, 99)
+"""Percentiles printed for each stage."""
+
+
+def _telemetry(path: Path, last: int | None, *, prometheus: bool, output: Path | None) -> None:
+    records = list(telemetry.read(path))
+    if last is not None:
+        records = records[-last:]
+    if prometheus:
+        text = telemetry.prometheus(records)
+        if output is None:
+            click.echo(text, nl=False)
+            return
+        # The textfile collector may read the file at any time, so replace it in one step.
+        tmp = output.with_name(f'{output.name}.{os.getpid()}')
+        tmp.write_text(text, encoding='utf-8')
+        tmp.replace(output)
+        return
+    if not (groups := telemetry.summarise(records)):
+        click.echo(f'No telemetry in {path}.', err=True)
+        raise click.exceptions.Exit(1)
+    counters = [x for x, _ in telemetry.COUNTERS]
+    widths = [
+        max(len(name), *(len(key[i]) for key in groups)) for i, name in enumerate(telemetry.LABELS)
+    ]
+    click.echo(' '.join(f'{x:<{w}}' for x, w in zip(telemetry.LABELS, widths, strict=True)) +
+               ''.join(f' {x:>19}' for x in counters))
+    for key, sums in groups.items():
+        click.echo(' '.join(f'{x:<{w}}' for x, w in zip(key, widths, strict=True)) +
+                   ''.join(f' {round(sums[x], 3):>19}' for x in counters))
+
+
+@click.command(context_settings={'help_option_names': ('-h', '--help')})
+@click.option('-f',
+              '--file',
+              'path',
+              help=f'Metrics file. Defaults to {METRICS_PATH}, or {TELEMETRY_PATH} with -t.',
+              type=click.Path(dir_okay=False, path_type=Path))
+@click.option('-n',
+              '--last',
+              help='Only use the last N records.',
+              metavar='N',
+              type=click.IntRange(1))
+@click.option('-t',
+              '--telemetry',
+              'use_telemetry',
+              help='Summarise the playback quality telemetry per machine, site and format.',
+              is_flag=True)
+@click.option('--prometheus',
+              help='With -t, print the sums as Prometheus counters.',
+              is_flag=True)
+@click.option('-o',
+              '--output',
+              help='With --prometheus, write to this file instead, for the node exporter.',
+              type=click.Path(dir_okay=False, path_type=Path))
+def main(*,
+         path: Path | None = None,
+         last: int | None = None,
+         use_telemetry: bool = False,
+         prometheus: bool = False,
+         output: Path | None = None) -> None:
+    """
+    Print the 50th, 95th and 99th percentile latency of each stage in milliseconds.
+
+    Enable metrics in the extension options to record them. With -t, print the telemetry
+    instead, which is recorded when telemetry is enabled.
+    """  # ruff:ignore[docstring-missing-exception]
+    if use_telemetry:
+        _telemetry(path or TELEMETRY_PATH, last, prometheus=prometheus, output=output)
+        return
+    path = path or METRICS_PATH
+    records = list(metrics.read(path))
+    if last is not None:
+        records = records[-last:]
+    values: dict[str, list[float]] = {}
+    for record in records:
+        for stage, value in record['stages'].items():
+            if isinstance(value, (int, float)):
+                values.setdefault(stage, []).append(value)
+    if not values:
+        click.echo(f'No metrics in {path}.', err=True)
+        raise click.exceptions.Exit(1)
+    stages = [x for x in metrics.STAGES if x in values] + sorted(set(values) - set(metrics.STAGES))
+    width = max(len(x) for x in stages)
+    click.echo(f'{"stage":<{width}} {"count":>7}' + ''.join(f' {f"p{p}":>10}' for p in PERCENTILES))
+    for stage in stages:
+        cells = ''.join(f' {metrics.percentile(values[stage], p):>10.1f}' for p in PERCENTILES)
+        click.echo(f'{stage:<{width}} {len(values[stage]):>7}{cells}')
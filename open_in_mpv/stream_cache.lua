@@ -0,0 +1,30 @@
+-- Loaded into instances started by open-in-mpv with the stream cache enabled. Passes the stream
+-- that ytdl_hook resolved for a page to the cache in the host, so the next time the page is opened
+-- mpv gets the stream directly. The Python interpreter is in script option open_in_mpv-python.
+local utils = require 'mp.utils'
+local python = mp.get_opt('open_in_mpv-python')
+mp.add_hook('on_preloaded', 50, function()
+  local path = mp.get_property('path', '')
+  local stream = mp.get_property('stream-open-filename', '')
+  if python == nil or stream == '' or stream == path or not path:find('^https?://') or
+      stream:find('^memory://') then
+    return
+  end
+  -- The cache is keyed by the format the host set for the file, not mpv's own ytdl-format.
+  local format = ''
+  if mp.get_property_native('option-info/ytdl-format/set-locally', false) then
+    format = mp.get_property('ytdl-format', '')
+  end
+  local data = utils.format_json({
+    format = format,
+    headers = mp.get_property_native('file-local-options/http-header-fields', {}),
+    stream = stream,
+    title = mp.get_property('media-title', ''),
+    url = path,
+  })
+  mp.command_native_async({
+    name = 'subprocess',
+    args = { python, '-m', 'open_in_mpv.streams', data },
+    playback_only = false,
+  }, function() end)
+end)
@@ -0,0 +1,236 @@
+"""
+Cache of the streams mpv's ``ytdl_hook`` resolved for page URLs.
+
+Instances started with :py:func:`script_args` load ``stream_cache.lua``, which runs
+``python -m open_in_mpv.streams`` with what ``ytdl_hook`` chose for each page: the stream URL
+(an ``edl://`` URL when audio and video are separate), the HTTP headers, the format and the title.
+When the page is opened again before the stream expires, mpv is given the stream URL directly and
+yt-dlp does not run.
+
+Each entry is a JSON file in ``STREAM_CACHE_DIR`` named after the hash of the canonical page URL
+and the ``ytdl-format`` it was resolved with. Only the owner can read it, as the headers may hold
+cookies. An entry expires at the earliest ``expire`` time in its stream URLs (signed URLs stop
+working then), or after ``DEFAULT_TTL`` seconds. Only the ``MAX_ENTRIES`` most recently used
+entries are kept.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, NamedTuple
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+from .constants import STREAM_CACHE_DIR
+from .urls import canonical_url
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+__all__ = ('DEFAULT_TTL', 'EXPIRY_MARGIN', 'MAX_ENTRIES', 'SCRIPT_PATH', 'Entry', 'canonical_url',
+           'expiry', 'lookup', 'main', 'prune', 'script_args', 'store')
+
+DEFAULT_TTL = 3600.0
+"""Seconds an entry is kept when its stream URLs have no expiry time."""
+EXPIRY_MARGIN = 120.0
+"""Seconds before the expiry time of a stream when the entry is no longer used."""
+MAX_ENTRIES = 256
+"""Number of entries kept."""
+SCRIPT_PATH = Path(__file__).parent / 'stream_cache.lua'
+"""mpv script that stores resolved streams."""
+
+_EXPIRY_RE = re.compile(r'(?:^|[?&;/~,=])(?:exp|expire|expires)[=/](\d{9,11})(?!\d)',
+                        re.IGNORECASE)
+
+log = logging.getLogger(__name__)
+
+
+class Entry(NamedTuple):
+    """A resolved page."""
+    url: str
+    """Canonical page URL."""
+    stream: str
+    """URL to give mpv instead of the page URL."""
+    headers: Sequence[str] = ()
+    """HTTP headers the stream needs, as ``Name: value`` strings."""
+    format: str | None = None
+    """``ytdl-format`` set for the file when the page was resolved, or ``None``."""
+    title: str | None = None
+    """Title of the media."""
+    expires: float = 0.0
+    """Time after which the entry is not used, in seconds since the epoch."""
+
+    def loadfile_options(self) -> dict[str, str]:
+        """
+        Get the per-file options that make mpv play the stream like ``ytdl_hook`` would.
+
+        Returns
+        -------
+        dict[str, str]
+            Option names and values.
+        """
+        options = {}
+        if self.headers:
+            # Commas separate the items of mpv string lists unless escaped.
+            options['http-header-fields'] = ','.join(x.replace(',', r'\,') for x in self.headers)
+        if self.title:
+            options['force-media-title'] = self.title
+        return options
+
+
+def expiry(stream: str) -> float | None:
+    """
+    Get the earliest expiry time in the signed URLs in ``stream``.
+
+    Recognises ``expire``, ``expires`` and ``exp`` query parameters, tokens and path segments.
+
+    Returns
+    -------
+    float | None
+        Seconds since the epoch, or ``None`` if there is no expiry time.
+    """
+    if not (times := [float(x) for x in _EXPIRY_RE.findall(stream)]):
+        return None
+    return min(times)
+
+
+def _path(url: str, ytdl_format: str | None, cache_dir: Path | None = None) -> Path:
+    key = f'{canonical_url(url)}\n{ytdl_format or ""}'
+    digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+    return (cache_dir or STREAM_CACHE_DIR) / f'{digest}.json'
+
+
+def _write_private(path: Path, text: str) -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def lookup(url: str,
+           *,
+           ytdl_format: str | None = None,
+           cache_dir: Path | None = None,
+           now: float | None = None) -> Entry | None:
+    """
+    Get the unexpired entry for page ``url`` resolved with ``ytdl_format``.
+
+    ``ytdl_format`` is the format the request sets for the file, or ``None`` if it leaves mpv's
+    own. An entry resolved with another format is not used. A hit marks the entry as recently used.
+
+    Returns
+    -------
+    Entry | None
+        The entry, or ``None`` on a miss.
+    """
+    path = _path(url, ytdl_format, cache_dir)
+    try:
+        data = json.loads(path.read_bytes())
+        entry = Entry(**data)
+    except FileNotFoundError:
+        return None
+    except (OSError, TypeError, ValueError):
+        log.debug('Removing invalid stream cache entry %s.', path)
+        path.unlink(missing_ok=True)
+        return None
+    if entry.expires <= (time.time() if now is None else now):
+        log.debug('Stream cache entry for %s expired.', url)
+        path.unlink(missing_ok=True)
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        log.debug('Cannot update the access time of %s.', path)
+    return entry
+
+
+def store(url: str,
+          stream: str,
+          *,
+          headers: Sequence[str] = (),
+          ytdl_format: str | None = None,
+          title: str | None = None,
+          cache_dir: Path | None = None,
+          now: float | None = None) -> Entry | None:
+    """
+    Add or replace the entry for page ``url`` resolved with ``ytdl_format``.
+
+    The file is only readable by the owner. Nothing is stored if the stream expires within
+    ``EXPIRY_MARGIN`` seconds.
+
+    Returns
+    -------
+    Entry | None
+        The new entry.
+    """
+    now = time.time() if now is None else now
+    expires = now + DEFAULT_TTL if (signed := expiry(stream)) is None else signed - EXPIRY_MARGIN
+    if expires <= now:
+        log.debug('Stream for %s expires too soon to cache.', url)
+        return None
+    entry = Entry(canonical_url(url), stream, list(headers), ytdl_format or None, title or None,
+                  expires)
+    path = _path(url, ytdl_format, cache_dir)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    try:
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        _write_private(tmp_path, json.dumps(entry._asdict()))
+        tmp_path.replace(path)
+    except OSError:
+        log.warning('Failed to write the stream cache entry for %s.', url)
+        tmp_path.unlink(missing_ok=True)
+        return None
+    prune(cache_dir=cache_dir)
+    return entry
+
+
+def prune(max_entries: int = MAX_ENTRIES, *, cache_dir: Path | None = None) -> int:
+    """
+    Remove the least recently used entries beyond ``max_entries``.
+
+    Returns
+    -------
+    int
+        Number of entries removed.
+    """
+    try:
+        entries = sorted(((x.stat().st_mtime, x)
+                          for x in (cache_dir or STREAM_CACHE_DIR).glob('*.json')),
+                         reverse=True)
+    except OSError:
+        return 0
+    for _, path in entries[max_entries:]:
+        path.unlink(missing_ok=True)
+    return max(0, len(entries) - max_entries)
+
+
+def script_args() -> list[str]:
+    """
+    Get the mpv arguments that make an instance store the streams it resolves.
+
+    Returns
+    -------
+    list[str]
+        Arguments to add to the command line.
+    """
+    return [
+        f'--script={SCRIPT_PATH}', f'--script-opts-append=open_in_mpv-python={sys.executable}'
+    ]
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Store the entry that ``stream_cache.lua`` passes as a JSON argument."""
+    data: dict[str, Any] = json.loads((sys.argv[1:] if argv is None else argv)[0])
+    headers = data.get('headers') or ()
+    store(data['url'],
+          data['stream'],
+          headers=[str(x) for x in headers] if isinstance(headers, list) else (),
+          ytdl_format=data.get('format'),
+          title=data.get('title'))
+
+
+if __name__ == '__main__':
+    main()
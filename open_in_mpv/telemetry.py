@@ -0,0 +1,221 @@
+"""
+Playback quality telemetry.
+
+With telemetry enabled, the host starts a collector next to each instance
+(:py:mod:`open_in_mpv.collector`). It observes ``PROPERTIES`` for each file and, when the file
+ends, appends a summary of the session to ``TELEMETRY_PATH`` as a JSON line. A record names the
+machine, the site (the host name of the page URL) and the video format, but not the URL, so stalls
+and dropped frames can be grouped by them. ``open-in-mpv-stats --telemetry`` summarises the records
+and :py:func:`prometheus` converts them to the Prometheus text format.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlsplit
+import json
+import socket
+import time
+
+from . import metrics
+from .constants import TELEMETRY_PATH
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator, Mapping
+    from pathlib import Path
+
+__all__ = ('COUNTERS', 'LABELS', 'PROPERTIES', 'Session', 'prometheus', 'read', 'summarise',
+           'write')
+
+PROPERTIES = ('frame-drop-count', 'decoder-frame-drop-count', 'demuxer-cache-duration',
+              'cache-speed', 'paused-for-cache', 'video-bitrate', 'audio-bitrate')
+"""Properties observed during a session."""
+LABELS = ('machine', 'site', 'format')
+"""Record fields that records are grouped by."""
+COUNTERS = (('sessions', 'Files played.'), ('seconds', 'Seconds files were open.'),
+            ('stalls', 'Times playback paused to wait for the cache.'),
+            ('stall_seconds', 'Seconds playback was paused to wait for the cache.'),
+            ('frame_drops', 'Frames dropped by the video output.'),
+            ('decoder_frame_drops', 'Frames dropped by the decoder.'))
+"""Record fields that are summed per group, and their descriptions."""
+
+
+class Session:
+    """
+    Playback quality of one file.
+
+    Parameters
+    ----------
+    url : str
+        Page URL or path of the file.
+    video_format : str
+        Video codec and height, such as ``vp9 1080p``. Empty for audio.
+    hwdec : str
+        Hardware decoder in use. Empty for software decoding.
+    """
+    def __init__(self, url: str, video_format: str = '', hwdec: str = '') -> None:
+        self.site = urlsplit(url).hostname or 'local'
+        """Host name of the page URL, or ``local`` for files."""
+        self.video_format = video_format
+        """Video codec and height."""
+        self.hwdec = hwdec
+        """Hardware decoder in use."""
+        self.frame_drops = 0
+        """Frames dropped by the video output."""
+        self.decoder_frame_drops = 0
+        """Frames dropped by the decoder."""
+        self.stalls = 0
+        """Times playback paused to wait for the cache."""
+        self.stall_seconds = 0.0
+        """Seconds playback was paused to wait for the cache, not counting a stall in progress."""
+        self.cache_min: float | None = None
+        """Lowest demuxer cache duration in seconds."""
+        self.cache_speed_max = 0.0
+        """Highest cache fill speed in bytes per second."""
+        self._start = time.monotonic()
+        self._stalled: float | None = None
+        self._totals: dict[str, list[float]] = {}
+        self._bitrates: dict[str, float] = {}
+
+    def update(self, name: str, value: Any) -> None:
+        """Take a new value of one of ``PROPERTIES``."""
+        if name == 'paused-for-cache':
+            if value is True and self._stalled is None:
+                self.stalls += 1
+                self._stalled = time.monotonic()
+            elif value is False and self._stalled is not None:
+                self.stall_seconds += time.monotonic() - self._stalled
+                self._stalled = None
+        elif not isinstance(value, (int, float)) or isinstance(value, bool):
+            return
+        elif name == 'frame-drop-count':
+            self.frame_drops = max(self.frame_drops, int(value))
+        elif name == 'decoder-frame-drop-count':
+            self.decoder_frame_drops = max(self.decoder_frame_drops, int(value))
+        elif name == 'demuxer-cache-duration':
+            self.cache_min = value if self.cache_min is None else min(self.cache_min, value)
+            self._add(name, value)
+        elif name == 'cache-speed':
+            self.cache_speed_max = max(self.cache_speed_max, value)
+            self._add(name, value)
+        elif name in {'video-bitrate', 'audio-bitrate'}:
+            self._bitrates[name] = value
+            self._add('bitrate', sum(self._bitrates.values()))
+
+    def _add(self, name: str, value: float) -> None:
+        total = self._totals.setdefault(name, [0.0, 0])
+        total[0] += value
+        total[1] += 1
+
+    def _mean(self, name: str) -> float | None:
+        total, count = self._totals.get(name, (0.0, 0))
+        return round(total / count, 3) if count else None
+
+    def record(self, machine: str | None = None) -> dict[str, Any]:
+        """
+        Summarise the session so far.
+
+        ``machine`` defaults to the host name.
+
+        Returns
+        -------
+        dict[str, Any]
+            The record.
+        """
+        now = time.monotonic()
+        stall_seconds = self.stall_seconds + (0 if self._stalled is None else now - self._stalled)
+        return {
+            'time': round(time.time(), 3),
+            'machine': machine or socket.gethostname(),
+            'site': self.site,
+            'format': self.video_format,
+            'hwdec': self.hwdec,
+            'sessions': 1,
+            'seconds': round(now - self._start, 3),
+            'stalls': self.stalls,
+            'stall_seconds': round(stall_seconds, 3),
+            'frame_drops': self.frame_drops,
+            'decoder_frame_drops': self.decoder_frame_drops,
+            'cache_min': self.cache_min,
+            'cache_mean': self._mean('demuxer-cache-duration'),
+            'cache_speed_max': self.cache_speed_max,
+            'cache_speed_mean': self._mean('cache-speed'),
+            'bitrate_mean': self._mean('bitrate')
+        }
+
+
+def write(record: Mapping[str, Any], *, path: Path | None = None) -> None:
+    """Append ``record`` to ``path``, which defaults to ``TELEMETRY_PATH``."""
+    metrics.append(record, path or TELEMETRY_PATH)
+
+
+def _decode(lines: Iterable[str]) -> Iterator[dict[str, Any]]:
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict):
+            yield record
+
+
+def read(path: Path | None = None) -> Iterator[dict[str, Any]]:
+    """
+    Read the records in ``path``, which defaults to ``TELEMETRY_PATH``.
+
+    Lines that cannot be decoded are skipped.
+
+    Yields
+    ------
+    dict[str, Any]
+        Each record.
+    """
+    try:
+        with (path or TELEMETRY_PATH).open(encoding='utf-8') as f:
+            yield from _decode(f)
+    except FileNotFoundError:
+        return
+
+
+def summarise(records: Iterable[Mapping[str, Any]]) -> dict[tuple[str, ...], dict[str, float]]:
+    """
+    Sum the ``COUNTERS`` of ``records`` per machine, site and format.
+
+    Returns
+    -------
+    dict[tuple[str, ...], dict[str, float]]
+        The sums for each combination of ``LABELS`` values, sorted.
+    """
+    groups: dict[tuple[str, ...], dict[str, float]] = {}
+    for record in records:
+        sums = groups.setdefault(tuple(str(record.get(x) or '') for x in LABELS),
+                                 dict.fromkeys((x for x, _ in COUNTERS), 0))
+        for name, _ in COUNTERS:
+            if isinstance(value := record.get(name), (int, float)):
+                sums[name] += value
+    return dict(sorted(groups.items()))
+
+
+def _label_value(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def prometheus(records: Iterable[Mapping[str, Any]]) -> str:
+    """
+    Convert ``records`` to counters in the Prometheus text format.
+
+    The result can be served by the textfile collector of the Prometheus node exporter.
+
+    Returns
+    -------
+    str
+        One ``open_in_mpv_<name>_total`` counter per ``COUNTERS`` entry, labelled with ``LABELS``.
+    """
+    groups = summarise(records)
+    lines: list[str] = []
+    for name, description in COUNTERS:
+        metric = f'open_in_mpv_{name}_total'
+        lines.extend((f'# HELP {metric} {description}', f'# TYPE {metric} counter'))
+        for key, sums in groups.items():
+            labels = ','.join(f'{k}="{_label_value(v)}"' for k, v in zip(LABELS, key, strict=True))
+            lines.append(f'{metric}{{{labels}}} {round(sums[name], 3)}')
+    return '\n'.join(lines) + '\n'
@@ -1,26 +1,196 @@
 """Command-line tool to test open-in-mpv."""
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from shlex import quote
 from shutil import which
 from struct import pack
+from typing import IO, TYPE_CHECKING, Any, NamedTuple, cast
 import json
 import logging
 import subprocess as sp
+import time
 
 from bascom import setup_logging
 import click
 
-__all__ = ('main',)
+from . import codec, metrics, pool
+from .constants import IS_WIN, MPV_INSTANCES_DIR, MPV_SOCKET
+
+if TYPE_CHECKING:
+    from collections.abc import Collection, Sequence
+
+__all__ = ('Result', 'count_instances', 'main', 'send', 'snapshot')
+
+PERCENTILES = (50, 95, 99)
+"""Percentiles of the response latency that are printed."""
+SETTLE_TIME = 1.0
+"""Seconds to wait after the last response before counting mpv processes and sockets."""
 
 log = logging.getLogger(__name__)
 
 
+class Result(NamedTuple):
+    """Outcome of one request."""
+    latency: float
+    """Milliseconds between starting the host and reading its response."""
+    error: str | None
+    """Why the request failed, or ``None``."""
+
+
+def _exchange(proc: sp.Popen[bytes], message: dict[str, Any]) -> Any:
+    # Both pipes exist because the host is always started with stdin and stdout as pipes.
+    stdin, stdout = cast('IO[bytes]', proc.stdin), cast('IO[bytes]', proc.stdout)
+    stdin.write(codec.encode(message))
+    stdin.close()
+    try:
+        return codec.read(stdout)
+    except (EOFError, codec.FrameError) as e:
+        return {'error': f'Invalid response: {e!r}'}
+
+
+def send(args: Sequence[str], message: dict[str, Any]) -> Result:
+    """
+    Start the host with ``args``, send it ``message`` and read the response.
+
+    Returns
+    -------
+    Result
+        The latency, and an error if the host did not exit cleanly or responded with one.
+    """
+    start = time.monotonic()
+    try:
+        with sp.Popen(args, stdin=sp.PIPE, stdout=sp.PIPE) as proc:
+            response = _exchange(proc, message)
+            latency = (time.monotonic() - start) * 1000
+    except OSError as e:
+        return Result((time.monotonic() - start) * 1000, str(e))
+    if isinstance(response, dict) and 'error' in response:
+        return Result(latency, str(response['error']))
+    if proc.returncode != 0:
+        return Result(latency, f'Exit code {proc.returncode}.')
+    return Result(latency, None)
+
+
+def _ipc_server(args: Sequence[str]) -> str | None:
+    return next((x.split('=', 1)[1] for x in args if x.startswith('--input-ipc-server=')), None)
+
+
+def _servers() -> list[str]:
+    if not (ps := which('ps')):
+        log.debug('ps not found in PATH.')
+        return []
+    try:
+        output = sp.run((ps, '-axo', 'args='), capture_output=True, check=True, text=True).stdout
+    except (OSError, sp.CalledProcessError):
+        log.debug('Cannot list processes.')
+        return []
+    servers = []
+    for line in output.splitlines():
+        if not (args := line.split()) or Path(args[0]).name != 'mpv':
+            continue
+        server = _ipc_server(args)
+        if server and server.startswith((str(MPV_SOCKET.parent), '@open-in-mpv')):
+            servers.append(server)
+    return servers
+
+
+def _sockets() -> list[str]:
+    try:
+        # Other sockets in the directory, such as the resolver's, are not instances.
+        return [
+            str(x) for x in (MPV_SOCKET, *pool.sockets(), *MPV_INSTANCES_DIR.glob('*.sock'))
+            if x.exists()
+        ]
+    except OSError:
+        return []
+
+
+def snapshot() -> frozenset[str]:
+    """
+    Get the IPC servers of the running mpv processes and the sockets that belong to open-in-mpv.
+
+    Pass the result to :py:func:`count_instances` to leave out what existed before a test run.
+    Always empty on Windows.
+
+    Returns
+    -------
+    frozenset[str]
+        The IPC server paths and socket paths.
+    """
+    if IS_WIN:
+        return frozenset()
+    return frozenset((*_servers(), *_sockets()))
+
+
+def count_instances(before: Collection[str] = ()) -> tuple[int, int, int]:
+    """
+    Count the mpv processes and sockets that belong to open-in-mpv.
+
+    Processes and sockets in ``before`` (see :py:func:`snapshot`) are not counted, but an instance
+    in ``before`` makes every new instance a duplicate. Idle pool instances are not counted as
+    duplicates. Always zero on Windows.
+
+    Returns
+    -------
+    tuple[int, int, int]
+        The number of new mpv processes, of new sockets and of instances beyond the first that are
+        not in the pool.
+    """
+    if IS_WIN:
+        return 0, 0, 0
+    pooled = {str(x) for x in pool.sockets()}
+    servers = _servers()
+    active = [x for x in servers if x not in pooled]
+    new_active = [x for x in active if x not in before]
+    first = 0 if len(new_active) < len(active) else 1
+    return (sum(1 for x in servers if x not in before),
+            sum(1 for x in _sockets() if x not in before), max(0, len(new_active) - first))
+
+
+def _load(args: Sequence[str], message: dict[str, Any], *, repeat: int, concurrency: int,
+          rate: float | None) -> list[Result]:
+    start = time.monotonic()
+
+    def run(index: int) -> Result:
+        if rate:
+            time.sleep(max(0.0, start + index / rate - time.monotonic()))
+        return send(args, message)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(run, range(repeat)))
+
+
 @click.command(context_settings={'help_option_names': ('-h', '--help')})
 @click.argument('url')
+@click.option('-c',
+              '--concurrency',
+              default=1,
+              help='Maximum number of requests in flight.',
+              type=click.IntRange(1))
 @click.option('-d', '--debug', help='Enable debug logging.', is_flag=True)
-def main(url: str, *, debug: bool = False) -> None:
-    """Test ``open-in-mpv`` command."""  # ruff:ignore[docstring-missing-exception]
+@click.option('-n',
+              '--repeat',
+              default=1,
+              help='Number of times to send the URL.',
+              type=click.IntRange(1))
+@click.option('-r',
+              '--rate',
+              help='Maximum requests started per second.',
+              type=click.FloatRange(0, min_open=True))
+def main(url: str,
+         *,
+         concurrency: int = 1,
+         debug: bool = False,
+         rate: float | None = None,
+         repeat: int = 1) -> None:
+    """
+    Test ``open-in-mpv`` command.
+
+    With ``--repeat``, ``--concurrency`` or ``--rate``, the URL is sent many times and the latency
+    percentiles, errors and new mpv processes, sockets and duplicate instances are printed.
+    """  # ruff:ignore[docstring-missing-exception]
     setup_logging(debug=debug,
                   loggers={'open_in_mpv': {
                       'handlers': ('console',),
@@ -36,9 +206,31 @@ def main(url: str, *, debug: bool = False) -> None:
     with sp.Popen(open_in_mpv_args, stdin=sp.PIPE, stdout=sp.PIPE) as proc0:
         proc0.communicate(input=pack('@i', len(data)) + data.encode())
         proc0.wait()
-    data = json.dumps({'url': url, 'debug': debug})
-    with sp.Popen(open_in_mpv_args, stdin=sp.PIPE, stdout=sp.PIPE) as proc:
-        proc.communicate(input=pack('@i', len(data)) + data.encode())
-        proc.wait()
-    if proc0.returncode != 0 or proc.returncode != 0:
+    if repeat == 1 and concurrency == 1 and rate is None:
+        data = json.dumps({'url': url, 'debug': debug})
+        with sp.Popen(open_in_mpv_args, stdin=sp.PIPE, stdout=sp.PIPE) as proc:
+            proc.communicate(input=pack('@i', len(data)) + data.encode())
+            proc.wait()
+        if proc0.returncode != 0 or proc.returncode != 0:
+            raise click.Abort
+        return
+    if proc0.returncode != 0:
         raise click.Abort
+    message = {'url': url, 'debug': debug}
+    before = snapshot()
+    results = _load(open_in_mpv_args, message, repeat=repeat, concurrency=concurrency, rate=rate)
+    time.sleep(SETTLE_TIME)
+    processes, sockets, duplicates = count_instances(before)
+    errors = [x.error for x in results if x.error is not None]
+    latencies = [x.latency for x in results]
+    click.echo(f'requests: {len(results)}')
+    click.echo(f'errors: {len(errors)}')
+    for error in sorted(set(errors)):
+        click.echo(f'  {errors.count(error)}: {error}')
+    click.echo('latency ms: ' +
+               ' '.join(f'p{p}={metrics.percentile(latencies, p):.1f}' for p in PERCENTILES))
+    click.echo(f'new mpv processes: {processes}')
+    click.echo(f'new sockets: {sockets}')
+    click.echo(f'duplicate instances: {duplicates}')
+    if errors or duplicates:
+        raise click.exceptions.Exit(1)
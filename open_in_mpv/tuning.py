@@ -0,0 +1,157 @@
+"""
+Cache settings tuned per site.
+
+mpv's default cache settings serve neither a slow CDN, which needs to buffer further ahead to stop
+stalling, nor a fast one, which could keep much less in memory. With cache tuning enabled, the
+telemetry collector (:py:mod:`open_in_mpv.collector`) passes each finished session to
+:py:func:`observe`, which updates the :py:class:`Profile` of the site in ``TUNING_PATH``: moving
+averages of the stalls per minute, the cache fill speed and the bitrate. The host then gives mpv the
+:py:func:`options` of the profile as per-file options.
+
+The table is small, so it is a JSON file changed under an exclusive ``flock`` like the recent
+requests table.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+import fcntl
+import json
+import logging
+import os
+
+from .constants import TUNING_PATH
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+    from pathlib import Path
+
+__all__ = ('BASE_SECS', 'MAX_BYTES', 'MAX_ENTRIES', 'MAX_SECS', 'MIN_BYTES', 'MIN_SECONDS',
+           'MIN_SESSIONS', 'SMOOTHING', 'Profile', 'lookup', 'observe', 'options')
+
+BASE_SECS = 10.0
+"""Seconds buffered ahead for a site that never stalls and is fast enough."""
+MAX_SECS = 120.0
+"""Most seconds buffered ahead."""
+MIN_BYTES = 16 * 1024 * 1024
+"""Smallest demuxer cache in bytes."""
+MAX_BYTES = 1024 * 1024 * 1024
+"""Largest demuxer cache in bytes."""
+MAX_ENTRIES = 256
+"""Number of sites kept."""
+MIN_SECONDS = 10.0
+"""Sessions shorter than this are not learnt from."""
+MIN_SESSIONS = 2
+"""Sessions needed before a profile is used."""
+SMOOTHING = 0.3
+"""Weight of a new session in the moving averages."""
+
+log = logging.getLogger(__name__)
+
+
+class Profile(NamedTuple):
+    """What was observed for a site."""
+    sessions: int
+    """Number of sessions learnt from."""
+    stall_rate: float
+    """Stalls per minute of playback."""
+    speed: float
+    """Cache fill speed in bytes per second."""
+    bitrate: float
+    """Bitrate of the streams in bits per second. Zero if not known."""
+
+
+def _read(path: Path) -> dict[str, Profile]:
+    try:
+        data = json.loads(path.read_bytes())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        log.warning('Ignoring invalid tuning table %s.', path)
+        return {}
+    return {
+        site: Profile(*values)
+        for site, values in (data.items() if isinstance(data, dict) else ())
+        if isinstance(values, list) and len(values) == len(Profile._fields)
+    }
+
+
+def lookup(site: str, *, path: Path | None = None) -> Profile | None:
+    """
+    Get the profile of ``site``.
+
+    Returns
+    -------
+    Profile | None
+        The profile, or ``None`` if the site was not seen often enough.
+    """
+    profile = _read(path or TUNING_PATH).get(site)
+    return profile if profile is not None and profile.sessions >= MIN_SESSIONS else None
+
+
+def _average(old: float, new: float) -> float:
+    return round(old + SMOOTHING * (new - old), 3)
+
+
+def _update(path: Path, site: str, stall_rate: float, speed: float, bitrate: float) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.with_name(f'{path.name}.lock').open('a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        table = _read(path)
+        if (old := table.pop(site, None)) is None:
+            new = Profile(1, round(stall_rate, 3), round(speed, 3), round(bitrate, 3))
+        else:
+            new = Profile(old.sessions + 1, _average(old.stall_rate, stall_rate),
+                          _average(old.speed, speed) if speed else old.speed,
+                          _average(old.bitrate, bitrate) if bitrate else old.bitrate)
+        # The most recently seen site is last, so the oldest are dropped first.
+        table[site] = new
+        tmp = path.with_name(f'{path.name}.{os.getpid()}')
+        tmp.write_text(json.dumps({k: list(v) for k, v in list(table.items())[-MAX_ENTRIES:]}),
+                       encoding='utf-8')
+        tmp.replace(path)
+
+
+def observe(record: Mapping[str, object], *, path: Path | None = None) -> None:
+    """
+    Update the profile of the site of telemetry ``record``.
+
+    Sessions of local files and sessions shorter than ``MIN_SECONDS`` are ignored.
+    """
+    site, seconds = record.get('site'), record.get('seconds')
+    if (not isinstance(site, str) or site == 'local' or not isinstance(seconds, (int, float))
+            or seconds < MIN_SECONDS):
+        return
+    values = [record.get(x) for x in ('stalls', 'cache_speed_mean', 'bitrate_mean')]
+    stalls, speed, bitrate = (float(x) if isinstance(x, (int, float)) else 0.0 for x in values)
+    stall_rate = stalls * 60 / seconds
+    path = path or TUNING_PATH
+    try:
+        _update(path, site, stall_rate, speed, bitrate)
+    except OSError:
+        log.warning('Cannot update the tuning table %s.', path)
+
+
+def options(profile: Profile) -> dict[str, str]:
+    """
+    Get the cache options for a site with ``profile``.
+
+    The time buffered ahead starts at ``BASE_SECS``, grows with the stall rate and doubles if the
+    site delivers less than 1.5 times the bitrate. The demuxer cache holds twice that time at the
+    bitrate, between ``MIN_BYTES`` and ``MAX_BYTES``. If the bitrate is not known, mpv's own limit
+    is kept.
+
+    Returns
+    -------
+    dict[str, str]
+        Values of ``demuxer-readahead-secs``, ``cache-secs`` and, if the bitrate is known,
+        ``demuxer-max-bytes``.
+    """
+    secs = BASE_SECS * (1 + 4 * profile.stall_rate)
+    if profile.bitrate and profile.speed * 8 < 1.5 * profile.bitrate:
+        secs *= 2
+    secs = min(secs, MAX_SECS)
+    ret = {'demuxer-readahead-secs': f'{secs:g}', 'cache-secs': f'{secs:g}'}
+    if profile.bitrate:
+        ret['demuxer-max-bytes'] = str(
+            int(min(MAX_BYTES, max(MIN_BYTES, profile.bitrate / 8 * secs * 2))))
+    return ret
@@ -0,0 +1,46 @@
+"""URL normalisation shared by the stream cache, the recent requests table and the history."""
+from __future__ import annotations
+
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+__all__ = ('PAGE_OPTION', 'TRACKING_PARAMETERS', 'canonical_url')
+
+PAGE_OPTION = 'open_in_mpv-page'
+"""
+Script option that holds the page URL of a file.
+
+The host sets it per file when mpv is given something other than the page, such as a cached
+stream, so companions (see :py:mod:`open_in_mpv.companion`) still see the page URL.
+"""
+TRACKING_PARAMETERS = frozenset({
+    'dclid', 'fbclid', 'feature', 'gclid', 'gclsrc', 'igsh', 'igshid', 'mc_cid', 'mc_eid',
+    'msclkid', 'si', 'ttclid', 'twclid', 'yclid'
+})
+"""Query parameters that do not change what a page shows."""
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalise a page URL so that links to the same page compare equal.
+
+    The scheme and host are lower-cased, a trailing dot and the default port are removed from the
+    host, the fragment and tracking parameters (``utm_*`` and ``TRACKING_PARAMETERS``) are removed,
+    and ``youtu.be`` links are expanded.
+
+    Returns
+    -------
+    str
+        The canonical URL.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower().rstrip('.')
+    if parts.port and (parts.scheme, parts.port) not in {('http', 80), ('https', 443)}:
+        host = f'{host}:{parts.port}'
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k not in TRACKING_PARAMETERS and not k.startswith('utm_')]
+    path = parts.path
+    if host in {'youtu.be', 'www.youtu.be'} and path.strip('/'):
+        host, query, path = 'www.youtube.com', [('v', path.strip('/')), *query], '/watch'
+    elif host in {'youtube.com', 'm.youtube.com'}:
+        host = 'www.youtube.com'
+    return urlunsplit((parts.scheme.lower(), host, path or '/', urlencode(query), ''))
@@ -0,0 +1,179 @@
+"""
+Process that watches an instance after a URL was sent to it.
+
+The host starts this in the background when metrics are enabled, so the host itself can exit as
+soon as mpv has been started or sent the URL. Run as
+``python -m open_in_mpv.watcher ADDRESS ID START HOST_END NEW URL``.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, cast
+import asyncio
+import logging
+import sys
+import time
+
+from . import instance, metrics
+from .ipc import MpvClient, MpvCommandError
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+__all__ = ('EVENTS', 'WATCH_TIMEOUT', 'command', 'main', 'watch')
+
+EVENTS = (('file-loaded', 'file_loaded'), ('playback-restart', 'playback_restart'))
+"""mpv events that end a stage, and the stage names."""
+WATCH_TIMEOUT = 120.0
+"""Seconds to wait for mpv to start playing before giving up."""
+
+log = logging.getLogger(__name__)
+
+
+def command(address: Path | str,
+            timer: metrics.Timer,
+            *,
+            new_instance: bool,
+            url: str | None = None) -> list[str]:
+    """
+    Get the command line that starts a watcher.
+
+    Returns
+    -------
+    list[str]
+        The command line.
+    """
+    return [
+        sys.executable, '-m', __name__,
+        str(address), timer.id,
+        repr(timer.start),
+        repr(timer.last), '1' if new_instance else '0', url or ''
+    ]
+
+
+def _socket_created(address: Path | str) -> float | None:
+    # mpv creates the socket file when it starts listening. There is no file for an abstract socket.
+    if str(address).startswith('@'):
+        return None
+    try:
+        mtime = Path(address).stat().st_mtime
+    except OSError:
+        return None
+    return time.monotonic() - (time.time() - mtime)
+
+
+async def _connect(client: MpvClient, deadline: float) -> bool | None:
+    # Returns whether the first attempt failed, or None if the instance never became reachable.
+    retried = False
+    while True:
+        try:
+            await client.connect()
+            break
+        except (OSError, asyncio.TimeoutError):
+            if time.monotonic() >= deadline:
+                return None
+            retried = True
+            await asyncio.sleep(0.01)
+    return retried
+
+
+async def _playing(client: MpvClient, url: str) -> bool:
+    path, position = await client.commands(
+        (('get_property', 'path'), ('get_property', 'playback-time')), return_exceptions=True)
+    return path == url and position is not None and not isinstance(position, Exception)
+
+
+async def _path(client: MpvClient) -> str | None:
+    try:
+        return cast('str | None', await client.get_property('path'))
+    except (MpvCommandError, ConnectionError, asyncio.TimeoutError):
+        return None
+
+
+async def watch(address: Path | str,
+                *,
+                start: float,
+                host_end: float,
+                new_instance: bool,
+                url: str | None = None,
+                timeout: float = WATCH_TIMEOUT) -> dict[str, float]:
+    """
+    Wait for the instance at ``address`` to start playing ``url``.
+
+    ``start`` and ``host_end`` are values of :py:func:`time.monotonic` from the host: when it
+    started handling the message and when it finished. With ``url``, events for other files are
+    ignored, and nothing more is timed if ``url`` was already playing when the connection was
+    made, as its events were missed.
+
+    A new instance is ready when it creates its socket file. For an abstract socket, that is only
+    known if the watcher was already waiting for it, so the watcher's own start-up time is not
+    counted.
+
+    Returns
+    -------
+    dict[str, float]
+        Milliseconds spent in each stage that was seen. ``mpv_start`` is only present for a new
+        instance and ``total`` only if playback started.
+    """
+    stage_names = dict(EVENTS)
+    events: asyncio.Queue[tuple[str, float]] = asyncio.Queue()
+    client = MpvClient(instance.connect_address(address))
+    for name in stage_names:
+        client.add_event_handler(
+            name, lambda message: events.put_nowait((message['event'], time.monotonic())))
+    stages: dict[str, float] = {}
+    last = host_end
+    deadline = time.monotonic() + timeout
+    try:
+        if (retried := await _connect(client, deadline)) is None:
+            log.debug('Instance at %s never became reachable.', address)
+            return stages
+        connected = time.monotonic()
+        if new_instance and (ready := _socket_created(address) or
+                             (connected if retried else None)) is not None and ready >= start:
+            ready = max(ready, host_end)
+            stages['mpv_start'] = round((ready - last) * 1000, 3)
+            last = ready
+        # Events are only sent once the connection is made. A reply is read after the events sent
+        # before it, so an empty queue means the file loaded before the connection.
+        if url and await _playing(client, url) and events.empty():
+            log.debug('%s was already playing.', url)
+            return stages
+        waiting = 'file-loaded'
+        while True:
+            try:
+                event, at = await asyncio.wait_for(events.get(),
+                                                   max(0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                log.debug('No %s event.', waiting)
+                return stages
+            if event != waiting or (event == 'file-loaded' and url and
+                                    await _path(client) != url):
+                continue
+            stages[stage_names[event]] = round((at - last) * 1000, 3)
+            last = at
+            if event == 'playback-restart':
+                break
+            waiting = 'playback-restart'
+        stages['total'] = round((last - start) * 1000, 3)
+        return stages
+    finally:
+        await client.close()
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Watch an instance and append the result to the metrics file."""
+    address, record_id, start, host_end, new_instance, *url = (sys.argv[1:]
+                                                                if argv is None else argv)
+    stages = asyncio.run(
+        watch(address,
+              start=float(start),
+              host_end=float(host_end),
+              new_instance=new_instance == '1',
+              url=url[0] if url else None))
+    if stages:
+        metrics.write(stages, record_id=record_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Stand-in for yt-dlp that asks the resolver daemon.
+
+mpv's ``ytdl_hook`` runs this as ``ytdl_path`` when the resolver is enabled. The arguments are
+sent to :py:mod:`open_in_mpv.resolver` and its output is printed as if yt-dlp had run. If the
+daemon is not running, is busy or cannot handle the arguments, yt-dlp is run instead.
+
+This runs for every video, so it only imports what talking to the socket needs.
+"""
+from __future__ import annotations
+
+from shutil import which
+from typing import TYPE_CHECKING, Any, NoReturn
+import json
+import os
+import socket
+import sys
+
+from .constants import RESOLVER_SOCKET
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from pathlib import Path
+
+__all__ = ('YTDL_NAMES', 'main', 'request')
+
+CONNECT_TIMEOUT = 0.5
+"""Seconds to wait for the daemon to accept the connection."""
+YTDL_NAMES = ('yt-dlp', 'youtube-dl')
+"""Executables that are run when the daemon cannot be used."""
+
+
+def _ask(args: Sequence[str], path: Path | str) -> Any:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(str(path))
+        sock.settimeout(None)
+        sock.sendall(json.dumps({'args': list(args)}).encode() + b'\n')
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+def request(args: Sequence[str], path: Path | str = RESOLVER_SOCKET) -> dict[str, Any] | None:
+    """
+    Send ``args`` to the daemon at ``path`` and wait for the reply.
+
+    Returns
+    -------
+    dict[str, Any] | None
+        The reply, or ``None`` if the daemon cannot be used.
+    """
+    try:
+        reply = _ask(args, path)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(reply, dict) or reply.get('fallback') or not isinstance(
+            reply.get('code'), int):
+        return None
+    return reply
+
+
+def _run_ytdl(args: Sequence[str]) -> NoReturn:
+    for name in YTDL_NAMES:
+        if path := which(name):
+            # Replace this process so mpv reads yt-dlp's output directly.
+            os.execv(path, (path, *args))  # ruff:ignore[start-process-with-no-shell]
+    sys.stderr.write('ERROR: yt-dlp not found.\n')
+    sys.exit(1)
+
+
+def main() -> None:
+    """Resolve with the daemon, or run yt-dlp."""
+    args = sys.argv[1:]
+    if (reply := request(args)) is None:
+        _run_ytdl(args)
+    sys.stdout.write(reply.get('stdout', ''))
+    sys.stderr.write(reply.get('stderr', ''))
+    sys.exit(reply['code'])
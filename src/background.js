@@ -24,10 +24,53 @@
 
 /**
  * @typedef StorageItems
+ * @property {number} debounce
  * @property {boolean} debugFlag
+ * @property {boolean} formatPolicyFlag
+ * @property {boolean} historyFlag
+ * @property {number} maxInstances
+ * @property {boolean} metricsFlag
+ * @property {boolean} persistentFlag
+ * @property {number} poolSize
+ * @property {boolean} resolverFlag
+ * @property {string} route
  * @property {boolean} singleFlag
+ * @property {boolean} streamCacheFlag
+ * @property {boolean} telemetryFlag
+ * @property {boolean} tuneCacheFlag
  */
 
+const HOST_NAME = 'sh.tat.open_in_mpv';
+
+/** @type chrome.runtime.Port | null */
+let port = null;
+
+/**
+ * Get the port to the persistent native host, connecting if necessary.
+ *
+ * The host keeps running between clicks and exits by itself after being idle for a while.
+ *
+ * @returns {chrome.runtime.Port}
+ */
+function getPort() {
+  if (port === null) {
+    port = chrome.runtime.connectNative(HOST_NAME);
+    port.onDisconnect.addListener(() => {
+      if (chrome.runtime.lastError) {
+        console.debug(chrome.runtime.lastError);
+      }
+      port = null;
+    });
+    port.onMessage.addListener((resp) => {
+      if (resp && resp.error) {
+        console.error(resp.error);
+      }
+    });
+    port.postMessage({ init: true, persistent: true });
+  }
+  return port;
+}
+
 chrome.runtime.onInstalled.addListener((details) => {
   chrome.contextMenus.create({
     contexts: ['audio', 'link', 'page', 'video'],
@@ -50,10 +93,27 @@ chrome.contextMenus.onClicked.addListener((message) => {
       console.error(chrome.runtime.lastError);
       return;
     }
-    chrome.runtime.sendNativeMessage('sh.tat.open_in_mpv', {
+    const data = {
+      clickTime: Date.now(),
+      debounce: typeof items.debounce === 'number' ? items.debounce : 1,
       debug: items.debugFlag,
+      formatPolicy: items.formatPolicyFlag || false,
+      history: items.historyFlag || false,
+      maxInstances: items.maxInstances || 0,
+      metrics: items.metricsFlag || false,
+      poolSize: items.poolSize || 0,
+      resolver: items.resolverFlag || false,
+      route: items.route || 'new',
       single: items.singleFlag,
+      streamCache: items.streamCacheFlag || false,
+      telemetry: items.telemetryFlag || false,
+      tuneCache: items.tuneCacheFlag || false,
       url: message.linkUrl || message.srcUrl || message.pageUrl,
-    });
+    };
+    if (items.persistentFlag === true) {
+      getPort().postMessage(data);
+    } else {
+      chrome.runtime.sendNativeMessage(HOST_NAME, data);
+    }
   });
 });
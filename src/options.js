@@ -38,11 +38,41 @@ const form = qs('form');
 /** @type {{[x: string]: HTMLInputElement}} */
 const checkboxFields = {
   debugFlag: qs('#debug'),
+  formatPolicyFlag: qs('#format-policy'),
+  historyFlag: qs('#history'),
+  metricsFlag: qs('#metrics'),
+  persistentFlag: qs('#persistent'),
+  resolverFlag: qs('#resolver'),
   singleFlag: qs('#single'),
+  streamCacheFlag: qs('#stream-cache'),
+  telemetryFlag: qs('#telemetry'),
+  tuneCacheFlag: qs('#tune-cache'),
+};
+/** @type {{[x: string]: HTMLInputElement}} */
+const numberFields = {
+  debounce: qs('#debounce'),
+  maxInstances: qs('#max-instances'),
+  poolSize: qs('#pool-size'),
+};
+/** @type {{[x: string]: HTMLSelectElement}} */
+const selectFields = {
+  route: qs('#route'),
 };
 const defaults = {
+  debounce: 1,
   debugFlag: false,
+  formatPolicyFlag: false,
+  historyFlag: false,
+  maxInstances: 0,
+  metricsFlag: false,
+  persistentFlag: false,
+  poolSize: 0,
+  resolverFlag: false,
+  route: 'new',
   singleFlag: true,
+  streamCacheFlag: false,
+  telemetryFlag: false,
+  tuneCacheFlag: false,
 };
 /** @type HTMLElement */
 const logFile = qs('#log-file');
@@ -59,6 +89,12 @@ form.addEventListener('submit', (event) => {
   for (const key of Object.keys(checkboxFields)) {
     data[key] = checkboxFields[key].checked;
   }
+  for (const key of Object.keys(numberFields)) {
+    data[key] = numberFields[key].valueAsNumber || 0;
+  }
+  for (const key of Object.keys(selectFields)) {
+    data[key] = selectFields[key].value;
+  }
   button.disabled = true;
   chrome.storage.local.set(data, () => {
     button.disabled = false;
@@ -95,6 +131,13 @@ chrome.storage.local.get((items) => {
   for (const key of Object.keys(checkboxFields)) {
     checkboxFields[key].checked = typeof items[key] !== 'undefined' ? items[key] : defaults[key];
   }
+  for (const key of Object.keys(numberFields)) {
+    numberFields[key].valueAsNumber =
+      typeof items[key] !== 'undefined' ? items[key] : defaults[key];
+  }
+  for (const key of Object.keys(selectFields)) {
+    selectFields[key].value = typeof items[key] !== 'undefined' ? items[key] : defaults[key];
+  }
 });
 chrome.runtime.sendNativeMessage(
   'sh.tat.open_in_mpv',
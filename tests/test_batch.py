@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+import json
+import os
+import socket
+import time
+
+from open_in_mpv import batch
+
+if TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
+
+def test_commands() -> None:
+    assert batch.commands(['https://a', 'https://b']) == [['loadfile', 'https://a', 'append-play'],
+                                                         ['loadfile', 'https://b', 'append-play']]
+    assert batch.commands(['https://a', 'https://b'], mode='replace', playlist='https://c.m3u') == [
+        ['loadfile', 'https://a', 'replace'], ['loadfile', 'https://b', 'append-play'],
+        ['loadlist', 'https://c.m3u', 'append-play']
+    ]
+    assert batch.commands([], mode='replace',
+                          playlist='/a.m3u') == [['loadlist', '/a.m3u', 'replace']]
+
+
+def test_commands_loadlist(mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.batch.MPV_SOCKET', tmp_path / 'mpv.sock')
+    urls = [f'https://example.com/{i}' for i in range(batch.LOADLIST_THRESHOLD + 1)]
+    commands = batch.commands(urls, mode='replace')
+    assert len(commands) == 1
+    command = commands[0]
+    assert isinstance(command, list)
+    assert command[0] == 'loadlist'
+    assert command[2] == 'replace'
+    assert Path(command[1]).read_text(encoding='utf-8').splitlines() == urls
+    args = batch.args(urls, playlist='https://c.m3u')
+    assert args[0].startswith(f'--playlist={tmp_path}')
+    assert args[1] == '--playlist=https://c.m3u'
+
+
+def test_args() -> None:
+    assert batch.args(['https://a']) == ['https://a']
+    assert batch.args([]) == []
+
+
+def test_write_playlist_removes_old(mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.batch.MPV_SOCKET', tmp_path / 'mpv.sock')
+    old = batch.write_playlist(['https://a'])
+    stale = time.time() - batch.PLAYLIST_TTL - 1
+    os.utime(old, (stale, stale))
+    new = batch.write_playlist(['https://b'])
+    assert not old.exists()
+    assert new.exists()
+
+
+def test_send(tmp_path: Path) -> None:
+    path = tmp_path / 'mpv.sock'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(path))
+        server.listen(1)
+        batch.send(batch.commands(['https://a', 'https://b']), path)
+        conn, _ = server.accept()
+        with conn:
+            data = conn.makefile('rb').read()
+    assert [json.loads(x)['command'][1] for x in data.splitlines()] == ['https://a', 'https://b']
+
+
+def test_commands_options() -> None:
+    options = {'force-media-title': 'A'}
+    assert batch.commands(['https://a', 'https://b'], mode='replace', options=options) == [{
+        'name': 'loadfile',
+        'url': 'https://a',
+        'flags': 'replace',
+        'options': options
+    }, ['loadfile', 'https://b', 'append-play']]
+    assert batch.commands([], playlist='/a.m3u', options=options) == [
+        ['loadlist', '/a.m3u', 'append-play']
+    ]
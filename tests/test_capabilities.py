@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import subprocess as sp
+
+from open_in_mpv import capabilities
+from open_in_mpv.capabilities import Capabilities
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+OUTPUT = {
+    '--version': 'mpv 0.38.0 Copyright © 2000-2024 mpv/MPlayer/mplayer2 projects\n built on x\n',
+    '--list-options': ('Options:\n\n --gpu-api                    Choices: auto opengl vulkan\n'
+                       ' --hwdec                      String\n'
+                       ' --player-operation-mode      Choices: cplayer pseudo-gui\n'
+                       ' --script-opts                Key/value list\n'
+                       ' --vo                         Object settings list\n\n'
+                       'Total: 5 options\n'),
+    '--vo=help': 'Available video outputs:\n  gpu              Shader-based GPU Renderer\n'
+                 '  null             Null video output\n',
+    '--hwdec=help': 'Valid values (with alternative full names):\n  vaapi (vaapi-vaapi)\n',
+    '--gpu-api=help': 'GPU APIs (contexts):\n    auto (autodetect)\n    opengl (x11egl)\n'
+}
+
+
+def _run(args: list[str], **kwargs: Any) -> sp.CompletedProcess[str]:
+    return sp.CompletedProcess(args, 0, OUTPUT[args[-1]])
+
+
+@pytest.fixture
+def mpv(tmp_path: Path) -> Path:
+    path = tmp_path / 'mpv'
+    path.write_bytes(b'mpv')
+    return path
+
+
+def test_probe(mocker: MockerFixture, mpv: Path) -> None:
+    mock_run = mocker.patch('open_in_mpv.capabilities.sp.run', side_effect=_run)
+    caps = capabilities.probe(mpv)
+    assert caps.path == str(mpv)
+    assert caps.size == 3
+    assert caps.version.startswith('mpv 0.38.0')
+    assert set(caps.options) == {
+        'gpu-api', 'hwdec', 'player-operation-mode', 'script-opts', 'vo'
+    }
+    assert caps.vos == ['gpu', 'null']
+    assert caps.hwdecs == ['vaapi']
+    assert caps.gpu_apis == ['auto', 'opengl']
+    assert mock_run.call_args.args[0][:2] == (str(mpv), '--no-config')
+    mock_run.side_effect = sp.TimeoutExpired('mpv', 10)
+    assert not capabilities.probe(mpv).options
+
+
+def test_supports() -> None:
+    options = frozenset({'fs', 'gpu-api', 'hwdec', 'script-opts', 'vo'})
+    caps = Capabilities('mpv', 0, 0, 'mpv', options, ['gpu'], ['vaapi'], ['opengl'])
+    assert caps.supports('https://a')
+    assert caps.supports('--')
+    assert caps.supports('--fs')
+    assert caps.supports('--no-fs')
+    assert caps.supports('--script-opts-append=a=b')
+    assert caps.supports('--vo=gpu')
+    assert caps.supports('--hwdec=vaapi,')
+    assert not caps.supports('--vo=gpu-next')
+    assert not caps.supports('--gpu-api=vulkan')
+    assert not caps.supports('--gpu-next')
+    assert Capabilities('mpv', 0, 0, 'mpv', {'vo'}).supports('--vo=gpu-next')
+    assert caps.filter(['--fs', '--gpu-api=vulkan', 'https://a']) == ['--fs', 'https://a']
+
+
+def test_store_load(mocker: MockerFixture, mpv: Path, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.capabilities.sp.run', side_effect=_run)
+    cache_path = tmp_path / 'cache' / 'capabilities.json'
+    assert capabilities.load(mpv, cache_path=cache_path) is None
+    capabilities.store(capabilities.probe(mpv), cache_path=cache_path)
+    assert not list(cache_path.parent.glob('*.json.*'))
+    caps = capabilities.load(mpv, cache_path=cache_path)
+    assert caps is not None
+    assert 'vo' in caps.options
+    assert caps.vos == ['gpu', 'null']
+    mpv.write_bytes(b'mpv 2')
+    assert capabilities.load(mpv, cache_path=cache_path) is None
+    cache_path.write_text('[]', encoding='utf-8')
+    assert capabilities.load(mpv, cache_path=cache_path) is None
+    cache_path.write_text('{', encoding='utf-8')
+    assert capabilities.load(mpv, cache_path=cache_path) is None
+    cache_path.write_text(f'{{"{mpv}": {{"path": 1}}}}', encoding='utf-8')
+    assert capabilities.load(mpv, cache_path=cache_path) is None
+
+
+def test_store_error(mocker: MockerFixture, tmp_path: Path) -> None:
+    cache_path = tmp_path / 'capabilities.json'
+    mocker.patch('open_in_mpv.capabilities.Path.replace', side_effect=OSError)
+    capabilities.store(Capabilities('mpv', 0, 0, 'mpv', frozenset()), cache_path=cache_path)
+    assert not list(tmp_path.iterdir())
+
+
+def test_profile() -> None:
+    assert capabilities.profile(None) == [*capabilities.PROFILE, '--quiet']
+    assert capabilities.profile(None, debug=True, gpu_api=False) == [
+        '--player-operation-mode=pseudo-gui', '-v'
+    ]
+    caps = Capabilities('mpv', 0, 0, 'mpv', frozenset({'player-operation-mode'}))
+    assert capabilities.profile(caps) == ['--player-operation-mode=pseudo-gui', '--quiet']
+
+
+def test_resolve(mocker: MockerFixture, mpv: Path) -> None:
+    mpv.chmod(0o755)
+    assert capabilities.resolve('mpv', str(mpv.parent)) == mpv.resolve()
+    assert capabilities.resolve('mpv', '') is None
+
+
+def test_main(mocker: MockerFixture, mpv: Path, tmp_path: Path) -> None:
+    cache_path = tmp_path / 'capabilities.json'
+    mocker.patch('open_in_mpv.capabilities.MPV_CAPABILITIES_PATH', cache_path)
+    mock_run = mocker.patch('open_in_mpv.capabilities.sp.run', side_effect=_run)
+    capabilities.main([str(mpv)])
+    assert capabilities.load(mpv, cache_path=cache_path) is not None
+    mock_run.reset_mock()
+    capabilities.main([str(mpv)])
+    mock_run.assert_not_called()
+    mpv.write_bytes(b'not mpv')
+    mock_run.side_effect = OSError
+    capabilities.main([str(mpv)])
+    assert capabilities.load(mpv, cache_path=cache_path) is None
+    assert capabilities.command(mpv)[-2:] == ['open_in_mpv.capabilities', str(mpv)]
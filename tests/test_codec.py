@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import io
+import struct
+
+from open_in_mpv import codec
+import pytest
+
+if TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
+
+def test_round_trip() -> None:
+    frame = codec.encode({'url': 'https://example.com'})
+    assert struct.unpack('@i', frame[:4])[0] == len(frame) - 4
+    assert codec.read(io.BytesIO(frame)) == {'url': 'https://example.com'}
+
+
+def test_read_short_reads() -> None:
+    class Trickle(io.BytesIO):
+        def __init__(self, data: bytes) -> None:
+            super().__init__()
+            self.data = data
+
+        def read(self, size: int | None = -1, /) -> bytes:
+            n = min(size or 0, 3)
+            chunk, self.data = self.data[:n], self.data[n:]
+            return chunk
+
+    assert codec.read(Trickle(codec.encode({'a': [1, 2, 3]}))) == {'a': [1, 2, 3]}
+
+
+def test_read_errors() -> None:
+    with pytest.raises(EOFError):
+        codec.read(io.BytesIO(b'\x01\x00'))
+    with pytest.raises(EOFError):
+        codec.read(io.BytesIO(b'\x05\x00\x00\x00{}'))
+    with pytest.raises(codec.FrameTooLargeError):
+        codec.read(io.BytesIO(struct.pack('@i', -1)))
+    with pytest.raises(codec.FrameTooLargeError):
+        codec.read(io.BytesIO(struct.pack('@i', codec.MAX_REQUEST_SIZE + 1)))
+    with pytest.raises(codec.MalformedFrameError) as exc_info:
+        codec.read(io.BytesIO(b'\x02\x00\x00\x00{x'))
+    assert exc_info.value.code == 'malformed-frame'
+    assert isinstance(exc_info.value, ValueError)
+
+
+def test_write(mocker: MockerFixture) -> None:
+    buffer = mocker.MagicMock()
+    codec.write(buffer, {'a': 1})
+    buffer.write.assert_called_once_with(codec.encode({'a': 1}))
+    buffer.flush.assert_called_once_with()
+    mocker.patch('open_in_mpv.codec.MAX_RESPONSE_SIZE', 4)
+    buffer.reset_mock()
+    with pytest.raises(codec.FrameTooLargeError):
+        codec.write(buffer, {'a': 1})
+    buffer.write.assert_not_called()
+
+
+def test_use_fast_backend(mocker: MockerFixture) -> None:
+    mocker.patch.dict('open_in_mpv.codec._backend')
+    mocker.patch.dict('sys.modules', {'orjson': None, 'msgspec': None})
+    assert codec.use_fast_backend() == 'json'
+    orjson = mocker.MagicMock()
+    mocker.patch.dict('sys.modules', {'orjson': orjson})
+    assert codec.use_fast_backend() == 'orjson'
+    codec.dumps({})
+    orjson.dumps.assert_called_once_with({})
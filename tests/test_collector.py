@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from open_in_mpv import collector
+from open_in_mpv.collector import Collector
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def test_collector(mocker: MockerFixture) -> None:
+    mock_write = mocker.patch('open_in_mpv.collector.telemetry.write')
+    col = Collector()
+    col.property_change('frame-drop-count', 5)
+    col.event({'event': 'end-file'})
+    mock_write.assert_not_called()
+    col.file_loaded({
+        'path': 'https://cdn.example/a.m3u8',
+        'script-opts': {
+            'open_in_mpv-page': 'https://youtu.be/a'
+        },
+        'video-format': 'vp9',
+        'height': 1080,
+        'hwdec-current': 'no'
+    })
+    col.property_change('frame-drop-count', 5)
+    col.file_loaded({'path': '/home/user/a.mkv'})
+    first = mock_write.call_args.args[0]
+    assert (first['site'], first['format'], first['hwdec'], first['frame_drops']) == (
+        'www.youtube.com', 'vp9 1080p', '', 5)
+    col.event({'event': 'end-file'})
+    second = mock_write.call_args.args[0]
+    assert (second['site'], second['format'], second['frame_drops']) == ('local', '', 0)
+    col.close()
+    assert mock_write.call_count == 2
+
+
+def test_collector_tune(mocker: MockerFixture) -> None:
+    mock_write = mocker.patch('open_in_mpv.collector.telemetry.write')
+    mock_observe = mocker.patch('open_in_mpv.collector.tuning.observe')
+    mock_formats_observe = mocker.patch('open_in_mpv.collector.formats.observe')
+    col = Collector(write=False, tune=True)
+    col.file_loaded({'path': 'https://youtu.be/a'})
+    col.event({'event': 'end-file'})
+    mock_write.assert_not_called()
+    mock_formats_observe.assert_not_called()
+    assert mock_observe.call_args.args[0]['site'] == 'www.youtube.com'
+    col = Collector(write=False, formats=True)
+    col.file_loaded({'path': 'https://youtu.be/a'})
+    col.close()
+    assert mock_observe.call_count == 1
+    assert mock_formats_observe.call_args.args[0]['site'] == 'www.youtube.com'
+
+
+def test_main(mocker: MockerFixture, tmp_path: Path) -> None:
+    mock_run = mocker.patch('open_in_mpv.collector.companion.run')
+    socket_path = str(tmp_path / 'mpv.sock')
+    collector.main([socket_path])
+    factory = mock_run.call_args.args[2]
+    assert mock_run.call_args.args[:2] == ('collector', socket_path)
+    assert (factory().write, factory().tune) == (True, False)
+    collector.main([socket_path, '--no-telemetry', '--tune', '--formats'])
+    factory = mock_run.call_args.args[2]
+    assert (factory().write, factory().tune, factory().formats) == (False, True, True)
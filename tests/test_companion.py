@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import asyncio
+import json
+import os
+
+from open_in_mpv import companion, instance
+from open_in_mpv.urls import PAGE_OPTION
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+PAGE = 'https://www.youtube.com/watch?v=a'
+PROPERTIES: dict[str, Any] = {
+    'path': 'https://cdn.example/a.m3u8',
+    'script-opts': {
+        PAGE_OPTION: PAGE
+    }
+}
+
+
+class _Companion(companion.Companion):
+    properties = ('time-pos',)
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, Any]] = []
+
+    def property_change(self, name: str, value: Any) -> None:
+        self.calls.append((name, value))
+
+    def file_loaded(self, properties: Mapping[str, Any]) -> None:
+        self.calls.append(('file_loaded', dict(properties)))
+
+    def event(self, event: Mapping[str, Any]) -> None:
+        self.calls.append(('event', event['event']))
+
+    def close(self) -> None:
+        self.calls.append(('close', None))
+
+
+async def _fake_mpv(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    def send(message: dict[str, Any]) -> None:
+        writer.write(json.dumps(message).encode() + b'\n')
+
+    async def reply(count: int, *, loaded: bool) -> None:
+        for _ in range(count):
+            message = json.loads(await reader.readline())
+            name, *args = message['command']
+            if name != 'get_property':
+                send({'request_id': message['request_id']})
+            elif loaded:
+                send({'data': PROPERTIES[args[0]], 'request_id': message['request_id']})
+            else:
+                send({'error': 'property unavailable', 'request_id': message['request_id']})
+        await writer.drain()
+
+    # One observe_property command, then the check for a file loaded before connecting.
+    await reply(3, loaded=False)
+    send({'event': 'start-file'})
+    send({'event': 'file-loaded'})
+    await writer.drain()
+    await reply(2, loaded=True)
+    await asyncio.sleep(0.01)
+    send({'event': 'property-change', 'id': 1, 'name': 'time-pos', 'data': 1.5})
+    send({'event': 'end-file', 'reason': 'stop'})
+    await writer.drain()
+    await asyncio.sleep(0.01)
+    writer.close()
+
+
+def test_follow(tmp_path: Path) -> None:
+    path = tmp_path / 'mpv.sock'
+    follower = _Companion()
+
+    async def run() -> None:
+        task = asyncio.create_task(companion.follow(path, follower, timeout=2))
+        await asyncio.sleep(0.05)
+        async with await asyncio.start_unix_server(_fake_mpv, path=str(path)):
+            await asyncio.wait_for(task, 2)
+
+    asyncio.run(run())
+    assert follower.calls == [('event', 'start-file'), ('file_loaded', PROPERTIES),
+                              ('time-pos', 1.5), ('event', 'end-file')]
+
+
+def test_follow_unreachable(tmp_path: Path) -> None:
+    follower = _Companion()
+    asyncio.run(companion.follow(tmp_path / 'mpv.sock', follower, timeout=0.05))
+    assert not follower.calls
+
+
+def test_page_url() -> None:
+    assert companion.page_url(PROPERTIES) == PAGE
+    assert companion.page_url({'path': 'https://youtu.be/b', 'script-opts': {}}) == (
+        'https://www.youtube.com/watch?v=b')
+    assert companion.page_url({'path': '/home/user/a.mkv'}) is None
+    assert companion.page_url({}) is None
+
+
+def test_run(mocker: MockerFixture, tmp_path: Path) -> None:
+    address = str(tmp_path / 'mpv.sock')
+    mock_follow = mocker.patch('open_in_mpv.companion.follow')
+    follower = _Companion()
+    companion.run('test', address, lambda: follower)
+    assert mock_follow.call_args.args == (address, follower)
+    assert follower.calls == [('close', None)]
+    mock_follow.reset_mock()
+    lock = instance.companion_lock(address, 'test')
+    assert lock is not None
+    companion.run('test', address, _Companion)
+    os.close(lock)
+    mock_follow.assert_not_called()
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import asyncio
+import io
+import json
+import os
+
+from open_in_mpv import instance
+from open_in_mpv.enqueue import START_TIMEOUT, enqueue, main
+from open_in_mpv.ipc import MpvClient
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from click.testing import CliRunner
+    from pytest_mock import MockerFixture
+
+
+def _run_enqueue(tmp_path: Path, text: str, **kwargs: Any) -> tuple[tuple[int, int], list[Any]]:
+    path = tmp_path / 'mpv.sock'
+    received: list[Any] = []
+
+    async def fake_mpv(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while line := await reader.readline():
+            message = json.loads(line)
+            received.append(message['command'])
+            error = 'success' if message['command'][1].startswith('https://') else 'bad'
+            reply = {'error': error, 'request_id': message['request_id']}
+            writer.write(json.dumps(reply).encode() + b'\n')
+            await writer.drain()
+        writer.close()
+
+    async def run() -> tuple[int, int]:
+        server = await asyncio.start_unix_server(fake_mpv, path=str(path))
+        async with server, MpvClient(path, timeout=1) as client:
+            return await enqueue(io.StringIO(text), client, **kwargs)
+
+    return asyncio.run(run()), received
+
+
+def test_enqueue(tmp_path: Path) -> None:
+    result, received = _run_enqueue(tmp_path,
+                                    'https://a\n\n# comment\nhttps://b\nhttps://c\n',
+                                    batch_size=2,
+                                    mode='replace')
+    assert result == (3, 0)
+    assert received == [['loadfile', 'https://a', 'replace'],
+                        ['loadfile', 'https://b', 'append-play'],
+                        ['loadfile', 'https://c', 'append-play']]
+
+
+def test_enqueue_rejected(tmp_path: Path) -> None:
+    result, _ = _run_enqueue(tmp_path, 'https://a\nnope\n')
+    assert result == (2, 1)
+
+
+def test_enqueue_empty(tmp_path: Path) -> None:
+    assert _run_enqueue(tmp_path, '') == ((0, 0), [])
+
+
+def test_main_no_instance(runner: CliRunner, mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.enqueue.setup_logging')
+    mocker.patch('open_in_mpv.enqueue.MPV_SOCKET', tmp_path / 'mpv.sock')
+    result = runner.invoke(main, ['--no-start'], input='https://a\n')
+    assert result.exit_code != 0
+    assert 'Could not connect' in result.output
+
+
+def test_main_starts_instance(runner: CliRunner, mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.enqueue.setup_logging')
+    mocker.patch('open_in_mpv.enqueue.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.enqueue.START_TIMEOUT', 0.1)
+    mock_start = mocker.patch('open_in_mpv.enqueue._start_instance', return_value=True)
+    result = runner.invoke(main, ['-d'], input='https://a\n')
+    assert result.exit_code != 0
+    mock_start.assert_called_once_with(debug=True)
+
+
+def _start(mocker: MockerFixture, tmp_path: Path, runner: CliRunner) -> tuple[Any, Any]:
+    mocker.patch('open_in_mpv.enqueue.setup_logging')
+    mocker.patch('open_in_mpv.enqueue.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.enqueue.instance.is_running', return_value=False)
+    mocker.patch('open_in_mpv.main.mpv_command')
+    mocker.patch('open_in_mpv.main.environment')
+    mock_launch = mocker.patch('open_in_mpv.main.launch', return_value=os.getpid())
+    mock_connect = mocker.patch('open_in_mpv.enqueue._connect')
+    mocker.patch('open_in_mpv.enqueue.MpvClient.close')
+    mocker.patch('open_in_mpv.enqueue.enqueue', return_value=(1, 0))
+    assert runner.invoke(main, [], input='https://a\n').exit_code == 0
+    return mock_launch, mock_connect
+
+
+def test_main_starts_instance_under_lock(runner: CliRunner, mocker: MockerFixture,
+                                         tmp_path: Path) -> None:
+    mock_launch, mock_connect = _start(mocker, tmp_path, runner)
+    mock_launch.assert_called_once()
+    assert mock_connect.call_args.args[1] == START_TIMEOUT
+    assert instance.read_owner(tmp_path / 'mpv.sock') is not None
+    with instance.LaunchLock(tmp_path / 'mpv.sock') as lock:
+        assert lock.starting()
+
+
+def test_main_waits_for_starting_instance(runner: CliRunner, mocker: MockerFixture,
+                                          tmp_path: Path) -> None:
+    with instance.LaunchLock(tmp_path / 'mpv.sock') as lock:
+        lock.mark(os.getpid())
+    mock_launch, mock_connect = _start(mocker, tmp_path, runner)
+    # A request that started an instance moments ago holds back a second start.
+    mock_launch.assert_not_called()
+    assert mock_connect.call_args.args[1] == START_TIMEOUT
+
+
+def test_main(runner: CliRunner, mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.enqueue.setup_logging')
+    mocker.patch('open_in_mpv.enqueue.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.enqueue.instance.is_running', return_value=True)
+    mocker.patch('open_in_mpv.enqueue._connect')
+    mocker.patch('open_in_mpv.enqueue.MpvClient.close')
+    mock_enqueue = mocker.patch('open_in_mpv.enqueue.enqueue', return_value=(2, 0))
+    result = runner.invoke(main, ['-r'], input='https://a\nhttps://b\n')
+    assert result.exit_code == 0
+    assert mock_enqueue.call_args.kwargs['mode'] == 'replace'
+    mock_enqueue.return_value = (2, 1)
+    result = runner.invoke(main, [], input='https://a\nhttps://b\n')
+    assert result.exit_code == 1
+    assert 'rejected 1 of 2' in result.output
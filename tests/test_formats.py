@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from open_in_mpv import formats
+from open_in_mpv.formats import Record
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_observe_lookup(tmp_path: Path) -> None:
+    path = tmp_path / 'cache' / 'formats.json'
+    record = {
+        'machine': 'box',
+        'site': 'a.example',
+        'format': 'av1 1080p',
+        'seconds': 60.0,
+        'frame_drops': 5,
+        'decoder_frame_drops': 20
+    }
+    formats.observe({**record, 'site': 'local'}, path=path)
+    formats.observe({**record, 'format': ''}, path=path)
+    formats.observe({**record, 'seconds': 5.0}, path=path)
+    assert not path.exists()
+    formats.observe(record, path=path)
+    formats.observe({**record, 'decoder_frame_drops': None}, path=path)
+    formats.observe({**record, 'format': 'vp9 720p'}, path=path)
+    assert formats.lookup('a.example', machine='box', path=path) == {
+        'av1 1080p': Record(2, 0.7),
+        'vp9 720p': Record(1, 1.0)
+    }
+    assert formats.lookup('a.example', machine='other', path=path) == {}
+
+
+def test_lookup_invalid(tmp_path: Path) -> None:
+    path = tmp_path / 'formats.json'
+    path.write_text('[', encoding='utf-8')
+    assert formats.lookup('a', machine='m', path=path) == {}
+    path.write_text('{"m a": [], "m b": {"h264 720p": [2, 1.0]}, "m c": {"vp9 720p": "21"}}',
+                    encoding='utf-8')
+    assert formats.lookup('a', machine='m', path=path) == {}
+    assert formats.lookup('c', machine='m', path=path) == {}
+    assert formats.lookup('b', machine='m', path=path) == {'h264 720p': Record(2, 1.0)}
+
+
+def test_screen_height(tmp_path: Path) -> None:
+    connectors = (('card0-HDMI-A-1', 'connected', '3840x2160\n1920x1080\n'),
+                  ('card0-DP-1', 'disconnected', ''), ('card1-DP-2', 'connected', '1080x1920\n'),
+                  ('card1-DP-3', 'connected', ''))
+    for name, status, modes in connectors:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'status').write_text(f'{status}\n', encoding='utf-8')
+        (tmp_path / name / 'modes').write_text(modes, encoding='utf-8')
+    assert formats.screen_height(tmp_path) == 2160
+    (tmp_path / 'card0-HDMI-A-1' / 'status').write_text('disconnected\n', encoding='utf-8')
+    assert formats.screen_height(tmp_path) == 607
+    assert formats.screen_height(tmp_path / 'missing') is None
+
+
+def test_selector() -> None:
+    assert formats.selector({'av1 1080p': Record(1, 1.0), 'vp9 720p': Record(5, 0.2)}) is None
+    assert formats.selector({}, 1080) == (
+        'bestvideo[height<=?1080]+bestaudio/best[height<=?1080]/best')
+    assert formats.selector({'av1 2160p': Record(2, 0.7)}, 1440) == (
+        'bestvideo[height<=?1440][vcodec!^=av01]+bestaudio/bestvideo[height<=?1440]+bestaudio/'
+        'best[height<=?1440]/best')
+    assert formats.selector({'hevc 1080p': Record(3, 0.5), 'xyz 720p': Record(2, 1.0)}) == (
+        'bestvideo[vcodec!^=hev1][vcodec!^=hvc1]+bestaudio/bestvideo[height<=?719]+bestaudio/best')
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import sqlite3
+import time
+
+from open_in_mpv import history
+from open_in_mpv.history import Entry, Update, Writer
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def test_resume_position() -> None:
+    assert Entry('u', 120.5, 600.0, None, 1, 0).resume_position() == pytest.approx(120.5)
+    assert Entry('u', 120.5, None, None, 1, 0).resume_position() == pytest.approx(120.5)
+    assert Entry('u', 5.0, 600.0, None, 1, 0).resume_position() is None
+    assert Entry('u', 590.0, 600.0, None, 1, 0).resume_position() is None
+    assert Entry('u', None, None, None, 1, 0).resume_position() is None
+
+
+def test_merge() -> None:
+    merged = Update('u', plays=1, updated=1).merge(Update('u', position=5.0, updated=2)).merge(
+        Update('u', start_ms=10.0, plays=1, updated=3))
+    assert merged == Update('u', 5.0, None, 10.0, 2, 3)
+
+
+def test_write_lookup(tmp_path: Path) -> None:
+    path = tmp_path / 'data' / 'history.sqlite3'
+    assert history.lookup('https://youtu.be/a', path=path) is None
+    connection = history.connect(path)
+    url = 'https://www.youtube.com/watch?v=a'
+    history.write(connection, [Update(url, plays=1, updated=1)])
+    history.write(connection, [Update(url, 100.0, 600.0, 850.0, 1, 2)])
+    history.write(connection, [Update(url, position=200.0, updated=3)])
+    connection.close()
+    assert history.lookup('https://youtu.be/a?si=x', path=path) == Entry(
+        url, 200.0, 600.0, 850.0, 2, 3)
+    assert history.lookup('https://youtu.be/b', path=path) is None
+
+
+def test_write_prune(mocker: MockerFixture, tmp_path: Path) -> None:
+    path = tmp_path / 'history.sqlite3'
+    mocker.patch('open_in_mpv.history.MAX_ENTRIES', 2)
+    connection = history.connect(path)
+    history.write(connection, [Update(f'https://a/{i}', updated=i) for i in range(4)])
+    assert [x for (x,) in connection.execute('SELECT url FROM history ORDER BY url')
+            ] == ['https://a/2', 'https://a/3']
+    history.write(connection, [Update('https://a/4', updated=4)], prune=False)
+    assert connection.execute('SELECT count(*) FROM history').fetchone() == (3,)
+    assert connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'history'").fetchall(
+        ) == [('history_updated',)]
+    connection.close()
+
+
+def _timed_lookup(path: Path, url: str) -> float:
+    start = time.perf_counter()
+    entry = history.lookup(url, path=path)
+    elapsed = time.perf_counter() - start
+    assert entry is not None
+    assert entry.url == url
+    return elapsed
+
+
+def test_lookup_large(tmp_path: Path) -> None:
+    path = tmp_path / 'history.sqlite3'
+    connection = history.connect(path)
+    history.write(connection,
+                  (Update(f'https://a/{i}', float(i), plays=1, updated=i) for i in range(200000)),
+                  prune=False)
+    plan = connection.execute(
+        'EXPLAIN QUERY PLAN SELECT * FROM history WHERE url = ?', ('https://a/1',)).fetchall()
+    connection.close()
+    assert 'USING PRIMARY KEY' in plan[0][-1]
+    best = min(_timed_lookup(path, f'https://a/{i}') for i in (0, 100000, 199999))
+    assert best < 0.05
+
+
+def test_writer_prune_interval(mocker: MockerFixture, tmp_path: Path) -> None:
+    spy_write = mocker.spy(history, 'write')
+    mock_time = mocker.patch('open_in_mpv.history.time')
+    writer = Writer(tmp_path / 'history.sqlite3', interval=0)
+    for i, now in enumerate((100.0, 200.0, 100.0 + history.PRUNE_INTERVAL)):
+        mock_time.monotonic.return_value = now
+        writer.put(Update('https://a/', plays=1, updated=now))
+        deadline = time.monotonic() + 5
+        while spy_write.call_count <= i and time.monotonic() < deadline:
+            time.sleep(0.001)
+    writer.close()
+    assert [x.kwargs['prune'] for x in spy_write.call_args_list] == [True, False, True]
+
+
+def test_lookup_invalid(tmp_path: Path) -> None:
+    path = tmp_path / 'history.sqlite3'
+    path.write_bytes(b'not a database')
+    assert history.lookup('https://a', path=path) is None
+    sqlite3.connect(path.with_name('empty.sqlite3')).close()
+    assert history.lookup('https://a', path=path.with_name('empty.sqlite3')) is None
+
+
+def test_writer(mocker: MockerFixture, tmp_path: Path) -> None:
+    path = tmp_path / 'history.sqlite3'
+    spy_write = mocker.spy(history, 'write')
+    writer = Writer(path, interval=10)
+    writer.close()
+    writer.put(Update('https://a/', plays=1, updated=1))
+    writer.put(Update('https://a/', position=50.0, updated=2))
+    writer.put(Update('https://b/', plays=1, updated=2))
+    writer.close()
+    assert spy_write.call_count == 1
+    assert history.lookup('https://a', path=path) == Entry('https://a/', 50.0, None, None, 1, 2)
+    writer = Writer(path, interval=0)
+    writer.put(Update('https://a/', position=60.0, updated=3))
+    writer.close()
+    entry = history.lookup('https://a', path=path)
+    assert entry is not None
+    assert entry.position == pytest.approx(60.0)
+
+
+def test_writer_error(mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.history.connect', side_effect=sqlite3.OperationalError)
+    mock_log = mocker.patch('open_in_mpv.history.log')
+    writer = Writer(tmp_path / 'history.sqlite3', interval=0)
+    writer.put(Update('https://a', plays=1))
+    writer.close()
+    mock_log.exception.assert_called_once()
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from open_in_mpv import inotify
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def test_watch(tmp_path: Path) -> None:
+    with inotify.Watch(tmp_path) as watch:
+        assert watch.read(0) == []
+        (tmp_path / 'a.sock').touch()
+        (tmp_path / 'b.tmp').touch()
+        (tmp_path / 'b.tmp').rename(tmp_path / 'b.sock')
+        assert watch.read(1) == ['a.sock', 'b.tmp', 'b.sock']
+        assert watch.read(0) == []
+
+
+def test_watch_missing_directory(tmp_path: Path) -> None:
+    with pytest.raises(OSError, match='inotify_add_watch'), inotify.Watch(tmp_path / 'missing'):
+        pass
+
+
+def test_watch_unavailable(tmp_path: Path, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.inotify._libc', side_effect=OSError)
+    with pytest.raises(OSError, match='not available'), inotify.Watch(tmp_path):
+        pass
+    mocker.patch('open_in_mpv.inotify._libc').return_value.inotify_init1.return_value = -1
+    with pytest.raises(OSError, match='inotify_init1'), inotify.Watch(tmp_path):
+        pass
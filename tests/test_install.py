@@ -109,3 +109,11 @@ def test_install_user_linux_2(runner: CliRunner, mocker: MockerFixture) -> None:
     mock_path.return_value.exists.side_effect = [False, True]
     result = runner.invoke(main, ['--user'])
     assert result.exit_code == 0
+
+
+def test_constants_user_hosts_dirs() -> None:
+    import open_in_mpv.constants
+    assert all(x.endswith(('NativeMessagingHosts', 'native-messaging-hosts'))
+               for x in open_in_mpv.constants.USER_HOSTS_DIRS)
+    with pytest.raises(AttributeError):
+        _ = open_in_mpv.constants.DOES_NOT_EXIST
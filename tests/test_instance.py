@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import fcntl
+import os
+import socket
+import sys
+import threading
+import time
+
+from open_in_mpv import instance
+import pytest
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def _serve(server: socket.socket, reply: bytes) -> None:
+    conn, _ = server.accept()
+    with conn:
+        conn.makefile('rb').readline()
+        conn.sendall(reply)
+
+
+@pytest.fixture
+def mpv_server(tmp_path: Path) -> Iterator[Path]:
+    path = tmp_path / 'mpv.sock'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(path))
+        server.listen(1)
+        thread = threading.Thread(
+            target=_serve,
+            args=(server, b'{"event":"idle"}\n{"data":123,"error":"success","request_id":1}\n'),
+            daemon=True)
+        thread.start()
+        yield path
+        thread.join(1)
+
+
+def test_abstract_address(tmp_path: Path) -> None:
+    address = instance.abstract_address(tmp_path / 'open-in-mpv.sock')
+    assert address == f'@open-in-mpv-{os.getuid()}'
+    assert instance.connect_address(address) == f'\0open-in-mpv-{os.getuid()}'
+    assert instance.connect_address(tmp_path / 'a.sock') == str(tmp_path / 'a.sock')
+
+
+def test_owner_round_trip(tmp_path: Path) -> None:
+    path = tmp_path / 'mpv.sock'
+    assert instance.read_owner(path) is None
+    assert instance.owner_alive(path) is None
+    instance.write_owner(path, os.getpid())
+    assert instance.read_owner(path) == (os.getpid(), instance.process_start_time(os.getpid()))
+    assert instance.owner_alive(path) is True
+    instance.remove_owner(path)
+    assert instance.read_owner(path) is None
+    instance.remove_owner(path)
+
+
+def test_owner_alive_reused_pid(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'mpv.sock'
+    mocker.patch('open_in_mpv.instance.process_start_time', side_effect=[100, 200])
+    instance.write_owner(path, 123)
+    assert instance.owner_alive(path) is False
+
+
+def test_owner_alive_no_start_time(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'mpv.sock'
+    mocker.patch('open_in_mpv.instance.process_start_time', return_value=None)
+    mock_kill = mocker.patch('open_in_mpv.instance.os.kill')
+    instance.write_owner(path, 123)
+    assert instance.owner_alive(path) is True
+    mock_kill.side_effect = ProcessLookupError
+    assert instance.owner_alive(path) is False
+    mock_kill.side_effect = PermissionError
+    assert instance.owner_alive(path) is True
+
+
+def test_process_start_time_missing(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.instance.IS_LINUX', new=False)
+    assert instance.process_start_time(os.getpid()) is None
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='Needs /proc.')
+def test_process_start_time_zombie() -> None:
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    try:
+        deadline = time.monotonic() + 5
+        while instance.process_start_time(pid) is not None and time.monotonic() < deadline:
+            time.sleep(0.005)
+        assert instance.process_start_time(pid) is None
+    finally:
+        os.waitpid(pid, 0)
+
+
+def test_probe(mpv_server: Path) -> None:
+    assert instance.probe(mpv_server, timeout=1) == 123
+
+
+def test_probe_no_server(tmp_path: Path) -> None:
+    assert instance.probe(tmp_path / 'mpv.sock') is None
+
+
+def test_is_running(mpv_server: Path) -> None:
+    assert instance.is_running(mpv_server) is True
+    assert instance.read_owner(mpv_server) == (123, instance.process_start_time(123))
+
+
+def test_is_running_dead_owner(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'mpv.sock'
+    path.touch()
+    instance.write_owner(path, 123)
+    mocker.patch('open_in_mpv.instance.owner_alive', return_value=False)
+    mock_probe = mocker.patch('open_in_mpv.instance.probe')
+    assert instance.is_running(path) is False
+    assert not path.exists()
+    assert not instance.owner_path(path).exists()
+    mock_probe.assert_not_called()
+
+
+def test_is_running_hung(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'mpv.sock'
+    path.touch()
+    instance.write_owner(path, 123)
+    mocker.patch('open_in_mpv.instance.owner_alive', return_value=True)
+    mocker.patch('open_in_mpv.instance.probe', return_value=None)
+    assert instance.is_running(path) is False
+    assert path.exists()
+    assert instance.owner_path(path).exists()
+
+
+def test_is_running_hung_unknown_owner(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'mpv.sock'
+    path.touch()
+    mocker.patch('open_in_mpv.instance.probe', return_value=None)
+    assert instance.is_running(path) is False
+    assert path.exists()
+
+
+def test_is_running_abstract(tmp_path: Path, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.instance.IS_LINUX', new=True)
+    mock_probe = mocker.patch('open_in_mpv.instance.probe', return_value=1)
+    assert instance.is_running(tmp_path / 'mpv.sock', abstract=True) is True
+    assert mock_probe.call_args.args[0].startswith('@')
+
+
+def _listen_later(path: Path, delay: float) -> Iterator[socket.socket]:
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def listen() -> None:
+        time.sleep(delay)
+        server.bind(str(path))
+        time.sleep(delay)
+        server.listen(1)
+
+    thread = threading.Thread(target=listen)
+    thread.start()
+    try:
+        yield server
+    finally:
+        thread.join()
+        server.close()
+
+
+def test_connectable(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'mpv.sock'
+    assert not instance.connectable(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(path))
+        assert not instance.connectable(path)
+        server.listen(1)
+        assert instance.connectable(path)
+        mocker.patch('open_in_mpv.instance.socket', spec=())
+        assert instance.connectable(path)
+        assert not instance.connectable('@abstract')
+
+
+def test_wait(tmp_path: Path) -> None:
+    path = tmp_path / 'mpv.sock'
+    assert instance.wait(path, 0.01) is False
+    for _ in _listen_later(path, 0.05):
+        start = time.monotonic()
+        assert instance.wait(path) is True
+        assert time.monotonic() - start < 1
+
+
+def test_wait_polling(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'mpv.sock'
+    mocker.patch('open_in_mpv.instance.IS_LINUX', new=False)
+    assert instance.wait(path, 0.01) is False
+    for _ in _listen_later(path, 0.05):
+        assert instance.wait(path) is True
+    mocker.patch('open_in_mpv.instance.IS_LINUX', new=True)
+    mock_connectable = mocker.patch('open_in_mpv.instance.connectable',
+                                    side_effect=[False, True])
+    assert instance.wait(path, abstract=True) is True
+    assert mock_connectable.call_args.args[0] == instance.abstract_address(path)
+
+
+def test_wait_no_directory(tmp_path: Path) -> None:
+    assert instance.wait(tmp_path / 'missing' / 'mpv.sock', 0.01) is False
+
+
+def test_launch_lock(tmp_path: Path) -> None:
+    path = tmp_path / 'run' / 'mpv.sock'
+    with instance.LaunchLock(path) as lock:
+        assert not lock.starting()
+        lock.mark(os.getpid())
+        start = time.monotonic()
+        with instance.LaunchLock(path, timeout=0.02):
+            # Timed out, so it continues without the lock.
+            assert time.monotonic() - start >= 0.02
+    with instance.LaunchLock(path) as lock:
+        assert lock.starting()
+        lock.mark(2**22 + 1)
+        assert not lock.starting()
+        lock.mark()
+        assert lock.starting()
+        lock.timeout = 0
+        assert not lock.starting()
+    assert lock.path == path.with_name('mpv.sock.launch')
+
+
+def test_launch_lock_backoff(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'mpv.sock'
+    clock = [0.0]
+
+    def advance(seconds: float) -> None:
+        clock[0] += seconds
+
+    mocker.patch('open_in_mpv.instance.time.monotonic', side_effect=lambda: clock[0])
+    mock_sleep = mocker.patch('open_in_mpv.instance.time.sleep', side_effect=advance)
+    with instance.LaunchLock(path), instance.LaunchLock(path, timeout=0.2):
+        pass
+    delays = [x.args[0] for x in mock_sleep.call_args_list]
+    assert delays == pytest.approx([0.005, 0.01, 0.02, 0.04, 0.05, 0.05, 0.025])
+
+
+def test_launch_lock_forked(tmp_path: Path) -> None:
+    path = tmp_path / 'mpv.sock'
+    with instance.LaunchLock(path) as lock:
+        fd = os.dup(lock._fd)  # type: ignore[arg-type]  # ruff:ignore[private-member-access]
+    try:
+        # A descriptor left open (as in a forked child) does not keep the lock.
+        with instance.LaunchLock(path, timeout=0) as lock:
+            assert lock._fd is not None  # ruff:ignore[private-member-access]
+            lock.mark()
+    finally:
+        os.close(fd)
+
+
+def test_launch_lock_exit_in_child(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'mpv.sock'
+    with instance.LaunchLock(path) as lock:
+        fd = os.dup(lock._fd)  # type: ignore[arg-type]  # ruff:ignore[private-member-access]
+        mocker.patch('open_in_mpv.instance.os.getpid', return_value=os.getpid() + 1)
+        # A forked child leaving the context does not release the lock of its parent.
+        lock.__exit__(None, None, None)
+    mocker.stopall()
+    try:
+        with instance.LaunchLock(path, timeout=0) as lock:
+            lock_fd = lock._fd  # ruff:ignore[private-member-access]
+            assert lock_fd is not None
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    finally:
+        os.close(fd)
+
+
+def test_launch_lock_clear(tmp_path: Path) -> None:
+    with instance.LaunchLock(tmp_path / 'mpv.sock') as lock:
+        lock.mark()
+        assert lock.starting()
+        lock.clear()
+        assert not lock.starting()
+
+
+def test_launch_lock_invalid(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'mpv.sock'
+    path.with_name('mpv.sock.launch').write_text('[]', encoding='utf-8')
+    with instance.LaunchLock(path) as lock:
+        assert not lock.starting()
+    mocker.patch('open_in_mpv.instance.os.open', side_effect=PermissionError)
+    with instance.LaunchLock(path) as lock:
+        assert not lock.starting()
+        lock.mark()
+    mocker.patch('open_in_mpv.instance.IS_WIN', new=True)
+    with instance.LaunchLock(path) as lock:
+        assert not lock.starting()
+
+
+def test_companion_lock_path(mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.instance.MPV_SOCKET', tmp_path / 'open-in-mpv.sock')
+    assert instance.companion_lock_path(tmp_path / 'a.sock', 'x') == tmp_path / 'a.sock.x'
+    assert instance.companion_lock_path('@open-in-mpv-0', 'x') == tmp_path / 'open-in-mpv-0.x'
+
+
+def test_companion_lock(mocker: MockerFixture, tmp_path: Path) -> None:
+    address = tmp_path / 'run' / 'mpv.sock'
+    assert not instance.companion_running(address, 'x')
+    fd = instance.companion_lock(address, 'x')
+    assert fd is not None
+    assert instance.companion_lock(address, 'x') is None
+    assert instance.companion_running(address, 'x')
+    assert not instance.companion_running(address, 'y')
+    os.close(fd)
+    assert not instance.companion_running(address, 'x')
+    mocker.patch('open_in_mpv.instance.os.open', side_effect=PermissionError)
+    assert not instance.companion_running(address, 'x')
+
+
+def test_companion_command() -> None:
+    assert instance.companion_command('recorder', '@a') == [
+        sys.executable, '-m', 'open_in_mpv.recorder', '@a'
+    ]
+    assert instance.companion_command('collector', '@a', '--tune')[-2:] == ['@a', '--tune']
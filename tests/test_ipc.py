@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import asyncio
+import json
+
+from open_in_mpv.ipc import MpvClient, MpvCommandError
+import pytest
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+async def _fake_mpv(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    def send(data: dict[str, Any]) -> None:
+        writer.write(json.dumps(data).encode() + b'\n')
+
+    while line := await reader.readline():
+        message = json.loads(line)
+        command = message['command']
+        request_id = message.get('request_id', 0)
+        if isinstance(command, dict):
+            # Echo named-argument commands so tests can check what was sent.
+            send({'data': command, 'error': 'success', 'request_id': request_id})
+            continue
+        if command == ['get_property', 'slow']:
+            continue
+        if command == ['quit']:
+            break
+        if command[0] == 'get_property' and command[1] == 'pid':
+            send({'data': 123, 'error': 'success', 'request_id': request_id})
+        elif command == ['get_property', 'playlist']:
+            send({
+                'data': [{
+                    'filename': f'https://example.com/{i:06d}'
+                } for i in range(5000)],
+                'error': 'success',
+                'request_id': request_id
+            })
+        elif command[0] == 'observe_property':
+            send({'error': 'success', 'request_id': request_id})
+            send({'data': 1.5, 'event': 'property-change', 'id': command[1], 'name': command[2]})
+        elif command[0] == 'loadfile':
+            send({'error': 'success', 'request_id': request_id})
+            send({'event': 'file-loaded'})
+        else:
+            send({'error': 'property unavailable', 'request_id': request_id})
+        writer.write(b'not json\n')
+        send({'data': None, 'error': 'success', 'request_id': 9999})
+        await writer.drain()
+    writer.close()
+
+
+def _run(tmp_path: Path, func: Callable[[MpvClient], Awaitable[None]]) -> None:
+    path = tmp_path / 'mpv.sock'
+
+    async def main() -> None:
+        server = await asyncio.start_unix_server(_fake_mpv, path=str(path))
+        async with server, MpvClient(path, timeout=0.5) as client:
+            await func(client)
+
+    asyncio.run(main())
+
+
+def test_command(tmp_path: Path) -> None:
+    async def check(client: MpvClient) -> None:
+        assert client.connected
+        assert await client.get_property('pid') == 123
+        with pytest.raises(MpvCommandError, match='property unavailable'):
+            await client.get_property('nope')
+        with pytest.raises(MpvCommandError):
+            await client.set_property('volume', 50)
+
+    _run(tmp_path, check)
+
+
+def test_commands_pipelined(tmp_path: Path) -> None:
+    async def check(client: MpvClient) -> None:
+        results = await client.commands(
+            (('get_property', 'pid'), ('get_property', 'nope'), ('get_property', 'pid')),
+            return_exceptions=True)
+        assert results[0] == 123
+        assert isinstance(results[1], MpvCommandError)
+        assert results[2] == 123
+
+    _run(tmp_path, check)
+
+
+def test_commands_named_arguments(tmp_path: Path) -> None:
+    async def check(client: MpvClient) -> None:
+        command = {'name': 'loadfile', 'url': 'https://a', 'options': {'start': '10'}}
+        assert await client.commands((command, ('get_property', 'pid'))) == [command, 123]
+
+    _run(tmp_path, check)
+
+
+def test_timeout(tmp_path: Path) -> None:
+    async def check(client: MpvClient) -> None:
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get_property('slow', timeout=0.05)
+        assert await client.get_property('pid') == 123
+
+    _run(tmp_path, check)
+
+
+def test_zero_timeout(tmp_path: Path) -> None:
+    async def check(client: MpvClient) -> None:
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get_property('pid', timeout=0)
+
+    _run(tmp_path, check)
+
+
+def test_long_reply(tmp_path: Path) -> None:
+    async def check(client: MpvClient) -> None:
+        # Longer than the default limit of asyncio streams.
+        assert len(await client.get_property('playlist')) == 5000
+        assert await client.get_property('pid') == 123
+
+    _run(tmp_path, check)
+
+
+def test_reply_over_limit(tmp_path: Path, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.ipc.READ_LIMIT', 1024)
+    mock_log = mocker.patch('open_in_mpv.ipc.log')
+
+    async def check(client: MpvClient) -> None:
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get_property('playlist', timeout=0.1)
+        assert await client.get_property('pid') == 123
+
+    _run(tmp_path, check)
+    mock_log.warning.assert_any_call('Ignoring a line from mpv longer than %d bytes.', 1024)
+
+
+def test_events_and_properties(tmp_path: Path) -> None:
+    async def check(client: MpvClient) -> None:
+        changes: list[tuple[str, Any]] = []
+        events: list[dict[str, Any]] = []
+        client.add_event_handler(None, events.append)
+        waiter = asyncio.create_task(client.wait_for_event('file-loaded', timeout=1))
+        await asyncio.sleep(0)
+        await client.command('loadfile', 'https://example.com')
+        assert (await waiter)['event'] == 'file-loaded'
+        observe_id = await client.observe_property('cache-speed',
+                                                   lambda *args: changes.append(args))
+        await client.get_property('pid')
+        assert changes == [('cache-speed', 1.5)]
+        assert [x['event'] for x in events] == ['file-loaded', 'property-change']
+        client.remove_event_handler(None, events.append)
+        client.remove_event_handler('not-added', events.append)
+        with pytest.raises(MpvCommandError):
+            await client.unobserve_property(observe_id)
+
+    _run(tmp_path, check)
+
+
+def test_connection_closed(tmp_path: Path) -> None:
+    async def check(client: MpvClient) -> None:
+        pending = asyncio.create_task(client.get_property('slow', timeout=1))
+        await asyncio.sleep(0)
+        await client.commands((('quit',),), return_exceptions=True)
+        with pytest.raises(ConnectionError):
+            await pending
+        await client.wait_closed()
+        assert not client.connected
+        with pytest.raises(ConnectionError):
+            await client.get_property('pid')
+
+    _run(tmp_path, check)
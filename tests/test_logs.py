@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import io
+import logging
+import threading
+
+from open_in_mpv import logs
+
+if TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
+
+class ListHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+        self.threads: set[str] = set()
+        self.closed = False
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+        self.threads.add(threading.current_thread().name)
+
+    def close(self) -> None:
+        self.closed = True
+        super().close()
+
+
+def _logger(handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f'test_logs.{id(handler)}')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    return logger
+
+
+def test_background_handler() -> None:
+    target = ListHandler()
+    target.setLevel(logging.INFO)
+    calls: list[str] = []
+
+    def factory() -> list[logging.Handler]:
+        calls.append(threading.current_thread().name)
+        return [target]
+
+    handler = logs.BackgroundHandler(factory)
+    assert not calls
+    logger = _logger(handler)
+    args = ['a']
+    logger.info('Value: %s', args)
+    args.append('b')
+    logger.debug('Not written.')
+    try:
+        raise ValueError('bad')  # ruff:ignore[raise-within-try,raw-string-in-exception]
+    except ValueError:
+        logger.exception('Failed.')
+    handler.close()
+    assert calls == ['open-in-mpv-log']
+    assert target.threads == {'open-in-mpv-log'}
+    assert [x.getMessage() for x in target.records] == ["Value: ['a']", 'Failed.']
+    assert 'ValueError: bad' in logging.Formatter().format(target.records[1])
+    assert target.closed
+
+
+def test_background_handler_factory_fails(mocker: MockerFixture) -> None:
+    mock_last_resort = mocker.patch('open_in_mpv.logs.logging.lastResort')
+    mock_last_resort.level = logging.WARNING
+    handler = logs.BackgroundHandler(mocker.Mock(side_effect=OSError))
+    logger = _logger(handler)
+    logger.info('Dropped.')
+    logger.warning('Written.')
+    handler.close()
+    messages = [x.args[0].getMessage() for x in mock_last_resort.handle.call_args_list]
+    assert messages == [
+        'Failed to set up logging. Only warnings and errors are logged.', 'Written.'
+    ]
+    mock_last_resort.close.assert_not_called()
+
+
+def test_background_handler_factory_fails_without_last_resort(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.logs.logging.lastResort', None)
+    mock_stderr = mocker.patch('open_in_mpv.logs.sys.stderr', new_callable=io.StringIO)
+    handler = logs.BackgroundHandler(mocker.Mock(side_effect=OSError))
+    logger = _logger(handler)
+    logger.info('Dropped.')
+    logger.warning('Written.')
+    handler.close()
+    assert mock_stderr.getvalue() == (
+        'Failed to set up logging. Only warnings and errors are logged.\nWritten.\n')
+
+
+def test_background_handler_prepare_fails(mocker: MockerFixture) -> None:
+    handler = logs.BackgroundHandler(list)
+    mock_handle_error = mocker.patch.object(handler, 'handleError')
+    _logger(handler).info('%d', 'not a number')
+    mock_handle_error.assert_called_once()
+    handler.close()
+
+
+def test_background_handler_after_fork() -> None:
+    target = ListHandler()
+    calls: list[int] = []
+
+    def factory() -> list[logging.Handler]:
+        calls.append(1)
+        return [target]
+
+    handler = logs.BackgroundHandler(factory)
+    logger = _logger(handler)
+    logger.info('Before.')
+    logs._after_fork_in_child()  # ruff:ignore[private-member-access]
+    logger.info('After.')
+    handler.close()
+    assert len(calls) == 2
+    assert 'After.' in [x.getMessage() for x in target.records]
+
+
+def test_background_handler_before_fork() -> None:
+    writing = threading.Event()
+    release = threading.Event()
+
+    class SlowHandler(ListHandler):
+        def emit(self, record: logging.LogRecord) -> None:
+            writing.set()
+            release.wait(5)
+            super().emit(record)
+
+    target = SlowHandler()
+    handler = logs.BackgroundHandler(lambda: [target])
+    logger = _logger(handler)
+    logger.info('Slow.')
+    assert writing.wait(5)
+    forking = threading.Thread(target=logs._before_fork)  # ruff:ignore[private-member-access]
+    forking.start()
+    forking.join(5)
+    assert not forking.is_alive()
+    queued = threading.Thread(target=logger.info, args=('Queued.',))
+    queued.start()
+    queued.join(0.1)
+    assert queued.is_alive()
+    logs._after_fork_in_parent()  # ruff:ignore[private-member-access]
+    queued.join(5)
+    assert not queued.is_alive()
+    release.set()
+    handler.close()
+    assert [x.getMessage() for x in target.records] == ['Slow.', 'Queued.']
+    assert target.closed
+
+
+def test_close_all() -> None:
+    target = ListHandler()
+    handler = logs.BackgroundHandler(lambda: [target])
+    _logger(handler).info('Queued.')
+    logs.close_all()
+    assert [x.getMessage() for x in target.records] == ['Queued.']
+    assert target.closed
@@ -2,19 +2,35 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING, Any
 import json
+import os
 import re
 import struct
 
+from open_in_mpv.instance import LaunchLock
 from open_in_mpv.main import get_callback, get_mpv_path, main, spawn
 import pytest
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
     from unittest.mock import MagicMock
 
     from click.testing import CliRunner
     from pytest_mock import MockerFixture
 
 
+@pytest.fixture
+def _isolate(mocker: MockerFixture) -> None:
+    # Keep command lines independent of an mpv binary and capability cache on this machine.
+    mocker.patch('open_in_mpv.main.capabilities.resolve', return_value=None)
+    # Keep launches in one test from looking like they are still starting in the next.
+    mock_lock = mocker.patch('open_in_mpv.main.instance.LaunchLock')
+    mock_lock.return_value.__enter__.return_value.starting.return_value = False
+
+
+pytestmark = pytest.mark.usefixtures('_isolate')
+
+
 def test_get_mpv_path_default() -> None:
     """Test get_mpv_path returns 'mpv' by default."""
     result = get_mpv_path()
@@ -99,9 +115,13 @@ def test_main_bad_url(runner: CliRunner) -> None:
 
 
 def test_main(runner: CliRunner, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.instance.write_owner')
     mpv_socket_path = mocker.patch('open_in_mpv.main.MPV_SOCKET')
     mpv_socket_path.exists.return_value = False
     mock_os = mocker.patch('open_in_mpv.main.os')
+    mock_os.pipe.return_value = (3, 4)
+    # The drain would read and close the real descriptors.
+    mocker.patch('open_in_mpv.mpvlog.Drain')
     mock_os.fork.side_effect = [1, 1]
     mock_os.environ.copy.return_value = {'PATH': '/usr/bin'}
     mocker.patch('open_in_mpv.main.sp.run')
@@ -117,7 +137,10 @@ def test_main_os_fork_fail(runner: CliRunner, mocker: MockerFixture) -> None:
     mock_os.environ.copy.return_value = {'PATH': '/usr/bin'}
     mock_os.fork.side_effect = OSError
     result = runner.invoke(main, ['chrome://aaa', '-'],
-                           input=b'\x1e\x00\x00\x00{"url": "https://example.com"}')
+                           input=_frame({
+                               'launcher': 'fork',
+                               'url': 'https://example.com'
+                           }))
     assert result.exit_code == 1
 
 
@@ -128,15 +151,21 @@ def test_main_os_fork_fail_2(runner: CliRunner, mocker: MockerFixture) -> None:
     mock_os.environ.copy.return_value = {'PATH': '/usr/bin'}
     mock_os.fork.side_effect = [0, OSError]
     result = runner.invoke(main, ['chrome://aaa', '-'],
-                           input=b'\x1e\x00\x00\x00{"url": "https://example.com"}')
+                           input=_frame({
+                               'launcher': 'fork',
+                               'url': 'https://example.com'
+                           }))
     assert result.exit_code == 1
 
 
 def test_main_os_fork_ok(runner: CliRunner, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.instance.write_owner')
     mpv_socket_path = mocker.patch('open_in_mpv.main.MPV_SOCKET')
     mpv_socket_path.exists.return_value = False
     mocker.patch('open_in_mpv.main.socket.socket')
     mock_os = mocker.patch('open_in_mpv.main.os')
+    mock_os.pipe.return_value = (3, 4)
+    mocker.patch('open_in_mpv.mpvlog.Drain')
     mock_os.environ.copy.return_value = {'PATH': '/usr/bin'}
     mock_os.fork.side_effect = [0, 0]
     mocker.patch('open_in_mpv.main.sp.run')
@@ -146,10 +175,13 @@ def test_main_os_fork_ok(runner: CliRunner, mocker: MockerFixture) -> None:
 
 
 def test_main_socket_failure(runner: CliRunner, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.instance.write_owner')
     mpv_socket_path = mocker.patch('open_in_mpv.main.MPV_SOCKET')
     mpv_socket_path.exists.return_value = False
     mock_socket = mocker.patch('open_in_mpv.main.socket.socket')
     mock_os = mocker.patch('open_in_mpv.main.os')
+    mock_os.pipe.return_value = (3, 4)
+    mocker.patch('open_in_mpv.mpvlog.Drain')
     mock_os.environ.copy.return_value = {'PATH': '/usr/bin'}
     mock_os.fork.side_effect = [1, 0, 0, 0]
     mock_socket.return_value.connect.side_effect = OSError
@@ -163,8 +195,8 @@ def test_main_single_instance(runner: CliRunner, mocker: MockerFixture) -> None:
     mock_json_dumps = mocker.patch('open_in_mpv.main.json.dumps')
     mock_json_dumps.return_value = '{"command": ["loadfile", "https://example.com"]}'
     mock_socket = mocker.patch('open_in_mpv.main.socket.socket')
-    mpv_socket_path = mocker.patch('open_in_mpv.main.MPV_SOCKET')
-    mpv_socket_path.exists.return_value = True
+    mocker.patch('open_in_mpv.main.MPV_SOCKET')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=True)
     mock_os = mocker.patch('open_in_mpv.main.os')
     mock_os.environ.copy.return_value = {'PATH': '/usr/bin'}
     mock_os.fork.side_effect = [0, 0, 1, 1]
@@ -174,20 +206,25 @@ def test_main_single_instance(runner: CliRunner, mocker: MockerFixture) -> None:
     assert result.exit_code == 0
     assert mock_socket.return_value.connect.call_count == 1
     assert mock_socket.return_value.send.call_count == 1
-    assert mock_json_dumps.call_count == 2
+    mock_json_dumps.assert_any_call({'command': ['loadfile', 'https://example.com', 'replace']})
 
 
 def test_main_single_instance_connection_refused(runner: CliRunner, mocker: MockerFixture) -> None:
     mock_socket = mocker.patch('open_in_mpv.main.socket.socket')
-    mpv_socket_path = mocker.patch('open_in_mpv.main.MPV_SOCKET')
-    mpv_socket_path.exists.return_value = True
+    mocker.patch('open_in_mpv.main.MPV_SOCKET')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=True)
     mock_socket.return_value.send.side_effect = OSError
     mock_os = mocker.patch('open_in_mpv.main.os')
+    mock_os.pipe.return_value = (3, 4)
+    mocker.patch('open_in_mpv.mpvlog.Drain')
     mock_os.environ.copy.return_value = {'PATH': '/usr/bin'}
     mock_os.fork.side_effect = [0, 0, 0, 0]
     run = mocker.patch('open_in_mpv.main.sp.run')
     result = runner.invoke(main, ['chrome://aaa', '-'],
-                           input=b'\x1e\x00\x00\x00{"url": "https://example.com"}')
+                           input=_frame({
+                               'launcher': 'fork',
+                               'url': 'https://example.com'
+                           }))
     assert result.exit_code == 0
     assert run.call_count == 1
     assert mock_socket.return_value.connect.call_count == 1
@@ -195,12 +232,21 @@ def test_main_single_instance_connection_refused(runner: CliRunner, mocker: Mock
     assert mock_os._exit.call_count == 2  # ruff:ignore[private-member-access]
 
 
+@pytest.fixture
+def env_cache() -> Iterator[None]:
+    from open_in_mpv.main import _launch_environment  # ruff:ignore[import-private-name]
+    _launch_environment.cache_clear()
+    yield
+    _launch_environment.cache_clear()
+
+
+@pytest.mark.usefixtures('env_cache')
 def test_main_single_instance_macports(runner: CliRunner, mocker: MockerFixture) -> None:
     mock_path = mocker.patch('open_in_mpv.main.Path')
     mock_path.return_value.is_dir.return_value = True
     mock_socket = mocker.patch('open_in_mpv.main.socket.socket')
-    mpv_socket_path = mocker.patch('open_in_mpv.main.MPV_SOCKET')
-    mpv_socket_path.exists.return_value = True
+    mocker.patch('open_in_mpv.main.MPV_SOCKET')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=True)
     mock_os = mocker.patch('open_in_mpv.main.os')
     mock_os.environ.copy.return_value = {'PATH': '/usr/bin'}
     mock_os.fork.side_effect = [0, 0, 1, 1]
@@ -218,6 +264,8 @@ def test_main_single_instance_macports(runner: CliRunner, mocker: MockerFixture)
     assert isinstance(data, dict)
     assert 'macports' in data
     assert data['macports'] is True
+    assert data['envOverrides']['PATH'].startswith('/opt/local/bin')
+    assert 'env' not in data
 
 
 def test_main_spawn_windows(mocker: MockerFixture) -> None:
@@ -240,17 +288,23 @@ def test_get_callback_no_af_unix(mocker: MockerFixture) -> None:
 def test_main_spawn_exit_second_parent(mocker: MockerFixture) -> None:
     mock_os = mocker.patch('open_in_mpv.main.os')
     mock_os.fork.side_effect = [0, 1]
+    mock_os._exit.side_effect = SystemExit  # ruff:ignore[private-member-access]
     mock_callable = mocker.Mock()
     with pytest.raises(SystemExit):
         spawn(mock_callable)
-    assert mock_os._exit.call_count == 0  # ruff:ignore[private-member-access]
+    mock_os._exit.assert_called_once_with(  # ruff:ignore[private-member-access]
+        mock_os.EX_OK)
+    mock_callable.assert_not_called()
 
 
 def test_main_debug_mode(runner: CliRunner, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.instance.write_owner')
     """Test main with debug=True to cover debug paths."""
     mpv_socket_path = mocker.patch('open_in_mpv.main.MPV_SOCKET')
     mpv_socket_path.exists.return_value = False
     mock_os = mocker.patch('open_in_mpv.main.os')
+    mock_os.pipe.return_value = (3, 4)
+    mocker.patch('open_in_mpv.mpvlog.Drain')
     mock_os.fork.side_effect = [1, 1]
     mock_os.environ.copy.return_value = {'PATH': '/usr/bin'}
     mocker.patch('open_in_mpv.main.sp.run')
@@ -259,13 +313,11 @@ def test_main_debug_mode(runner: CliRunner, mocker: MockerFixture) -> None:
     assert result.exit_code == 0
 
 
-def test_mpv_and_cleanup_callback_windows(mocker: MockerFixture) -> None:
+def test_mpv_and_cleanup_callback_windows(mocker: MockerFixture, tmp_path: Path) -> None:
     """Test mpv_and_cleanup callback on Windows to cover Windows-specific paths."""
     from open_in_mpv.main import mpv_and_cleanup
     mocker.patch('open_in_mpv.main.IS_WIN', new=True)
-    mock_path_open = mocker.patch('open_in_mpv.main.Path')
-    mock_path_open.return_value.open.return_value.__enter__.return_value = mocker.Mock()
-    mock_path_open.return_value.open.return_value.__exit__.return_value = None
+    mocker.patch('open_in_mpv.main.MPV_LOG_PATH', tmp_path / 'mpv.log')
     mock_get_mpv_path = mocker.patch('open_in_mpv.main.get_mpv_path')
     mock_get_mpv_path.return_value = 'C:\\test\\mpv.exe'
     mock_sp_run = mocker.patch('open_in_mpv.main.sp.run')
@@ -301,12 +353,14 @@ def test_mpv_and_cleanup_callback_debug(mocker: MockerFixture) -> None:
     assert mock_sp_run.call_count == 1
     args = mock_sp_run.call_args
     cmd_parts = args[0][0]
-    # In debug mode, should have -v and --log-file.
+    # In debug mode, should have -v. The output is drained through a pipe instead of mpv writing
+    # the log file itself.
     assert '-v' in cmd_parts
-    assert any('--log-file=' in arg for arg in cmd_parts)
+    assert not any('--log-file=' in arg for arg in cmd_parts)
+    assert isinstance(args.kwargs['stdout'], int)
 
 
-def test_mpv_and_cleanup_windows_with_ytdlp(mocker: MockerFixture) -> None:
+def test_mpv_and_cleanup_windows_with_ytdlp(mocker: MockerFixture, tmp_path: Path) -> None:
     """Test mpv_and_cleanup on Windows with PyInstaller bundle and yt-dlp.exe present."""
     from unittest.mock import MagicMock
 
@@ -314,18 +368,11 @@ def test_mpv_and_cleanup_windows_with_ytdlp(mocker: MockerFixture) -> None:
     mocker.patch('open_in_mpv.main.IS_WIN', new=True)
     mocker.patch('open_in_mpv.main.sys.frozen', new=True, create=True)
     mocker.patch('open_in_mpv.main.sys.executable', 'C:\\test\\open-in-mpv.exe')
+    mocker.patch('open_in_mpv.main.MPV_LOG_PATH', tmp_path / 'mpv.log')
     mock_path_class = mocker.patch('open_in_mpv.main.Path')
-    call_count = [0]
 
     def path_constructor(path_arg: Any) -> MagicMock:
-        call_count[0] += 1
-        if call_count[0] == 1:
-            # First call: Path(MPV_LOG_PATH) for log file
-            mock_log_path = MagicMock()
-            mock_log_path.open.return_value.__enter__.return_value = MagicMock()
-            mock_log_path.open.return_value.__exit__.return_value = None
-            return mock_log_path
-        # Second call: Path(sys.executable) for yt-dlp check
+        # Path(sys.executable) for yt-dlp check
         mock_exe_path = MagicMock()
         mock_parent = MagicMock()
         mock_exe_path.parent = mock_parent
@@ -350,7 +397,7 @@ def test_mpv_and_cleanup_windows_with_ytdlp(mocker: MockerFixture) -> None:
     assert any('--script-opts=ytdl_hook-ytdl_path=' in arg for arg in cmd_parts)
 
 
-def test_mpv_and_cleanup_windows_without_ytdlp(mocker: MockerFixture) -> None:
+def test_mpv_and_cleanup_windows_without_ytdlp(mocker: MockerFixture, tmp_path: Path) -> None:
     """Test mpv_and_cleanup on Windows with PyInstaller bundle but no yt-dlp.exe."""
     from unittest.mock import MagicMock
 
@@ -358,18 +405,11 @@ def test_mpv_and_cleanup_windows_without_ytdlp(mocker: MockerFixture) -> None:
     mocker.patch('open_in_mpv.main.IS_WIN', new=True)
     mocker.patch('open_in_mpv.main.sys.frozen', new=True, create=True)
     mocker.patch('open_in_mpv.main.sys.executable', 'C:\\test\\open-in-mpv.exe')
+    mocker.patch('open_in_mpv.main.MPV_LOG_PATH', tmp_path / 'mpv.log')
     mock_path_class = mocker.patch('open_in_mpv.main.Path')
-    call_count = [0]
 
     def path_constructor(path_arg: Any) -> MagicMock:
-        call_count[0] += 1
-        if call_count[0] == 1:
-            # First call: Path(MPV_LOG_PATH) for log file
-            mock_log_path = MagicMock()
-            mock_log_path.open.return_value.__enter__.return_value = MagicMock()
-            mock_log_path.open.return_value.__exit__.return_value = None
-            return mock_log_path
-        # Second call: Path(sys.executable) for yt-dlp check
+        # Path(sys.executable) for yt-dlp check
         mock_exe_path = MagicMock()
         mock_parent = MagicMock()
         mock_exe_path.parent = mock_parent
@@ -391,3 +431,980 @@ def test_mpv_and_cleanup_windows_without_ytdlp(mocker: MockerFixture) -> None:
     args = mock_sp_run.call_args
     cmd_parts = args[0][0]
     assert not any('--script-opts=ytdl_hook-ytdl_path=' in arg for arg in cmd_parts)
+
+
+def _frame(data: dict[str, Any]) -> bytes:
+    encoded = json.dumps(data).encode()
+    return struct.pack('@i', len(encoded)) + encoded
+
+
+def _responses(stdout: bytes) -> list[dict[str, Any]]:
+    ret = []
+    while stdout:
+        size = struct.unpack('@i', stdout[:4])[0]
+        ret.append(json.loads(stdout[4:4 + size].decode()))
+        stdout = stdout[4 + size:]
+    return ret
+
+
+def test_request_eof() -> None:
+    import io
+
+    from open_in_mpv.main import request
+    with pytest.raises(EOFError):
+        request(io.BytesIO(b''))
+    with pytest.raises(EOFError):
+        request(io.BytesIO(b'\x0e\x00\x00\x00{"init"'))
+
+
+def test_request_short_reads() -> None:
+    import io
+
+    from open_in_mpv.main import request
+
+    class Trickle(io.BytesIO):
+        def __init__(self, data: bytes) -> None:
+            super().__init__()
+            self.data = data
+
+        def read(self, size: int | None = -1, /) -> bytes:
+            chunk, self.data = self.data[:1], self.data[1:]
+            return chunk
+
+    assert request(Trickle(_frame({'url': 'https://example.com'}))).url == 'https://example.com'
+
+
+def test_main_persistent(runner: CliRunner, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.reap_children')
+    result = runner.invoke(main, ['chrome://aaa', '-'],
+                           input=_frame({
+                               'init': True,
+                               'persistent': True
+                           }) + _frame({}) + _frame({'url': 'bad'}) + _frame({'init': True}))
+    assert result.exit_code == 0
+    responses = _responses(result.stdout_bytes)
+    assert len(responses) == 4
+    assert 'version' in responses[0]
+    assert responses[1] == {'error': 'No URL was given.'}
+    assert responses[2] == {'error': 'Invalid URL: bad'}
+    assert 'socketPath' in responses[3]
+
+
+def test_main_persistent_first_message_invalid(runner: CliRunner, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.reap_children')
+    result = runner.invoke(main, ['chrome://aaa', '-'], input=_frame({'persistent': True}))
+    assert result.exit_code == 0
+    assert _responses(result.stdout_bytes) == [{'error': 'No URL was given.'}]
+
+
+def test_main_persistent_launch_fails(runner: CliRunner, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.reap_children')
+    mock_handle_message = mocker.patch(
+        'open_in_mpv.main.handle_message',
+        side_effect=[FileNotFoundError(2, 'No such file or directory'), OSError('busy'), None])
+    result = runner.invoke(main, ['chrome://aaa', '-'],
+                           input=_frame({
+                               'persistent': True,
+                               'url': 'https://a'
+                           }) + _frame({'url': 'https://b'}) + _frame({'url': 'https://c'}))
+    assert result.exit_code == 0
+    assert _responses(result.stdout_bytes) == [{
+        'error': '[Errno 2] No such file or directory'
+    }, {
+        'error': 'busy'
+    }]
+    assert mock_handle_message.call_count == 3
+
+
+def test_main_persistent_idle_timeout(runner: CliRunner, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.reap_children')
+    wait = mocker.patch('open_in_mpv.main.wait_for_message', return_value=False)
+    result = runner.invoke(main, ['chrome://aaa', '-'],
+                           input=_frame({
+                               'idleTimeout': 5,
+                               'init': True,
+                               'persistent': True
+                           }) + _frame({'init': True}))
+    assert result.exit_code == 0
+    assert len(_responses(result.stdout_bytes)) == 1
+    wait.assert_called_once_with(mocker.ANY, 5)
+
+
+def test_wait_for_message() -> None:
+    from open_in_mpv.main import wait_for_message
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(read_fd, 'rb', buffering=0) as reader, os.fdopen(write_fd, 'wb') as writer:
+        assert wait_for_message(reader, 0) is False
+        writer.write(b'x')
+        writer.flush()
+        assert wait_for_message(reader, 0) is True
+        assert wait_for_message(reader, None) is True
+
+
+def test_wait_for_message_no_fileno() -> None:
+    import io
+
+    from open_in_mpv.main import wait_for_message
+    assert wait_for_message(io.BytesIO(), 0) is True
+
+
+def test_reap_children(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import reap_children
+    waitpid = mocker.patch('open_in_mpv.main.os.waitpid', side_effect=[(123, 0), (0, 0)])
+    reap_children()
+    assert waitpid.call_count == 2
+    waitpid.side_effect = ChildProcessError
+    reap_children()
+    mocker.patch('open_in_mpv.main.IS_WIN', new=True)
+    waitpid.reset_mock()
+    reap_children()
+    assert waitpid.call_count == 0
+
+
+def _import_time(module: str) -> int:
+    import subprocess as sp
+    import sys
+    proc = sp.run((sys.executable, '-X', 'importtime', '-c', f'import {module}'),
+                  capture_output=True,
+                  check=True,
+                  text=True)
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_str, name = line.removeprefix('import time:').split('|')
+        if name.strip() == module:
+            return int(cumulative_str)
+    return 0
+
+
+def test_main_imports() -> None:
+    import subprocess as sp
+    import sys
+    code = 'import json, sys; import open_in_mpv.main; print(json.dumps(list(sys.modules)))'
+    proc = sp.run((sys.executable, '-c', code),
+                  capture_output=True,
+                  check=True,
+                  text=True)
+    names = set(json.loads(proc.stdout))
+    assert not names & {
+        'asyncio', 'bascom', 'click', 'colorlog', 'platform', 'sqlite3', 'typing_extensions'
+    }
+    # Feature modules are imported when a message enables them.
+    assert {x for x in names if x.startswith('open_in_mpv.')} == {
+        f'open_in_mpv.{x}'
+        for x in ('batch', 'capabilities', 'codec', 'constants', 'instance', 'logs', 'main',
+                  'metrics', 'pool')
+    }
+
+
+def test_main_import_budget() -> None:
+    # Generous, so slow machines pass, but well below what importing heavy dependencies costs. Set
+    # OPEN_IN_MPV_IMPORT_BUDGET_US to check a tighter budget.
+    budget = int(os.environ.get('OPEN_IN_MPV_IMPORT_BUDGET_US', '500000'))
+    best = None
+    for _ in range(5):
+        cumulative = _import_time('open_in_mpv.main')
+        best = cumulative if best is None else min(best, cumulative)
+    assert best is not None
+    assert best <= budget, f'Importing open_in_mpv.main took {best} us (budget {budget} us).'
+
+
+def test_run_fast_path(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import run
+    mocker.patch('open_in_mpv.main.sys.argv', ['open-in-mpv', 'chrome-extension://abc/'])
+    mock_stdin = mocker.patch('open_in_mpv.main.sys.stdin')
+    mock_host = mocker.patch('open_in_mpv.main.host')
+    mock_cli = mocker.patch('open_in_mpv.cli.main')
+    run()
+    mock_host.assert_called_once_with(mock_stdin.buffer.raw)
+    mock_cli.assert_not_called()
+    for exc in (ValueError, EOFError, OSError):
+        mock_host.side_effect = exc
+        with pytest.raises(SystemExit) as exc_info:
+            run()
+        assert exc_info.value.code == 1
+
+
+def test_run_click_path(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import run
+    mocker.patch('open_in_mpv.main.sys.argv', ['open-in-mpv', '--help'])
+    mock_host = mocker.patch('open_in_mpv.main.host')
+    mock_cli = mocker.patch('open_in_mpv.cli.main')
+    run()
+    mock_cli.assert_called_once_with()
+    mock_host.assert_not_called()
+
+
+def test_main_module_getattr() -> None:
+    import open_in_mpv.main
+    with pytest.raises(AttributeError):
+        _ = open_in_mpv.main.does_not_exist
+
+
+def test_launch(mocker: MockerFixture, tmp_path: Path) -> None:
+    import sys
+
+    from open_in_mpv.main import launch
+    log_path = tmp_path / 'log' / 'mpv.log'
+    mocker.patch('open_in_mpv.main.MPV_LOG_PATH', log_path)
+    pid = launch((sys.executable, '-c', 'import os; print(os.getsid(0) == os.getpid())'),
+                 dict(os.environ))
+    os.waitpid(pid, 0)
+    assert log_path.read_text(encoding='utf-8').strip() == 'True'
+
+
+def test_launch_no_setsid(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import launch
+    mocker.patch('open_in_mpv.main.MPV_LOG_PATH', tmp_path / 'mpv.log')
+    mocker.patch('open_in_mpv.main.os.posix_spawn', side_effect=NotImplementedError)
+    mock_popen = mocker.patch('open_in_mpv.main.sp.Popen')
+    mock_popen.return_value.pid = 123
+    assert launch(('mpv', 'https://example.com'), {'PATH': ''}) == 123
+    assert mock_popen.call_args.args[0] == ('mpv', 'https://example.com')
+    assert mock_popen.call_args.kwargs['start_new_session'] is True
+
+
+def test_launch_drain(mocker: MockerFixture, tmp_path: Path) -> None:
+    import sys
+    import time
+
+    from open_in_mpv.main import launch
+    log_path = tmp_path / 'log' / 'mpv.log'
+    mocker.patch('open_in_mpv.main.MPV_LOG_PATH', log_path)
+    env = {**os.environ, 'XDG_STATE_HOME': str(tmp_path / 'state')}
+    pid = launch((sys.executable, '-c', 'print("drained")'), env, drain=True)
+    os.waitpid(pid, 0)
+    # The drain process writes to the log directory in its own environment.
+    for _ in range(100):
+        if drained := list((tmp_path / 'state').glob('**/mpv.log')):
+            break
+        time.sleep(0.05)
+    assert drained[0].read_text(encoding='utf-8') == 'drained\n'
+    assert 'drained' not in log_path.read_text(encoding='utf-8')
+
+
+def test_mpv_and_cleanup_crash(mocker: MockerFixture, tmp_path: Path) -> None:
+    import subprocess as sp
+
+    from open_in_mpv.main import mpv_and_cleanup
+    mocker.patch('open_in_mpv.main.MPV_LOG_PATH', tmp_path / 'mpv.log')
+    mocker.patch('open_in_mpv.main.MPV_CRASH_LOG_PATH', tmp_path / 'mpv-crash.log')
+    mocker.patch('open_in_mpv.main.mpv_command',
+                 return_value=['sh', '-c', 'echo output; echo error >&2; exit 3'])
+    mocker.patch('open_in_mpv.main.mpv_capabilities')
+    with pytest.raises(sp.CalledProcessError):
+        mpv_and_cleanup('https://example.com', {'PATH': os.environ['PATH']})()
+    assert (tmp_path / 'mpv.log').read_text(encoding='utf-8') == 'output\nerror\n'
+    assert (tmp_path / 'mpv-crash.log').read_text(encoding='utf-8') == 'output\nerror\n'
+
+
+def test_spawn_init_launcher(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import spawn_init
+    mocker.patch('open_in_mpv.main.MPV_SOCKET')
+    mock_launch = mocker.patch('open_in_mpv.main.launch', return_value=123)
+    mock_write_owner = mocker.patch('open_in_mpv.main.instance.write_owner')
+    mock_remove_owner = mocker.patch('open_in_mpv.main.instance.remove_owner')
+    mock_spawn = mocker.patch('open_in_mpv.main.spawn')
+    spawn_init('https://example.com', {}, launcher='spawn')
+    assert mock_launch.call_count == 1
+    assert mock_write_owner.call_args.args[1] == 123
+    assert 'https://example.com' in mock_launch.call_args.args[0]
+    mock_remove_owner.assert_not_called()
+    spawn_init('https://example.com', {}, launcher='fork')
+    assert mock_spawn.call_count == 1
+    mock_remove_owner.assert_called_once()
+    mocker.patch('open_in_mpv.main.IS_WIN', new=True)
+    spawn_init('https://example.com', {}, launcher='spawn')
+    assert mock_launch.call_count == 1
+    assert mock_spawn.call_count == 2
+
+
+def test_spawn_init_pool(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import spawn_init
+    mocker.patch('open_in_mpv.main.MPV_SOCKET')
+    mock_claim = mocker.patch('open_in_mpv.main.pool.claim', return_value=True)
+    mocker.patch('open_in_mpv.main.pool.missing', return_value=2)
+    mocker.patch('open_in_mpv.main.pool.new_socket_path', return_value='/pool/a.sock')
+    mock_launch = mocker.patch('open_in_mpv.main.launch', return_value=123)
+    mock_write_owner = mocker.patch('open_in_mpv.main.instance.write_owner')
+    spawn_init('https://example.com', {}, pool_size=2, pool_ttl=10)
+    mock_claim.assert_called_once_with('https://example.com', None, target=None)
+    assert mock_launch.call_count == 2
+    mock_write_owner.assert_called_with('/pool/a.sock', 123)
+    cmd = mock_launch.call_args.args[0]
+    assert '--input-ipc-server=/pool/a.sock' in cmd
+    assert '--idle=yes' in cmd
+    assert 'https://example.com' not in cmd
+    mock_claim.return_value = False
+    mock_launch.reset_mock()
+    spawn_init('https://example.com', {}, pool_size=2)
+    assert mock_launch.call_count == 3
+    assert 'https://example.com' in mock_launch.call_args_list[0].args[0]
+
+
+def test_spawn_init_abstract(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import spawn_init
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mock_claim = mocker.patch('open_in_mpv.main.pool.claim')
+    mock_launch = mocker.patch('open_in_mpv.main.launch', return_value=123)
+    mock_write_owner = mocker.patch('open_in_mpv.main.instance.write_owner')
+    mocker.patch('open_in_mpv.main.pool.missing', return_value=0)
+    spawn_init('https://example.com', {}, pool_size=2, abstract=True)
+    mock_claim.assert_not_called()
+    mock_write_owner.assert_not_called()
+    assert any(x.startswith('--input-ipc-server=@') for x in mock_launch.call_args.args[0])
+
+
+def test_handle_message_batch(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=True)
+    mock_spawn = mocker.patch('open_in_mpv.main.spawn')
+    mock_get_callback = mocker.patch('open_in_mpv.main.get_callback')
+    handle_message(Request(urls=['https://a', 'https://b'], mode='append'), debug=False)
+    mock_spawn.assert_called_once_with(mock_get_callback.return_value)
+    assert mock_get_callback.call_args.args[0] == 'https://a'
+    assert mock_get_callback.call_args.kwargs['queue'] == ['https://b']
+    assert mock_get_callback.call_args.kwargs['mode'] == 'append'
+    with pytest.raises(ValueError, match='Invalid URL: ftp://b'):
+        handle_message(Request(urls=['https://a', 'ftp://b']), debug=False)
+    with pytest.raises(ValueError, match='Invalid mode'):
+        handle_message(Request(url='https://a', mode='shuffle'), debug=False)
+    with pytest.raises(ValueError, match='Invalid playlist'):
+        handle_message(Request(playlist='/does/not/exist.m3u'), debug=False)
+
+
+def test_get_callback_batch(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.MPV_SOCKET')
+    mock_socket = mocker.patch('open_in_mpv.main.socket.socket')
+    get_callback('https://a', {}, queue=['https://b'], playlist='https://c.m3u', mode='append')()
+    assert mock_socket.return_value.send.call_count == 1
+    data = mock_socket.return_value.send.call_args.args[0]
+    assert [json.loads(x)['command'] for x in data.splitlines()] == [
+        ['loadfile', 'https://a', 'append-play'], ['loadfile', 'https://b', 'append-play'],
+        ['loadlist', 'https://c.m3u', 'append-play']
+    ]
+
+
+def test_spawn_init_batch(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import spawn_init
+    mpv_socket_path = mocker.patch('open_in_mpv.main.MPV_SOCKET')
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.main.instance.write_owner')
+    mock_launch = mocker.patch('open_in_mpv.main.launch', return_value=123)
+    spawn_init('https://a', {}, queue=['https://b'], playlist='https://c.m3u')
+    assert mock_launch.call_args.args[0][-3:] == [
+        'https://a', 'https://b', '--playlist=https://c.m3u'
+    ]
+    mocker.patch('open_in_mpv.main.pool.claim', return_value=True)
+    mocker.patch('open_in_mpv.main.pool.missing', return_value=0)
+    mock_send = mocker.patch('open_in_mpv.main.batch.send')
+    spawn_init('https://a', {}, pool_size=1, queue=['https://b'])
+    mock_send.assert_called_once_with([['loadfile', 'https://b', 'append-play']],
+                                      mpv_socket_path)
+
+
+def test_request_types() -> None:
+    import io
+
+    from open_in_mpv.codec import MalformedFrameError
+    from open_in_mpv.main import Request, request
+    assert request(io.BytesIO(_frame({
+        'poolSize': 2,
+        'urls': ['https://a'],
+        'idleTimeout': None
+    }))) == Request(pool_size=2, urls=['https://a'], idle_timeout=None)
+    assert request(io.BytesIO(_frame({'init': False}))).init is True
+    with pytest.raises(MalformedFrameError, match='poolSize'):
+        request(io.BytesIO(_frame({'poolSize': '2'})))
+    with pytest.raises(MalformedFrameError, match='not an object'):
+        request(io.BytesIO(b'\x02\x00\x00\x00[]'))
+
+
+def test_main_persistent_frame_errors(runner: CliRunner, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.reap_children')
+    result = runner.invoke(main, ['chrome://aaa', '-'],
+                           input=_frame({
+                               'init': True,
+                               'persistent': True
+                           }) + b'\x03\x00\x00\x00{{{' + _frame({'url': 1}) +
+                           b'\xff\xff\xff\x7f' + _frame({'init': True}))
+    assert result.exit_code == 0
+    responses = _responses(result.stdout_bytes)
+    assert len(responses) == 4
+    assert [x.get('code') for x in responses[1:]] == [
+        'malformed-frame', 'malformed-frame', 'frame-too-large'
+    ]
+
+
+def test_response_too_large(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import response
+    mocker.patch('open_in_mpv.codec.MAX_RESPONSE_SIZE', 100)
+    stdout = mocker.patch('open_in_mpv.main.sys.stdout')
+    response({'data': 'x' * 200})
+    assert stdout.buffer.write.call_count == 1
+    data = stdout.buffer.write.call_args.args[0]
+    assert _responses(data)[0]['code'] == 'frame-too-large'
+
+
+@pytest.mark.usefixtures('env_cache')
+def test_environment_cached(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import environment
+    mocker.patch('open_in_mpv.main.Path.is_dir', return_value=False)
+    mock_copy = mocker.patch('open_in_mpv.main.os.environ.copy', return_value={'HOME': '/home/a'})
+    data_resp: dict[str, Any] = {}
+    assert environment(data_resp, debugging=False) == {'HOME': '/home/a'}
+    assert environment({}, debugging=False) == {'HOME': '/home/a'}
+    assert mock_copy.call_count == 1
+    assert data_resp == {'envOverrides': {}}
+
+
+@pytest.mark.usefixtures('env_cache')
+def test_environment_debug_one_record(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import environment
+    mocker.patch('open_in_mpv.main.Path.is_dir', return_value=False)
+    mocker.patch('open_in_mpv.main.os.environ.copy', return_value={'A': '1', 'B': '2'})
+    mock_debug = mocker.patch('open_in_mpv.main.logger.debug')
+    environment({}, debugging=True)
+    mock_debug.assert_called_once_with('Environment:%s', '\n  A=1\n  B=2')
+
+
+def test_setup_logging(mocker: MockerFixture, tmp_path: Path) -> None:
+    import logging
+
+    from open_in_mpv.main import _setup_logging  # ruff:ignore[import-private-name]
+    mocker.patch('open_in_mpv.main._LOG_DIR_PATH', tmp_path / 'logs')
+    root = logging.getLogger()
+    mocker.patch.object(root, 'handlers', [])
+    mocker.patch.object(root, 'level', logging.WARNING)
+    _setup_logging(debug=False)
+    assert root.level == logging.INFO
+    handler = root.handlers[0]
+    assert not (tmp_path / 'logs').exists()
+    logging.getLogger('test_setup_logging').info('Hello.')
+    handler.close()
+    assert 'test_setup_logging:test_setup_logging' in (tmp_path / 'logs' / 'main.log').read_text()
+    _setup_logging(debug=True)
+    assert root.handlers != [handler]
+    assert root.level == logging.DEBUG
+    root.handlers[0].close()
+
+
+def test_log_handlers(mocker: MockerFixture, tmp_path: Path) -> None:
+    import logging
+
+    from open_in_mpv.main import _log_handlers  # ruff:ignore[import-private-name]
+    mocker.patch('open_in_mpv.main._LOG_DIR_PATH', tmp_path)
+    handlers = _log_handlers(debug=True)
+    assert [type(x).__name__ for x in handlers] == ['StreamHandler', 'RotatingFileHandler']
+    handlers[1].close()
+    mocker.patch('logging.handlers.RotatingFileHandler', side_effect=PermissionError)
+    assert [type(x) for x in _log_handlers(debug=False)] == [logging.StreamHandler]
+
+
+@pytest.mark.usefixtures('env_cache')
+def test_handle_message_dump_env(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import Request, handle_message
+    mock_response = mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mocker.patch('open_in_mpv.main.spawn_init')
+    handle_message(Request(url='https://a'), debug=False)
+    assert 'env' not in mock_response.call_args.args[0]
+    handle_message(Request(url='https://a', dump_env=True), debug=False)
+    assert mock_response.call_args.args[0]['env']['PATH']
+
+
+def test_handle_message_metrics(mocker: MockerFixture) -> None:
+    from open_in_mpv.constants import MPV_SOCKET
+    from open_in_mpv.main import Request, handle_message
+    from open_in_mpv.metrics import Timer
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mocker.patch('open_in_mpv.main.spawn_init')
+    mock_write = mocker.patch('open_in_mpv.main.metrics.write')
+    mock_launch = mocker.patch('open_in_mpv.main.launch')
+    handle_message(Request(url='https://a'), debug=False)
+    mock_write.assert_not_called()
+    timer = Timer()
+    handle_message(Request(url='https://a', metrics=True, click_time=0), debug=False, timer=timer)
+    assert set(timer.stages) == {'browser', 'env', 'spawn'}
+    mock_write.assert_called_once_with(timer.stages, record_id=timer.id)
+    cmd = mock_launch.call_args.args[0]
+    assert cmd[2:4] == ['open_in_mpv.watcher', str(MPV_SOCKET)]
+    assert cmd[-2:] == ['1', 'https://a']
+    mock_launch.side_effect = OSError
+    handle_message(Request(url='https://a', metrics=True), debug=False)
+
+
+def test_handle_message_stream_cache(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv import streams
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.streams.STREAM_CACHE_DIR', tmp_path)
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init')
+    handle_message(Request(url='https://a'), debug=False)
+    assert 'extra_args' not in mock_spawn_init.call_args.kwargs
+    handle_message(Request(url='https://a', stream_cache=True), debug=False)
+    assert mock_spawn_init.call_args.args[0] == 'https://a'
+    assert mock_spawn_init.call_args.kwargs['extra_args'] == streams.script_args()
+    assert 'url_options' not in mock_spawn_init.call_args.kwargs
+    streams.store('https://a', 'https://b/v.mp4', title='A')
+    handle_message(Request(url='https://a', stream_cache=True), debug=False)
+    assert mock_spawn_init.call_args.args[0] == 'https://b/v.mp4'
+    assert mock_spawn_init.call_args.kwargs['url_options'] == {
+        'force-media-title': 'A',
+        'script-opts-append': 'open_in_mpv-page=https://a'
+    }
+    mocker.patch('open_in_mpv.main.sys.frozen', new=True, create=True)
+    handle_message(Request(url='https://a', stream_cache=True), debug=False)
+    assert mock_spawn_init.call_args.kwargs['extra_args'] == ()
+
+
+def test_handle_message_stream_cache_format(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv import streams
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.main.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.streams.STREAM_CACHE_DIR', tmp_path / 'streams')
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.launch')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mocker.patch('open_in_mpv.main.instance.companion_running', return_value=False)
+    mocker.patch('open_in_mpv.formats.lookup', return_value={})
+    mocker.patch('open_in_mpv.formats.screen_height', return_value=720)
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init')
+    streams.store('https://youtu.be/a', 'https://b/any.mp4')
+    request = Request(url='https://youtu.be/a', stream_cache=True, format_policy=True)
+    # The stream resolved without a format is not used for a request that picks one.
+    handle_message(request, debug=False)
+    assert mock_spawn_init.call_args.args[0] == 'https://youtu.be/a'
+    picked = mock_spawn_init.call_args.kwargs['url_options']['ytdl-format']
+    streams.store('https://youtu.be/a', 'https://b/720.mp4', ytdl_format=picked)
+    handle_message(request, debug=False)
+    assert mock_spawn_init.call_args.args[0] == 'https://b/720.mp4'
+    assert 'ytdl-format' not in mock_spawn_init.call_args.kwargs['url_options']
+
+
+def test_handle_message_stream_cache_route(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv import streams
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.streams.STREAM_CACHE_DIR', tmp_path)
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.spawn_init')
+    mock_route = mocker.patch('open_in_mpv.registry.route',
+                              return_value=(tmp_path / 'a.sock', True))
+    streams.store('https://a.com/v', 'https://cdn.b.com/v.mp4', title='A')
+    handle_message(Request(url='https://a.com/v', stream_cache=True, single=False, route='domain'),
+                   debug=False)
+    assert mock_route.call_args.args[0] == 'https://a.com/v'
+
+
+def test_handle_message_resolver(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mock_launch = mocker.patch('open_in_mpv.main.launch')
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init')
+    mocker.patch('open_in_mpv.resolver.shim_path', return_value='/venv/bin/open-in-mpv-ytdl')
+    mock_is_running = mocker.patch('open_in_mpv.resolver.is_running', return_value=False)
+    handle_message(Request(url='https://a', resolver=True), debug=False)
+    assert mock_spawn_init.call_args.kwargs['extra_args'] == [
+        '--script-opts-append=ytdl_hook-ytdl_path=/venv/bin/open-in-mpv-ytdl'
+    ]
+    assert mock_launch.call_args.args[0][1:] == ['-m', 'open_in_mpv.resolver']
+    mock_launch.reset_mock()
+    mock_is_running.return_value = True
+    handle_message(Request(url='https://a', resolver=True), debug=False)
+    mock_launch.assert_not_called()
+    mock_is_running.return_value = False
+    mock_launch.side_effect = OSError
+    handle_message(Request(url='https://a', resolver=True), debug=False)
+    assert len(mock_spawn_init.call_args.kwargs['extra_args']) == 1
+    mocker.patch('open_in_mpv.resolver.shim_path', return_value=None)
+    handle_message(Request(url='https://a', resolver=True), debug=False)
+    assert 'extra_args' not in mock_spawn_init.call_args.kwargs
+    mocker.patch('open_in_mpv.main.IS_WIN', new=True)
+    mocker.patch('open_in_mpv.resolver.shim_path', return_value='/venv/bin/open-in-mpv-ytdl')
+    handle_message(Request(url='https://a', resolver=True), debug=False)
+    assert 'extra_args' not in mock_spawn_init.call_args.kwargs
+
+
+def test_mpv_command_url_options() -> None:
+    from open_in_mpv.main import mpv_command
+    cmd = mpv_command('https://b/v.mp4',
+                      extra_args=['--script=a.lua'],
+                      queue=['https://c'],
+                      url_options={'force-media-title': 'A'})
+    assert cmd[-6:] == [
+        '--script=a.lua', '--{', '--force-media-title=A', 'https://b/v.mp4', '--}', 'https://c'
+    ]
+
+
+def test_mpv_command_log_file(mocker: MockerFixture) -> None:
+    from open_in_mpv.constants import MPV_LOG_PATH
+    from open_in_mpv.main import mpv_command
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    assert f'--log-file={MPV_LOG_PATH}' not in mpv_command('https://a', debug=True)
+    assert f'--log-file={MPV_LOG_PATH}' in mpv_command('https://a', debug=True, drained=False)
+    assert f'--log-file={MPV_LOG_PATH}' not in mpv_command('https://a', drained=False)
+    mocker.patch('open_in_mpv.main.sys.frozen', new=True, create=True)
+    assert f'--log-file={MPV_LOG_PATH}' in mpv_command('https://a', debug=True)
+
+
+def test_get_callback_url_options(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.main.MPV_SOCKET')
+    mock_socket = mocker.patch('open_in_mpv.main.socket.socket')
+    get_callback('https://b/v.mp4', {}, url_options={'force-media-title': 'A'})()
+    data = mock_socket.return_value.send.call_args.args[0]
+    assert json.loads(data)['command'] == {
+        'name': 'loadfile',
+        'url': 'https://b/v.mp4',
+        'flags': 'replace',
+        'options': {
+            'force-media-title': 'A'
+        }
+    }
+
+
+def test_handle_message_multi_instance(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv import registry
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.registry.REGISTRY_PATH', tmp_path / 'registry.json')
+    mocker.patch('open_in_mpv.main.response')
+    mock_is_running = mocker.patch('open_in_mpv.main.instance.is_running')
+    mocker.patch('open_in_mpv.main.instance.write_owner')
+    mock_launch = mocker.patch('open_in_mpv.main.launch', return_value=os.getpid())
+    mock_spawn = mocker.patch('open_in_mpv.main.spawn')
+    handle_message(Request(url='https://a.com', single=False, max_instances=2), debug=False)
+    handle_message(Request(url='https://b.com', single=False, max_instances=2), debug=False)
+    first, second = (x.args[0] for x in mock_launch.call_args_list)
+    first_address, second_address = (next(y for y in x if y.startswith('--input-ipc-server='))
+                                      for x in (first, second))
+    assert first_address.startswith(f'--input-ipc-server={tmp_path}')
+    assert first_address != second_address
+    assert [x.pending for x in registry.entries()] == [False, False]
+    mock_is_running.assert_not_called()
+    handle_message(Request(url='https://c.com', single=False, max_instances=2), debug=False)
+    assert mock_launch.call_count == 2
+    mock_spawn.assert_called_once()
+    handle_message(Request(url='https://b.com/2', single=False, route='domain'), debug=False)
+    assert mock_launch.call_count == 2
+    assert registry.entries()[1].domain == 'b.com'
+    mock_launch.side_effect = OSError
+    with pytest.raises(OSError):  # ruff:ignore[pytest-raises-too-broad]
+        handle_message(Request(url='https://d.com', single=False), debug=False)
+    assert len(registry.entries()) == 2
+    with pytest.raises(ValueError, match='Invalid route'):
+        handle_message(Request(url='https://a.com', single=False, route='bad'), debug=False)
+
+
+def test_get_callback_socket_path(mocker: MockerFixture, tmp_path: Path) -> None:
+    socket_path = tmp_path / 'a.sock'
+    mock_wait = mocker.patch('open_in_mpv.main.instance.wait')
+    mock_socket = mocker.patch('open_in_mpv.main.socket.socket')
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init')
+    get_callback('https://a', {}, socket_path=socket_path)()
+    mock_wait.assert_called_once_with(socket_path, abstract=False)
+    mock_socket.return_value.connect.assert_called_once_with(str(socket_path))
+    mock_socket.return_value.connect.side_effect = OSError
+    get_callback('https://a', {}, socket_path=socket_path)()
+    assert mock_spawn_init.call_args.kwargs['socket_path'] == socket_path
+
+
+def test_mpv_and_cleanup_registered(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import mpv_and_cleanup
+    mocker.patch('open_in_mpv.main.MPV_LOG_PATH', tmp_path / 'mpv.log')
+    mocker.patch('open_in_mpv.main.sp.run')
+    mock_register = mocker.patch('open_in_mpv.registry.register')
+    mock_release = mocker.patch('open_in_mpv.registry.release')
+    socket_path = tmp_path / 'a.sock'
+    socket_path.touch()
+    mpv_and_cleanup('https://a', {}, socket_path=socket_path, registered=True)()
+    assert mock_register.call_args.args[0] == socket_path
+    mock_release.assert_called_once_with(socket_path)
+    assert not socket_path.exists()
+
+
+def test_spawn_init_pool_registered(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import spawn_init
+    mocker.patch('open_in_mpv.main.MPV_SOCKET', tmp_path / 'main.sock')
+    mock_claim = mocker.patch('open_in_mpv.main.pool.claim', return_value=True)
+    mocker.patch('open_in_mpv.main.pool.missing', return_value=0)
+    mocker.patch('open_in_mpv.main.instance.read_owner', return_value=(123, None))
+    mock_send = mocker.patch('open_in_mpv.main.batch.send')
+    mock_register = mocker.patch('open_in_mpv.registry.register')
+    socket_path = tmp_path / 'a.sock'
+    spawn_init('https://a', {}, pool_size=1, queue=['https://b'], socket_path=socket_path)
+    mock_claim.assert_called_once_with('https://a', None, target=socket_path)
+    assert mock_send.call_args.args[1] == socket_path
+    mock_register.assert_called_once_with(socket_path, 123)
+
+
+def test_spawn_init_extra_args(mocker: MockerFixture) -> None:
+    from open_in_mpv.main import spawn_init
+    mocker.patch('open_in_mpv.main.MPV_SOCKET')
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.main.instance.write_owner')
+    mock_claim = mocker.patch('open_in_mpv.main.pool.claim', return_value=False)
+    mocker.patch('open_in_mpv.main.pool.missing', return_value=1)
+    mocker.patch('open_in_mpv.main.pool.new_socket_path', return_value='/pool/a.sock')
+    mock_launch = mocker.patch('open_in_mpv.main.launch', return_value=123)
+    spawn_init('https://a', {},
+               pool_size=1,
+               extra_args=['--script=a.lua'],
+               url_options={'force-media-title': 'A'})
+    mock_claim.assert_called_once_with('https://a', {'force-media-title': 'A'}, target=None)
+    first, pooled = (x.args[0] for x in mock_launch.call_args_list)
+    assert '--script=a.lua' in first
+    assert first[-4:] == ['--{', '--force-media-title=A', 'https://a', '--}']
+    assert '--script=a.lua' in pooled
+
+
+def test_mpv_capabilities(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import mpv_capabilities
+    mocker.patch('open_in_mpv.main.capabilities.resolve', return_value=tmp_path / 'mpv')
+    mock_load = mocker.patch('open_in_mpv.main.capabilities.load', return_value=None)
+    mock_launch = mocker.patch('open_in_mpv.main.launch')
+    assert mpv_capabilities({'PATH': '/bin'}) is None
+    assert mock_launch.call_args.args[0][-1] == str(tmp_path / 'mpv')
+    mock_launch.side_effect = OSError
+    assert mpv_capabilities({}) is None
+    mock_load.return_value = caps = mocker.Mock()
+    mock_launch.reset_mock()
+    assert mpv_capabilities({}) is caps
+    mock_launch.assert_not_called()
+    mock_load.return_value = None
+    mocker.patch('open_in_mpv.main.sys.frozen', new=True, create=True)
+    assert mpv_capabilities({}) is None
+    mock_launch.assert_not_called()
+    mocker.patch('open_in_mpv.main.capabilities.resolve', return_value=None)
+    mock_load.reset_mock()
+    assert mpv_capabilities({}) is None
+    mock_load.assert_not_called()
+
+
+def test_mpv_command_capabilities() -> None:
+    from open_in_mpv.capabilities import Capabilities
+    from open_in_mpv.main import mpv_command
+    caps = Capabilities('/usr/bin/mpv', 0, 0, 'mpv 0.38.0',
+                        frozenset({'input-ipc-server', 'player-operation-mode', 'script'}))
+    cmd = mpv_command('https://a',
+                      extra_args=['--script=a.lua', '--new-option=1'],
+                      url_options={
+                          'force-media-title': 'A',
+                          'script': 'b.lua'
+                      },
+                      caps=caps)
+    assert '--gpu-api=opengl' not in cmd
+    assert '--player-operation-mode=pseudo-gui' in cmd
+    assert '--new-option=1' not in cmd
+    assert cmd[-5:] == ['--script=a.lua', '--{', '--script=b.lua', 'https://a', '--}']
+    cmd = mpv_command('https://a', url_options={'force-media-title': 'A'}, caps=caps)
+    assert cmd[-1] == 'https://a'
+
+
+def test_handle_message_launch_lock(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.main.instance.LaunchLock', LaunchLock)
+    mocker.patch('open_in_mpv.main.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init', return_value=None)
+    mock_get_callback = mocker.patch('open_in_mpv.main.get_callback')
+    mock_spawn = mocker.patch('open_in_mpv.main.spawn')
+    handle_message(Request(url='https://a'), debug=False)
+    handle_message(Request(url='https://b'), debug=False)
+    mock_spawn_init.assert_called_once()
+    mock_spawn.assert_called_once_with(mock_get_callback.return_value)
+    assert mock_get_callback.call_args.args[0] == 'https://b'
+    assert mock_get_callback.call_args.kwargs['starting'] is True
+    handle_message(Request(url='https://c', single=False), debug=False)
+    assert mock_spawn_init.call_count == 2
+
+
+def test_handle_message_launch_lock_stale(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.main.instance.LaunchLock', LaunchLock)
+    mocker.patch('open_in_mpv.main.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init', return_value=None)
+    mock_spawn = mocker.patch('open_in_mpv.main.spawn')
+    handle_message(Request(url='https://a'), debug=False)
+    # is_running() finds the socket of the instance that was started stale.
+    (tmp_path / 'mpv.sock').touch()
+    handle_message(Request(url='https://b'), debug=False)
+    assert mock_spawn_init.call_count == 2
+    mock_spawn.assert_not_called()
+
+
+def test_handle_message_launch_lock_started(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.main.instance.LaunchLock', LaunchLock)
+    mocker.patch('open_in_mpv.main.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.main.response')
+    mock_is_running = mocker.patch('open_in_mpv.main.instance.is_running',
+                                   side_effect=[False, True, False])
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init', return_value=None)
+    mocker.patch('open_in_mpv.main.get_callback')
+    mock_spawn = mocker.patch('open_in_mpv.main.spawn')
+    handle_message(Request(url='https://a'), debug=False)
+    handle_message(Request(url='https://b'), debug=False)
+    # The instance quit after it was seen running, so the next request starts another.
+    handle_message(Request(url='https://c'), debug=False)
+    assert mock_is_running.call_count == 3
+    assert mock_spawn_init.call_count == 2
+    mock_spawn.assert_called_once()
+
+
+def test_get_callback_starting(mocker: MockerFixture) -> None:
+    mpv_socket_path = mocker.patch('open_in_mpv.main.MPV_SOCKET')
+    mock_wait = mocker.patch('open_in_mpv.main.instance.wait')
+    mocker.patch('open_in_mpv.main.socket.socket')
+    get_callback('https://a', {})()
+    mock_wait.assert_not_called()
+    get_callback('https://a', {}, starting=True, abstract=True)()
+    mock_wait.assert_called_once_with(mpv_socket_path, abstract=True)
+
+
+def test_handle_message_debounce(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.recent.RECENT_PATH', tmp_path / 'recent.json')
+    mock_response = mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init')
+    handle_message(Request(url='https://youtu.be/a', debounce=1), debug=False)
+    handle_message(Request(url='https://www.youtube.com/watch?v=a&si=x', debounce=1),
+                   debug=False)
+    mock_spawn_init.assert_called_once()
+    assert mock_response.call_args.args[0]['duplicate'] is True
+    handle_message(Request(url='https://youtu.be/a', mode='append', debounce=1), debug=False)
+    handle_message(Request(url='https://youtu.be/a'), debug=False)
+    assert mock_spawn_init.call_count == 3
+    assert 'duplicate' not in mock_response.call_args.args[0]
+
+
+def test_handle_message_history(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.history import Update, connect, write
+    from open_in_mpv.main import Request, handle_message
+    path = tmp_path / 'history.sqlite3'
+    connection = connect(path)
+    write(connection, [Update('https://www.youtube.com/watch?v=a', 125.5, 600.0, None, 1, 1)])
+    connection.close()
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.main.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.history.HISTORY_PATH', path)
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mocker.patch('open_in_mpv.main.instance.companion_running', side_effect=[False, True])
+    mock_launch = mocker.patch('open_in_mpv.main.launch')
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init')
+    handle_message(Request(url='https://youtu.be/a', history=True), debug=False)
+    assert mock_spawn_init.call_args.kwargs['url_options'] == {'start': '125.5'}
+    assert mock_launch.call_args.args[0][-2:] == [
+        'open_in_mpv.recorder', str(tmp_path / 'mpv.sock')
+    ]
+    mock_launch.reset_mock()
+    mocker.patch('open_in_mpv.streams.lookup',
+                 return_value=mocker.Mock(stream='https://cdn/a.m3u8',
+                                          loadfile_options=lambda: {'force-media-title': 'A'}))
+    handle_message(Request(url='https://youtu.be/b', history=True, stream_cache=True),
+                   debug=False)
+    assert mock_spawn_init.call_args.args[0] == 'https://cdn/a.m3u8'
+    assert mock_spawn_init.call_args.kwargs['url_options'] == {
+        'force-media-title': 'A',
+        'script-opts-append': 'open_in_mpv-page=https://youtu.be/b'
+    }
+    mock_launch.assert_not_called()
+
+
+def test_handle_message_history_without_companions(mocker: MockerFixture,
+                                                   tmp_path: Path) -> None:
+    from open_in_mpv.history import Update, connect, write
+    from open_in_mpv.main import Request, handle_message
+    path = tmp_path / 'history.sqlite3'
+    connection = connect(path)
+    write(connection, [Update('https://www.youtube.com/watch?v=a', 125.5, 600.0, None, 1, 1)])
+    connection.close()
+    # No companion can be started on Windows, but the history still applies.
+    mocker.patch('open_in_mpv.main.IS_WIN', new=True)
+    mocker.patch('open_in_mpv.history.HISTORY_PATH', path)
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mock_launch = mocker.patch('open_in_mpv.main.launch')
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init')
+    handle_message(Request(url='https://youtu.be/a', history=True), debug=False)
+    assert mock_spawn_init.call_args.kwargs['url_options'] == {'start': '125.5'}
+    mock_launch.assert_not_called()
+
+
+def test_handle_message_telemetry(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.main.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mocker.patch('open_in_mpv.main.instance.companion_running', return_value=False)
+    mock_launch = mocker.patch('open_in_mpv.main.launch')
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init')
+    handle_message(Request(url='https://youtu.be/a', telemetry=True), debug=False)
+    assert 'url_options' not in mock_spawn_init.call_args.kwargs
+    assert mock_launch.call_args.args[0][-2:] == [
+        'open_in_mpv.collector', str(tmp_path / 'mpv.sock')
+    ]
+    mocker.patch('open_in_mpv.main.IS_WIN', new=True)
+    mock_launch.reset_mock()
+    handle_message(Request(url='https://youtu.be/a', telemetry=True, single=False), debug=False)
+    mock_launch.assert_not_called()
+
+
+def test_handle_message_tune_cache(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import Request, handle_message
+    from open_in_mpv.tuning import Profile
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.main.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mocker.patch('open_in_mpv.main.instance.companion_running', return_value=False)
+    mock_lookup = mocker.patch('open_in_mpv.tuning.lookup', return_value=Profile(2, 0, 0, 0))
+    mock_launch = mocker.patch('open_in_mpv.main.launch')
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init')
+    handle_message(Request(url='https://youtu.be/a', tune_cache=True), debug=False)
+    mock_lookup.assert_called_once_with('www.youtube.com')
+    assert mock_spawn_init.call_args.kwargs['url_options']['cache-secs'] == '10'
+    assert mock_launch.call_args.args[0][-4:] == [
+        'open_in_mpv.collector', str(tmp_path / 'mpv.sock'), '--no-telemetry', '--tune'
+    ]
+    mock_lookup.return_value = None
+    handle_message(Request(url='https://youtu.be/a', tune_cache=True, telemetry=True),
+                   debug=False)
+    assert 'url_options' not in mock_spawn_init.call_args.kwargs
+    assert mock_launch.call_args.args[0][-2:] == [str(tmp_path / 'mpv.sock'), '--tune']
+
+
+def test_handle_message_format_policy(mocker: MockerFixture, tmp_path: Path) -> None:
+    from open_in_mpv.main import Request, handle_message
+    mocker.patch('open_in_mpv.main.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.main.MPV_SOCKET', tmp_path / 'mpv.sock')
+    mocker.patch('open_in_mpv.main.response')
+    mocker.patch('open_in_mpv.main.instance.is_running', return_value=False)
+    mocker.patch('open_in_mpv.main.instance.companion_running', return_value=False)
+    mock_lookup = mocker.patch('open_in_mpv.formats.lookup', return_value={})
+    mocker.patch('open_in_mpv.formats.screen_height', return_value=1080)
+    mock_launch = mocker.patch('open_in_mpv.main.launch')
+    mock_spawn_init = mocker.patch('open_in_mpv.main.spawn_init')
+    handle_message(Request(url='https://youtu.be/a', format_policy=True), debug=False)
+    mock_lookup.assert_called_once_with('www.youtube.com')
+    assert mock_spawn_init.call_args.kwargs['url_options'] == {
+        'ytdl-format': 'bestvideo[height<=?1080]+bestaudio/best[height<=?1080]/best'
+    }
+    assert mock_launch.call_args.args[0][-2:] == ['--no-telemetry', '--formats']
+    mocker.patch('open_in_mpv.formats.screen_height', return_value=None)
+    handle_message(Request(url='https://youtu.be/a', format_policy=True), debug=False)
+    assert 'url_options' not in mock_spawn_init.call_args.kwargs
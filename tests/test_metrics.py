@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import math
+
+from open_in_mpv import metrics
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def test_timer(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.metrics.time.monotonic', side_effect=[10.0, 10.25, 11.0])
+    timer = metrics.Timer()
+    timer.mark('decode')
+    timer.mark('env')
+    assert timer.stages == {'decode': 250.0, 'env': 750.0}
+    assert timer.last == pytest.approx(11.0)
+
+
+def test_timer_browser(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.metrics.time.monotonic', side_effect=[10.0, 10.5, 10.5])
+    mocker.patch('open_in_mpv.metrics.time.time', return_value=1000.5)
+    timer = metrics.Timer()
+    timer.mark_browser(999_900)
+    assert timer.stages == {'browser': 100.0}
+    timer.mark_browser(2_000_000)
+    assert timer.stages == {'browser': 0.0}
+
+
+def test_write_read(tmp_path: Path) -> None:
+    path = tmp_path / 'log' / 'metrics.jsonl'
+    assert list(metrics.read(path)) == []
+    metrics.write({'decode': 1.5}, record_id='a', path=path)
+    with path.open('a', encoding='utf-8') as f:
+        f.write('not json\n[]\n')
+    metrics.write({'file_loaded': 20}, record_id='a', path=path)
+    records = list(metrics.read(path))
+    assert [x['stages'] for x in records] == [{'decode': 1.5}, {'file_loaded': 20}]
+    assert all(x['id'] == 'a' for x in records)
+
+
+def test_write_fails(tmp_path: Path) -> None:
+    path = tmp_path / 'file'
+    path.touch()
+    metrics.write({'decode': 1.5}, record_id='a', path=path / 'metrics.jsonl')
+
+
+def test_percentile() -> None:
+    values = list(range(1, 101))
+    assert metrics.percentile(values, 50) == 50
+    assert metrics.percentile(values, 95) == 95
+    assert metrics.percentile(values, 99) == 99
+    assert metrics.percentile([3.0], 99) == pytest.approx(3.0)
+    assert math.isnan(metrics.percentile([], 50))
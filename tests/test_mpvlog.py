@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import gzip
+import io
+import os
+
+from open_in_mpv import mpvlog
+from open_in_mpv.mpvlog import Drain
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def test_rotate(tmp_path: Path) -> None:
+    path = tmp_path / 'mpv.log'
+    mpvlog.rotate(path, max_bytes=4)
+    path.write_bytes(b'abc')
+    mpvlog.rotate(path, max_bytes=4)
+    assert path.read_bytes() == b'abc'
+    for data in (b'1111', b'2222', b'3333'):
+        path.write_bytes(data)
+        mpvlog.rotate(path, max_bytes=4, backups=2)
+    assert not path.exists()
+    assert gzip.decompress((tmp_path / 'mpv.log.1.gz').read_bytes()) == b'3333'
+    assert gzip.decompress((tmp_path / 'mpv.log.2.gz').read_bytes()) == b'2222'
+    assert not (tmp_path / 'mpv.log.3.gz').exists()
+    assert not (tmp_path / 'mpv.log.1').exists()
+    path.write_bytes(b'4444')
+    mpvlog.rotate(path, max_bytes=4, compress=False)
+    assert (tmp_path / 'mpv.log.1').read_bytes() == b'4444'
+    path.write_bytes(b'5555')
+    mpvlog.rotate(path, max_bytes=4, backups=0)
+    assert not path.exists()
+
+
+def _drain(data: bytes, path: Path, **kwargs: Any) -> Drain:
+    read_fd, write_fd = os.pipe()
+    drain = Drain(read_fd, path, **kwargs)
+    drain.start()
+    os.write(write_fd, data)
+    os.close(write_fd)
+    drain.close()
+    return drain
+
+
+def test_drain(tmp_path: Path) -> None:
+    data = b''.join(f'line {i:02}\n'.encode() for i in range(30))
+    logs = tmp_path / 'logs'
+    drain = _drain(data, logs / 'mpv.log', max_bytes=100, compress=False, interval=0.01)
+    assert drain.tail() == data
+    assert drain.dropped == 0
+    # Rotated after the first batch that took it past 100 bytes.
+    assert b''.join((logs / x).read_bytes() for x in ('mpv.log.3', 'mpv.log.2', 'mpv.log.1',
+                                                      'mpv.log') if (logs / x).exists()) == data
+    assert (logs / 'mpv.log.1').exists()
+
+
+def test_drain_ring(tmp_path: Path) -> None:
+    data = b''.join(f'line {i:02}\n'.encode() for i in range(30))
+    drain = _drain(data, tmp_path / 'mpv.log', ring_bytes=16)
+    assert drain.tail() == b'line 28\nline 29\n'
+    assert len((tmp_path / 'mpv.log').read_bytes()) + drain.dropped == len(data)
+
+
+def test_drain_write_error(mocker: MockerFixture, tmp_path: Path) -> None:
+    mock_exception = mocker.patch('open_in_mpv.mpvlog.log.exception')
+    (tmp_path / 'file').write_text('', encoding='utf-8')
+    assert _drain(b'a', tmp_path / 'file' / 'mpv.log').tail() == b'a'
+    mock_exception.assert_called_once()
+
+
+def test_write_crash_report(mocker: MockerFixture, tmp_path: Path) -> None:
+    drain = mocker.Mock(spec=Drain)
+    drain.tail.return_value = b'crash'
+    mpvlog.write_crash_report(drain, path=tmp_path / 'logs' / 'mpv-crash.log')
+    assert (tmp_path / 'logs' / 'mpv-crash.log').read_bytes() == b'crash'
+
+
+def test_main(mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.mpvlog.MPV_LOG_PATH', tmp_path / 'mpv.log')
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b'output\n')
+    os.close(write_fd)
+    mocker.patch('open_in_mpv.mpvlog.sys.stdin',
+                 io.TextIOWrapper(io.FileIO(read_fd), encoding='utf-8'))
+    mpvlog.main()
+    assert (tmp_path / 'mpv.log').read_bytes() == b'output\n'
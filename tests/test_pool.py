@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import json
+import socket
+
+from open_in_mpv import instance, pool
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+@pytest.fixture
+def pool_dir(mocker: MockerFixture, tmp_path: Path) -> Path:
+    mocker.patch('open_in_mpv.pool.MPV_POOL_DIR', tmp_path / 'pool')
+    mocker.patch('open_in_mpv.pool.MPV_SOCKET', tmp_path / 'main.sock')
+    return tmp_path / 'pool'
+
+
+def test_sockets_no_dir(pool_dir: Path) -> None:
+    assert pool.sockets() == []
+    assert pool.missing(2) == 2
+
+
+def test_new_socket_path(pool_dir: Path) -> None:
+    path = pool.new_socket_path()
+    assert path.parent == pool_dir
+    assert path.suffix == '.sock'
+    assert path != pool.new_socket_path()
+
+
+def test_instance_args() -> None:
+    args = pool.instance_args(30)
+    assert '--idle=yes' in args
+    assert '--force-window=no' in args
+    assert '--script-opts-append=open_in_mpv-pool-ttl=30' in args
+    assert any(x.startswith('--script=') and x.endswith('pool_ttl.lua') for x in args)
+
+
+def test_claim(pool_dir: Path, tmp_path: Path) -> None:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(pool.new_socket_path()))
+        server.listen(1)
+        assert pool.missing(2) == 1
+        assert pool.claim('https://example.com') is True
+        assert pool.sockets() == []
+        assert (tmp_path / 'main.sock').exists()
+        conn, _ = server.accept()
+        with conn:
+            data = conn.makefile('rb').read()
+    commands = [json.loads(x)['command'] for x in data.splitlines()]
+    assert commands == [['set_property', 'force-window', 'yes'],
+                        ['loadfile', 'https://example.com'], ['set_property', 'idle', 'once']]
+
+
+def test_claim_target(pool_dir: Path, tmp_path: Path) -> None:
+    target = tmp_path / 'instances' / 'a.sock'
+    target.parent.mkdir()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        path = pool.new_socket_path()
+        server.bind(str(path))
+        server.listen(1)
+        instance.write_owner(path, 123)
+        assert pool.claim('https://example.com', target=target) is True
+        assert target.exists()
+        assert not (tmp_path / 'main.sock').exists()
+        owner = instance.read_owner(target)
+        assert owner is not None
+        assert owner[0] == 123
+
+
+def test_claim_options(pool_dir: Path) -> None:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(pool.new_socket_path()))
+        server.listen(1)
+        assert pool.claim('https://b/v.mp4', {'force-media-title': 'A'}) is True
+        conn, _ = server.accept()
+        with conn:
+            data = conn.makefile('rb').read()
+    assert json.loads(data.splitlines()[1])['command'] == {
+        'name': 'loadfile',
+        'url': 'https://b/v.mp4',
+        'flags': 'replace',
+        'options': {
+            'force-media-title': 'A'
+        }
+    }
+
+
+def test_claim_dead_instance(pool_dir: Path, tmp_path: Path) -> None:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(pool.new_socket_path()))
+    assert pool.claim('https://example.com') is False
+    assert not (tmp_path / 'main.sock').exists()
+
+
+def test_claim_already_claimed(pool_dir: Path, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.pool.sockets', return_value=[pool_dir / 'gone.sock'])
+    assert pool.claim('https://example.com') is False
+
+
+def test_claim_moves_owner(pool_dir: Path, tmp_path: Path) -> None:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        path = pool.new_socket_path()
+        server.bind(str(path))
+        server.listen(1)
+        instance.write_owner(path, 123)
+        (pool_dir / 'gone.sock.owner').touch()
+        assert pool.missing(1) == 0
+        assert not (pool_dir / 'gone.sock.owner').exists()
+        assert pool.claim('https://example.com') is True
+        assert instance.read_owner(tmp_path / 'main.sock') is not None
+        assert not instance.owner_path(path).exists()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+import json
+
+from open_in_mpv import recent
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def test_key() -> None:
+    key = recent.key(['https://www.youtube.com/watch?v=a&si=x', 'https://b'])
+    assert key == recent.key(['https://youtu.be/a', 'https://b/'])
+    assert key.startswith('replace 2 ')
+    assert key.endswith(' https://www.youtube.com/watch?v=a')
+    assert key != recent.key(['https://youtu.be/a', 'https://b/'], mode='append')
+    assert key != recent.key(['https://youtu.be/a', 'https://c/'])
+    assert recent.key([], playlist='/a.m3u') == recent.key([], playlist='/a.m3u')
+    assert recent.key([], playlist='/a.m3u') != recent.key([], playlist='/b.m3u')
+    assert recent.key([], playlist='HTTPS://a/l.m3u') == recent.key([],
+                                                                    playlist='https://a/l.m3u')
+
+
+def test_seen(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'run' / 'recent.json'
+    mock_time = mocker.patch('open_in_mpv.recent.time.time', return_value=100.0)
+    assert not recent.seen('a', 1, path=path)
+    assert recent.seen('a', 1, path=path)
+    assert not recent.seen('b', 1, path=path)
+    mock_time.return_value = 100.5
+    assert recent.seen('a', 1, path=path)
+    mock_time.return_value = 101.0
+    assert not recent.seen('a', 1, path=path)
+    assert json.loads(path.read_text(encoding='utf-8')) == {'a': 101.0}
+
+
+def test_seen_time_after_lock(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'recent.json'
+    mock_time = mocker.patch('open_in_mpv.recent.time.time', return_value=100.0)
+    assert not recent.seen('a', 1, path=path)
+    mock_time.return_value = 99.0
+
+    def flock(*args: object) -> None:
+        # The process that held the lock recorded 'a' at 100 while this one waited.
+        mock_time.return_value = 100.2
+
+    mocker.patch('open_in_mpv.recent.fcntl.flock', side_effect=flock)
+    assert recent.seen('a', 1, path=path)
+
+
+def test_seen_limit(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'recent.json'
+    mocker.patch('open_in_mpv.recent.MAX_ENTRIES', 2)
+    mock_time = mocker.patch('open_in_mpv.recent.time.time', return_value=100.0)
+    for i, x in enumerate('abc'):
+        mock_time.return_value = 100.0 + i / 10
+        recent.seen(x, 10, path=path)
+    assert set(json.loads(path.read_text(encoding='utf-8'))) == {'b', 'c'}
+
+
+def test_seen_invalid(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'recent.json'
+    path.write_text('{', encoding='utf-8')
+    assert not recent.seen('a', 1, path=path)
+    path.write_text('[]', encoding='utf-8')
+    assert not recent.seen('a', 1, path=path)
+    path.write_text('{"a": "x"}', encoding='utf-8')
+    assert not recent.seen('a', 1, path=path)
+    mocker.patch('pathlib.Path.mkdir', side_effect=PermissionError)
+    assert not recent.seen('a', 1, path=tmp_path / 'ro' / 'recent.json')
+
+
+def test_seen_concurrent(tmp_path: Path) -> None:
+    path = tmp_path / 'recent.json'
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: recent.seen('a', 10, path=path), range(8)))
+    assert results.count(False) == 1
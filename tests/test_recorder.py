@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from open_in_mpv import history, recorder
+from open_in_mpv.history import Update
+from open_in_mpv.recorder import Recorder
+
+if TYPE_CHECKING:
+    from unittest.mock import Mock
+
+    from pytest_mock import MockerFixture
+
+
+def _updates(writer: Mock) -> list[tuple[str, float | None, float | None, int]]:
+    return [(x.url, x.position, x.start_ms, x.plays)
+            for x in (y.args[0] for y in writer.put.call_args_list)]
+
+
+def test_recorder(mocker: MockerFixture) -> None:
+    writer = mocker.Mock(spec=history.Writer)
+    rec = Recorder(writer, interval=0)
+    rec.property_change('time-pos', 5.0)
+    rec.event({'event': 'playback-restart'})
+    rec.file_loaded({'path': '/home/user/a.mkv'})
+    rec.property_change('time-pos', 5.0)
+    writer.put.assert_not_called()
+    rec.event({'event': 'start-file'})
+    rec.file_loaded({'path': 'https://youtu.be/b'})
+    rec.event({'event': 'playback-restart'})
+    rec.property_change('time-pos', None)
+    rec.property_change('duration', 600.0)
+    rec.property_change('time-pos', 30.0)
+    rec.event({'event': 'end-file', 'reason': 'eof'})
+    url = 'https://www.youtube.com/watch?v=b'
+    updates = _updates(writer)
+    assert updates[0] == (url, None, None, 1)
+    assert updates[1][:2] == (url, None)
+    assert updates[1][2] is not None
+    assert updates[2:] == [(url, 30.0, None, 0), (url, 0.0, None, 0)]
+    assert rec.url is None
+
+
+def test_recorder_close(mocker: MockerFixture) -> None:
+    writer = mocker.Mock(spec=history.Writer)
+    rec = Recorder(writer, interval=60)
+    rec.file_loaded({'path': 'https://a/'})
+    rec.property_change('time-pos', 30.0)
+    rec.event({'event': 'end-file', 'reason': 'quit'})
+    rec.file_loaded({'path': 'https://b/'})
+    rec.property_change('time-pos', 40.0)
+    rec.close()
+    assert [x.args[0] for x in writer.put.call_args_list][1::2] == [
+        Update('https://a/', 30.0, updated=mocker.ANY),
+        Update('https://b/', 40.0, updated=mocker.ANY)
+    ]
+    writer.close.assert_called_once()
+
+
+def test_main(mocker: MockerFixture) -> None:
+    mock_run = mocker.patch('open_in_mpv.recorder.companion.run')
+    mock_writer = mocker.patch('open_in_mpv.recorder.history.Writer')
+    recorder.main(['@mpv'])
+    name, address, factory = mock_run.call_args.args
+    assert (name, address) == ('recorder', '@mpv')
+    assert factory().writer is mock_writer.return_value
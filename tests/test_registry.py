@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+import json
+import os
+
+from open_in_mpv import registry
+from open_in_mpv.registry import Entry
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def _entry(socket: str, **kwargs: object) -> Entry:
+    return Entry(socket, os.getpid(), **kwargs)  # type: ignore[arg-type]
+
+
+@pytest.mark.parametrize(('url', 'expected'), [('https://www.Example.com/a', 'example.com'),
+                                               ('https://youtu.be/x', 'youtu.be'),
+                                               ('file:///a', None), (None, None)])
+def test_domain(url: str | None, expected: str | None) -> None:
+    assert registry.domain(url) == expected
+
+
+def test_choose() -> None:
+    a = _entry('a', last_used=1, items=5, domain='a.com')
+    b = _entry('b', last_used=2, items=1, domain='b.com')
+    pending = _entry('c', last_used=0, items=0, pending=True)
+    entries = [a, b, pending]
+    assert registry.choose([], 'https://a.com') is None
+    assert registry.choose(entries, 'https://a.com') is None
+    assert registry.choose(entries, 'https://a.com', max_instances=4) is None
+    assert registry.choose(entries, 'https://a.com', max_instances=3) == a
+    assert registry.choose(entries, 'https://x.com', policy='lru') == a
+    assert registry.choose(entries, 'https://x.com', policy='fewest') == b
+    assert registry.choose(entries, 'https://b.com', policy='domain') == b
+    assert registry.choose(entries, 'https://x.com', policy='domain') is None
+    assert registry.choose(entries, 'https://x.com', policy='domain', max_instances=2) == a
+    assert registry.choose([pending], 'https://x.com', policy='lru') == pending
+    assert registry.choose([pending], 'https://x.com', max_instances=1) == pending
+    assert registry.choose([], 'https://x.com', policy='lru') is None
+
+
+def test_route_register_release(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'registry.json'
+    socket_path, new = registry.route('https://a.com/1', items=2, path=path)
+    assert new
+    assert socket_path.parent == tmp_path
+    entry = registry.entries(path)[0]
+    assert entry.pending
+    assert (entry.items, entry.domain) == (2, 'a.com')
+    registry.register(socket_path, os.getpid(), path=path)
+    assert not registry.entries(path)[0].pending
+    assert registry.route('https://b.com/1', policy='lru', replace=False,
+                          path=path) == (socket_path, False)
+    entry = registry.entries(path)[0]
+    assert (entry.items, entry.domain) == (3, 'b.com')
+    registry.route('https://b.com/1', policy='fewest', items=1, path=path)
+    assert registry.entries(path)[0].items == 1
+    registry.release(socket_path, path=path)
+    assert registry.entries(path) == []
+    registry.register(tmp_path / 'other.sock', os.getpid(), path=path)
+    assert [x.socket for x in registry.entries(path)] == [str(tmp_path / 'other.sock')]
+
+
+def test_route_removes_dead(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / 'registry.json'
+    dead = tmp_path / 'dead.sock'
+    dead.touch()
+    path.write_text(json.dumps({'instances': [Entry(str(dead), 1, -1)._asdict()]}))
+    assert registry.entries(path) == []
+    _, new = registry.route('https://a.com', policy='lru', path=path)
+    assert new
+    assert not dead.exists()
+    assert len(json.loads(path.read_text())['instances']) == 1
+
+
+def test_route_invalid_registry(tmp_path: Path) -> None:
+    path = tmp_path / 'registry.json'
+    path.write_text('[]')
+    assert registry.entries(path) == []
+    registry.route('https://a.com', path=path)
+    assert len(registry.entries(path)) == 1
+
+
+def test_route_concurrent_cap(tmp_path: Path) -> None:
+    path = tmp_path / 'registry.json'
+    with ThreadPoolExecutor(8) as executor:
+        results = list(
+            executor.map(lambda _: registry.route('https://a.com', max_instances=2, path=path),
+                         range(8)))
+    assert sum(new for _, new in results) == 2
+    assert len({x for x, _ in results}) == 2
+    assert len(registry.entries(path)) == 2
+
+
+def test_wait(tmp_path: Path, mocker: MockerFixture) -> None:
+    mock_wait = mocker.patch('open_in_mpv.registry.instance.wait', return_value=True)
+    socket_path = tmp_path / 'a.sock'
+    assert registry.wait(socket_path, 1) is True
+    mock_wait.assert_called_once_with(socket_path, 1)
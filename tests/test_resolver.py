@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any
+import json
+import socket
+import sys
+import threading
+
+from open_in_mpv import resolver
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+class DownloadError(Exception):
+    pass
+
+
+@pytest.fixture
+def yt_dlp(mocker: MockerFixture) -> Any:
+    module = mocker.MagicMock()
+    module.utils.DownloadError = DownloadError
+    module.parse_options.return_value = SimpleNamespace(ydl_opts={
+        'dump_single_json': True,
+        'format': 'best'
+    },
+                                                        urls=['https://example.com/v'])
+    client = module.YoutubeDL.return_value
+    client.extract_info.return_value = {'id': 'v'}
+    client.sanitize_info.side_effect = lambda x: x
+    mocker.patch.dict(sys.modules, {'yt_dlp': module, 'yt_dlp.extractor': module.extractor})
+    return module
+
+
+def test_resolve(yt_dlp: Any) -> None:
+    r = resolver.Resolver(workers=1)
+    assert r.resolve(['-J', '--', 'https://example.com/v']) == {
+        'code': 0,
+        'stdout': '{"id": "v"}\n',
+        'stderr': ''
+    }
+    assert r.resolve(['-J', '--', 'https://example.com/v'])['code'] == 0
+    yt_dlp.YoutubeDL.assert_called_once()
+    assert yt_dlp.YoutubeDL.call_args.args[0]['format'] == 'best'
+    yt_dlp.parse_options.assert_called_with(['-J', '--', 'https://example.com/v'])
+
+
+def test_resolve_error(yt_dlp: Any) -> None:
+    def extract_info(url: str, *, download: bool) -> None:
+        yt_dlp.YoutubeDL.call_args.args[0]['logger'].error('ERROR: Unsupported URL')
+        raise DownloadError
+
+    yt_dlp.YoutubeDL.return_value.extract_info.side_effect = extract_info
+    assert resolver.Resolver(workers=1).resolve(['-J', 'https://example.com/v']) == {
+        'code': 1,
+        'stdout': '',
+        'stderr': 'ERROR: Unsupported URL\n'
+    }
+    yt_dlp.YoutubeDL.return_value.extract_info.side_effect = None
+    yt_dlp.YoutubeDL.return_value.extract_info.return_value = None
+    assert resolver.Resolver(workers=1).resolve(['-J', 'https://example.com/v'])['code'] == 1
+
+
+def test_resolve_fallback(yt_dlp: Any) -> None:
+    r = resolver.Resolver(workers=1)
+    yt_dlp.parse_options.side_effect = SystemExit(2)
+    assert r.resolve(['--bad']) == {'fallback': True}
+    yt_dlp.parse_options.side_effect = None
+    yt_dlp.parse_options.return_value = SimpleNamespace(ydl_opts={}, urls=['https://a'])
+    assert r.resolve(['https://a']) == {'fallback': True}
+    yt_dlp.parse_options.return_value = SimpleNamespace(ydl_opts={'dump_single_json': True},
+                                                        urls=['https://a', 'https://b'])
+    assert r.resolve(['-J', 'https://a', 'https://b']) == {'fallback': True}
+
+
+def test_resolve_bounded_clients(yt_dlp: Any, mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.resolver._MAX_CLIENTS_PER_THREAD', new=2)
+    r = resolver.Resolver(workers=1)
+    for i in range(3):
+        yt_dlp.parse_options.return_value = SimpleNamespace(ydl_opts={
+            'dump_single_json': True,
+            'format': str(i)
+        },
+                                                            urls=['https://a'])
+        r.resolve(['-J', 'https://a'])
+    assert yt_dlp.YoutubeDL.call_count == 3
+    assert yt_dlp.YoutubeDL.return_value.close.call_count == 2
+
+
+def test_handle(yt_dlp: Any) -> None:
+    r = resolver.Resolver(workers=1, max_pending=1)
+    assert r.slots.acquire(blocking=False)
+    server, client = socket.socketpair()
+    with client:
+        client.sendall(b'{"args": ["-J", "https://example.com/v"]}\n')
+        r.handle(server)
+        assert json.loads(client.makefile('rb').readline())['code'] == 0
+    assert r.slots.acquire(blocking=False)
+
+
+@pytest.mark.parametrize('data', [b'not json\n', b'[]\n', b'{"args": "x"}\n'])
+def test_handle_invalid(yt_dlp: Any, data: bytes) -> None:
+    r = resolver.Resolver(workers=1)
+    r.slots.acquire()
+    server, client = socket.socketpair()
+    with client:
+        client.sendall(data)
+        r.handle(server)
+        assert json.loads(client.makefile('rb').readline()) == {'fallback': True}
+    yt_dlp.parse_options.assert_not_called()
+
+
+def test_handle_probe(yt_dlp: Any, mocker: MockerFixture) -> None:
+    mock_log = mocker.patch('open_in_mpv.resolver.log')
+    r = resolver.Resolver(workers=1, max_pending=1)
+    assert r.slots.acquire(blocking=False)
+    server, client = socket.socketpair()
+    client.close()
+    r.handle(server)
+    mock_log.warning.assert_not_called()
+    mock_log.exception.assert_not_called()
+    assert r.slots.acquire(blocking=False)
+
+
+def test_handle_exception(yt_dlp: Any) -> None:
+    yt_dlp.YoutubeDL.return_value.extract_info.side_effect = RuntimeError
+    r = resolver.Resolver(workers=1, max_pending=1)
+    r.slots.acquire()
+    server, client = socket.socketpair()
+    with client:
+        client.sendall(b'{"args": ["-J", "https://example.com/v"]}\n')
+        r.handle(server)
+        assert client.makefile('rb').readline() == b''
+    assert r.slots.acquire(blocking=False)
+
+
+def test_serve(yt_dlp: Any, mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.resolver._ACCEPT_TIMEOUT', new=0.05)
+    yt_dlp.extractor.gen_extractor_classes.return_value = [mocker.MagicMock()]
+    path = tmp_path / 'resolver.sock'
+    r = resolver.Resolver(workers=1, max_pending=2)
+    thread = threading.Thread(target=r.serve, args=(path,), kwargs={'idle_timeout': 0.5})
+    thread.start()
+    try:
+        while not resolver.is_running(path):
+            pass
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(path))
+            sock.sendall(b'{"args": ["-J", "https://example.com/v"]}\n')
+            assert json.loads(sock.makefile('rb').readline())['stdout'] == '{"id": "v"}\n'
+        # Waits for the connection made by is_running() to be handled.
+        r.slots.acquire()
+        r.slots.acquire()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(path))
+            assert json.loads(sock.makefile('rb').readline()) == {'fallback': True}
+    finally:
+        thread.join(5)
+    assert not thread.is_alive()
+    assert not path.exists()
+    yt_dlp.extractor.gen_extractor_classes.return_value[0].suitable.assert_called_once()
+
+
+def test_is_running(tmp_path: Path) -> None:
+    path = tmp_path / 'resolver.sock'
+    assert resolver.is_running(path) is False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(path))
+        server.listen(1)
+        assert resolver.is_running(path) is True
+
+
+def test_command() -> None:
+    assert resolver.command() == [sys.executable, '-m', 'open_in_mpv.resolver']
+
+
+def test_shim_path(mocker: MockerFixture) -> None:
+    mock_which = mocker.patch('open_in_mpv.resolver.which', return_value='/venv/bin/shim')
+    assert resolver.shim_path() == '/venv/bin/shim'
+    assert mock_which.call_args.args[0] == 'open-in-mpv-ytdl'
+
+
+def test_main(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.resolver.logging.basicConfig')
+    mocker.patch('open_in_mpv.resolver.importlib.util.find_spec', return_value=None)
+    with pytest.raises(SystemExit):
+        resolver.main()
+    mocker.patch('open_in_mpv.resolver.importlib.util.find_spec')
+    mocker.patch('open_in_mpv.resolver.is_running', return_value=True)
+    mock_resolver = mocker.patch('open_in_mpv.resolver.Resolver')
+    resolver.main()
+    mock_resolver.assert_not_called()
+    mocker.patch('open_in_mpv.resolver.is_running', return_value=False)
+    resolver.main()
+    mock_resolver.return_value.serve.assert_called_once_with()
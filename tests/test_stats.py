@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from open_in_mpv import metrics, telemetry
+from open_in_mpv.stats import main
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from click.testing import CliRunner
+
+
+def test_stats(runner: CliRunner, tmp_path: Path) -> None:
+    path = tmp_path / 'metrics.jsonl'
+    for i in range(1, 101):
+        metrics.write({'decode': i, 'spawn': i * 2}, record_id=str(i), path=path)
+    metrics.append({'id': 'x', 'stages': {'custom': 1, 'file_loaded': 'x'}}, path)
+    result = runner.invoke(main, ['-f', str(path)])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0].split() == ['stage', 'count', 'p50', 'p95', 'p99']
+    assert lines[1].split() == ['decode', '100', '50.0', '95.0', '99.0']
+    assert lines[2].split() == ['spawn', '100', '100.0', '190.0', '198.0']
+    assert lines[3].split()[0] == 'custom'
+    result = runner.invoke(main, ['-f', str(path), '-n', '2'])
+    assert result.output.splitlines()[1].split() == ['decode', '1', '100.0', '100.0', '100.0']
+
+
+def test_stats_empty(runner: CliRunner, tmp_path: Path) -> None:
+    result = runner.invoke(main, ['-f', str(tmp_path / 'metrics.jsonl')])
+    assert result.exit_code == 1
+    assert 'No metrics' in result.output
+
+
+def test_stats_telemetry(runner: CliRunner, tmp_path: Path) -> None:
+    path = tmp_path / 'telemetry.jsonl'
+    result = runner.invoke(main, ['-t', '-f', str(path)])
+    assert result.exit_code == 1
+    assert 'No telemetry' in result.output
+    for site, stalls in (('a.example', 1), ('b.example', 2), ('a.example', 3)):
+        telemetry.write({
+            'machine': 'box',
+            'site': site,
+            'format': 'h264 720p',
+            'sessions': 1,
+            'stalls': stalls
+        },
+                        path=path)
+    result = runner.invoke(main, ['-t', '-f', str(path)])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0].split()[:5] == ['machine', 'site', 'format', 'sessions', 'seconds']
+    assert lines[1].split()[:7] == ['box', 'a.example', 'h264', '720p', '2', '0', '4']
+    result = runner.invoke(main, ['-t', '-f', str(path), '-n', '1'])
+    assert len(result.output.splitlines()) == 2
+    result = runner.invoke(main, ['-t', '-f', str(path), '--prometheus'])
+    assert ('open_in_mpv_stalls_total{machine="box",site="b.example",format="h264 720p"} 2'
+            in result.output.splitlines())
+    output = tmp_path / 'open_in_mpv.prom'
+    result = runner.invoke(main, ['-t', '-f', str(path), '--prometheus', '-o', str(output)])
+    assert not result.output
+    assert output.read_text(encoding='utf-8') == telemetry.prometheus(telemetry.read(path))
+    assert set(tmp_path.iterdir()) == {path, output}
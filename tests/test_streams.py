@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import json
+import os
+import sys
+
+from open_in_mpv import streams
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+NOW = 1_700_000_000.0
+
+
+def test_expiry() -> None:
+    assert streams.expiry('https://r1.googlevideo.com/videoplayback?expire=1700003600&ei=x') == (
+        1700003600)
+    assert streams.expiry('https://cdn.example.com/a.m3u8?Expires=1700000900&Signature=x') == (
+        1700000900)
+    assert streams.expiry('https://manifest.googlevideo.com/api/manifest/hls/expire/1700001000/'
+                          'ei/x/index.m3u8') == 1700001000
+    assert streams.expiry('edl://%60%https://a/?expire=1700002000;%60%https://b/?expire=1700001500'
+                          ) == 1700001500
+    assert streams.expiry('https://cdn.example.com/a.mp4?hdnts=exp=1700000500~hmac=x') == 1700000500
+    assert streams.expiry('https://cdn.example.com/a.mp4?expire=12') is None
+    assert streams.expiry('https://cdn.example.com/a.mp4') is None
+
+
+def test_store_lookup(tmp_path: Path) -> None:
+    stream = 'https://r1.googlevideo.com/videoplayback?expire=1700003600'
+    entry = streams.store('https://youtu.be/abc',
+                          stream,
+                          headers=['User-Agent: a, b', 'Referer: https://x'],
+                          ytdl_format='bv+ba',
+                          title='Title',
+                          cache_dir=tmp_path,
+                          now=NOW)
+    assert entry is not None
+    assert entry.url == 'https://www.youtube.com/watch?v=abc'
+    assert entry.expires == 1700003600 - streams.EXPIRY_MARGIN
+    hit = streams.lookup('https://www.youtube.com/watch?v=abc&si=x',
+                         ytdl_format='bv+ba',
+                         cache_dir=tmp_path,
+                         now=NOW)
+    assert hit == entry
+    assert hit.loadfile_options() == {
+        'http-header-fields': r'User-Agent: a\, b,Referer: https://x',
+        'force-media-title': 'Title'
+    }
+    assert streams.lookup('https://youtu.be/abc', ytdl_format='best', cache_dir=tmp_path,
+                          now=NOW) is None
+    assert streams.lookup('https://youtu.be/abc', cache_dir=tmp_path, now=NOW) is None
+    assert streams.lookup('https://youtu.be/other', cache_dir=tmp_path, now=NOW) is None
+    # Another format gets its own entry instead of replacing the first.
+    other = streams.store('https://youtu.be/abc', stream, cache_dir=tmp_path, now=NOW)
+    assert streams.lookup('https://youtu.be/abc', cache_dir=tmp_path, now=NOW) == other
+    assert streams.lookup('https://youtu.be/abc', ytdl_format='bv+ba', cache_dir=tmp_path,
+                          now=NOW) == entry
+    # The headers may hold cookies.
+    assert {x.stat().st_mode & 0o777 for x in tmp_path.iterdir()} == {0o600}
+
+
+def test_lookup_expired(tmp_path: Path) -> None:
+    assert streams.store('https://a', 'https://b/v.mp4', cache_dir=tmp_path, now=NOW) is not None
+    last = NOW + streams.DEFAULT_TTL - 1
+    assert streams.lookup('https://a', cache_dir=tmp_path, now=last) is not None
+    assert streams.lookup('https://a', cache_dir=tmp_path, now=NOW + streams.DEFAULT_TTL) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_store_expires_too_soon(tmp_path: Path) -> None:
+    assert streams.store('https://a', f'https://b/v.mp4?expire={int(NOW) + 60}',
+                         cache_dir=tmp_path,
+                         now=NOW) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_store_write_error(mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.streams.os.open', side_effect=OSError)
+    assert streams.store('https://a', 'https://b/v.mp4', cache_dir=tmp_path, now=NOW) is None
+    assert not list(tmp_path.iterdir())
+
+
+def test_lookup_invalid(tmp_path: Path) -> None:
+    streams.store('https://a', 'https://b/v.mp4', cache_dir=tmp_path, now=NOW)
+    path = next(tmp_path.iterdir())
+    path.write_text('{"unknown": 1}', encoding='utf-8')
+    assert streams.lookup('https://a', cache_dir=tmp_path, now=NOW) is None
+    assert not path.exists()
+
+
+def test_lookup_marks_recently_used(tmp_path: Path) -> None:
+    for i in range(3):
+        streams.store(f'https://a/{i}', 'https://b/v.mp4', cache_dir=tmp_path, now=NOW)
+    for i, path in enumerate(sorted(tmp_path.iterdir())):
+        os.utime(path, (NOW + i, NOW + i))
+    oldest = min(tmp_path.iterdir(), key=lambda x: x.stat().st_mtime)
+    url = json.loads(oldest.read_text(encoding='utf-8'))['url']
+    assert streams.lookup(url, cache_dir=tmp_path, now=NOW) is not None
+    assert streams.prune(2, cache_dir=tmp_path) == 1
+    assert oldest.exists()
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_store_prunes(mocker: MockerFixture, tmp_path: Path) -> None:
+    mocker.patch('open_in_mpv.streams.MAX_ENTRIES', new=2)
+    mock_prune = mocker.patch('open_in_mpv.streams.prune')
+    streams.store('https://a', 'https://b/v.mp4', cache_dir=tmp_path, now=NOW)
+    mock_prune.assert_called_once_with(cache_dir=tmp_path)
+
+
+def test_prune_missing_dir(tmp_path: Path) -> None:
+    assert streams.prune(cache_dir=tmp_path / 'missing') == 0
+
+
+def test_script_args() -> None:
+    assert streams.script_args() == [
+        f'--script={streams.SCRIPT_PATH}',
+        f'--script-opts-append=open_in_mpv-python={sys.executable}'
+    ]
+    assert streams.SCRIPT_PATH.exists()
+
+
+def test_main(mocker: MockerFixture) -> None:
+    mock_store = mocker.patch('open_in_mpv.streams.store')
+    streams.main([
+        json.dumps({
+            'url': 'https://a',
+            'stream': 'https://b',
+            'headers': ['Referer: https://a'],
+            'format': '',
+            'title': 'T'
+        })
+    ])
+    mock_store.assert_called_once_with('https://a',
+                                       'https://b',
+                                       headers=['Referer: https://a'],
+                                       ytdl_format='',
+                                       title='T')
+    streams.main([json.dumps({'url': 'https://a', 'stream': 'https://b', 'headers': {}})])
+    assert mock_store.call_args.kwargs['headers'] == ()
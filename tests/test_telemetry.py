@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from open_in_mpv import telemetry
+from open_in_mpv.telemetry import Session
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def test_session(mocker: MockerFixture) -> None:
+    mock_monotonic = mocker.patch('open_in_mpv.telemetry.time.monotonic', return_value=100.0)
+    session = Session('https://www.youtube.com/watch?v=a', 'vp9 1080p', 'vaapi')
+    for name, value in (('frame-drop-count', 3), ('frame-drop-count', None),
+                        ('decoder-frame-drop-count', 2), ('demuxer-cache-duration', 10.0),
+                        ('demuxer-cache-duration', 2.0), ('cache-speed', 1000.0),
+                        ('cache-speed', 500), ('paused-for-cache', True),
+                        ('paused-for-cache', True), ('video-bitrate', 1000.0),
+                        ('audio-bitrate', 200.0)):
+        session.update(name, value)
+    mock_monotonic.return_value = 101.5
+    session.update('paused-for-cache', False)  # ruff:ignore[boolean-positional-value-in-call]
+    session.update('paused-for-cache', True)  # ruff:ignore[boolean-positional-value-in-call]
+    mock_monotonic.return_value = 102.0
+    record = session.record('box')
+    assert {k: v for k, v in record.items() if k != 'time'} == {
+        'machine': 'box',
+        'site': 'www.youtube.com',
+        'format': 'vp9 1080p',
+        'hwdec': 'vaapi',
+        'sessions': 1,
+        'seconds': 2.0,
+        'stalls': 2,
+        'stall_seconds': 2.0,
+        'frame_drops': 3,
+        'decoder_frame_drops': 2,
+        'cache_min': 2.0,
+        'cache_mean': 6.0,
+        'cache_speed_max': 1000.0,
+        'cache_speed_mean': 750.0,
+        'bitrate_mean': 1100.0
+    }
+    assert Session('/home/user/a.mkv').record()['site'] == 'local'
+    assert Session('/home/user/a.mkv').record()['cache_mean'] is None
+    assert Session('/home/user/a.mkv').record()['bitrate_mean'] is None
+
+
+def test_write_read(tmp_path: Path) -> None:
+    path = tmp_path / 'logs' / 'telemetry.jsonl'
+    assert list(telemetry.read(path)) == []
+    telemetry.write({'site': 'a'}, path=path)
+    with path.open('a', encoding='utf-8') as f:
+        f.write('{\n[]\n')
+    telemetry.write({'site': 'b'}, path=path)
+    assert list(telemetry.read(path)) == [{'site': 'a'}, {'site': 'b'}]
+
+
+def test_summarise() -> None:
+    records = [{
+        'machine': 'm',
+        'site': 'b',
+        'format': 'f',
+        'sessions': 1,
+        'stalls': 2,
+        'stall_seconds': 1.5
+    }, {
+        'machine': 'm',
+        'site': 'a',
+        'sessions': 1,
+        'frame_drops': 'x'
+    }, {
+        'machine': 'm',
+        'site': 'b',
+        'format': 'f',
+        'sessions': 1,
+        'stalls': 1,
+        'stall_seconds': 0.25
+    }]
+    groups = telemetry.summarise(records)
+    assert list(groups) == [('m', 'a', ''), ('m', 'b', 'f')]
+    assert groups['m', 'a', '']['frame_drops'] == 0
+    assert groups['m', 'b', 'f'] == {
+        'sessions': 2,
+        'seconds': 0,
+        'stalls': 3,
+        'stall_seconds': 1.75,
+        'frame_drops': 0,
+        'decoder_frame_drops': 0
+    }
+
+
+def test_prometheus() -> None:
+    text = telemetry.prometheus([{
+        'machine': 'm',
+        'site': 'a"b',
+        'format': 'vp9 1080p',
+        'sessions': 1,
+        'stall_seconds': 0.1 + 0.2
+    }])
+    lines = text.splitlines()
+    assert lines[:2] == [
+        '# HELP open_in_mpv_sessions_total Files played.',
+        '# TYPE open_in_mpv_sessions_total counter'
+    ]
+    assert lines[2] == 'open_in_mpv_sessions_total{machine="m",site="a\\"b",format="vp9 1080p"} 1'
+    assert lines[-7] == (
+        'open_in_mpv_stall_seconds_total{machine="m",site="a\\"b",format="vp9 1080p"} 0.3')
+    assert text.endswith('\n')
+    assert telemetry.prometheus([]).count('\n') == 2 * len(telemetry.COUNTERS)
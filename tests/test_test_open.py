@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 from typing import TYPE_CHECKING
+import io
 
-from open_in_mpv.test_open import main
+from open_in_mpv.codec import encode
+from open_in_mpv.test_open import SETTLE_TIME, Result, count_instances, main, send, snapshot
 
 if TYPE_CHECKING:
-    from click.testing import CliRunner, Result
+    from pathlib import Path
+
+    from click.testing import CliRunner, Result as ClickResult
     from pytest_mock import MockerFixture
 
 
@@ -44,7 +48,141 @@ def test_test_open_process_failure(mocker: MockerFixture, runner: CliRunner) ->
     mock_proc.returncode = 1
     mock_popen.return_value = mock_proc
 
-    result: Result = runner.invoke(main, ['http://example.com'])
+    result: ClickResult = runner.invoke(main, ['http://example.com'])
 
     assert result.exit_code != 0
     assert mock_popen.call_count == 2
+
+
+def test_test_open_load(mocker: MockerFixture, runner: CliRunner) -> None:
+    mocker.patch('open_in_mpv.test_open.which', return_value='/usr/bin/open-in-mpv')
+    mocker.patch('open_in_mpv.test_open.time.sleep')
+    mock_popen = mocker.patch('open_in_mpv.test_open.sp.Popen')
+    mock_popen.return_value.__enter__.return_value.returncode = 0
+    mock_send = mocker.patch('open_in_mpv.test_open.send',
+                             side_effect=[Result(10, None),
+                                          Result(20, 'Exit code 1.'),
+                                          Result(30, None)])
+    mocker.patch('open_in_mpv.test_open.snapshot', return_value=frozenset({'/run/old.sock'}))
+    mock_count = mocker.patch('open_in_mpv.test_open.count_instances', return_value=(2, 2, 1))
+    result = runner.invoke(main, ['http://example.com', '-n', '3', '-c', '2'])
+    assert result.exit_code == 1
+    mock_count.assert_called_once_with(frozenset({'/run/old.sock'}))
+    assert mock_send.call_count == 3
+    mock_send.assert_called_with(('/usr/bin/open-in-mpv', 'chrome://nothing'), {
+        'url': 'http://example.com',
+        'debug': False
+    })
+    assert 'requests: 3\n' in result.output
+    assert 'errors: 1\n  1: Exit code 1.\n' in result.output
+    assert 'latency ms: p50=20.0 p95=30.0 p99=30.0\n' in result.output
+    assert 'new mpv processes: 2\n' in result.output
+    assert 'new sockets: 2\n' in result.output
+    assert 'duplicate instances: 1\n' in result.output
+
+
+def test_test_open_load_rate(mocker: MockerFixture, runner: CliRunner) -> None:
+    mocker.patch('open_in_mpv.test_open.which', return_value='/usr/bin/open-in-mpv')
+    mock_sleep = mocker.patch('open_in_mpv.test_open.time.sleep')
+    mocker.patch('open_in_mpv.test_open.time.monotonic', return_value=100.0)
+    mock_popen = mocker.patch('open_in_mpv.test_open.sp.Popen')
+    mock_popen.return_value.__enter__.return_value.returncode = 0
+    mocker.patch('open_in_mpv.test_open.send', return_value=Result(10, None))
+    mocker.patch('open_in_mpv.test_open.snapshot', return_value=frozenset())
+    mocker.patch('open_in_mpv.test_open.count_instances', return_value=(1, 1, 0))
+    result = runner.invoke(main, ['http://example.com', '-n', '3', '--rate', '2'])
+    assert result.exit_code == 0
+    delays = sorted(x.args[0] for x in mock_sleep.call_args_list)
+    assert delays == [0.0, 0.5, 1.0, SETTLE_TIME]
+
+
+def test_send(mocker: MockerFixture) -> None:
+    mock_popen = mocker.patch('open_in_mpv.test_open.sp.Popen')
+    proc = mock_popen.return_value.__enter__.return_value
+    proc.stdout = io.BytesIO(encode({'message': 'About to spawn.'}))
+    proc.returncode = 0
+    result = send(('open-in-mpv',), {'url': 'https://example.com'})
+    assert result.error is None
+    proc.stdin.write.assert_called_once_with(encode({'url': 'https://example.com'}))
+
+
+def test_send_error_response(mocker: MockerFixture) -> None:
+    mock_popen = mocker.patch('open_in_mpv.test_open.sp.Popen')
+    proc = mock_popen.return_value.__enter__.return_value
+    proc.stdout = io.BytesIO(encode({'error': 'Invalid URL.'}))
+    proc.returncode = 1
+    assert send(('open-in-mpv',), {}).error == 'Invalid URL.'
+
+
+def test_send_no_response(mocker: MockerFixture) -> None:
+    mock_popen = mocker.patch('open_in_mpv.test_open.sp.Popen')
+    proc = mock_popen.return_value.__enter__.return_value
+    proc.stdout = io.BytesIO(b'')
+    error = send(('open-in-mpv',), {}).error
+    assert error is not None
+    assert error.startswith('Invalid response')
+
+
+def test_send_not_started(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.test_open.sp.Popen', side_effect=FileNotFoundError('No such file'))
+    assert send(('open-in-mpv',), {}).error == 'No such file'
+
+
+def _instances(mocker: MockerFixture, tmp_path: Path) -> tuple[Path, Path]:
+    socket_path = tmp_path / 'open-in-mpv.sock'
+    pool_socket = tmp_path / 'pool' / '1.sock'
+    pool_socket.parent.mkdir()
+    socket_path.touch()
+    pool_socket.touch()
+    (tmp_path / 'instances').mkdir()
+    (tmp_path / 'instances' / '2.sock').touch()
+    (tmp_path / 'resolver.sock').touch()
+    mocker.patch('open_in_mpv.test_open.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.test_open.MPV_SOCKET', new=socket_path)
+    mocker.patch('open_in_mpv.test_open.MPV_INSTANCES_DIR', new=tmp_path / 'instances')
+    mocker.patch('open_in_mpv.test_open.pool.sockets', return_value=[pool_socket])
+    mocker.patch('open_in_mpv.test_open.which', return_value='/bin/ps')
+    mocker.patch('open_in_mpv.test_open.sp.run').return_value.stdout = (
+        f'/usr/bin/mpv --input-ipc-server={socket_path} https://a\n'
+        f'/usr/bin/mpv --input-ipc-server={socket_path} https://b\n'
+        f'mpv --idle=yes --input-ipc-server={pool_socket}\n'
+        'mpv --input-ipc-server=/tmp/other.sock\n'
+        f'vim --input-ipc-server={socket_path}\n')
+    return socket_path, pool_socket
+
+
+def test_count_instances(mocker: MockerFixture, tmp_path: Path) -> None:
+    _instances(mocker, tmp_path)
+    assert count_instances() == (3, 3, 1)
+
+
+def test_count_instances_before(mocker: MockerFixture, tmp_path: Path) -> None:
+    socket_path, pool_socket = _instances(mocker, tmp_path)
+    before = frozenset({str(socket_path), str(pool_socket)})
+    assert snapshot() == before | {str(tmp_path / 'instances' / '2.sock')}
+    # Both processes on the main socket predate the run, so they are not reported.
+    assert count_instances(before) == (0, 1, 0)
+
+
+def test_count_instances_new_after_existing(mocker: MockerFixture, tmp_path: Path) -> None:
+    socket_path, _ = _instances(mocker, tmp_path)
+    instance = tmp_path / 'instances' / '2.sock'
+    mocker.patch('open_in_mpv.test_open.sp.run').return_value.stdout = (
+        f'mpv --input-ipc-server={socket_path}\nmpv --input-ipc-server={instance}\n')
+    assert count_instances(frozenset({str(socket_path)})) == (1, 2, 1)
+    assert count_instances(frozenset()) == (2, 3, 1)
+
+
+def test_count_instances_no_ps(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.test_open.IS_WIN', new=False)
+    mocker.patch('open_in_mpv.test_open.which', return_value=None)
+    mocker.patch('open_in_mpv.test_open.pool.sockets', return_value=[])
+    mock_run = mocker.patch('open_in_mpv.test_open.sp.run')
+    assert count_instances()[0] == 0
+    mock_run.assert_not_called()
+
+
+def test_count_instances_windows(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.test_open.IS_WIN', new=True)
+    assert count_instances() == (0, 0, 0)
+    assert snapshot() == frozenset()
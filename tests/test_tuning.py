@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from open_in_mpv import tuning
+from open_in_mpv.tuning import Profile
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def test_observe_lookup(tmp_path: Path) -> None:
+    path = tmp_path / 'cache' / 'tuning.json'
+    record = {
+        'site': 'a.example',
+        'seconds': 60.0,
+        'stalls': 1,
+        'cache_speed_mean': 1000.0,
+        'bitrate_mean': 8000.0
+    }
+    tuning.observe({**record, 'site': 'local'}, path=path)
+    tuning.observe({**record, 'seconds': 5.0}, path=path)
+    assert not path.exists()
+    tuning.observe(record, path=path)
+    assert tuning.lookup('a.example', path=path) is None
+    tuning.observe({**record, 'stalls': 0, 'cache_speed_mean': None, 'bitrate_mean': 0}, path=path)
+    assert tuning.lookup('a.example', path=path) == Profile(2, 0.7, 1000.0, 8000.0)
+    assert tuning.lookup('b.example', path=path) is None
+
+
+def test_observe_max_entries(mocker: MockerFixture, tmp_path: Path) -> None:
+    path = tmp_path / 'tuning.json'
+    for site in ('a', 'b', 'c', 'a', 'a'):
+        tuning.observe({'site': site, 'seconds': 20}, path=path)
+    mocker.patch('open_in_mpv.tuning.MAX_ENTRIES', 2)
+    tuning.observe({'site': 'd', 'seconds': 20}, path=path)
+    assert tuning.lookup('a', path=path) is not None
+    assert tuning.lookup('b', path=path) is None
+    assert '"c"' not in path.read_text(encoding='utf-8')
+
+
+def test_lookup_invalid(tmp_path: Path) -> None:
+    path = tmp_path / 'tuning.json'
+    path.write_text('[', encoding='utf-8')
+    assert tuning.lookup('a', path=path) is None
+    path.write_text('{"a": [3, 0, 0], "b": [3, 0, 0, 0], "c": "3000"}', encoding='utf-8')
+    assert tuning.lookup('a', path=path) is None
+    assert tuning.lookup('c', path=path) is None
+    assert tuning.lookup('b', path=path) == Profile(3, 0, 0, 0)
+
+
+def test_options() -> None:
+    # Without a bitrate, mpv's own limit is kept.
+    assert tuning.options(Profile(2, 0.0, 0.0, 0.0)) == {
+        'demuxer-readahead-secs': '10',
+        'cache-secs': '10'
+    }
+    # 1 Mb/s delivered at 125 kB/s stalls once a minute.
+    assert tuning.options(Profile(2, 1.0, 125000.0, 1000000.0)) == {
+        'demuxer-max-bytes': str(25000000),
+        'demuxer-readahead-secs': '100',
+        'cache-secs': '100'
+    }
+    assert tuning.options(Profile(2, 0.0, 1e9, 1000000.0))['demuxer-max-bytes'] == str(
+        tuning.MIN_BYTES)
+    assert tuning.options(Profile(2, 10.0, 1e9, 1e9))['cache-secs'] == '120'
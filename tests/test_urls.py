@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+from open_in_mpv.urls import canonical_url
+
+
+def test_canonical_url() -> None:
+    assert canonical_url('HTTPS://WWW.Example.com:443/watch?v=1&utm_source=x&si=abc#t=10') == (
+        'https://www.example.com/watch?v=1')
+    assert canonical_url('http://example.com:8080') == 'http://example.com:8080/'
+    assert canonical_url('https://example.com./a?fbclid=1&msclkid=2&b=') == (
+        'https://example.com/a?b=')
+    assert canonical_url('https://youtu.be/abc?t=5') == ('https://www.youtube.com/watch?v=abc&t=5')
+    assert canonical_url('https://m.youtube.com/watch?v=abc&feature=share') == (
+        'https://www.youtube.com/watch?v=abc')
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import asyncio
+import json
+import sys
+
+from open_in_mpv import metrics, watcher
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+async def _fake_mpv(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    await asyncio.sleep(0.01)
+    writer.write(json.dumps({'event': 'start-file'}).encode() + b'\n')
+    writer.write(json.dumps({'event': 'file-loaded'}).encode() + b'\n')
+    await writer.drain()
+    await asyncio.sleep(0.01)
+    writer.write(json.dumps({'event': 'playback-restart'}).encode() + b'\n')
+    await writer.drain()
+    await reader.read()
+    writer.close()
+
+
+def test_watch(tmp_path: Path) -> None:
+    path = tmp_path / 'mpv.sock'
+
+    async def run() -> dict[str, float]:
+        start = asyncio.get_running_loop().time()
+        task = asyncio.create_task(
+            watcher.watch(path, start=start, host_end=start, new_instance=True, timeout=2))
+        await asyncio.sleep(0.05)
+        async with await asyncio.start_unix_server(_fake_mpv, path=str(path)):
+            return await task
+
+    stages = asyncio.run(run())
+    assert list(stages) == ['mpv_start', 'file_loaded', 'playback_restart', 'total']
+    assert stages['mpv_start'] >= 40
+    assert stages['playback_restart'] >= 10
+    assert stages['total'] >= stages['mpv_start'] + stages['playback_restart']
+
+
+async def _fake_mpv_url(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    state: dict[str, Any] = {'path': None}
+
+    async def reply() -> None:
+        while line := await reader.readline():
+            message = json.loads(line)
+            data = state.get(message['command'][1])
+            writer.write(
+                json.dumps({
+                    'data': data,
+                    'error': 'property unavailable' if data is None else 'success',
+                    'request_id': message['request_id']
+                }).encode() + b'\n')
+        writer.close()
+
+    replies = asyncio.create_task(reply())
+    await asyncio.sleep(0.05)
+    for path in ('https://other', 'https://a'):
+        state['path'] = path
+        writer.write(json.dumps({'event': 'file-loaded'}).encode() + b'\n')
+        # The watcher asks for the path in between.
+        await asyncio.sleep(0.05)
+        writer.write(json.dumps({'event': 'playback-restart'}).encode() + b'\n')
+    await replies
+
+
+def test_watch_url(tmp_path: Path) -> None:
+    path = tmp_path / 'mpv.sock'
+
+    async def run() -> dict[str, float]:
+        start = asyncio.get_running_loop().time()
+        async with await asyncio.start_unix_server(_fake_mpv_url, path=str(path)):
+            return await watcher.watch(path,
+                                       start=start,
+                                       host_end=start,
+                                       new_instance=False,
+                                       url='https://a',
+                                       timeout=2)
+
+    stages = asyncio.run(run())
+    assert list(stages) == ['file_loaded', 'playback_restart', 'total']
+    assert stages['file_loaded'] >= 100
+    assert stages['playback_restart'] >= 40
+
+
+def test_watch_already_playing(tmp_path: Path) -> None:
+    path = tmp_path / 'mpv.sock'
+
+    async def playing(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        values = {'path': 'https://a', 'playback-time': 1.5}
+        while line := await reader.readline():
+            message = json.loads(line)
+            writer.write(
+                json.dumps({
+                    'data': values[message['command'][1]],
+                    'error': 'success',
+                    'request_id': message['request_id']
+                }).encode() + b'\n')
+        writer.close()
+
+    async def run() -> tuple[dict[str, float], float]:
+        loop = asyncio.get_running_loop()
+        async with await asyncio.start_unix_server(playing, path=str(path)):
+            start = loop.time()
+            stages = await watcher.watch(path,
+                                         start=start,
+                                         host_end=start,
+                                         new_instance=False,
+                                         url='https://a',
+                                         timeout=5)
+            return stages, loop.time() - start
+
+    stages, elapsed = asyncio.run(run())
+    assert stages == {}
+    assert elapsed < 1
+
+
+def test_watch_timeouts(tmp_path: Path) -> None:
+    path = tmp_path / 'mpv.sock'
+    assert asyncio.run(watcher.watch(path, start=0, host_end=0, new_instance=True,
+                                     timeout=0.05)) == {}
+
+    async def silent(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await reader.read()
+        writer.close()
+
+    async def run() -> dict[str, float]:
+        async with await asyncio.start_unix_server(silent, path=str(path)):
+            return await watcher.watch(path, start=0, host_end=0, new_instance=False, timeout=0.05)
+
+    assert asyncio.run(run()) == {}
+
+
+def test_command() -> None:
+    timer = metrics.Timer()
+    cmd = watcher.command('@open-in-mpv', timer, new_instance=False)
+    assert cmd[:3] == [sys.executable, '-m', 'open_in_mpv.watcher']
+    assert cmd[3:5] == ['@open-in-mpv', timer.id]
+    assert float(cmd[5]) == pytest.approx(timer.start)
+    assert cmd[-2:] == ['0', '']
+    assert watcher.command('@open-in-mpv', timer, new_instance=True,
+                           url='https://a')[-2:] == ['1', 'https://a']
+
+
+def test_main(mocker: MockerFixture) -> None:
+    mock_watch = mocker.patch('open_in_mpv.watcher.watch', return_value={'file_loaded': 1.0})
+    mock_write = mocker.patch('open_in_mpv.watcher.metrics.write')
+    watcher.main(['@mpv', 'id', '1.5', '2.5', '1', 'https://a'])
+    assert mock_watch.call_args.kwargs == {
+        'start': 1.5,
+        'host_end': 2.5,
+        'new_instance': True,
+        'url': 'https://a'
+    }
+    mock_write.assert_called_once_with({'file_loaded': 1.0}, record_id='id')
+    mock_watch.return_value = {}
+    mock_write.reset_mock()
+    watcher.main(['@mpv', 'id', '1.5', '2.5', '0'])
+    mock_write.assert_not_called()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import socket
+import threading
+
+from open_in_mpv import ytdl
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+
+def _serve(path: Path, reply: bytes) -> list[bytes]:
+    requests: list[bytes] = []
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(str(path))
+    sock.listen()
+
+    def serve() -> None:
+        with sock:
+            conn, _ = sock.accept()
+            with conn, conn.makefile('rb') as f:
+                requests.append(f.readline())
+                conn.sendall(reply)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return requests
+
+
+def test_request(tmp_path: Path) -> None:
+    path = tmp_path / 'resolver.sock'
+    requests = _serve(path, b'{"code": 0, "stdout": "{}\\n", "stderr": ""}\n')
+    assert ytdl.request(['-J', 'https://example.com'], path) == {
+        'code': 0,
+        'stdout': '{}\n',
+        'stderr': ''
+    }
+    assert requests == [b'{"args": ["-J", "https://example.com"]}\n']
+
+
+@pytest.mark.parametrize('reply', [b'{"fallback": true}\n', b'[]\n', b'{"code": "x"}\n', b'x\n'])
+def test_request_unusable(tmp_path: Path, reply: bytes) -> None:
+    path = tmp_path / 'resolver.sock'
+    _serve(path, reply)
+    assert ytdl.request(['-J', 'https://example.com'], path) is None
+
+
+def test_request_not_running(tmp_path: Path) -> None:
+    assert ytdl.request(['-J', 'https://example.com'], tmp_path / 'resolver.sock') is None
+
+
+def test_main(mocker: MockerFixture, capsys: pytest.CaptureFixture[str]) -> None:
+    mocker.patch('open_in_mpv.ytdl.sys.argv', ['open-in-mpv-ytdl', '-J', 'https://example.com'])
+    mock_request = mocker.patch('open_in_mpv.ytdl.request',
+                                return_value={
+                                    'code': 1,
+                                    'stdout': '',
+                                    'stderr': 'ERROR: no\n'
+                                })
+    with pytest.raises(SystemExit) as e:
+        ytdl.main()
+    assert e.value.code == 1
+    assert capsys.readouterr().err == 'ERROR: no\n'
+    mock_request.assert_called_once_with(['-J', 'https://example.com'])
+
+
+def test_main_fallback(mocker: MockerFixture) -> None:
+    mocker.patch('open_in_mpv.ytdl.sys.argv', ['open-in-mpv-ytdl', '--version'])
+    mocker.patch('open_in_mpv.ytdl.request', return_value=None)
+    mocker.patch('open_in_mpv.ytdl.which', side_effect=[None, '/usr/bin/youtube-dl'])
+    mock_execv = mocker.patch('open_in_mpv.ytdl.os.execv', side_effect=SystemExit(0))
+    with pytest.raises(SystemExit):
+        ytdl.main()
+    mock_execv.assert_called_once_with('/usr/bin/youtube-dl', ('/usr/bin/youtube-dl', '--version'))
+
+
+def test_main_fallback_not_found(mocker: MockerFixture,
+                                 capsys: pytest.CaptureFixture[str]) -> None:
+    mocker.patch('open_in_mpv.ytdl.sys.argv', ['open-in-mpv-ytdl', '--version'])
+    mocker.patch('open_in_mpv.ytdl.request', return_value=None)
+    mocker.patch('open_in_mpv.ytdl.which', return_value=None)
+    with pytest.raises(SystemExit) as e:
+        ytdl.main()
+    assert e.value.code == 1
+    assert 'not found' in capsys.readouterr().err